@@ -1,34 +1,92 @@
-from weaving_analyser.analyser import WeavingAnalyser
-import sys
-import requests
-from weaving_analyser.api import APIhandler
+import argparse
+import weaving_analyser
+from weaving_analyser.config import PICTURE_CODEC, PICTURE_CODEC_QUALITY, PICTURE_ENCODER_PROCESSES, SPOOL_DIRECTORY, \
+    METRICS_HOST, METRICS_PORT
 
-#* usage: python application.py --ttl xx
+#* usage: python application.py [--ttl xx] [--engine threads|asyncio] [--virtual-clock seed] [--codec name]
+#*                              [--quality 1-100] [--spool-dir path | --no-spool [--stream-uploads]]
+#*                              [--metrics-port port | --no-metrics]
+
+# analyser class of each engine, imported when the engine is chosen (the modules of the analyser, numpy and requests
+# are only imported once the arguments are parsed)
+ENGINES = {
+    "threads": "WeavingAnalyser",
+    "asyncio": "AsyncWeavingAnalyser"
+}
 
 def main() -> None:
-    weaving_analyzer = WeavingAnalyser()
+    parser = argparse.ArgumentParser(description="Weaving analyser.")
+    parser.add_argument("-t", "--ttl", type=int, default=None, help="time to live (seconds)")
+    parser.add_argument("-e", "--engine", choices=ENGINES, default="threads",
+                        help="threads: update thread and thread pools; asyncio: single event loop")
+    parser.add_argument("--virtual-clock", type=int, default=None, metavar="SEED",
+                        help="simulate faster than real time on a virtual clock seeded with SEED (threads engine)")
+    parser.add_argument("--codec", default=PICTURE_CODEC,
+                        help="compression of the pictures: lossless raw, zlib, zstd, png or lossy jpeg, webp")
+    parser.add_argument("--quality", type=int, default=PICTURE_CODEC_QUALITY,
+                        help="quality of the lossy codecs (1-100)")
+    parser.add_argument("--spool-dir", default=SPOOL_DIRECTORY,
+                        help="directory of the write-ahead spool of the pictures, kept across runs")
+    parser.add_argument("--no-spool", action="store_true",
+                        help="send the pictures directly, a batch that fails to be sent is lost")
+    parser.add_argument("--stream-uploads", action="store_true",
+                        help="stream the pictures to the API as they are encoded (threads engine, with --no-spool)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help=f"port of the Prometheus metrics endpoint (http://{METRICS_HOST}:port/metrics)")
+    parser.add_argument("--no-metrics", action="store_true", help="do not expose the metrics")
+    args = parser.parse_args()
+
+    from weaving_analyser import APIhandler, MetricsServer, PictureEncoder, PictureSpool, REGISTRY
+
+    try: # the unknown codecs are rejected here
+        picture_encoder = PictureEncoder(args.codec, args.quality, processes=PICTURE_ENCODER_PROCESSES)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.stream_uploads and (args.engine != "threads" or not args.no_spool):
+        parser.error("--stream-uploads needs the threads engine and --no-spool")
+
+    spool = None if args.no_spool else PictureSpool(args.spool_dir)
+
+    if args.virtual_clock is not None:
+        if args.engine != "threads" or args.ttl is None:
+            parser.error("--virtual-clock needs the threads engine and a ttl")
+        from hardware_controllers.clock import VirtualClock
+        weaving_analyzer = weaving_analyser.WeavingAnalyser(clock=VirtualClock(seed=args.virtual_clock),
+                                                            picture_encoder=picture_encoder, spool=spool,
+                                                            stream_uploads=args.stream_uploads)
+    elif args.stream_uploads:
+        weaving_analyzer = weaving_analyser.WeavingAnalyser(picture_encoder=picture_encoder, stream_uploads=True)
+    else:
+        weaving_analyzer = getattr(weaving_analyser, ENGINES[args.engine])(picture_encoder=picture_encoder, spool=spool)
     api_handler = APIhandler()
 
+    import requests # imported by the API handlers on their first request
+
     try:
         api_handler.ping()
     except requests.exceptions.ConnectionError as e:
         print("API server failed or is not running.")
-        return
-
-    del api_handler # delete api_handler to avoid memory leak
-    
-    num_args = len(sys.argv)
-    ttl = None
-    
-    if num_args >= 3 and (sys.argv[1] == "--ttl" or sys.argv[1] == "-t"):
-        try:
-            ttl = int(sys.argv[2])
-        except ValueError:
-            print("Invalid ttl value.\n usage: python application.py --t <n_seconds>")
+        if spool is None:
             return
+        print("Pictures are spooled until it is reachable.")
 
+    api_handler.close() # release the pooled connection, the handlers own their own pools
 
-    weaving_analyzer.start(ttl)
+    metrics_server = None
+    if not args.no_metrics:
+        try:
+            metrics_server = MetricsServer(REGISTRY, METRICS_HOST, args.metrics_port)
+            metrics_server.start()
+        except OSError as e:
+            print(f"Metrics endpoint failed to start: {e}")
+            metrics_server = None
+
+    try:
+        weaving_analyzer.start(args.ttl)
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
 
 
 
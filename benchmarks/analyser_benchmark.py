@@ -0,0 +1,348 @@
+"""
+Benchmark of the full analyser pipeline: the WeavingAnalyser runs against the simulated controllers and a local
+stand-in of server/server.py (the same Flask app, on an ephemeral port), and the results are written as JSON so that
+runs can be diffed between versions.
+
+Reported: samples/s against the 50 Hz target and sampling jitter, per-iteration capture latency, displacement between
+the first and the last light type of an iteration, upload bytes/s, request latency percentiles, peak RSS and thread
+count, plus the analyser metrics.
+
+usage: python -m benchmarks.analyser_benchmark [--ttl 60] [--virtual-clock SEED] [--codec raw] [--output run.json]
+                                               [--baseline previous.json] [--tolerance 0.1]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from werkzeug.serving import make_server
+
+from hardware_controllers.clock import VirtualClock
+from server.server import app
+from weaving_analyser.analyser import WeavingAnalyser
+from weaving_analyser.camera_handler import CameraHandler
+from weaving_analyser.config import PICTURE_CODEC, PICTURE_CODEC_QUALITY
+from weaving_analyser.picture_codecs import PictureEncoder, CODECS
+from weaving_analyser.velocity_handler import VelocityHandler
+
+MONITOR_PERIOD = 0.5
+
+# metrics compared with a baseline: path in the results, and whether higher is better
+REGRESSION_METRICS = {
+    ("sampling", "rate"): True,
+    ("sampling", "lateness_p99"): False,
+    ("capture", "latency_p50"): False,
+    ("uploads", "bytes_per_second"): True,
+    ("uploads", "latency_p99"): False,
+    ("telemetry", "latency_p99"): False,
+    ("process", "peak_rss_bytes"): False,
+}
+
+
+def percentiles(values: List[float]) -> dict:
+    """
+    Summarize a list of measures.
+
+    Args:
+        values (List[float]): measures.
+
+    Returns:
+        dict: count, mean, p50, p90, p99 and max of the measures (0 when there are none).
+    """
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+
+    p50, p90, p99 = np.percentile(values, [50, 90, 99]).tolist()
+    return {"count": len(values), "mean": float(np.mean(values)), "p50": p50, "p90": p90, "p99": p99,
+            "max": float(np.max(values))}
+
+
+class Recorder:
+    """
+    Recorder times the calls of the analyser functions it wraps, and samples the process resources.
+
+    Attributes
+    ----------
+    durations : Dict[str, List[float]]
+        Duration of each call, by name (seconds).
+    sizes : Dict[str, int]
+        Total size of the bodies sent, by name (bytes).
+    displacement_gaps : List[float]
+        Displacement between the first and the last light type of each iteration (cm).
+    peak_threads : int
+        Highest number of threads seen.
+
+    Methods
+    -------
+    timed(name: str, function: Callable, body_size: bool)
+        Wrap a function to time its calls.
+    instrument(weaving_analyser: WeavingAnalyser)
+        Wrap the requests and the captures of an analyser.
+    start_monitor()
+        Sample the thread count until stop_monitor is called.
+    stop_monitor()
+        Stop sampling the thread count.
+    """
+
+    def __init__(self) -> None:
+        self.durations: Dict[str, List[float]] = {}
+        self.sizes: Dict[str, int] = {}
+        self.displacement_gaps: List[float] = []
+        self.peak_threads = threading.active_count()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor = None
+
+    def timed(self, name: str, function: Callable, body_size: bool = False) -> Callable:
+        """
+        Wrap a function to time its calls (wall time, even on a virtual clock).
+
+        Args:
+            name (str): name of the measures.
+            function (Callable): function to wrap.
+            body_size (bool): whether the first argument is a request body whose size is recorded.
+
+        Returns:
+            Callable: the wrapped function.
+        """
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                with self._lock:
+                    self.durations.setdefault(name, []).append(duration)
+                    if body_size:
+                        self.sizes[name] = self.sizes.get(name, 0) + len(args[0])
+
+        return wrapper
+
+    def instrument(self, weaving_analyser: WeavingAnalyser) -> None:
+        """
+        Wrap the requests of an analyser and the captures of its camera handler.
+
+        Returns
+        -------
+        None
+        """
+        velocity_api = weaving_analyser.velocity_handler.api_handler
+        velocity_api.send_surface_movement_batch = self.timed("telemetry", velocity_api.send_surface_movement_batch)
+        pictures_api = weaving_analyser.camera_handler.api_handler
+        pictures_api.send_encoded_pictures_batch = self.timed("uploads", pictures_api.send_encoded_pictures_batch,
+                                                              body_size=True)
+
+        camera_handler = weaving_analyser.camera_handler
+        trigger_camera = camera_handler.trigger_camera
+        started = {}
+
+        def timed_trigger_camera(batch, light_type):
+            light_index = batch.light_index(light_type)
+            if light_index == 0:
+                started[id(batch)] = time.perf_counter()
+            collected = trigger_camera(batch, light_type)
+            if collected and light_index == len(batch.light_types) - 1:
+                with self._lock:
+                    self.durations.setdefault("capture", []).append(time.perf_counter() - started.pop(id(batch)))
+                    self.displacement_gaps.append(float(batch.displacements[-1] - batch.displacements[0]))
+            return collected
+
+        camera_handler.trigger_camera = timed_trigger_camera
+
+    def start_monitor(self) -> None:
+        """
+        Sample the thread count every MONITOR_PERIOD seconds until stop_monitor is called.
+
+        Returns
+        -------
+        None
+        """
+        def monitor():
+            while not self._stop.wait(MONITOR_PERIOD):
+                self.peak_threads = max(self.peak_threads, threading.active_count())
+
+        self._monitor = threading.Thread(target=monitor, name='benchmark_monitor', daemon=True)
+        self._monitor.start()
+
+    def stop_monitor(self) -> None:
+        """
+        Stop sampling the thread count.
+
+        Returns
+        -------
+        None
+        """
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
+
+
+def git_revision() -> Optional[str]:
+    """
+    Get the git revision of the benchmarked tree.
+
+    Returns:
+        str: commit hash, None outside of a git repository.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(ttl: float, seed: Optional[int] = None, codec: str = PICTURE_CODEC,
+        quality: int = PICTURE_CODEC_QUALITY) -> dict:
+    """
+    Run the analyser against a local stand-in of the server and measure it.
+
+    Args:
+        ttl (float): duration of the run (seconds of the analyser clock).
+        seed (int, optional): seed of a virtual clock, to simulate faster than real time. Defaults to real time (the
+            sampling rate and jitter are only meaningful in real time).
+        codec (str): picture codec.
+        quality (int): quality of the lossy codecs.
+
+    Returns:
+        dict: benchmark results.
+    """
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, name='benchmark_server', daemon=True)
+    server_thread.start()
+
+    recorder = Recorder()
+    clock = VirtualClock(seed=seed) if seed is not None else None
+    weaving_analyser = WeavingAnalyser(clock=clock, picture_encoder=PictureEncoder(codec, quality))
+    for api_handler in (weaving_analyser.velocity_handler.api_handler, weaving_analyser.camera_handler.api_handler):
+        api_handler.port = server.server_port
+    recorder.instrument(weaving_analyser)
+
+    recorder.start_monitor()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()): # the server prints every request
+        weaving_analyser.start(ttl)
+    wall_time = time.perf_counter() - start
+    recorder.stop_monitor()
+
+    server.shutdown()
+    server_thread.join()
+
+    metrics = weaving_analyser.metrics()
+    upload_bytes = recorder.sizes.get("uploads", 0)
+    capture = percentiles(recorder.durations.get("capture", []))
+    uploads = percentiles(recorder.durations.get("uploads", []))
+    telemetry = percentiles(recorder.durations.get("telemetry", []))
+
+    return {
+        "version": git_revision(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "platform": {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system()},
+        "config": {"ttl": ttl, "virtual_clock_seed": seed, "codec": codec, "quality": quality},
+        "wall_time": wall_time,
+        "sampling": {
+            "target_rate": VelocityHandler.SAMPLING_RATE,
+            **metrics["sampling"]
+        },
+        "capture": {
+            "iterations": capture["count"],
+            "latency_p50": capture["p50"],
+            "latency_p90": capture["p90"],
+            "latency_p99": capture["p99"],
+            "latency_max": capture["max"],
+            "light_displacement_gap": percentiles(recorder.displacement_gaps),
+            "vertical_fov": CameraHandler.VERTICAL_FOV
+        },
+        "uploads": {
+            "requests": uploads["count"],
+            "bytes": upload_bytes,
+            "bytes_per_second": upload_bytes / wall_time if wall_time else 0.0,
+            "latency_p50": uploads["p50"],
+            "latency_p90": uploads["p90"],
+            "latency_p99": uploads["p99"],
+            "latency_max": uploads["max"]
+        },
+        "telemetry": {
+            "requests": telemetry["count"],
+            "latency_p50": telemetry["p50"],
+            "latency_p90": telemetry["p90"],
+            "latency_p99": telemetry["p99"],
+            "latency_max": telemetry["max"]
+        },
+        "process": {
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin"
+                                                                                   else 1024),
+            "peak_threads": recorder.peak_threads
+        },
+        "analyser": metrics
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Compare the results of a run with a baseline run.
+
+    Args:
+        results (dict): results of the run.
+        baseline (dict): results of the baseline run.
+        tolerance (float): relative change allowed before a metric is reported as a regression.
+
+    Returns:
+        List[str]: description of each regression.
+    """
+    regressions = []
+    for (section, name), higher_is_better in REGRESSION_METRICS.items():
+        value, reference = results[section][name], baseline.get(section, {}).get(name)
+        if not reference:
+            continue
+
+        change = (value - reference) / reference
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{section}.{name}: {reference:.6g} -> {value:.6g} ({change:+.1%})")
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the full analyser pipeline.")
+    parser.add_argument("-t", "--ttl", type=float, default=60, help="duration of the run (seconds)")
+    parser.add_argument("--virtual-clock", type=int, default=None, metavar="SEED",
+                        help="simulate faster than real time on a virtual clock seeded with SEED")
+    parser.add_argument("--codec", choices=CODECS, default=PICTURE_CODEC, help="picture codec")
+    parser.add_argument("--quality", type=int, default=PICTURE_CODEC_QUALITY, help="quality of the lossy codecs")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run, to report the regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative change allowed before a metric is a regression (default 10%%)")
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    results = run(args.ttl, args.virtual_clock, args.codec, args.quality)
+
+    document = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(document)
+    else:
+        print(document)
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
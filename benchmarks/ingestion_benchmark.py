@@ -0,0 +1,254 @@
+"""
+Load generator of the API: simulated looms post their fabric movement samples at the sampling rate, and
+periodically a batch of pictures, on keep-alive connections from a single event loop. Reports the requests/s served
+and the latency percentiles, as JSON, so that the ingestion server and the Flask server can be compared.
+
+The load is open-loop: every request is sent at its scheduled time whether or not the previous ones were answered,
+and its latency is measured from that time, so a server falling behind shows in the latency rather than in a lower
+request rate. --rate 0 sends the requests back to back on every connection instead, to measure the peak throughput.
+
+The server is started on an ephemeral port (--server ingestion or flask), in other processes so that it does not
+share the interpreter of the load generator, or is an already running one (--server none, see --port).
+
+usage: python -m benchmarks.ingestion_benchmark [--server ingestion] [--workers N] [--looms 20] [--rate 50]
+                                                [--duration 10] [--connections 64] [--pictures-period 5]
+                                                [--output run.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.analyser_benchmark import percentiles
+from hardware_controllers.cameras_controller import CaptureBatch, CameraPosition, LightType
+from server.ingestion_server import bind_socket, start_workers, stop_workers, WORKERS
+from weaving_analyser.async_api import AsyncHTTPClient
+from weaving_analyser.batch_codec import encode_capture_batch, BATCH_CONTENT_TYPE
+
+PICTURE_SHAPE = (76, 100, 3)
+
+
+def serve_flask(sock: socket.socket) -> None:
+    """
+    Serve server.py with the development server of Flask on a listening socket, as app.run does (process target).
+
+    Args:
+        sock (socket.socket): listening socket.
+    """
+    from werkzeug.serving import make_server
+    from server.server import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull): # the server prints every request
+        make_server(*sock.getsockname()[:2], app, threaded=True, fd=sock.fileno()).serve_forever()
+
+
+def wait_ready(host: str, port: int, timeout: float = 30) -> None:
+    """
+    Wait until the server answers a ping.
+
+    Args:
+        host (str): host of the server.
+        port (int): port of the server.
+        timeout (float): time given to the server to start (seconds).
+
+    Raises:
+        TimeoutError: the server did not answer in time.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        connection = http.client.HTTPConnection(host, port, timeout=1)
+        try:
+            connection.request("GET", "/ping")
+            if connection.getresponse().status == 204:
+                return
+        except OSError:
+            pass
+        finally:
+            connection.close()
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"The server on port {port} did not start in {timeout} seconds")
+        time.sleep(0.1)
+
+
+def start_server(kind: str, workers: int = WORKERS, host: str = "127.0.0.1") -> Tuple[int, Callable[[], None]]:
+    """
+    Start a server on an ephemeral port, in other processes, and wait until it answers.
+
+    Args:
+        kind (str): "ingestion" for server/ingestion_server.py, "flask" for server/server.py.
+        workers (int): worker processes of the ingestion server.
+        host (str): address to listen on.
+
+    Returns:
+        Tuple[int, Callable[[], None]]: port of the server, and a function stopping it.
+    """
+    sock = bind_socket(host, 0)
+    if kind == "ingestion":
+        ingestion_workers = start_workers(sock, workers, {"stats_period": None})
+    else:
+        flask_process = multiprocessing.get_context("spawn").Process(target=serve_flask, args=(sock,))
+        flask_process.start()
+
+    def stop() -> None:
+        if kind == "ingestion":
+            stop_workers(ingestion_workers)
+        else:
+            flask_process.terminate()
+            flask_process.join()
+        sock.close()
+
+    try:
+        wait_ready(host, sock.getsockname()[1])
+    except TimeoutError:
+        stop()
+        raise
+    return sock.getsockname()[1], stop
+
+
+def pictures_body() -> bytes:
+    """
+    Encode the batch of pictures posted by the looms: two light types, two cameras.
+
+    Returns:
+        bytes: body of a pictures batch request.
+    """
+    batch = CaptureBatch.allocate([LightType.GREEN, LightType.BLUE], [CameraPosition.LEFT, CameraPosition.RIGHT],
+                                  PICTURE_SHAPE)
+    batch.frames[:] = np.random.default_rng(0).integers(0, 256, batch.frames.shape, dtype=np.uint8)
+    batch.collected[:] = True
+    return encode_capture_batch(batch)
+
+
+async def generate_load(host: str, port: int, looms: int = 20, rate: float = 50, duration: float = 10,
+                        connections: int = 64, pictures_period: Optional[float] = 5) -> dict:
+    """
+    Post the requests of simulated looms to a server and measure their latency.
+
+    Args:
+        host (str): host of the server.
+        port (int): port of the server.
+        looms (int): simulated looms, each one posting its own samples.
+        rate (float): fabric movement requests per second of each loom, 0 to send them back to back.
+        duration (float): duration of the load (seconds).
+        connections (int): keep-alive connections to the server, the requests above it wait for a free one.
+        pictures_period (float, optional): seconds between two pictures batches of a loom, None to send none.
+
+    Returns:
+        dict: requests sent, failed and by status, requests/s, and latency percentiles of each route (seconds).
+    """
+    client = AsyncHTTPClient(host, port, pool_size=connections, retries=0) # every response counted as served
+    latencies: Dict[str, List[float]] = {"fabric_movement": [], "pictures_batch": []}
+    statuses: Dict[str, int] = {}
+    errors = 0
+    pictures = pictures_body()
+    tasks = set()
+
+    async def post(route: str, body: bytes, content_type: str, scheduled: float) -> None:
+        nonlocal errors
+        try:
+            response = await client.request("POST", f"/{route}", body, {"Content-Type": content_type})
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            errors += 1
+            return
+        latencies[route].append(time.perf_counter() - scheduled)
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    def sample_body(loom: int, index: int) -> bytes:
+        return json.dumps({"samples": [{"timestamp": time.time(), "velocity": 1.0, "displacement": index / 100,
+                                        "loom": loom}]}).encode()
+
+    async def open_loop(period: float, route: str, body: Callable[[int], bytes], content_type: str,
+                        first: float) -> None:
+        index = 0
+        while (scheduled := first + index * period) < start + duration:
+            await asyncio.sleep(scheduled - time.perf_counter())
+            task = asyncio.create_task(post(route, body(index), content_type, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            index += 1
+
+    async def closed_loop(connection: int, start: float) -> None:
+        index = 0
+        while time.perf_counter() < start + duration:
+            await post("fabric_movement", sample_body(connection, index), "application/json", time.perf_counter())
+            index += 1
+
+    start = time.perf_counter()
+    if rate > 0:
+        # the looms are spread over the first period, as they would not sample in phase
+        generators = [open_loop(1 / rate, "fabric_movement", lambda index, loom=loom: sample_body(loom, index),
+                                "application/json", start + loom / (rate * looms)) for loom in range(looms)]
+    else:
+        generators = [closed_loop(connection, start) for connection in range(connections)]
+    if pictures_period:
+        generators += [open_loop(pictures_period, "pictures_batch", lambda index: pictures,
+                                 BATCH_CONTENT_TYPE, start + loom * pictures_period / looms) for loom in range(looms)]
+    await asyncio.gather(*generators)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    await client.close()
+
+    served = sum(len(values) for values in latencies.values())
+    return {
+        "requests": served + errors,
+        "errors": errors,
+        "statuses": statuses,
+        "seconds": elapsed,
+        "requests_per_second": served / elapsed,
+        "fabric_movement": percentiles(latencies["fabric_movement"]),
+        "pictures_batch": percentiles(latencies["pictures_batch"]),
+        "connections": client.new_connections,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate load on the API and report its throughput and latency.")
+    parser.add_argument("--server", choices=("ingestion", "flask", "none"), default="ingestion",
+                        help="server started for the run, none to load the one listening on --port")
+    parser.add_argument("--host", default="127.0.0.1", help="host of the server")
+    parser.add_argument("--port", type=int, default=5000, help="port of the server with --server none")
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS, help="worker processes of the ingestion server")
+    parser.add_argument("--looms", type=int, default=20, help="simulated looms")
+    parser.add_argument("--rate", type=float, default=50,
+                        help="fabric movement requests per second of each loom, 0 to send them back to back")
+    parser.add_argument("-d", "--duration", type=float, default=10, help="duration of the load (seconds)")
+    parser.add_argument("-c", "--connections", type=int, default=64, help="keep-alive connections to the server")
+    parser.add_argument("--pictures-period", type=float, default=5,
+                        help="seconds between two pictures batches of a loom, 0 to send none")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    port, stop = (args.port, lambda: None) if args.server == "none" else start_server(args.server, args.workers,
+                                                                                        args.host)
+    try:
+        results = asyncio.run(generate_load(args.host, port, args.looms, args.rate, args.duration, args.connections,
+                                            args.pictures_period or None))
+    finally:
+        stop()
+    results = {"server": args.server, "workers": args.workers if args.server == "ingestion" else 1,
+               "looms": args.looms, "rate": args.rate, **results}
+
+    document = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(document)
+    else:
+        print(document)
+    print(f"{results['requests_per_second']:.0f} requests/s, fabric movement p99 "
+          f"{results['fabric_movement']['p99'] * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark of the cold start of the analyser: a fresh interpreter imports the application, and runs its main() as
+`python application.py` would, and the time to its first velocity sample is measured from the launch of the
+interpreter. The analyser is restarted on every loom changeover, so this should stay well under a second.
+
+The API requests are replaced by no-ops: only the startup is measured.
+
+usage: python -m benchmarks.startup_benchmark [--repeat 5] [--output startup.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# run by the fresh interpreter, prints its measures as JSON
+CHILD = """
+import json, sys, threading, time
+start = time.perf_counter()
+import application
+imported = time.perf_counter()
+modules = sorted(name for name in ("numpy", "requests", "PIL", "asyncio", "http.server") if name in sys.modules)
+threads = threading.active_count()
+
+# patched on the classes, main() builds its own handlers
+from weaving_analyser.api import APIhandler
+from weaving_analyser.velocity_handler import VelocityHandler
+APIhandler.ping = lambda self: None
+APIhandler.send_surface_movement_batch = lambda self, samples: None
+APIhandler.send_encoded_pictures_batch = lambda self, body: None
+
+first_sample = []
+update = VelocityHandler.update
+def first_update(self, dt=None):
+    if not first_sample:
+        first_sample.append((time.time(), time.perf_counter()))
+    return update(self, dt)
+VelocityHandler.update = first_update
+
+sys.argv = ["application.py", "--ttl", "1", "--no-spool", "--no-metrics"]
+patched = time.perf_counter()
+application.main()
+
+print(json.dumps({"import_seconds": imported - start, "start_seconds": first_sample[0][1] - patched,
+                  "first_sample_time": first_sample[0][0], "modules_after_import": modules,
+                  "threads_after_import": threads}))
+"""
+
+
+def measure() -> dict:
+    """
+    Run the application in a fresh interpreter, in an empty working directory, and measure its cold start.
+
+    Returns:
+        dict: import time of the application, time from main() to the first velocity sample, time from the launch
+            of the interpreter to the first velocity sample (seconds), heavy modules loaded and threads running after
+            the import.
+    """
+    environment = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT),
+                                                                             os.environ.get("PYTHONPATH")]))}
+    with tempfile.TemporaryDirectory() as directory:
+        launched = time.time()
+        result = subprocess.run([sys.executable, "-c", CHILD], cwd=directory, env=environment, capture_output=True,
+                                text=True, check=True)
+
+    measures = json.loads(result.stdout.strip().splitlines()[-1])
+    measures["first_sample_seconds"] = measures.pop("first_sample_time") - launched
+    return measures
+
+
+def summarize(runs: List[dict]) -> dict:
+    """
+    Summarize the measures of several cold starts.
+
+    Args:
+        runs (List[dict]): measures of each cold start (see measure).
+
+    Returns:
+        dict: median and max of each duration, and the measures of the last run.
+    """
+    summary = {}
+    for name in ("import_seconds", "start_seconds", "first_sample_seconds"):
+        values = [run[name] for run in runs]
+        summary[name] = {"median": float(np.median(values)), "max": max(values)}
+    summary["runs"] = len(runs)
+    summary["modules_after_import"] = runs[-1]["modules_after_import"]
+    summary["threads_after_import"] = runs[-1]["threads_after_import"]
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the analyser.")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="cold starts measured")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    document = json.dumps(summarize([measure() for _ in range(args.repeat)]), indent=2)
+    if args.output:
+        Path(args.output).write_text(document)
+    else:
+        print(document)
+
+
+if __name__ == '__main__':
+    main()
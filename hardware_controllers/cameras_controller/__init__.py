@@ -1,2 +1,26 @@
+from importlib import import_module
+
 from .enumerators import CameraPosition, LightType
-from .cameras_controller import CamerasController
+
+# imported on first access: the enumerators are enough for most importers, the rest needs numpy
+_LAZY_ATTRIBUTES = {
+    "PictureSource": ".picture_source",
+    "FilePictureSource": ".picture_source",
+    "CachedPictureSource": ".picture_source",
+    "CaptureBatch": ".capture_batch",
+    "FramePool": ".frame_pool",
+    "SharedFrameRing": ".shared_frame_ring",
+    "CamerasController": ".cameras_controller",
+}
+
+__all__ = ["CameraPosition", "LightType", *_LAZY_ATTRIBUTES]
+
+
+def __getattr__(name: str):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -3,15 +3,16 @@ CamerasController is a fake controller to take pictures of fabric (or maybe some
 """
 
 import numpy as np
-from PIL import Image
-from time import sleep
-from random import choice, uniform as random_uniform
-from typing import List, Tuple
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, Optional, Sequence, Tuple
 from threading import Event, Lock
 
 from . import LightType, CameraPosition
-from .errors import PictureNotReadyError, PictureNotFoundError, CamerasNotReadyError
+from .errors import PictureNotReadyError, CamerasNotReadyError
+from .picture_source import PictureSource, CachedPictureSource
+from .capture_batch import CaptureBatch
+from ..clock import Clock, SystemClock
 
 ONE_SECOND = 1
 
@@ -28,6 +29,16 @@ class CamerasController:
         Trigger event to inform if a trigger was triggered and not consumed.
     _trigger_lock : Lock
         Trigger event lock to guarantee that the trigger is thread safe.
+    _clock : Clock
+        Clock of the capturing time.
+    _random : Random
+        Random number generator of the capturing time and of the pictures metadata.
+    _picture_source : PictureSource
+        Source of the decoded pictures.
+    _camera_positions : Tuple[CameraPosition, ...]
+        Positions of the cameras, in the order of the collected pictures.
+    _acquisition_executor : ThreadPoolExecutor
+        Threads acquiring the pictures of the cameras concurrently, None to acquire them one after the other.
     _DIAPHRAGM_OPENINGS : List[float]
         Possible diaphragm opening of these cameras' sensors.
     _ISOS : List[int]
@@ -36,6 +47,8 @@ class CamerasController:
         Minimum exposure time of these cameras' sensors.
     _EXPOSITION_TIME_UPPER_LIMIT: float
         Maximum exposure time of these cameras' sensors.
+    _PICTURE_CACHE_BYTE_BUDGET: int
+        Maximum size of the decoded pictures kept in memory by the default picture source.
 
     Methods
     -------
@@ -43,12 +56,16 @@ class CamerasController:
         Trigger the cameras to capture the pictures.
     collect_pictures()
         Collect the pictures obtained with the trigger.
+    allocate_batch(light_types: Sequence[LightType], allocate_frames: Callable[[Tuple, np.dtype], np.ndarray])
+        Allocate a CaptureBatch for the pictures of these cameras.
+    collect_into(batch: CaptureBatch, light_type: LightType)
+        Collect the pictures obtained with the trigger into a CaptureBatch.
     _get_pictures()
         Gets the dataclass with the wanted pictures.
     _get_picture()
         Gets the dataclass with the wanted picture - only one camera.
-    _create_picture_filepath()
-        Creates the picture filepath using the light type and camera position information's.
+    _get_picture_metadata()
+        Draws the metadata of a picture.
     """
 
     _DIAPHRAGM_OPENINGS: List[float] = [2.8, 5, 5.6, 8, 11]
@@ -56,8 +73,20 @@ class CamerasController:
     _EXPOSITION_TIME_LOWER_LIMIT: float = 0.00125 * ONE_SECOND
     _EXPOSITION_TIME_UPPER_LIMIT: float = 2 * ONE_SECOND
     _CAPTURING_PICTURES_BASE_SLEEP_TIME: int = 4 * ONE_SECOND
-
-    def __init__(self) -> None:
+    _PICTURE_CACHE_BYTE_BUDGET: int = 256 * 1024 * 1024
+
+    def __init__(self, clock: Optional[Clock] = None, picture_source: Optional[PictureSource] = None,
+                 camera_positions: Optional[Sequence[CameraPosition]] = None,
+                 concurrent_acquisition: bool = True) -> None:
+        self._clock = clock or SystemClock()
+        self._picture_source = picture_source or CachedPictureSource(
+            byte_budget=CamerasController._PICTURE_CACHE_BYTE_BUDGET)
+        self._camera_positions = tuple(camera_positions or CameraPosition)
+        self._acquisition_executor = None
+        if concurrent_acquisition and len(self._camera_positions) > 1:
+            self._acquisition_executor = ThreadPoolExecutor(max_workers=len(self._camera_positions),
+                                                            thread_name_prefix='camera_acquisition_')
+        self._random = self._clock.random('cameras_controller')
         self._cameras_ready = False
         self._cameras_ready_lock = Lock()
         self._trigger = Event()
@@ -131,6 +160,7 @@ class CamerasController:
         Output order:
             (left_picture, left_picture_exposition_time, left_picture_diaphragm_opening, left_picture_iso_value,
              right_picture, right_picture_exposition_time, right_picture_diaphragm_opening, right_picture_iso_value)
+        With other camera positions, the same four values for each camera, in the order of the positions.
 
         Parameters
         ----------
@@ -157,13 +187,101 @@ class CamerasController:
                 raise PictureNotReadyError('The trigger was not set!')
 
             pictures = self._get_pictures(light_type)
-            sleep(self._calculate_capturing_sleep_time())
+            self._clock.sleep(self._calculate_capturing_sleep_time())
             self._trigger.clear()
 
             return pictures
 
-    @staticmethod
-    def _calculate_capturing_sleep_time() -> float:
+    def allocate_batch(self, light_types: Sequence[LightType],
+                       allocate_frames: Optional[Callable[[Tuple[int, ...], np.dtype], np.ndarray]] = None) \
+            -> CaptureBatch:
+        """
+        Allocate a CaptureBatch for the pictures of these cameras.
+
+        Parameters
+        ----------
+        light_types : Sequence[LightType]
+            Light types of the batch, in capture order.
+        allocate_frames : Callable[[Tuple[int, ...], np.dtype], np.ndarray], optional
+            Allocates the frames array, e.g. in a SharedFrameRing. Defaults to np.empty.
+
+        Returns
+        -------
+        CaptureBatch
+            The batch, with no picture collected.
+        """
+
+        frame = self._picture_source.get_picture(light_types[0], self._camera_positions[0])
+
+        return CaptureBatch.allocate(light_types, self._camera_positions, frame.shape, frame.dtype, allocate_frames)
+
+    def collect_into(self, batch: CaptureBatch, light_type: LightType) -> None:
+        """
+        Collect pictures of all the cameras into a CaptureBatch, without allocating them.
+
+        Parameters
+        ----------
+        batch : CaptureBatch
+            Batch allocated by allocate_batch.
+        light_type : LightType
+            The light type that the client want to use.
+
+        Raises
+        ------
+        PictureNotReadyError
+            When cameras don't have any ready picture to return.
+        CamerasNotReadyError
+            When cameras are not ready to be used.
+
+        Returns
+        -------
+        None
+        """
+
+        self._raise_on_cameras_not_ready()
+        light_index = batch.light_index(light_type)
+
+        with self._trigger_lock:
+            if not self._trigger.is_set():
+                raise PictureNotReadyError('The trigger was not set!')
+
+            acquired = self._acquire(light_type, partial(self._copy_picture, batch, light_index))
+            for camera_index, (_, exposition_time, diaphragm_opening, iso_value) in enumerate(acquired):
+                batch.exposure_times[light_index, camera_index] = exposition_time
+                batch.diaphragm_openings[light_index, camera_index] = diaphragm_opening
+                batch.isos[light_index, camera_index] = iso_value
+
+            batch.creation_dates[light_index] = self._clock.time()
+            batch.collected[light_index] = True
+            self._clock.sleep(self._calculate_capturing_sleep_time())
+            self._trigger.clear()
+
+    def _copy_picture(self, batch: CaptureBatch, light_index: int, light_type: LightType,
+                      camera_position: CameraPosition) -> None:
+        """
+        Copy the picture of a camera into a CaptureBatch.
+
+        Parameters
+        ----------
+        batch : CaptureBatch
+            Batch receiving the picture.
+        light_index : int
+            Index of the light type in the batch.
+        light_type : LightType
+            The light type that the client want to use.
+        camera_position : CameraPosition
+            The selected camera position of this picture.
+
+        Returns
+        -------
+        None
+        """
+
+        camera_index = batch.camera_positions.index(camera_position)
+        picture = self._picture_source.get_picture(light_type, camera_position)
+        np.copyto(batch.frames[light_index, camera_index], picture)
+
+    def _calculate_capturing_sleep_time(self) -> float:
         """
         Calculate a capturing sleep time to add some uncertainty to capture the pictures.
 
@@ -174,7 +292,7 @@ class CamerasController:
         """
 
         dispersion_factor = 1
-        sleep_uncertainty = random_uniform(-1, 1) * dispersion_factor
+        sleep_uncertainty = self._random.uniform(-1, 1) * dispersion_factor
         effective_sleep_time = CamerasController._CAPTURING_PICTURES_BASE_SLEEP_TIME + sleep_uncertainty
 
         return effective_sleep_time
@@ -184,6 +302,12 @@ class CamerasController:
         """
         Gets the dataclass with the wanted pictures.
 
+        Notes
+        -----
+        With concurrent acquisition, the cameras are read (and their pictures decoded) in parallel, so the
+        acquisition takes as long as the slowest camera. The metadata is drawn beforehand, in the order of the
+        cameras, so it does not depend on the order in which the cameras answer.
+
         Parameters
         ----------
         light_type : LightType
@@ -195,67 +319,75 @@ class CamerasController:
             Pictures and their metadata.
         """
 
-        left_picture = self._get_picture(light_type, CameraPosition.LEFT)
-        right_picture = self._get_picture(light_type, CameraPosition.RIGHT)
-        pictures = left_picture + right_picture
+        return sum(self._acquire(light_type, self._picture_source.get_picture), ())
 
-        return pictures
-
-    def _get_picture(self, light_type: LightType,
-                     camera_position: CameraPosition) -> Tuple[np.ndarray, float, float, int]:
+    def _acquire(self, light_type: LightType,
+                 read_camera: Callable[[LightType, CameraPosition], Any]) -> List[Tuple[Any, float, float, int]]:
         """
-        Gets the dataclass with the wanted picture - only one camera.
+        Reads every camera, concurrently unless the concurrent acquisition is disabled.
 
         Parameters
         ----------
         light_type : LightType
             The light type that the client want to use.
-        camera_position : CameraPosition
-            The selected camera position of this picture.
+        read_camera : Callable[[LightType, CameraPosition], Any]
+            Reads the picture of a camera.
 
         Returns
         -------
-        Tuple[np.ndarray, float, float, int]
-            Pictures and its metadata.
+        List[Tuple[Any, float, float, int]]
+            For each camera, in order: the output of read_camera and the picture metadata.
         """
 
-        filepath = self._create_picture_filepath(light_type, camera_position)
-        iso_value = choice(CamerasController._ISOS)
-        diaphragm_opening = choice(CamerasController._DIAPHRAGM_OPENINGS)
-        exposition_time = random_uniform(CamerasController._EXPOSITION_TIME_LOWER_LIMIT,
-                                         CamerasController._EXPOSITION_TIME_UPPER_LIMIT)
-        exposition_time = round(exposition_time, 2)
-        decoded_picture = np.array(Image.open(filepath))
+        metadata = [self._get_picture_metadata() for _ in self._camera_positions]
+        get_picture = partial(self._get_picture, light_type, read_camera)
 
-        return decoded_picture, exposition_time, diaphragm_opening, iso_value
+        if self._acquisition_executor is None:
+            return list(map(get_picture, self._camera_positions, metadata))
 
-    @staticmethod
-    def _create_picture_filepath(light_type: LightType, camera_position: CameraPosition) -> Path:
+        return list(self._acquisition_executor.map(get_picture, self._camera_positions, metadata))
+
+    def _get_picture(self, light_type: LightType, read_camera: Callable[[LightType, CameraPosition], Any],
+                     camera_position: CameraPosition,
+                     metadata: Tuple[float, float, int]) -> Tuple[np.ndarray, float, float, int]:
         """
-        Creates the picture filepath using the light type and camera position information's.
+        Gets the dataclass with the wanted picture - only one camera.
 
         Parameters
         ----------
         light_type : LightType
             The light type that the client want to use.
+        read_camera : Callable[[LightType, CameraPosition], Any]
+            Reads the picture of a camera.
         camera_position : CameraPosition
             The selected camera position of this picture.
-
-        Raises
-        ------
-        PictureNotFoundError
-            When the picture was not found in the expected directory.
+        metadata : Tuple[float, float, int]
+            Exposition time, diaphragm opening and ISO value of the picture.
 
         Returns
         -------
-        Path
-            The filepath of the selected picture.
+        Tuple[np.ndarray, float, float, int]
+            Pictures and its metadata.
+        """
+
+        decoded_picture = read_camera(light_type, camera_position)
+
+        return (decoded_picture, *metadata)
+
+    def _get_picture_metadata(self) -> Tuple[float, float, int]:
         """
+        Draws the metadata of a picture.
 
-        filename = f'{camera_position.value}_picture_{light_type.value}.jpg'
-        filepath = Path(__file__).parent.resolve().joinpath('pictures').joinpath(filename)
+        Returns
+        -------
+        Tuple[float, float, int]
+            Exposition time, diaphragm opening and ISO value.
+        """
 
-        if not filepath.is_file():
-            raise PictureNotFoundError(f'The picture was not found with the expected filepath {filepath}')
+        iso_value = self._random.choice(CamerasController._ISOS)
+        diaphragm_opening = self._random.choice(CamerasController._DIAPHRAGM_OPENINGS)
+        exposition_time = self._random.uniform(CamerasController._EXPOSITION_TIME_LOWER_LIMIT,
+                                               CamerasController._EXPOSITION_TIME_UPPER_LIMIT)
+        exposition_time = round(exposition_time, 2)
 
-        return filepath
+        return exposition_time, diaphragm_opening, iso_value
@@ -0,0 +1,139 @@
+"""
+CaptureBatch holds the pictures of every camera for every light type of a capture iteration.
+"""
+
+import numpy as np
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Tuple
+
+from .enumerators import LightType, CameraPosition
+
+
+@dataclass(slots=True)
+class CaptureBatch:
+    """
+    CaptureBatch holds the pictures of a capture iteration in one preallocated contiguous array, and their metadata
+    in compact arrays indexed the same way (light type first, then camera).
+
+    Attributes
+    ----------
+    light_types : Tuple[LightType, ...]
+        Light types of the batch, in capture order.
+    camera_positions : Tuple[CameraPosition, ...]
+        Positions of the cameras.
+    frames : np.ndarray
+        Pictures, of shape (lights, cameras, height, width, channels).
+    exposure_times : np.ndarray
+        Exposure time of each picture (seconds), of shape (lights, cameras).
+    diaphragm_openings : np.ndarray
+        Diaphragm opening of each picture, of shape (lights, cameras).
+    isos : np.ndarray
+        ISO value of each picture, of shape (lights, cameras).
+    velocities : np.ndarray
+        Fabric velocity at the trigger of each light type (cm/sec).
+    displacements : np.ndarray
+        Fabric displacement at the trigger of each light type (cm).
+    creation_dates : np.ndarray
+        Time of the collection of each light type (seconds since the epoch).
+    collected : np.ndarray
+        Whether the pictures of each light type were collected.
+
+    Methods
+    -------
+    allocate(light_types: Sequence[LightType], camera_positions: Sequence[CameraPosition], frame_shape: Tuple,
+             dtype: np.dtype, allocate_frames: Callable[[Tuple, np.dtype], np.ndarray])
+        Allocates an empty batch.
+    light_index(light_type: LightType)
+        Gets the index of a light type in the batch.
+    reset()
+        Marks every light type as not collected, so the batch can be reused.
+    """
+
+    light_types: Tuple[LightType, ...]
+    camera_positions: Tuple[CameraPosition, ...]
+    frames: np.ndarray
+    exposure_times: np.ndarray
+    diaphragm_openings: np.ndarray
+    isos: np.ndarray
+    velocities: np.ndarray
+    displacements: np.ndarray
+    creation_dates: np.ndarray
+    collected: np.ndarray
+
+    @classmethod
+    def allocate(cls, light_types: Sequence[LightType], camera_positions: Sequence[CameraPosition],
+                 frame_shape: Tuple[int, ...], dtype: np.dtype = np.uint8,
+                 allocate_frames: Optional[Callable[[Tuple[int, ...], np.dtype], np.ndarray]] = None) -> 'CaptureBatch':
+        """
+        Allocates an empty batch.
+
+        Parameters
+        ----------
+        light_types : Sequence[LightType]
+            Light types of the batch, in capture order.
+        camera_positions : Sequence[CameraPosition]
+            Positions of the cameras.
+        frame_shape : Tuple[int, ...]
+            Shape of a picture (height, width, channels).
+        dtype : np.dtype, default=np.uint8
+            Type of the picture values.
+        allocate_frames : Callable[[Tuple[int, ...], np.dtype], np.ndarray], optional
+            Allocates the frames array from its shape and type, e.g. in shared memory (see SharedFrameRing).
+            Defaults to np.empty.
+
+        Returns
+        -------
+        CaptureBatch
+            The batch, with no picture collected.
+        """
+
+        shape = (len(light_types), len(camera_positions))
+        allocate_frames = allocate_frames or np.empty
+
+        return cls(light_types=tuple(light_types),
+                   camera_positions=tuple(camera_positions),
+                   frames=allocate_frames(shape + tuple(frame_shape), dtype),
+                   exposure_times=np.zeros(shape),
+                   diaphragm_openings=np.zeros(shape),
+                   isos=np.zeros(shape, dtype=np.int32),
+                   velocities=np.zeros(len(light_types)),
+                   displacements=np.zeros(len(light_types)),
+                   creation_dates=np.zeros(len(light_types)),
+                   collected=np.zeros(len(light_types), dtype=bool))
+
+    def light_index(self, light_type: LightType) -> int:
+        """
+        Gets the index of a light type in the batch.
+
+        Parameters
+        ----------
+        light_type : LightType
+            The light type.
+
+        Raises
+        ------
+        ValueError
+            When the light type is not part of the batch.
+
+        Returns
+        -------
+        int
+            Index of the light type in the arrays of the batch.
+        """
+
+        return self.light_types.index(light_type)
+
+    def reset(self) -> None:
+        """
+        Marks every light type as not collected, so the batch can be reused. The frames are not cleared: they are
+        overwritten by the next collection.
+
+        Returns
+        -------
+        None
+        """
+
+        self.collected[:] = False
+        self.velocities[:] = 0
+        self.displacements[:] = 0
+        self.creation_dates[:] = 0
@@ -1,3 +1,4 @@
 from .picture_not_ready_error import PictureNotReadyError
 from .picture_not_found_error import PictureNotFoundError
-from .cameras_not_ready_error import CamerasNotReadyError
\ No newline at end of file
+from .cameras_not_ready_error import CamerasNotReadyError
+from .frame_pool_exhausted_error import FramePoolExhaustedError
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""
+Exception FramePoolExhaustedError.
+"""
+
+
+class FramePoolExhaustedError(Exception):
+    """
+    Exception raises when no frame buffer of the pool was returned in time. Normally this occurs when the pictures
+    are not uploaded as fast as they are captured, or when a buffer was never released.
+    """
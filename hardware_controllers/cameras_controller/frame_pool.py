@@ -0,0 +1,298 @@
+"""
+FramePool keeps a fixed set of CaptureBatch frame buffers that are reused by every capture iteration.
+"""
+
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from threading import Condition
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .capture_batch import CaptureBatch
+from .errors import FramePoolExhaustedError
+
+
+@dataclass(slots=True)
+class _Lease:
+    """
+    Checkout of a batch: who holds it and since when.
+    """
+
+    checkout_time: float
+    holders: Counter = field(default_factory=Counter)
+
+
+class FramePool:
+    """
+    FramePool lends preallocated CaptureBatch buffers, so that sustained capturing does not allocate frames.
+
+    Notes
+    -----
+    Ownership is explicit: acquire checks a batch out for an owner, every other holder (e.g. each pipeline item
+    referencing the batch) retains it, and each of them releases it when done. The batch goes back to the pool, and
+    can be handed to the next capture, once its last holder released it. The batches are allocated lazily, up to the
+    size of the pool; acquire blocks while they are all checked out.
+
+    A batch that stays checked out longer than the leak timeout is reported as leaked, with its holders, by leaks()
+    and when acquire gives up.
+
+    Attributes
+    ----------
+    size : int
+        Maximum number of batches.
+    leak_timeout : float
+        Time after which a checked out batch is reported as leaked (seconds), None to never report it.
+    _allocate : Callable[[], CaptureBatch]
+        Allocates a new batch.
+    _free : List[CaptureBatch]
+        Batches ready to be checked out.
+    _leases : Dict[int, _Lease]
+        Lease of each checked out batch, by batch id.
+    _allocated : int
+        Number of batches allocated.
+    _condition : Condition
+        Condition notified when a batch is released.
+
+    Methods
+    -------
+    acquire(owner: str, timeout: float)
+        Checks a batch out of the pool.
+    retain(batch: CaptureBatch, owner: str)
+        Adds a holder to a checked out batch.
+    release(batch: CaptureBatch, owner: str)
+        Removes a holder of a batch, returning it to the pool after the last one.
+    leaks()
+        Gets the batches checked out for longer than the leak timeout.
+    stats()
+        Gets the pool occupancy statistics.
+    """
+
+    def __init__(self, allocate: Callable[[], CaptureBatch], size: int,
+                 leak_timeout: Optional[float] = None) -> None:
+        if size <= 0:
+            raise ValueError("a frame pool needs a size greater than 0")
+
+        self.size = size
+        self.leak_timeout = leak_timeout
+        self._allocate = allocate
+        self._free: List[CaptureBatch] = []
+        self._leases: Dict[int, _Lease] = {}
+        self._allocated = 0
+        self._bytes = 0
+        self._condition = Condition()
+        self._peak_in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._exhausted = 0
+
+    def acquire(self, owner: str, timeout: Optional[float] = None) -> CaptureBatch:
+        """
+        Checks a batch out of the pool, blocking while every batch is checked out.
+
+        Parameters
+        ----------
+        owner : str
+            Name of the first holder of the batch, reported if it leaks.
+        timeout : float, optional
+            Maximum time to wait for a batch (seconds), None to wait forever.
+
+        Raises
+        ------
+        FramePoolExhaustedError
+            When no batch was released before the timeout.
+
+        Returns
+        -------
+        CaptureBatch
+            The batch, with no picture collected.
+        """
+
+        with self._condition:
+            if not self._available():
+                self._waits += 1
+                if not self._condition.wait_for(self._available, timeout):
+                    self._exhausted += 1
+                    raise FramePoolExhaustedError(f'No frame buffer was released in {timeout} seconds, '
+                                                  f'checked out: {self._describe_leases(self._leases.values())}')
+
+            if self._free:
+                batch = self._free.pop()
+            else:
+                batch = self._allocate()
+                self._allocated += 1
+                self._bytes += batch.frames.nbytes
+
+            self._leases[id(batch)] = _Lease(time.monotonic(), Counter({owner: 1}))
+            self._checkouts += 1
+            self._peak_in_use = max(self._peak_in_use, len(self._leases))
+
+        batch.reset()
+        return batch
+
+    def retain(self, batch: CaptureBatch, owner: str) -> None:
+        """
+        Adds a holder to a checked out batch: the batch is not returned to the pool until it releases it.
+
+        Parameters
+        ----------
+        batch : CaptureBatch
+            A batch checked out of this pool.
+        owner : str
+            Name of the holder.
+
+        Raises
+        ------
+        ValueError
+            When the batch is not checked out of this pool.
+
+        Returns
+        -------
+        None
+        """
+
+        with self._condition:
+            self._lease(batch).holders[owner] += 1
+
+    def release(self, batch: CaptureBatch, owner: str) -> None:
+        """
+        Removes a holder of a batch. The batch is returned to the pool once its last holder released it.
+
+        Parameters
+        ----------
+        batch : CaptureBatch
+            A batch checked out of this pool.
+        owner : str
+            Name of the holder, as given to acquire or retain.
+
+        Raises
+        ------
+        ValueError
+            When the batch is not checked out of this pool, or not held by this owner (e.g. released twice).
+
+        Returns
+        -------
+        None
+        """
+
+        with self._condition:
+            lease = self._lease(batch)
+            if lease.holders[owner] <= 0:
+                raise ValueError(f'The frame buffer is not held by {owner}')
+
+            lease.holders[owner] -= 1
+            if lease.holders[owner] == 0:
+                del lease.holders[owner]
+
+            if not lease.holders:
+                del self._leases[id(batch)]
+                self._free.append(batch)
+                self._condition.notify()
+
+    def leaks(self) -> List[Tuple[Tuple[str, ...], float]]:
+        """
+        Gets the batches checked out for longer than the leak timeout.
+
+        Returns
+        -------
+        List[Tuple[Tuple[str, ...], float]]
+            Holders and checkout age (seconds) of each leaked batch, oldest first.
+        """
+
+        with self._condition:
+            return [(tuple(sorted(lease.holders)), age) for lease, age in self._leaked()]
+
+    def stats(self) -> dict:
+        """
+        Gets the pool occupancy statistics.
+
+        Returns
+        -------
+        dict
+            Size of the pool, batches allocated, free and checked out (current and peak), size of the allocated
+            frames (bytes), checkouts, checkouts that waited for a batch, checkouts that timed out, and leaked
+            batches.
+        """
+
+        with self._condition:
+            return {
+                'size': self.size,
+                'allocated': self._allocated,
+                'free': self.size - len(self._leases),
+                'in_use': len(self._leases),
+                'peak_in_use': self._peak_in_use,
+                'bytes': self._bytes,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'exhausted': self._exhausted,
+                'leaked': len(self._leaked())
+            }
+
+    def _available(self) -> bool:
+        """
+        Whether a batch can be checked out without waiting.
+
+        Returns
+        -------
+        bool
+            True if a batch is free or can still be allocated.
+        """
+
+        return bool(self._free) or self._allocated < self.size
+
+    def _lease(self, batch: CaptureBatch) -> _Lease:
+        """
+        Gets the lease of a checked out batch.
+
+        Parameters
+        ----------
+        batch : CaptureBatch
+            The batch.
+
+        Raises
+        ------
+        ValueError
+            When the batch is not checked out of this pool.
+
+        Returns
+        -------
+        _Lease
+            The lease of the batch.
+        """
+
+        lease = self._leases.get(id(batch))
+        if lease is None:
+            raise ValueError('The frame buffer is not checked out of this pool')
+
+        return lease
+
+    def _leaked(self) -> List[Tuple[_Lease, float]]:
+        """
+        Gets the leases older than the leak timeout.
+
+        Returns
+        -------
+        List[Tuple[_Lease, float]]
+            Each leaked lease and its age (seconds), oldest first.
+        """
+
+        if self.leak_timeout is None:
+            return []
+
+        now = time.monotonic()
+        leases = sorted(self._leases.values(), key=lambda lease: lease.checkout_time)
+        return [(lease, now - lease.checkout_time) for lease in leases
+                if now - lease.checkout_time > self.leak_timeout]
+
+    @staticmethod
+    def _describe_leases(leases) -> str:
+        """
+        Describes the holders and the age of leases, for the error messages.
+
+        Returns
+        -------
+        str
+            Holders and age of each lease.
+        """
+
+        now = time.monotonic()
+        return ', '.join(f'{"+".join(sorted(lease.holders))} ({now - lease.checkout_time:.1f}s)' for lease in leases)
@@ -0,0 +1,295 @@
+"""
+Picture sources of the CamerasController: where the simulated cameras get their frames from.
+"""
+
+from abc import ABC, abstractmethod
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Hashable, Optional, Tuple
+
+from .enumerators import LightType, CameraPosition
+from .errors import PictureNotFoundError
+
+
+class PictureSource(ABC):
+    """
+    PictureSource is the interface of the picture sources.
+
+    Methods
+    -------
+    get_picture(light_type: LightType, camera_position: CameraPosition)
+        Gets the decoded picture of a camera for a light type.
+    """
+
+    @abstractmethod
+    def get_picture(self, light_type: LightType, camera_position: CameraPosition) -> np.ndarray:
+        ...
+
+
+class FilePictureSource(PictureSource):
+    """
+    FilePictureSource decodes the pictures from the JPEG files of a directory on every call.
+
+    Attributes
+    ----------
+    _directory : Path
+        Directory of the pictures.
+
+    Methods
+    -------
+    get_picture(light_type: LightType, camera_position: CameraPosition)
+        Decodes the picture of a camera for a light type.
+    create_picture_filepath(light_type: LightType, camera_position: CameraPosition)
+        Creates the picture filepath using the light type and camera position information's.
+    """
+
+    _DEFAULT_DIRECTORY: Path = Path(__file__).parent.resolve().joinpath('pictures')
+
+    def __init__(self, directory: Optional[Path] = None) -> None:
+        self._directory = Path(directory) if directory is not None else FilePictureSource._DEFAULT_DIRECTORY
+
+    def get_picture(self, light_type: LightType, camera_position: CameraPosition) -> np.ndarray:
+        """
+        Decodes the picture of a camera for a light type.
+
+        Parameters
+        ----------
+        light_type : LightType
+            The light type that the client want to use.
+        camera_position : CameraPosition
+            The selected camera position of this picture.
+
+        Raises
+        ------
+        PictureNotFoundError
+            When the picture was not found in the expected directory.
+
+        Returns
+        -------
+        np.ndarray
+            The decoded picture.
+        """
+
+        from PIL import Image # imported on the first picture read
+
+        return np.array(Image.open(self.create_picture_filepath(light_type, camera_position)))
+
+    def create_picture_filepath(self, light_type: LightType, camera_position: CameraPosition) -> Path:
+        """
+        Creates the picture filepath using the light type and camera position information's.
+
+        Parameters
+        ----------
+        light_type : LightType
+            The light type that the client want to use.
+        camera_position : CameraPosition
+            The selected camera position of this picture.
+
+        Raises
+        ------
+        PictureNotFoundError
+            When the picture was not found in the expected directory.
+
+        Returns
+        -------
+        Path
+            The filepath of the selected picture.
+        """
+
+        filename = f'{camera_position.value}_picture_{light_type.value}.jpg'
+        filepath = self._directory.joinpath(filename)
+
+        if not filepath.is_file():
+            raise PictureNotFoundError(f'The picture was not found with the expected filepath {filepath}')
+
+        return filepath
+
+
+class CachedPictureSource(PictureSource):
+    """
+    CachedPictureSource keeps the decoded pictures of another source, so each picture is only decoded once.
+
+    Notes
+    -----
+    The cached pictures are read-only arrays shared by every caller, so they never need a defensive copy.
+    With a directory, the decoded pictures are also written there as raw frames (.npy files) and the cache holds
+    read-only memory maps of them: the operating system pages the frames in and out, and an evicted frame is mapped
+    again instead of being decoded again. The least recently used frames are evicted when the cached frames exceed
+    the byte budget.
+
+    Attributes
+    ----------
+    _source : PictureSource
+        Source of the pictures that are not cached.
+    _byte_budget : int
+        Maximum size of the cached frames (bytes), None for no limit.
+    _directory : Path
+        Directory of the raw frames, None to keep the frames in memory only.
+    _frames : OrderedDict
+        Cached frames, least recently used first.
+    _cached_bytes : int
+        Size of the cached frames (bytes).
+    _lock : Lock
+        Lock of the cache, shared by the capturing threads.
+    _loading_locks : Dict[Hashable, Lock]
+        Lock of each frame, held while it is loaded.
+    hits : int
+        Number of pictures served from the cache.
+    misses : int
+        Number of pictures loaded from the source or from the raw frames.
+    evictions : int
+        Number of frames evicted from the cache.
+
+    Methods
+    -------
+    get_picture(light_type: LightType, camera_position: CameraPosition)
+        Gets the decoded picture of a camera for a light type.
+    stats()
+        Gets the cache statistics.
+    """
+
+    def __init__(self, source: Optional[PictureSource] = None, byte_budget: Optional[int] = None,
+                 directory: Optional[Path] = None) -> None:
+        self._source = source or FilePictureSource()
+        self._byte_budget = byte_budget
+        self._directory = Path(directory) if directory is not None else None
+        self._frames: Dict[Hashable, np.ndarray] = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = Lock()
+        self._loading_locks: Dict[Hashable, Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self._directory is not None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+
+    def get_picture(self, light_type: LightType, camera_position: CameraPosition) -> np.ndarray:
+        """
+        Gets the decoded picture of a camera for a light type.
+
+        Parameters
+        ----------
+        light_type : LightType
+            The light type that the client want to use.
+        camera_position : CameraPosition
+            The selected camera position of this picture.
+
+        Returns
+        -------
+        np.ndarray
+            The decoded picture, read-only.
+        """
+
+        key = (light_type, camera_position)
+
+        with self._lock:
+            frame = self._cached_frame(key)
+            if frame is not None:
+                return frame
+            loading_lock = self._loading_locks.setdefault(key, Lock())
+
+        # frames of different cameras are loaded concurrently, a frame is only loaded once
+        with loading_lock:
+            with self._lock:
+                frame = self._cached_frame(key)
+                if frame is not None:
+                    return frame
+
+            frame = self._load_frame(key)
+
+            with self._lock:
+                self.misses += 1
+                self._frames[key] = frame
+                self._cached_bytes += frame.nbytes
+                self._evict()
+
+            return frame
+
+    def _cached_frame(self, key: Tuple[LightType, CameraPosition]) -> Optional[np.ndarray]:
+        """
+        Gets a frame from the cache, marking it as the most recently used.
+
+        Parameters
+        ----------
+        key : Tuple[LightType, CameraPosition]
+            Light type and camera position of the frame.
+
+        Returns
+        -------
+        Optional[np.ndarray]
+            The frame, None if it is not cached.
+        """
+
+        frame = self._frames.get(key)
+        if frame is not None:
+            self._frames.move_to_end(key)
+            self.hits += 1
+
+        return frame
+
+    def _load_frame(self, key: Tuple[LightType, CameraPosition]) -> np.ndarray:
+        """
+        Loads a frame from the raw frames, or decodes it from the source (and stores it as a raw frame).
+
+        Parameters
+        ----------
+        key : Tuple[LightType, CameraPosition]
+            Light type and camera position of the frame.
+
+        Returns
+        -------
+        np.ndarray
+            The frame, read-only.
+        """
+
+        if self._directory is None:
+            frame = self._source.get_picture(*key)
+            frame.setflags(write=False)
+            return frame
+
+        light_type, camera_position = key
+        filepath = self._directory.joinpath(f'{camera_position.value}_picture_{light_type.value}.npy')
+        if not filepath.is_file():
+            np.save(filepath, self._source.get_picture(*key))
+
+        return np.load(filepath, mmap_mode='r')
+
+    def _evict(self) -> None:
+        """
+        Evicts the least recently used frames until the cached frames fit in the byte budget. The most recently used
+        frame is always kept, even if it alone exceeds the budget.
+
+        Returns
+        -------
+        None
+        """
+
+        if self._byte_budget is None:
+            return
+
+        while self._cached_bytes > self._byte_budget and len(self._frames) > 1:
+            _, frame = self._frames.popitem(last=False)
+            self._cached_bytes -= frame.nbytes
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Gets the cache statistics.
+
+        Returns
+        -------
+        dict
+            Hits, misses, evictions, number and size (bytes) of the cached frames.
+        """
+
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'frames': len(self._frames),
+                'bytes': self._cached_bytes
+            }
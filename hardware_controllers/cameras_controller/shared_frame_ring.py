@@ -0,0 +1,232 @@
+"""
+SharedFrameRing keeps the frame buffers of the capture batches in shared memory, so that other processes can read the
+pictures in place.
+"""
+
+from multiprocessing import shared_memory
+from threading import Lock
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# blocks attached by the reading processes, by name, kept for the life of the process
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def attach_frame(name: str, offset: int, shape: Sequence[int], dtype: str) -> np.ndarray:
+    """
+    Get a picture written in the slot of a SharedFrameRing, from another process, without copying it.
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory block of the ring.
+    offset : int
+        Offset of the picture in the block (bytes), as given by SharedFrameRing.locate.
+    shape : Sequence[int]
+        Shape of the picture.
+    dtype : str
+        Type of the picture values.
+
+    Returns
+    -------
+    np.ndarray
+        Read-only view over the picture in the shared memory.
+    """
+
+    memory = _attached.get(name)
+    if memory is None:
+        memory = _attached[name] = shared_memory.SharedMemory(name=name)
+
+    picture = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=memory.buf, offset=offset)
+    picture.flags.writeable = False
+    return picture
+
+
+class SharedFrameRing:
+    """
+    SharedFrameRing is a block of shared memory split into frame slots, used as the frame buffers of the CaptureBatch
+    of a FramePool: the cameras write their pictures into the slots, and the encoder processes read them by slot,
+    without the frames being pickled or copied across the process boundary.
+
+    Notes
+    -----
+    The FramePool decides when a slot is reused: a batch is handed to the other processes by the location of its
+    frames, and goes back to the pool once its upload is acknowledged, so a slot is not overwritten while it is read.
+    The block is created with the first slot, its size depends on the pictures of the cameras.
+
+    Attributes
+    ----------
+    slots : int
+        Number of slots.
+    name : str
+        Name of the shared memory block, None before the first slot is allocated.
+    _memory : SharedMemory
+        The block.
+    _slot_shape : Tuple[int, ...]
+        Shape of the frames of a slot.
+    _slot_dtype : np.dtype
+        Type of the frame values.
+    _slot_bytes : int
+        Size of a slot (bytes).
+    _address : int
+        Address of the block in this process.
+    _allocated : int
+        Number of slots allocated.
+    _handoffs : np.ndarray
+        Number of pictures of each slot handed to another process.
+    _lock : Lock
+        Lock of the allocation and of the counters.
+
+    Methods
+    -------
+    allocate_frames(shape: Tuple[int, ...], dtype: np.dtype)
+        Allocates the frames of a batch in the next slot.
+    locate(picture: np.ndarray)
+        Gets the slot and the offset of a picture in the block.
+    record_handoff(slot: int)
+        Counts a picture of a slot handed to another process.
+    stats()
+        Gets the slot usage statistics.
+    close()
+        Destroys the block.
+    """
+
+    def __init__(self, slots: int) -> None:
+        if slots <= 0:
+            raise ValueError("a frame ring needs at least one slot")
+
+        self.slots = slots
+        self.name = None
+        self._memory: Optional[shared_memory.SharedMemory] = None
+        self._slot_shape: Optional[Tuple[int, ...]] = None
+        self._slot_dtype: Optional[np.dtype] = None
+        self._slot_bytes = 0
+        self._address = 0
+        self._allocated = 0
+        self._handoffs = np.zeros(slots, dtype=np.int64)
+        self._lock = Lock()
+
+    def allocate_frames(self, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        """
+        Allocates the frames of a batch in the next slot, to be given to CaptureBatch.allocate.
+
+        Parameters
+        ----------
+        shape : Tuple[int, ...]
+            Shape of the frames (lights, cameras, height, width, channels), the same for every slot.
+        dtype : np.dtype
+            Type of the frame values.
+
+        Raises
+        ------
+        ValueError
+            When every slot is allocated, or the frames do not have the shape of the previous slots.
+
+        Returns
+        -------
+        np.ndarray
+            The frames, in shared memory.
+        """
+
+        dtype = np.dtype(dtype)
+        with self._lock:
+            if self._memory is None:
+                self._slot_shape, self._slot_dtype = tuple(shape), dtype
+                self._slot_bytes = int(np.prod(shape)) * dtype.itemsize
+                self._memory = shared_memory.SharedMemory(create=True, size=self.slots * self._slot_bytes)
+                self.name = self._memory.name
+                self._address = np.frombuffer(self._memory.buf, dtype=np.uint8).ctypes.data
+            elif (tuple(shape), dtype) != (self._slot_shape, self._slot_dtype):
+                raise ValueError(f"frames of shape {tuple(shape)} do not fit the slots of shape {self._slot_shape}")
+            if self._allocated == self.slots:
+                raise ValueError(f"the {self.slots} slots of the frame ring are allocated")
+
+            slot = self._allocated
+            self._allocated += 1
+
+        return np.ndarray(self._slot_shape, dtype=self._slot_dtype, buffer=self._memory.buf,
+                          offset=slot * self._slot_bytes)
+
+    def locate(self, picture: np.ndarray) -> Optional[Tuple[int, int]]:
+        """
+        Gets the slot and the offset of a picture in the block, for attach_frame.
+
+        Parameters
+        ----------
+        picture : np.ndarray
+            A picture, usually a view over the frames of a batch.
+
+        Returns
+        -------
+        Tuple[int, int]
+            Slot of the picture and its offset in the block (bytes), None if it is not a contiguous picture of a slot.
+        """
+
+        if self._memory is None or not picture.flags.c_contiguous:
+            return None
+
+        offset = picture.__array_interface__['data'][0] - self._address
+        if offset < 0 or offset + picture.nbytes > self._allocated * self._slot_bytes:
+            return None
+
+        return offset // self._slot_bytes, offset
+
+    def record_handoff(self, slot: int) -> None:
+        """
+        Counts a picture of a slot handed to another process.
+
+        Parameters
+        ----------
+        slot : int
+            The slot.
+
+        Returns
+        -------
+        None
+        """
+
+        with self._lock:
+            self._handoffs[slot] += 1
+
+    def stats(self) -> dict:
+        """
+        Gets the slot usage statistics.
+
+        Returns
+        -------
+        dict
+            Number of slots, slots allocated, size of the block (bytes), pictures handed off, and pictures handed
+            off from each slot.
+        """
+
+        with self._lock:
+            handoffs = self._handoffs.tolist()
+            return {
+                'slots': self.slots,
+                'allocated': self._allocated,
+                'bytes': self.slots * self._slot_bytes,
+                'handoffs': sum(handoffs),
+                'slot_handoffs': handoffs
+            }
+
+    def close(self) -> None:
+        """
+        Destroys the block. The block stays mapped while batches of the pool still reference its slots: it is freed
+        once they are all garbage collected.
+
+        Returns
+        -------
+        None
+        """
+
+        with self._lock:
+            memory, self._memory = self._memory, None
+        if memory is None:
+            return
+
+        memory.unlink()
+        try:
+            memory.close()
+        except BufferError: # slots still referenced by the batches of the pool
+            pass
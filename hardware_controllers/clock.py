@@ -0,0 +1,165 @@
+"""
+Clocks shared by the hardware controllers and the weaving analyser.
+
+SystemClock is the wall clock. VirtualClock is a simulation clock that advances instantly, so that hours of
+production can be simulated in seconds, and deterministically when it is seeded.
+"""
+
+from abc import ABC, abstractmethod
+from random import Random
+from threading import Condition, Thread, current_thread
+import time
+from typing import Hashable, Optional
+
+
+class Clock(ABC):
+    """
+    Clock is the interface of the clocks: time, sleeps and random number generators.
+
+    Attributes
+    ----------
+    virtual : bool
+        Whether the clock is a simulation clock.
+
+    Methods
+    -------
+    monotonic()
+        Monotonic time (seconds).
+    time()
+        Time since the epoch (seconds).
+    sleep(seconds: float)
+        Sleep for a number of seconds.
+    random(stream: Hashable)
+        Random number generator of a component.
+    drive(thread: Thread)
+        Set the thread that drives the time forward.
+    """
+
+    virtual = False
+
+    @abstractmethod
+    def monotonic(self) -> float:
+        ...
+
+    @abstractmethod
+    def time(self) -> float:
+        ...
+
+    @abstractmethod
+    def sleep(self, seconds: float) -> None:
+        ...
+
+    @abstractmethod
+    def random(self, stream: Hashable) -> Random:
+        ...
+
+    def drive(self, thread: Optional[Thread] = None) -> None:
+        pass
+
+
+class SystemClock(Clock):
+    """
+    SystemClock is the wall clock.
+    """
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def random(self, stream: Hashable) -> Random:
+        return Random()
+
+
+class VirtualClock(Clock):
+    """
+    VirtualClock is a simulation clock: its time only moves when the driver thread sleeps, and then it jumps to the
+    end of the sleep instantly. The other threads sleep until the driver has moved the time past their deadline.
+
+    Notes
+    -----
+    The driver is the thread running the sampling loop (see WeavingAnalyser.start). While no driver is set, or once
+    it has finished, every sleep moves the time forward, which is what single-threaded code expects.
+    When the clock is seeded, every component gets its own random number generator, seeded from the clock seed and
+    the component name, so the simulation does not depend on the order in which the threads draw numbers.
+
+    Attributes
+    ----------
+    seed : Hashable
+        Seed of the random number generators, None for unseeded generators.
+    epoch : float
+        Time since the epoch at monotonic time 0 (seconds).
+    _now : float
+        Monotonic time (seconds).
+    _driver : Thread
+        Thread that drives the time forward.
+    _time_changed : Condition
+        Notified when the time moves forward.
+    """
+
+    virtual = True
+
+    _DRIVER_CHECK_INTERVAL = 0.05 # real seconds between checks that the driver is still alive
+
+    def __init__(self, seed: Optional[Hashable] = None, epoch: float = 0.0) -> None:
+        """
+        Initialize the VirtualClock.
+
+        Args:
+            seed (Hashable, optional): seed of the random number generators. Defaults to unseeded generators.
+            epoch (float): time since the epoch at monotonic time 0 (seconds).
+        """
+        self.seed = seed
+        self.epoch = epoch
+        self._now = 0.0
+        self._driver = None
+        self._time_changed = Condition()
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def time(self) -> float:
+        return self.epoch + self._now
+
+    def sleep(self, seconds: float) -> None:
+        with self._time_changed:
+            deadline = self._now + max(0.0, seconds)
+
+            while self._driver is not None and self._driver.is_alive() and self._driver is not current_thread():
+                if self._now >= deadline:
+                    return
+                self._time_changed.wait(VirtualClock._DRIVER_CHECK_INTERVAL)
+
+            self.advance(deadline - self._now)
+
+    def advance(self, seconds: float) -> None:
+        """
+        Move the time forward and wake up the threads whose sleep is over.
+
+        Args:
+            seconds (float): time to move forward (seconds).
+        """
+        with self._time_changed:
+            if seconds > 0:
+                self._now += seconds
+                self._time_changed.notify_all()
+
+    def random(self, stream: Hashable) -> Random:
+        if self.seed is None:
+            return Random()
+        return Random(f"{self.seed}:{stream}")
+
+    def drive(self, thread: Optional[Thread] = None) -> None:
+        """
+        Set the thread that drives the time forward.
+
+        Args:
+            thread (Thread, optional): driver thread. Defaults to the current thread.
+        """
+        with self._time_changed:
+            self._driver = thread or current_thread()
+            self._time_changed.notify_all()
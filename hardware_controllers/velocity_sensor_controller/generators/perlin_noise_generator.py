@@ -2,7 +2,8 @@
 PerlinNoiseGenerator is a generator of Perlin noise, which permits an appearance of realism to a wave.
 """
 
-from random import randint
+from random import Random
+from typing import Optional
 import noise
 
 
@@ -14,6 +15,8 @@ class PerlinNoiseGenerator:
     ----------
     t_increment : float, default=0.1
         Increment value for generating noise over time, by default 0.1.
+    random_generator : Random, optional
+        Random number generator of the initial time value, by default an unseeded one.
 
     Attributes
     ----------
@@ -28,9 +31,9 @@ class PerlinNoiseGenerator:
         Generates a new Perlin noise value.
     """
 
-    def __init__(self, t_increment: float = 0.1) -> None:
+    def __init__(self, t_increment: float = 0.1, random_generator: Optional[Random] = None) -> None:
         self._t_increment = t_increment
-        self._t_value = randint(0, 1000)
+        self._t_value = (random_generator or Random()).randint(0, 1000)
 
     def new_value(self) -> float:
         """
@@ -2,12 +2,11 @@
 VelocityGenerator simulates a fabric velocity sensor to be used by the VelocitySensorController.
 """
 
-from time import sleep
-from random import random, uniform as random_uniform
-from typing import Optional
+from typing import Iterator, Optional
 from threading import Thread
 
 from .perlin_noise_generator import PerlinNoiseGenerator
+from ...clock import Clock, SystemClock
 
 ONE_HERTZ = 1
 
@@ -16,14 +15,26 @@ class VelocityGenerator:
     """
     VelocityGenerator simulates a fabric velocity sensor using Perlin noise.
 
+    Notes
+    -----
+    On the system clock, a thread updates the velocity at _UPDATE_FREQUENCY. On a virtual clock, there is no thread:
+    the updates due since the previous reading are run when the velocity is read, so the velocity only depends on the
+    virtual time and on the clock seed.
+
     Attributes
     ----------
     _UPDATE_FREQUENCY : int
         Update frequency in Hz.
+    _clock : Clock
+        Clock of the updates.
+    _random : Random
+        Random number generator of the outliers.
     _noise_generator : PerlinNoiseGenerator
         Perlin noise generator instance.
     _sleep_time : float
-        Time to sleep between updates.
+        Time between updates.
+    _next_update_time : float
+        Monotonic deadline of the next update.
     _current_value : float
         Current fabric velocity value.
     _noisy_value : float
@@ -34,6 +45,8 @@ class VelocityGenerator:
         Flag to control the sensor thread.
     _speed_generator_thread : Thread
         Thread for generating speed values.
+    _updates : Iterator[None]
+        Velocity profile, one item per update.
 
     Methods
     -------
@@ -43,6 +56,10 @@ class VelocityGenerator:
         Get the noisy fabric velocity in cm/min.
     _generate_speed_values()
         Internal method for generating fabric speed values.
+    _profile()
+        Velocity profile, one item per update.
+    _catch_up()
+        Run the updates due on the virtual clock.
     stop_sensor()
         Stop the fabric velocity sensor.
     _ramp(iterations: int, target_value: float, add_noise: bool = True)
@@ -51,6 +68,8 @@ class VelocityGenerator:
         Simulate a constant velocity period.
     _add_noise()
         Add Perlin noise to the current value.
+    _wait_next_update()
+        Sleep until the next update deadline.
     """
 
     _UPDATE_FREQUENCY = 50 * ONE_HERTZ
@@ -61,14 +80,18 @@ class VelocityGenerator:
     _MINIMUM_OUTLIER_VALUE = -150
     _MAXIMUM_OUTLIER_VALUE = 400
 
-    def __init__(self) -> None:
-        self._noise_generator = PerlinNoiseGenerator()
+    def __init__(self, clock: Optional[Clock] = None) -> None:
+        self._clock = clock or SystemClock()
+        self._random = self._clock.random('velocity_generator')
+        self._noise_generator = PerlinNoiseGenerator(random_generator=self._clock.random('perlin_noise_generator'))
         self._sleep_time = 1 / VelocityGenerator._UPDATE_FREQUENCY
         self._current_value = 0
         self._noisy_value = 0
         self.noise_coefficient = 5
         self._run_thread = False
         self._speed_generator_thread: Optional[Thread] = None
+        self._next_update_time = 0.0
+        self._updates: Optional[Iterator[None]] = None
 
     def start_generator(self) -> None:
         """
@@ -79,6 +102,13 @@ class VelocityGenerator:
         None
         """
 
+        if self._clock.virtual:
+            if not self._run_thread:
+                self._run_thread = True
+                self._updates = self._updates or self._profile()
+                self._next_update_time = self._clock.monotonic()
+            return
+
         if not self._speed_generator_thread or not self._speed_generator_thread.is_alive():
             self._run_thread = True
             self._speed_generator_thread = Thread(target=self._generate_speed_values)
@@ -105,13 +135,15 @@ class VelocityGenerator:
             Returns the velocity of the fabric in cm/min.
         """
 
+        if self._clock.virtual and self._run_thread:
+            self._catch_up()
+
         if self._is_outlier():
             return self._get_outlier_velocity()
 
         return self._noisy_value
 
-    @staticmethod
-    def _is_outlier() -> bool:
+    def _is_outlier(self) -> bool:
         """
         Calculates if the velocity to get will be an outlier or not.
 
@@ -121,17 +153,16 @@ class VelocityGenerator:
             True if it will be an outlier, False otherwise.
         """
 
-        if random() < VelocityGenerator._OUTLIER_PROBABILITY:
+        if self._random.random() < VelocityGenerator._OUTLIER_PROBABILITY:
             return True
 
         return False
 
-    @staticmethod
-    def _get_outlier_velocity() -> float:
-        if random() < VelocityGenerator._OUTLIER_AT_ZERO_PROBABILITY:
+    def _get_outlier_velocity(self) -> float:
+        if self._random.random() < VelocityGenerator._OUTLIER_AT_ZERO_PROBABILITY:
             return 0
 
-        return random_uniform(VelocityGenerator._MINIMUM_OUTLIER_VALUE, VelocityGenerator._MAXIMUM_OUTLIER_VALUE)
+        return self._random.uniform(VelocityGenerator._MINIMUM_OUTLIER_VALUE, VelocityGenerator._MAXIMUM_OUTLIER_VALUE)
 
     def _generate_speed_values(self) -> None:
         """
@@ -142,13 +173,46 @@ class VelocityGenerator:
         None
         """
 
-        while self._run_thread:
-            self._ramp(iterations=500, target_value=VelocityGenerator._MAXIMUM_VALUE_WITHOUT_NOISE)
-            self._linear(iterations=500)
-            self._ramp(iterations=200, target_value=VelocityGenerator._MINIMUM_VALUE_WITHOUT_NOISE)
-            self._linear(iterations=200)
+        self._next_update_time = self._clock.monotonic()
+        self._updates = self._updates or self._profile()
+
+        for _ in self._updates:
+            if not self._run_thread:
+                break
+
+            self._wait_next_update()
+
+    def _profile(self) -> Iterator[None]:
+        """
+        Velocity profile: ramp up, constant, ramp down, constant, repeated forever.
+
+        Returns
+        -------
+        Iterator[None]
+            One item per update, yielded after the velocity is updated.
+        """
+
+        while True:
+            yield from self._ramp(iterations=500, target_value=VelocityGenerator._MAXIMUM_VALUE_WITHOUT_NOISE)
+            yield from self._linear(iterations=500)
+            yield from self._ramp(iterations=200, target_value=VelocityGenerator._MINIMUM_VALUE_WITHOUT_NOISE)
+            yield from self._linear(iterations=200)
 
-    def _ramp(self, iterations: int, target_value: float, add_noise: bool = True) -> None:
+    def _catch_up(self) -> None:
+        """
+        Run the updates due on the virtual clock.
+
+        Returns
+        -------
+        None
+        """
+
+        now = self._clock.monotonic()
+        while self._next_update_time <= now:
+            next(self._updates)
+            self._next_update_time += self._sleep_time
+
+    def _ramp(self, iterations: int, target_value: float, add_noise: bool = True) -> Iterator[None]:
         """
         Simulate a ramping velocity change.
 
@@ -160,6 +224,11 @@ class VelocityGenerator:
             Target value to ramp to.
         add_noise : bool, default=True
             Whether to add noise during the ramp.
+
+        Returns
+        -------
+        Iterator[None]
+            One item per update.
         """
 
         slope = (target_value - self._current_value) / iterations
@@ -170,9 +239,9 @@ class VelocityGenerator:
             if add_noise:
                 self._add_noise()
 
-            sleep(self._sleep_time)
+            yield
 
-    def _linear(self, iterations: int, add_noise: bool = True) -> None:
+    def _linear(self, iterations: int, add_noise: bool = True) -> Iterator[None]:
         """
         Simulate a constant velocity period.
 
@@ -182,13 +251,18 @@ class VelocityGenerator:
             Number of iterations for the linear period.
         add_noise : bool, default=True
             Whether to add noise during the linear period.
+
+        Returns
+        -------
+        Iterator[None]
+            One item per update.
         """
 
         for _ in range(iterations):
             if add_noise:
                 self._add_noise()
 
-            sleep(self._sleep_time)
+            yield
 
     def _add_noise(self) -> None:
         """
@@ -200,3 +274,22 @@ class VelocityGenerator:
         """
 
         self._noisy_value = self._current_value + self._noise_generator.new_value() * self.noise_coefficient
+
+    def _wait_next_update(self) -> None:
+        """
+        Sleep until the next update deadline. Deadlines are absolute, so the time spent updating does not make the
+        update rate drift; if the generator is late by more than a period, the deadlines restart from now instead of
+        rushing through the late updates.
+
+        Returns
+        -------
+        None
+        """
+
+        self._next_update_time += self._sleep_time
+        delay = self._next_update_time - self._clock.monotonic()
+
+        if delay > 0:
+            self._clock.sleep(delay)
+        elif delay < -self._sleep_time:
+            self._next_update_time = self._clock.monotonic()
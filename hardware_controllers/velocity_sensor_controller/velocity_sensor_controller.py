@@ -2,7 +2,10 @@
 VelocitySensorController is a fake controller to give linear velocity of fabric using a cool Perlin Noise.
 """
 
+from typing import Optional
+
 from .generators import VelocityGenerator
+from ..clock import Clock
 
 
 class VelocitySensorController:
@@ -25,8 +28,8 @@ class VelocitySensorController:
         Get the current fabric velocity.
     """
 
-    def __init__(self) -> None:
-        self._velocity_generator = VelocityGenerator()
+    def __init__(self, clock: Optional[Clock] = None) -> None:
+        self._velocity_generator = VelocityGenerator(clock)
 
     def start_sensor(self) -> None:
         """
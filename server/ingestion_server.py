@@ -0,0 +1,907 @@
+"""
+Production ingestion server: the routes of server.py (/ping, /fabric_movement, /pictures_batch) served by worker
+processes, each running a minimal HTTP/1.1 server with keep-alive connections on an asyncio event loop.
+
+The decoded requests are batched on the event loop and handed, a batch at a time, to an in-process queue read by
+the analysis backend thread of the worker. The logs are JSON lines, written by a background thread.
+
+usage: python -m server.ingestion_server [--host 127.0.0.1] [--port 5000] [--workers N] [--batch-size 64]
+                                         [--batch-latency 0.05] [--queue-size 1024] [--access-log] [--log-file path]
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http import HTTPStatus
+from multiprocessing.synchronize import Event
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl
+
+from weaving_analyser.log_pipeline import BufferedRotatingFileHandler, LogWriter
+from .server import decode_fabric_movement, decode_pictures_batch, decode_pictures_stream, BATCH_CONTENT_TYPE, \
+    BATCH_STREAM_CONTENT_TYPE
+
+# Worker processes sharing the listening socket, one event loop each
+WORKERS = os.cpu_count() or 1
+
+# Requests accepted by a worker are handed to its analysis backend in batches of up to BATCH_SIZE requests, at most
+# BATCH_LATENCY seconds after the first one. Requests are rejected (503) while QUEUE_SIZE batches wait for the backend
+BATCH_SIZE = 64
+BATCH_LATENCY = 0.05
+QUEUE_SIZE = 1024
+
+# Threads of a worker decoding the pictures batches, off the event loop
+DECODE_THREADS = 2
+
+# Largest request head and body accepted (bytes)
+MAX_HEAD_BYTES = 64 * 1024
+MAX_BODY_BYTES = 512 * 1024 * 1024
+
+# Seconds between two statistics records of a worker. Records waiting for the log writer, written LOG_BATCH_SIZE at
+# a time, and rotation of the log file
+STATS_PERIOD = 10
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 256
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+logger = logging.getLogger('ingestion_server')
+logger.setLevel(logging.INFO)
+logger.propagate = False
+log_writer = LogWriter(LOG_QUEUE_SIZE, LOG_BATCH_SIZE) # the records are queued, never written by the event loop
+logger.addHandler(log_writer.queue_handler)
+
+# routes and their method, as in server.py
+ROUTES = {'/ping': 'GET', '/fabric_movement': 'POST', '/pictures_batch': 'POST'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a JSON line: time, level, worker pid and event, plus the fields given with
+    extra={"fields": {...}}.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {'time': record.created, 'level': record.levelname, 'worker': record.process,
+                    'event': record.getMessage()}
+        document.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            document['exception'] = self.formatException(record.exc_info)
+        return json.dumps(document)
+
+
+def configure_logging(log_file: Optional[str] = None) -> None:
+    """
+    Write the records of the server as JSON lines, to stderr or to a rotating log file.
+
+    Parameters
+    ----------
+    log_file : str, optional
+        Path of the log file, defaults to stderr.
+
+    Returns
+    -------
+    None
+    """
+
+    def create() -> logging.Handler:
+        if log_file is None:
+            handler = logging.StreamHandler(sys.stderr)
+        else:
+            os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+            handler = BufferedRotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+        handler.setFormatter(JsonFormatter())
+        return handler
+
+    log_writer.add_logger(logger, create)
+
+
+class HTTPError(Exception):
+    """
+    Request that is answered with an error status, the connection is closed after it.
+
+    Attributes
+    ----------
+    status : int
+        Status of the response.
+    """
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def response_head(status: int, keep_alive: bool) -> bytes:
+    """
+    Build the head of an empty response.
+
+    Parameters
+    ----------
+    status : int
+        Status of the response.
+    keep_alive : bool
+        Whether the connection is kept open after the response.
+
+    Returns
+    -------
+    bytes
+        Status line and headers.
+    """
+
+    head = f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n'
+    if status not in (204, 304):
+        head += 'Content-Length: 0\r\n'
+    if not keep_alive:
+        head += 'Connection: close\r\n'
+    return (head + '\r\n').encode('latin-1')
+
+
+class RequestBatcher:
+    """
+    RequestBatcher collects the requests decoded on the event loop and puts them in the analysis queue in batches,
+    so the backend thread is woken once per batch rather than once per request.
+
+    Attributes
+    ----------
+    analysis_queue : queue.Queue
+        Queue of the analysis backend, holding lists of (route, payload) requests.
+    batch_size : int
+        Maximum number of requests in a batch.
+    batch_latency : float
+        Maximum time a request waits for its batch to be queued (seconds).
+    accepted : int
+        Number of requests accepted.
+    rejected : int
+        Number of requests rejected because the analysis queue was full.
+    batches : int
+        Number of batches queued.
+    _pending : List[Tuple[str, object]]
+        Requests of the next batch.
+    _timer : asyncio.TimerHandle
+        Queues the next batch once its first request waited batch_latency.
+
+    Methods
+    -------
+    add(route: str, payload: object)
+        Add a request to the next batch.
+    flush()
+        Queue the next batch now.
+    stats()
+        Get the number of requests accepted and rejected and of batches queued.
+    """
+
+    def __init__(self, analysis_queue: queue.Queue, batch_size: int = BATCH_SIZE,
+                 batch_latency: float = BATCH_LATENCY) -> None:
+        self.analysis_queue = analysis_queue
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.accepted = 0
+        self.rejected = 0
+        self.batches = 0
+        self._pending: List[Tuple[str, object]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, route: str, payload: object) -> bool:
+        """
+        Add a request to the next batch, from the event loop.
+
+        Parameters
+        ----------
+        route : str
+            Route of the request.
+        payload : object
+            Decoded request.
+
+        Returns
+        -------
+        bool
+            Whether the request was accepted, False when the analysis queue is full.
+        """
+
+        if self.analysis_queue.full():
+            self.rejected += 1
+            return False
+
+        self.accepted += 1
+        self._pending.append((route, payload))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_latency, self.flush)
+        return True
+
+    def flush(self) -> None:
+        """
+        Queue the next batch now.
+
+        Returns
+        -------
+        None
+        """
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        try:
+            self.analysis_queue.put_nowait(batch)
+            self.batches += 1
+        except queue.Full: # the queue is shared with another producer
+            self.accepted -= len(batch)
+            self.rejected += len(batch)
+            logger.warning('batch dropped', extra={'fields': {'requests': len(batch)}})
+
+    def stats(self) -> dict:
+        """
+        Get the number of requests accepted and rejected and of batches queued.
+
+        Returns
+        -------
+        dict
+            Requests accepted, rejected, waiting for their batch, and batches queued.
+        """
+
+        return {'accepted': self.accepted, 'rejected': self.rejected, 'pending': len(self._pending),
+                'batches': self.batches}
+
+
+class AnalysisBackend:
+    """
+    AnalysisBackend is the thread of a worker reading the batches of requests from the analysis queue, and handing
+    them to the analysis.
+
+    Attributes
+    ----------
+    analysis_queue : queue.Queue
+        Batches of (route, payload) requests.
+    analyse : Callable[[List[Tuple[str, object]]], None]
+        Analysis of a batch, None to only count the requests.
+    counts : Dict[str, int]
+        Number of batches, requests, fabric movement samples and pictures analysed.
+
+    Methods
+    -------
+    start()
+        Start the backend thread.
+    stop()
+        Analyse the batches still queued and stop the backend thread.
+    stats()
+        Get the analysis counts.
+    """
+
+    _STOP = object()
+
+    def __init__(self, analysis_queue: queue.Queue,
+                 analyse: Optional[Callable[[List[Tuple[str, object]]], None]] = None) -> None:
+        self.analysis_queue = analysis_queue
+        self.analyse = analyse
+        self.counts = {'batches': 0, 'requests': 0, 'samples': 0, 'pictures': 0}
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+
+    def start(self) -> None:
+        """
+        Start the backend thread.
+
+        Returns
+        -------
+        None
+        """
+
+        self._thread = Thread(target=self._run, name='analysis_backend', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Analyse the batches still queued and stop the backend thread.
+
+        Returns
+        -------
+        None
+        """
+
+        if self._thread is None:
+            return
+        self.analysis_queue.put(AnalysisBackend._STOP) # blocks only while the queue is full
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        """
+        Get the analysis counts.
+
+        Returns
+        -------
+        dict
+            Batches, requests, samples and pictures analysed, and batches waiting in the queue.
+        """
+
+        with self._lock:
+            return {**self.counts, 'queued': self.analysis_queue.qsize()}
+
+    def _run(self) -> None:
+        """
+        Analyse the queued batches until stopped.
+
+        Returns
+        -------
+        None
+        """
+
+        while True:
+            batch = self.analysis_queue.get()
+            if batch is AnalysisBackend._STOP:
+                return
+
+            samples = sum(len(payload) for route, payload in batch if route == '/fabric_movement')
+            pictures = sum(len(light['pictures']) for route, payload in batch if route == '/pictures_batch'
+                           for light in payload['lights'])
+            with self._lock:
+                self.counts['batches'] += 1
+                self.counts['requests'] += len(batch)
+                self.counts['samples'] += samples
+                self.counts['pictures'] += pictures
+
+            if self.analyse is not None:
+                try:
+                    self.analyse(batch)
+                except Exception:
+                    logger.exception('analysis failed', extra={'fields': {'requests': len(batch)}})
+
+
+def decode_pictures(content_type: str, body: bytes) -> Optional[dict]:
+    """
+    Decode the body of a pictures batch request, by its content type.
+
+    Parameters
+    ----------
+    content_type : str
+        Content type of the body, without its parameters.
+    body : bytes
+        Body of the request.
+
+    Raises
+    ------
+    ValueError
+        When the body is malformed.
+
+    Returns
+    -------
+    dict
+        The batch, as decode_pictures_batch returns it, None for another content type (accepted as is, like
+        server.py does).
+    """
+
+    if content_type == BATCH_CONTENT_TYPE:
+        return decode_pictures_batch(body)
+    if content_type == BATCH_STREAM_CONTENT_TYPE:
+        return decode_pictures_stream(io.BytesIO(body))
+    return None
+
+
+class IngestionServer:
+    """
+    IngestionServer serves the routes of the API on the event loop of a worker: the requests are read and answered
+    on keep-alive connections, the fabric movements are decoded on the loop, the pictures batches by a pool of
+    decoding threads, and every accepted request is queued for the analysis backend by the RequestBatcher.
+
+    A request is answered once it is queued, not once it is analysed: 503 tells the client to retry when the
+    analysis queue is full.
+
+    Attributes
+    ----------
+    analysis_queue : queue.Queue
+        Batches of requests waiting for the analysis backend.
+    batcher : RequestBatcher
+        Batches the accepted requests.
+    backend : AnalysisBackend
+        Analyses the batches.
+    max_body_bytes : int
+        Largest request body accepted (bytes).
+    access_log : bool
+        Whether every request is logged.
+    stats_period : float
+        Seconds between two statistics records, None to log none.
+    responses : Dict[int, int]
+        Number of responses by status.
+    _decoder : ThreadPoolExecutor
+        Decodes the pictures batches.
+    _connections : Set[asyncio.StreamWriter]
+        Open connections, closed when the server stops.
+    _loop : asyncio.AbstractEventLoop
+        Event loop of the server once it is serving.
+    _stopped : asyncio.Event
+        Set to stop the server.
+
+    Methods
+    -------
+    serve(sock: socket.socket, handle_signals: bool, ready: Callable[[], None])
+        Serve the requests of a listening socket until stopped.
+    stop()
+        Stop the server, from any thread.
+    handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter)
+        Answer the requests of a connection until it is closed.
+    handle_request(method: str, path: str, headers: Dict[str, str], body: bytes)
+        Route a request.
+    stats()
+        Get the responses, batching and analysis statistics.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, batch_latency: float = BATCH_LATENCY,
+                 queue_size: int = QUEUE_SIZE, decode_threads: int = DECODE_THREADS,
+                 max_body_bytes: int = MAX_BODY_BYTES, access_log: bool = False,
+                 stats_period: Optional[float] = STATS_PERIOD,
+                 analyse: Optional[Callable[[List[Tuple[str, object]]], None]] = None) -> None:
+        self.analysis_queue = queue.Queue(queue_size)
+        self.batcher = RequestBatcher(self.analysis_queue, batch_size, batch_latency)
+        self.backend = AnalysisBackend(self.analysis_queue, analyse)
+        self.max_body_bytes = max_body_bytes
+        self.access_log = access_log
+        self.stats_period = stats_period
+        self.responses: Dict[int, int] = {}
+        self._decoder = ThreadPoolExecutor(decode_threads, thread_name_prefix='pictures_decoder_')
+        self._connections: Set[asyncio.StreamWriter] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: Optional[asyncio.Event] = None
+
+    async def serve(self, sock: socket.socket, handle_signals: bool = False,
+                    ready: Optional[Callable[[], None]] = None) -> None:
+        """
+        Serve the requests of a listening socket until stopped, then queue the last batch and wait for the backend
+        to analyse every queued batch.
+
+        Parameters
+        ----------
+        sock : socket.socket
+            Listening socket, possibly shared with other workers.
+        handle_signals : bool
+            Whether SIGTERM stops the server.
+        ready : Callable[[], None], optional
+            Called once the server accepts connections, and SIGTERM stops it cleanly.
+
+        Returns
+        -------
+        None
+        """
+
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if handle_signals:
+            self._loop.add_signal_handler(signal.SIGTERM, self._stopped.set)
+
+        self.backend.start()
+        server = await asyncio.start_server(self.handle_connection, sock=sock, limit=MAX_HEAD_BYTES)
+        if ready is not None:
+            ready()
+        stats_task = asyncio.create_task(self._log_stats()) if self.stats_period else None
+        logger.info('worker started', extra={'fields': {'address': list(sock.getsockname()[:2])}})
+        try:
+            await self._stopped.wait()
+        finally:
+            server.close()
+            if stats_task is not None:
+                stats_task.cancel()
+            for writer in list(self._connections):
+                writer.close()
+            await server.wait_closed()
+            self.batcher.flush()
+            await self._loop.run_in_executor(None, self.backend.stop)
+            self._decoder.shutdown()
+            logger.info('worker stopped', extra={'fields': self.stats()})
+
+    def stop(self) -> None:
+        """
+        Stop the server, from any thread.
+
+        Returns
+        -------
+        None
+        """
+
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer the requests of a connection until the client closes it, asks for it to be closed, or sends a
+        malformed request.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            Reads the requests.
+        writer : asyncio.StreamWriter
+            Writes the responses.
+
+        Returns
+        -------
+        None
+        """
+
+        self._connections.add(writer)
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError: # closed by the client between two requests
+                    return
+                start = time.perf_counter()
+                method, path, body_size = '-', '-', 0
+                try:
+                    method, path, version, headers = self._parse_head(head)
+                    keep_alive = headers.get('connection', '').lower() != 'close' if version == 'HTTP/1.1' \
+                        else headers.get('connection', '').lower() == 'keep-alive'
+                    if headers.get('expect', '').lower() == '100-continue':
+                        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                    body = await self._read_body(reader, headers)
+                    body_size = len(body)
+                    status = await self.handle_request(method, path, headers, body)
+                except HTTPError as e:
+                    status, keep_alive = e.status, False
+                    logger.warning('bad request', extra={'fields': {'status': e.status, 'reason': str(e)}})
+
+                self.responses[status] = self.responses.get(status, 0) + 1
+                writer.write(response_head(status, keep_alive))
+                await writer.drain()
+                if self.access_log:
+                    logger.info('request', extra={'fields': {'method': method, 'path': path, 'status': status,
+                                                             'bytes': body_size,
+                                                             'duration': time.perf_counter() - start}})
+        except asyncio.LimitOverrunError:
+            writer.write(response_head(431, False))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass # closed by the client during a request
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def handle_request(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> int:
+        """
+        Route a request: decode it, and queue it for the analysis backend.
+
+        Parameters
+        ----------
+        method : str
+            Method of the request.
+        path : str
+            Path of the request, without its query.
+        headers : Dict[str, str]
+            Headers of the request, by lower case name.
+        body : bytes
+            Body of the request.
+
+        Returns
+        -------
+        int
+            Status of the response.
+        """
+
+        route_method = ROUTES.get(path)
+        if route_method is None:
+            return 404
+        if method != route_method:
+            return 405
+        if path == '/ping':
+            return 204
+
+        content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+        try:
+            if path == '/fabric_movement':
+                if content_type == 'application/json' or content_type.endswith('+json'):
+                    payload = decode_fabric_movement(json.loads(body))
+                else:
+                    payload = decode_fabric_movement(dict(parse_qsl(body.decode('latin-1'))))
+            else:
+                payload = await self._loop.run_in_executor(self._decoder, decode_pictures, content_type, body)
+                if payload is None:
+                    return 201
+        except (ValueError, KeyError, TypeError) as e: # json.JSONDecodeError is a ValueError
+            logger.warning('malformed request', extra={'fields': {'path': path, 'reason': str(e)}})
+            return 400
+
+        return 201 if self.batcher.add(path, payload) else 503
+
+    def stats(self) -> dict:
+        """
+        Get the responses, batching and analysis statistics.
+
+        Returns
+        -------
+        dict
+            Responses by status, requests accepted and rejected by the batcher, and analysis counts.
+        """
+
+        return {'responses': dict(self.responses), 'batcher': self.batcher.stats(), 'analysis': self.backend.stats(),
+                'connections': len(self._connections), 'log_records_dropped': log_writer.stats()['dropped']}
+
+    @staticmethod
+    def _parse_head(head: bytes) -> Tuple[str, str, str, Dict[str, str]]:
+        """
+        Parse the request line and the headers of a request.
+
+        Parameters
+        ----------
+        head : bytes
+            Request line and headers, ending with an empty line.
+
+        Raises
+        ------
+        HTTPError
+            400 when the head is malformed.
+
+        Returns
+        -------
+        Tuple[str, str, str, Dict[str, str]]
+            Method, path without the query, HTTP version, and headers by lower case name.
+        """
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise HTTPError(400, f'malformed request line {lines[0]!r}')
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise HTTPError(505, f'unsupported version {version!r}')
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, separator, value = line.partition(':')
+                if not separator:
+                    raise HTTPError(400, f'malformed header {line!r}')
+                headers[name.strip().lower()] = value.strip()
+
+        return method, target.split('?', 1)[0], version, headers
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+        """
+        Read the body of a request, delimited by its Content-Length or sent with chunked transfer-encoding.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            Reads the request.
+        headers : Dict[str, str]
+            Headers of the request, by lower case name.
+
+        Raises
+        ------
+        HTTPError
+            400 when the body is malformed, 413 when it is larger than max_body_bytes.
+
+        Returns
+        -------
+        bytes
+            The body, empty without one.
+        """
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks, size = [], 0
+            while True:
+                try:
+                    chunk_size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                except ValueError:
+                    raise HTTPError(400, 'malformed chunk size')
+                if chunk_size == 0:
+                    break
+                size += chunk_size
+                if size > self.max_body_bytes:
+                    raise HTTPError(413, f'body larger than {self.max_body_bytes} bytes')
+                chunks.append(await reader.readexactly(chunk_size))
+                await reader.readexactly(2)
+            while await reader.readuntil(b'\r\n') != b'\r\n': # trailers
+                pass
+            return b''.join(chunks)
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, 'malformed Content-Length')
+        if length > self.max_body_bytes:
+            raise HTTPError(413, f'body larger than {self.max_body_bytes} bytes')
+        return await reader.readexactly(length) if length > 0 else b''
+
+    async def _log_stats(self) -> None:
+        """
+        Log the statistics of the worker every stats_period seconds.
+
+        Returns
+        -------
+        None
+        """
+
+        while True:
+            await asyncio.sleep(self.stats_period)
+            logger.info('stats', extra={'fields': self.stats()})
+
+
+def bind_socket(host: str, port: int, backlog: int = 1024) -> socket.socket:
+    """
+    Create the listening socket shared by the workers.
+
+    Parameters
+    ----------
+    host : str
+        Address to listen on.
+    port : int
+        Port to listen on, 0 for an ephemeral port.
+    backlog : int
+        Connections waiting to be accepted.
+
+    Returns
+    -------
+    socket.socket
+        The listening socket.
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+@dataclass
+class IngestionWorker:
+    """
+    Worker process of the ingestion server.
+
+    Attributes
+    ----------
+    process : multiprocessing.Process
+        The process, running run_worker.
+    ready : multiprocessing.synchronize.Event
+        Set once the worker serves, from then on SIGTERM stops it after it analysed its queued requests. Before,
+        SIGTERM would kill it.
+    """
+    process: multiprocessing.Process
+    ready: Event
+
+
+def run_worker(sock: socket.socket, ready: Event, options: dict, log_file: Optional[str] = None) -> None:
+    """
+    Run a worker: serve the requests of the shared socket until SIGTERM.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Listening socket shared by the workers.
+    ready : multiprocessing.synchronize.Event
+        Set once the worker serves and handles SIGTERM.
+    options : dict
+        Arguments of the IngestionServer.
+    log_file : str, optional
+        Path of the log file, defaults to stderr.
+
+    Returns
+    -------
+    None
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the parent stops the workers
+    configure_logging(log_file)
+    try:
+        asyncio.run(IngestionServer(**options).serve(sock, handle_signals=True, ready=ready.set))
+    finally:
+        log_writer.stop()
+
+
+def start_workers(sock: socket.socket, workers: int, options: dict,
+                  log_file: Optional[str] = None) -> List[IngestionWorker]:
+    """
+    Start the worker processes on a shared listening socket.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Listening socket.
+    workers : int
+        Number of worker processes.
+    options : dict
+        Arguments of the IngestionServer of each worker.
+    log_file : str, optional
+        Path of the log file of the workers, defaults to stderr.
+
+    Returns
+    -------
+    List[IngestionWorker]
+        The workers, stopped with stop_workers.
+    """
+
+    context = multiprocessing.get_context('spawn')
+    started = []
+    for i in range(workers):
+        ready = context.Event()
+        process = context.Process(target=run_worker, args=(sock, ready, options, log_file),
+                                  name=f'ingestion_worker_{i}')
+        process.start()
+        started.append(IngestionWorker(process, ready))
+    return started
+
+
+def stop_workers(workers: List[IngestionWorker], timeout: float = 10) -> None:
+    """
+    Stop the worker processes, each one once it analysed its queued requests.
+
+    Notes
+    -----
+    A worker still starting is waited for until it is ready: SIGTERM would kill it before it handles the signal.
+
+    Parameters
+    ----------
+    workers : List[IngestionWorker]
+        The workers.
+    timeout : float
+        Time given to each worker to start, then to stop, before it is killed (seconds).
+
+    Returns
+    -------
+    None
+    """
+
+    deadline = time.monotonic() + timeout
+    for worker in workers:
+        while not worker.ready.wait(0.05) and worker.process.is_alive() and time.monotonic() < deadline:
+            pass
+        if worker.process.is_alive():
+            worker.process.terminate()
+    for worker in workers:
+        worker.process.join(timeout)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run the ingestion server.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=5000, help='port to listen on')
+    parser.add_argument('-w', '--workers', type=int, default=WORKERS, help='worker processes')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='requests per analysis batch')
+    parser.add_argument('--batch-latency', type=float, default=BATCH_LATENCY,
+                        help='seconds a request waits for its analysis batch')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help='analysis batches waiting in each worker before the requests are rejected')
+    parser.add_argument('--access-log', action='store_true', help='log every request')
+    parser.add_argument('--log-file', help='write the JSON logs to this rotating file instead of stderr')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    sock = bind_socket(args.host, args.port)
+    options = {'batch_size': args.batch_size, 'batch_latency': args.batch_latency, 'queue_size': args.queue_size,
+               'access_log': args.access_log}
+    workers = start_workers(sock, args.workers, options, args.log_file)
+    print(f'Ingestion server listening on {args.host}:{sock.getsockname()[1]} with {args.workers} workers',
+          file=sys.stderr)
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    try:
+        while not stopping and any(worker.process.is_alive() for worker in workers):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(workers)
+        sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,28 +2,340 @@
 Server that will process the data from the pictures and the fabric movement.
 """
 
+import io
+import json
+import struct
+import zlib
+from typing import BinaryIO, Iterator
+
+import numpy as np
+from PIL import Image
 from flask import Flask, request, make_response
 
+try:
+    import zstandard
+except ImportError: # optional dependency, only needed by the zstd codec
+    zstandard = None
+
 
 app = Flask(__name__)
 
+BATCH_CONTENT_TYPE = 'application/x-weaving-batch'
+BATCH_STREAM_CONTENT_TYPE = 'application/x-weaving-batch-stream'
+HEADER_LENGTH = struct.Struct('!I')
+IMAGE_CODECS = ('png', 'jpeg', 'webp')
+
+# Largest header and picture buffer of a streamed pictures batch (bytes): their sizes are sent by the client, they are
+# checked before the buffers are allocated
+MAX_STREAM_HEADER_BYTES = 64 * 1024
+MAX_PICTURE_BYTES = 512 * 1024 * 1024
+
+
+def decode_picture(buffer: memoryview, codec: str, shape: list, dtype: np.dtype) -> np.ndarray:
+    """
+    Decode a picture buffer of a pictures batch.
+
+    Notes
+    -----
+    Raw pictures are read-only views over the body. zlib and zstd buffers hold compressed raw pictures,
+    png, jpeg and webp buffers hold image files.
+
+    Parameters
+    ----------
+    buffer : memoryview
+        Encoded picture.
+    codec : str
+        Codec of the picture (raw, zlib, zstd, png, jpeg or webp).
+    shape : list
+        Shape of the decoded picture.
+    dtype : np.dtype
+        Type of the decoded picture values.
+
+    Raises
+    ------
+    ValueError
+        When the codec is not supported or the buffer does not hold a picture of this shape.
+
+    Returns
+    -------
+    np.ndarray
+        The decoded picture.
+    """
+
+    if codec == 'raw':
+        return np.frombuffer(buffer, dtype=dtype, count=len(buffer) // dtype.itemsize).reshape(shape)
+
+    if codec == 'zlib':
+        try:
+            return np.frombuffer(zlib.decompress(buffer), dtype=dtype).reshape(shape)
+        except zlib.error as e:
+            raise ValueError(f'Corrupted zlib picture: {e}')
+
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd pictures need the zstandard package')
+        try:
+            return np.frombuffer(zstandard.ZstdDecompressor().decompress(buffer), dtype=dtype).reshape(shape)
+        except zstandard.ZstdError as e:
+            raise ValueError(f'Corrupted zstd picture: {e}')
+
+    if codec in IMAGE_CODECS:
+        try:
+            picture = np.asarray(Image.open(io.BytesIO(buffer)))
+        except OSError as e:
+            raise ValueError(f'Corrupted {codec} picture: {e}')
+        return picture.astype(dtype, copy=False).reshape(shape)
+
+    raise ValueError(f'Unsupported picture codec {codec}')
+
+
+def decode_pictures_batch(body: bytes) -> dict:
+    """
+    Decode a pictures batch encoded in the binary batch format.
+
+    Notes
+    -----
+    Body layout: [header length: uint32, big endian][JSON header][picture buffers].
+    Raw pictures are rebuilt as read-only views over the body, nothing is copied; compressed pictures are decoded
+    with the codec announced in their header (see decode_picture).
+
+    Parameters
+    ----------
+    body : bytes
+        Raw request body.
+
+    Raises
+    ------
+    ValueError
+        When the body is malformed.
+
+    Returns
+    -------
+    dict
+        The batch with every picture rebuilt as a np.ndarray.
+    """
+
+    view = memoryview(body)
+    if len(view) < HEADER_LENGTH.size:
+        raise ValueError('Body is too short to hold a batch header')
+
+    (header_length,) = HEADER_LENGTH.unpack_from(view)
+    payload_start = HEADER_LENGTH.size + header_length
+    if len(view) < payload_start:
+        raise ValueError('Body is too short to hold the announced batch header')
+
+    batch = json.loads(bytes(view[HEADER_LENGTH.size:payload_start]))
+    payload = view[payload_start:]
+
+    for light in batch['lights']:
+        for picture in light['pictures'].values():
+            offset, nbytes = picture['offset'], picture['nbytes']
+            if offset < 0 or nbytes < 0:
+                raise ValueError('Picture buffer has a negative offset or size')
+            if offset + nbytes > len(payload):
+                raise ValueError('Picture buffer exceeds the body size')
+
+            picture['picture'] = decode_picture(payload[offset:offset + nbytes], picture.get('codec', 'raw'),
+                                                picture['shape'], np.dtype(picture['dtype']))
+
+    return batch
+
+
+def read_exactly(stream: BinaryIO, size: int) -> bytearray:
+    """
+    Read a number of bytes from a request stream, which may return fewer bytes per read.
+
+    Parameters
+    ----------
+    stream : BinaryIO
+        Request body stream.
+    size : int
+        Number of bytes to read.
+
+    Raises
+    ------
+    ValueError
+        When the stream ends before.
+
+    Returns
+    -------
+    bytearray
+        The bytes read.
+    """
+
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    read = 0
+    while read < size:
+        chunk = stream.read(size - read)
+        if not chunk:
+            raise ValueError(f'Stream ended after {read} of {size} bytes')
+        view[read:read + len(chunk)] = chunk
+        read += len(chunk)
+
+    return buffer
+
+
+def iter_pictures_stream(stream: BinaryIO) -> Iterator[dict]:
+    """
+    Decode the pictures of a streamed pictures batch as they arrive.
+
+    Notes
+    -----
+    Stream layout: [header length: uint32][JSON header][picture buffer] for each picture, then a 0 header length.
+    Each header holds the metadata of the picture and of its light type, and the size of its buffer. A single
+    picture is read at once.
+
+    Parameters
+    ----------
+    stream : BinaryIO
+        Request body stream.
+
+    Raises
+    ------
+    ValueError
+        When the stream is malformed, announces a header or a picture buffer above MAX_STREAM_HEADER_BYTES or
+        MAX_PICTURE_BYTES, or ends before the end of the batch.
+
+    Returns
+    -------
+    Iterator[dict]
+        The header of each picture, with the picture rebuilt as a np.ndarray.
+    """
+
+    while True:
+        (header_length,) = HEADER_LENGTH.unpack(read_exactly(stream, HEADER_LENGTH.size))
+        if header_length == 0:
+            return
+        if header_length > MAX_STREAM_HEADER_BYTES:
+            raise ValueError(f'Picture header of {header_length} bytes exceeds {MAX_STREAM_HEADER_BYTES} bytes')
+
+        picture = json.loads(read_exactly(stream, header_length))
+        nbytes = picture['nbytes']
+        if not isinstance(nbytes, int) or not 0 <= nbytes <= MAX_PICTURE_BYTES:
+            raise ValueError(f'Picture buffer of {nbytes} bytes is not between 0 and {MAX_PICTURE_BYTES} bytes')
+        buffer = read_exactly(stream, nbytes)
+        picture['picture'] = decode_picture(memoryview(buffer), picture.get('codec', 'raw'), picture['shape'],
+                                            np.dtype(picture['dtype']))
+        yield picture
+
+
+def decode_pictures_stream(stream: BinaryIO) -> dict:
+    """
+    Decode a whole streamed pictures batch, into the structure of decode_pictures_batch.
+
+    Parameters
+    ----------
+    stream : BinaryIO
+        Request body stream.
+
+    Raises
+    ------
+    ValueError
+        When the stream is malformed.
+
+    Returns
+    -------
+    dict
+        The batch with every picture rebuilt as a np.ndarray.
+    """
+
+    lights = []
+    for picture in iter_pictures_stream(stream):
+        light = {key: picture.pop(key) for key in ('light', 'creation_date', 'velocity', 'displacement')}
+        if not lights or lights[-1]['light'] != light['light']:
+            lights.append({**light, 'pictures': {}})
+        lights[-1]['pictures'][picture.pop('camera')] = picture
+
+    return {'lights': lights}
+
 
 @app.route('/pictures_batch', methods=['POST'])
 def pictures_batch():
     if request.method == 'POST':
         print('Received pictures batch request')
         response = make_response()
+
+        if request.mimetype == BATCH_CONTENT_TYPE:
+            try:
+                batch = decode_pictures_batch(request.get_data(cache=False))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f'Malformed pictures batch: {e}')
+                response.status_code = 400
+                return response
+
+            print(f'Decoded {sum(len(light["pictures"]) for light in batch["lights"])} pictures')
+
+        elif request.mimetype == BATCH_STREAM_CONTENT_TYPE:
+            pictures = 0
+            try:
+                for _ in iter_pictures_stream(request.stream): # each picture is processed as it arrives
+                    pictures += 1
+            except (ValueError, KeyError, TypeError) as e:
+                print(f'Malformed pictures stream after {pictures} pictures: {e}')
+                response.status_code = 400
+                return response
+
+            print(f'Decoded {pictures} streamed pictures')
+
         response.status_code = 201
 
         return response
 
 
+def decode_fabric_movement(payload) -> list:
+    """
+    Decode the samples of a fabric movement request.
+
+    Notes
+    -----
+    Accepts a single sample ({"velocity", "displacement"}), a JSON array of samples
+    or an object holding the array ({"samples": [...]}).
+
+    Parameters
+    ----------
+    payload : Union[dict, list]
+        Parsed request body.
+
+    Raises
+    ------
+    ValueError
+        When the payload does not hold valid samples.
+
+    Returns
+    -------
+    list
+        The samples, each one with at least a velocity and a displacement.
+    """
+
+    if isinstance(payload, dict):
+        payload = payload.get('samples', [payload])
+
+    if not isinstance(payload, list):
+        raise ValueError('Samples must be sent as a JSON array')
+
+    for sample in payload:
+        if not isinstance(sample, dict) or 'velocity' not in sample or 'displacement' not in sample:
+            raise ValueError('Every sample needs a velocity and a displacement')
+
+    return payload
+
+
 @app.route('/fabric_movement', methods=['POST'])
 def fabric_movement():
     if request.method == 'POST':
         print('Received fabric movement request')
 
         response = make_response()
+
+        try:
+            samples = decode_fabric_movement(request.get_json() if request.is_json else request.form.to_dict())
+        except ValueError as e:
+            print(f'Malformed fabric movement: {e}')
+            response.status_code = 400
+            return response
+
+        print(f'Decoded {len(samples)} fabric movement samples')
         response.status_code = 201
 
         return response
@@ -0,0 +1,20 @@
+import unittest
+from benchmarks.analyser_benchmark import run, compare
+
+class TestAnalyserBenchmark(unittest.TestCase):
+    def test_virtual_run(self):
+        results = run(60, seed=1)
+        self.assertEqual(results["sampling"]["missed"], 0)
+        self.assertGreater(results["capture"]["iterations"], 0)
+        self.assertGreater(results["uploads"]["bytes"], 0)
+        self.assertGreater(results["telemetry"]["requests"], 0)
+        self.assertGreater(results["process"]["peak_rss_bytes"], 0)
+        self.assertEqual(compare(results, results, 0.1), [])
+
+    def test_compare(self):
+        baseline = {"sampling": {"rate": 50}, "uploads": {"latency_p99": 0.1}}
+        results = {"sampling": {"rate": 40}, "uploads": {"latency_p99": 0.105}, "capture": {"latency_p50": 1},
+                   "telemetry": {"latency_p99": 1}, "process": {"peak_rss_bytes": 1}}
+        results["sampling"]["lateness_p99"] = 0
+        results["uploads"]["bytes_per_second"] = 1
+        self.assertEqual(len(compare(results, baseline, 0.1)), 1) # the rate dropped 20%, the latency rose 5%
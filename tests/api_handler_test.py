@@ -1,22 +1,58 @@
 import unittest
+import requests
 from unittest.mock import patch, MagicMock
+import numpy as np
 from weaving_analyser.api import APIhandler
+from hardware_controllers.cameras_controller import CaptureBatch, LightType, CameraPosition
+from keep_alive_server import start_keep_alive_server
 
 class TestAPIhandler(unittest.TestCase):
     def setUp(self):
         self.api_handler = APIhandler()
 
-    @patch('requests.get')
+    @patch.object(requests.Session, 'get')
     def test_ping(self, mock_get):
         mock_get.return_value.status_code = 200
         self.assertEqual(self.api_handler.ping().status_code, 200)
 
-    @patch('requests.post')
+    @patch.object(requests.Session, 'post')
     def test_send_pictures_batch(self, mock_post):
         mock_post.return_value.status_code = 200
-        self.assertEqual(self.api_handler.send_pictures_batch('pictures_batch').status_code, 200)
+        batch = CaptureBatch.allocate([LightType.GREEN], list(CameraPosition), (4, 3, 3))
+        batch.collected[:] = True
+        self.assertEqual(self.api_handler.send_pictures_batch(batch).status_code, 200)
+        self.assertIsInstance(mock_post.call_args.kwargs['data'], bytes)
 
-    @patch('requests.post')
+    @patch.object(requests.Session, 'post')
     def test_send_surface_movement(self, mock_post):
         mock_post.return_value.status_code = 200
-        self.assertEqual(self.api_handler.send_surface_movement(10, 20).status_code, 200)
\ No newline at end of file
+        self.assertEqual(self.api_handler.send_surface_movement(10, 20).status_code, 200)
+
+class TestAPIhandlerConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = start_keep_alive_server()
+        self.api_handler = APIhandler(pool_size=2)
+        self.api_handler.port = self.server.server_port
+
+    def tearDown(self):
+        self.api_handler.close()
+        self.server.shutdown()
+
+    def test_connection_reuse(self):
+        for _ in range(5):
+            self.assertEqual(self.api_handler.ping().status_code, 204)
+        self.assertEqual(self.api_handler.connection_stats(),
+                         {"requests": 5, "new_connections": 1, "reused_connections": 4})
+
+    def test_reconnections_are_counted(self):
+        from threading import Thread
+        from werkzeug.serving import make_server
+        from server.server import app
+
+        server = make_server('127.0.0.1', 0, app, threaded=True) # closes every connection
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.api_handler.port = server.server_port
+        for _ in range(3):
+            self.api_handler.ping()
+        server.shutdown()
+        self.assertEqual(self.api_handler.connection_stats()["new_connections"], 3)
@@ -0,0 +1,169 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, AsyncMock
+from keep_alive_server import start_keep_alive_server
+from weaving_analyser.async_api import AsyncAPIhandler, AsyncHTTPClient, ConnectError, StaleConnectionError
+from weaving_analyser.async_analyser import AsyncWeavingAnalyser
+
+class TestAsyncAPIhandler(unittest.TestCase):
+    def setUp(self):
+        self.server = start_keep_alive_server()
+        self.api_handler = AsyncAPIhandler()
+        self.api_handler.port = self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_requests_reuse_connections(self):
+        async def send():
+            statuses = [(await self.api_handler.ping()).status_code for _ in range(3)]
+            samples = [{"timestamp": 0, "velocity": 1, "displacement": 2}]
+            statuses.append((await self.api_handler.send_surface_movement_batch(samples)).status_code)
+            await self.api_handler.close()
+            return statuses
+
+        self.assertEqual(asyncio.run(send()), [204, 204, 204, 201])
+        self.assertEqual(self.api_handler.connection_stats(),
+                         {"requests": 4, "new_connections": 1, "reused_connections": 3})
+
+class TestAsyncHTTPClient(unittest.TestCase):
+    def serve(self, statuses, answered):
+        async def handle(reader, writer):
+            try:
+                while await reader.readuntil(b"\r\n\r\n"):
+                    if not statuses: # never answers
+                        await reader.read()
+                        answered.append("closed by the client")
+                        return
+                    status = statuses.pop(0)
+                    answered.append(status)
+                    writer.write(b"HTTP/1.1 %d X\r\nContent-Length: 0\r\n\r\n" % status)
+            except asyncio.IncompleteReadError:
+                pass
+            finally:
+                writer.close()
+        return asyncio.start_server(handle, "127.0.0.1", 0)
+
+    def test_unavailable_server_is_retried(self):
+        async def send():
+            answered = []
+            server = await self.serve([503, 502, 201], answered)
+            client = AsyncHTTPClient("127.0.0.1", server.sockets[0].getsockname()[1], backoff_factor=0.01)
+            response = await client.request("POST", "/fabric_movement", b"{}")
+            await client.close()
+            server.close()
+            return response.status_code, answered
+
+        self.assertEqual(asyncio.run(send()), (201, [503, 502, 201]))
+
+    def test_refused_connection_is_retried(self):
+        async def send():
+            client = AsyncHTTPClient("127.0.0.1", 1, retries=2, backoff_factor=0.01)
+            with self.assertRaises(ConnectError):
+                await client.request("GET", "/ping")
+
+        asyncio.run(send())
+
+    def test_cancelled_request_closes_its_connection(self):
+        async def send():
+            answered = []
+            server = await self.serve([], answered)
+            client = AsyncHTTPClient("127.0.0.1", server.sockets[0].getsockname()[1])
+            task = asyncio.create_task(client.request("GET", "/ping"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await asyncio.sleep(0.1)
+            server.close()
+            return answered, len(client._idle)
+
+        self.assertEqual(asyncio.run(send()), (["closed by the client"], 0))
+
+    def serve_counting(self, received, delays, close_after=None):
+        async def handle(reader, writer):
+            try:
+                while await reader.readuntil(b"\r\n\r\n"):
+                    await reader.readexactly(2) # body of the requests
+                    received.append(len(received))
+                    await asyncio.sleep(delays[min(len(received), len(delays)) - 1])
+                    writer.write(b"HTTP/1.1 201 X\r\nContent-Length: 0\r\n\r\n")
+                    await writer.drain()
+                    if close_after is not None and len(received) == close_after:
+                        return # closes the idle connection
+            except (asyncio.IncompleteReadError, ConnectionResetError):
+                pass
+            finally:
+                writer.close()
+        return asyncio.start_server(handle, "127.0.0.1", 0)
+
+    def test_timed_out_request_is_not_sent_again(self):
+        async def send():
+            received = []
+            server = await self.serve_counting(received, [0, 0.5])
+            client = AsyncHTTPClient("127.0.0.1", server.sockets[0].getsockname()[1], read_timeout=0.1)
+            await client.request("POST", "/pictures_batch", b"{}")
+            with self.assertRaises(asyncio.TimeoutError): # answered after the read timeout, on the reused connection
+                await client.request("POST", "/pictures_batch", b"{}")
+            await asyncio.sleep(0.6)
+            await client.close()
+            server.close()
+            return received
+
+        self.assertEqual(len(asyncio.run(send())), 2)
+
+    def test_stale_connection_is_retried(self):
+        async def send():
+            received = []
+            server = await self.serve_counting(received, [0], close_after=1)
+            client = AsyncHTTPClient("127.0.0.1", server.sockets[0].getsockname()[1])
+            await client.request("POST", "/fabric_movement", b"{}")
+            await asyncio.sleep(0.1) # the server closes the idle connection
+            response = await client.request("POST", "/fabric_movement", b"{}")
+            await client.close()
+            server.close()
+            return response.status_code, len(received), client.new_connections
+
+        self.assertEqual(asyncio.run(send()), (201, 2, 2))
+
+    def test_stale_connection_is_not_retried_on_a_new_connection(self):
+        async def send():
+            server = await asyncio.start_server(lambda reader, writer: writer.close(), "127.0.0.1", 0)
+            client = AsyncHTTPClient("127.0.0.1", server.sockets[0].getsockname()[1])
+            with self.assertRaises(StaleConnectionError):
+                await client.request("POST", "/fabric_movement", b"{}")
+            server.close()
+            return client.requests
+
+        self.assertEqual(asyncio.run(send()), 1)
+
+class TestAsyncWeavingAnalyser(unittest.TestCase):
+    def setUp(self):
+        self.weaving_analyser = AsyncWeavingAnalyser()
+        self.weaving_analyser.velocity_handler.velocity_sensor_controller = MagicMock()
+        self.weaving_analyser.velocity_handler.velocity_sensor_controller.get_velocity.return_value = 60 * 60 * 100
+        self.weaving_analyser.camera_handler.make_batch = MagicMock(return_value=['green', 'blue'])
+        self.weaving_analyser.camera_handler.encode_batch = MagicMock(return_value=b'green blue')
+        self.weaving_analyser.camera_handler.release_batch = MagicMock()
+        self.weaving_analyser.async_api_handler = AsyncMock()
+
+    def test_run(self):
+        asyncio.run(self.weaving_analyser.run(ttl=0.3))
+        api_handler = self.weaving_analyser.async_api_handler
+        samples = sum(len(call.args[0]) for call in api_handler.send_surface_movement_batch.call_args_list)
+        self.assertGreater(samples, 5)
+        api_handler.send_encoded_pictures_batch.assert_called_with(b'green blue')
+        self.weaving_analyser.camera_handler.release_batch.assert_called_with(['green', 'blue'])
+        self.assertEqual(self.weaving_analyser.velocity_handler.take_samples(), [])
+
+    def test_stop_waits_for_the_uploads(self):
+        sent = []
+
+        async def send(body):
+            await asyncio.sleep(0.2)
+            sent.append(body)
+        self.weaving_analyser.async_api_handler.send_encoded_pictures_batch.side_effect = send
+        asyncio.run(self.weaving_analyser.run(ttl=0.3))
+        api_handler = self.weaving_analyser.async_api_handler
+        self.assertGreater(len(sent), 0)
+        self.assertEqual(len(sent), api_handler.send_encoded_pictures_batch.call_count) # none was cancelled
@@ -0,0 +1,63 @@
+import json
+import unittest
+import numpy as np
+from weaving_analyser.batch_codec import encode_capture_batch, BATCH_CONTENT_TYPE
+from hardware_controllers.cameras_controller import CaptureBatch, LightType, CameraPosition
+from server.server import app, decode_pictures_batch, HEADER_LENGTH
+
+class TestBatchCodec(unittest.TestCase):
+    def setUp(self):
+        self.left = np.arange(760 * 1000 * 3, dtype=np.uint8).reshape(760, 1000, 3)
+        self.right = np.ones((760, 1000, 3), dtype=np.uint8)
+        self.batch = CaptureBatch.allocate([LightType.GREEN, LightType.BLUE], [CameraPosition.LEFT,
+                                                                                CameraPosition.RIGHT], (760, 1000, 3))
+        self.batch.frames[:, 0] = self.left
+        self.batch.frames[:, 1] = self.right
+        self.batch.exposure_times[:] = [[0.5, 0.25], [0.5, 0.25]]
+        self.batch.diaphragm_openings[:] = [[2.8, 5.6], [2.8, 5.6]]
+        self.batch.isos[:] = [[100, 800], [100, 800]]
+        self.batch.velocities[:] = [1.5, 1.6]
+        self.batch.displacements[:] = [10.0, 10.2]
+        self.batch.collected[:] = True
+
+    def test_round_trip(self):
+        decoded = decode_pictures_batch(encode_capture_batch(self.batch))
+        self.assertEqual([light['light'] for light in decoded['lights']], ['green_light', 'blue_light'])
+        self.assertEqual([light['displacement'] for light in decoded['lights']], [10.0, 10.2])
+        left = decoded['lights'][1]['pictures']['left']
+        np.testing.assert_array_equal(left['picture'], self.left)
+        np.testing.assert_array_equal(decoded['lights'][0]['pictures']['right']['picture'], self.right)
+        self.assertEqual((left['iso'], left['exposure_time'], left['diaphragm_opening']), (100, 0.5, 2.8))
+
+    def test_light_subset(self):
+        self.batch.frames[1, 0] = 7
+        decoded = decode_pictures_batch(encode_capture_batch(self.batch, [1]))
+        self.assertEqual([light['light'] for light in decoded['lights']], ['blue_light'])
+        self.assertTrue((decoded['lights'][0]['pictures']['left']['picture'] == 7).all())
+
+    def test_only_collected_lights(self):
+        self.batch.collected[1] = False
+        decoded = decode_pictures_batch(encode_capture_batch(self.batch))
+        self.assertEqual([light['light'] for light in decoded['lights']], ['green_light'])
+
+    def test_no_base64_overhead(self):
+        body = encode_capture_batch(self.batch)
+        self.assertLess(len(body), 4 * self.left.nbytes + 4096)
+
+    def test_malformed_body(self):
+        with self.assertRaises(ValueError):
+            decode_pictures_batch(b'\x00\x00\x10\x00{}')
+
+    def test_negative_offset(self):
+        header = json.dumps({'lights': [{'pictures': {'left': {'offset': -4, 'nbytes': 4, 'shape': [2, 2],
+                                                               'dtype': 'uint8'}}}]}).encode()
+        with self.assertRaises(ValueError):
+            decode_pictures_batch(HEADER_LENGTH.pack(len(header)) + header + b'\x00' * 8)
+
+    def test_server_route(self):
+        client = app.test_client()
+        response = client.post('/pictures_batch', data=encode_capture_batch(self.batch),
+                               content_type=BATCH_CONTENT_TYPE)
+        self.assertEqual(response.status_code, 201)
+        response = client.post('/pictures_batch', data=b'garbage', content_type=BATCH_CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
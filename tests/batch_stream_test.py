@@ -0,0 +1,86 @@
+import io
+import json
+import unittest
+from threading import Thread
+from unittest.mock import MagicMock
+import numpy as np
+from werkzeug.serving import make_server
+from hardware_controllers.cameras_controller import CamerasController, CaptureBatch, LightType, CameraPosition
+from hardware_controllers.clock import VirtualClock
+from weaving_analyser.api import APIhandler
+from weaving_analyser.batch_codec import stream_capture_batch, BATCH_STREAM_CONTENT_TYPE
+from weaving_analyser.camera_handler import CameraHandler
+from weaving_analyser.picture_codecs import PictureEncoder
+from server.server import app, decode_pictures_stream, HEADER_LENGTH, MAX_PICTURE_BYTES
+
+class TestBatchStream(unittest.TestCase):
+    def setUp(self):
+        self.batch = CaptureBatch.allocate([LightType.GREEN, LightType.BLUE], [CameraPosition.LEFT,
+                                                                                CameraPosition.RIGHT], (76, 100, 3))
+        self.batch.frames[:] = np.arange(76 * 100 * 3, dtype=np.uint8).reshape(76, 100, 3)
+        self.batch.frames[1, 1] = 3
+        self.batch.isos[:] = [[100, 800], [100, 800]]
+        self.batch.displacements[:] = [10.0, 10.2]
+        self.batch.collected[:] = True
+
+    def test_round_trip(self):
+        for encoder in (None, PictureEncoder('zlib')):
+            decoded = decode_pictures_stream(io.BytesIO(b"".join(stream_capture_batch(self.batch, encoder=encoder))))
+            self.assertEqual([light['light'] for light in decoded['lights']], ['green_light', 'blue_light'])
+            self.assertEqual([light['displacement'] for light in decoded['lights']], [10.0, 10.2])
+            right = decoded['lights'][1]['pictures']['right']
+            np.testing.assert_array_equal(right['picture'], self.batch.frames[1, 1])
+            np.testing.assert_array_equal(decoded['lights'][0]['pictures']['left']['picture'], self.batch.frames[0, 0])
+            self.assertEqual(right['iso'], 800)
+
+    def test_one_picture_per_chunk(self):
+        chunks = list(stream_capture_batch(self.batch, [1]))
+        self.assertEqual(len(chunks), 5) # header and buffer of each camera, then the end of the batch
+        self.assertEqual(bytes(chunks[1]), self.batch.frames[1, 0].tobytes())
+
+    def test_truncated_stream(self):
+        body = b"".join(stream_capture_batch(self.batch))
+        with self.assertRaises(ValueError):
+            decode_pictures_stream(io.BytesIO(body[:-100]))
+
+    def test_oversized_sizes_are_rejected_before_reading(self):
+        header = json.dumps({'nbytes': MAX_PICTURE_BYTES + 1}).encode()
+        for body in (b'\xff\xff\xff\xff', HEADER_LENGTH.pack(len(header)) + header):
+            with self.assertRaises(ValueError):
+                decode_pictures_stream(io.BytesIO(body))
+
+    def test_chunked_upload(self):
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        api_handler = APIhandler()
+        api_handler.port = server.port
+        self.addCleanup(api_handler.close)
+
+        response = api_handler.stream_pictures_batch(self.batch, encoder=PictureEncoder('zlib'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.request.headers['Transfer-Encoding'], 'chunked')
+        self.assertEqual(response.request.headers['Content-Type'], BATCH_STREAM_CONTENT_TYPE)
+        self.assertGreater(response.request.body.sent, 0)
+        self.assertNotIn('Content-Length', response.request.headers)
+
+class TestCameraHandlerStream(unittest.TestCase):
+    def test_captures_are_streamed(self):
+        camera_handler = CameraHandler(stream_uploads=True)
+        picture_source = MagicMock()
+        picture_source.get_picture.return_value = np.full((4, 4, 3), 9, np.uint8)
+        camera_handler.cameras_controller = CamerasController(clock=VirtualClock(), picture_source=picture_source)
+        client = app.test_client()
+        camera_handler.api_handler.stream_pictures_batch = MagicMock(
+            side_effect=lambda batch, lights, encoder: client.post(
+                '/pictures_batch', data=b"".join(stream_capture_batch(batch, lights, encoder)),
+                content_type=BATCH_STREAM_CONTENT_TYPE))
+        camera_handler.api_handler.send_encoded_pictures_batch = MagicMock()
+        camera_handler.start()
+        for _ in range(2):
+            camera_handler()
+        camera_handler.stop()
+
+        self.assertEqual(camera_handler.api_handler.stream_pictures_batch.call_count, 4)
+        camera_handler.api_handler.send_encoded_pictures_batch.assert_not_called()
+        self.assertFalse(CameraHandler(stream_uploads=True, spool=MagicMock()).stream_uploads)
@@ -0,0 +1,67 @@
+import unittest
+from threading import Event, Timer
+from weaving_analyser.bounded_executor import BoundedExecutor, SubmitPolicy
+
+class TestBoundedExecutor(unittest.TestCase):
+    def setUp(self):
+        self.release = Event()
+        self.started = Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def block_worker(self, executor):
+        def blocking_task():
+            self.started.set()
+            self.release.wait()
+        executor.submit(blocking_task)
+        self.started.wait(1)
+
+    def test_drop_newest(self):
+        executor = BoundedExecutor(max_workers=1, max_queue_size=2, policy=SubmitPolicy.DROP_NEWEST)
+        self.block_worker(executor)
+        self.assertIsNotNone(executor.submit(lambda: 1))
+        self.assertIsNotNone(executor.submit(lambda: 2))
+        self.assertIsNone(executor.submit(lambda: 3))
+        metrics = executor.metrics()
+        self.assertEqual((metrics['queue_depth'], metrics['dropped']), (2, 1))
+        executor.shutdown(wait=False)
+
+    def test_drop_oldest(self):
+        executor = BoundedExecutor(max_workers=1, max_queue_size=2, policy=SubmitPolicy.DROP_OLDEST)
+        self.block_worker(executor)
+        oldest = executor.submit(lambda: 1)
+        executor.submit(lambda: 2)
+        newest = executor.submit(lambda: 3)
+        self.assertTrue(oldest.cancelled())
+        self.release.set()
+        self.assertEqual(newest.result(1), 3)
+        self.assertEqual(executor.metrics()['dropped'], 1)
+        executor.shutdown()
+
+    def test_coalesce_latest(self):
+        executor = BoundedExecutor(max_workers=1, max_queue_size=4, policy=SubmitPolicy.COALESCE_LATEST)
+        self.block_worker(executor)
+        calls = []
+        futures = [executor.submit(calls.append, i) for i in range(10)]
+        self.assertEqual(executor.metrics()['queue_depth'], 1)
+        self.release.set()
+        futures[-1].result(1)
+        self.assertEqual(calls, [9])
+        self.assertEqual(executor.metrics()['coalesced'], 9)
+        executor.shutdown()
+
+    def test_block(self):
+        executor = BoundedExecutor(max_workers=1, max_queue_size=1, policy=SubmitPolicy.BLOCK)
+        self.block_worker(executor)
+        executor.submit(lambda: 1)
+        Timer(0.05, self.release.set).start()
+        self.assertEqual(executor.submit(lambda: 2).result(1), 2)
+        self.assertGreater(executor.metrics()['blocked_time_total'], 0)
+        executor.shutdown()
+
+    def test_submit_after_shutdown(self):
+        executor = BoundedExecutor(max_workers=1, max_queue_size=1)
+        executor.shutdown()
+        with self.assertRaises(RuntimeError):
+            executor.submit(lambda: 1)
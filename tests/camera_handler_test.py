@@ -1,29 +1,46 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import numpy as np
 from weaving_analyser.camera_handler import CameraHandler
-from hardware_controllers.cameras_controller import LightType
+from hardware_controllers.cameras_controller import CamerasController, CaptureBatch, LightType, CameraPosition
+from hardware_controllers.clock import VirtualClock
 
 class TestCameraHandler(unittest.TestCase):
     def setUp(self):
         self.camera_handler = CameraHandler()
+        self.batch = CaptureBatch.allocate(CameraHandler.LIGHT_SEQUENCE, list(CameraPosition), (4, 4, 3))
 
     @patch('hardware_controllers.cameras_controller.CamerasController')
     def test_trigger_camera(self, mock_cameras_controller):
         self.camera_handler.cameras_controller = mock_cameras_controller
-        mock_cameras_controller.collect_pictures.return_value = 'picture'
-        self.assertEqual(self.camera_handler.trigger_camera(LightType.GREEN), 'picture')
+        self.camera_handler.update(2, 30)
+        self.assertTrue(self.camera_handler.trigger_camera(self.batch, LightType.BLUE))
+        mock_cameras_controller.collect_into.assert_called_once_with(self.batch, LightType.BLUE)
+        self.assertEqual((self.batch.velocities[1], self.batch.displacements[1]), (2, 30))
 
     @patch('hardware_controllers.cameras_controller.CamerasController')
-    @patch('weaving_analyser.camera_handler.APIhandler')
-    def test_make_batch(self, mock_cameras_controller, mock_api_handler):
+    def test_make_batch(self, mock_cameras_controller):
         self.camera_handler.cameras_controller = mock_cameras_controller
-        self.camera_handler.api_handler = mock_api_handler
-        mock_api_handler.prepare_body.return_value = 'body'
-        mock_cameras_controller.collect_pictures.return_value = 'picture'
-        self.assertEqual(self.camera_handler.make_batch(), ['body', 'body'])
+        mock_cameras_controller.allocate_batch.return_value = self.batch
+        self.assertIs(self.camera_handler.make_batch(), self.batch)
+        self.assertEqual(mock_cameras_controller.collect_into.call_count, 2)
 
     @patch('hardware_controllers.cameras_controller.CamerasController')
     def test_trigger_fail(self, mock_cameras_controller):
         self.camera_handler.cameras_controller = mock_cameras_controller
         mock_cameras_controller.trigger.return_value = False
         self.assertEqual(self.camera_handler.make_batch(), None)
+        self.assertFalse(self.camera_handler.camera_lock.locked())
+
+    def test_collect_into_batch(self):
+        picture_source = MagicMock()
+        picture_source.get_picture.side_effect = lambda light_type, camera_position: \
+            np.full((4, 4, 3), len(light_type.value) + len(camera_position.value), np.uint8)
+        self.camera_handler.cameras_controller = CamerasController(clock=VirtualClock(), picture_source=picture_source)
+        self.camera_handler.start()
+        batch = self.camera_handler.make_batch()
+        self.assertEqual(batch.frames.shape, (2, 2, 4, 4, 3))
+        self.assertTrue(batch.frames.flags.c_contiguous)
+        self.assertTrue(batch.collected.all())
+        self.assertEqual(batch.frames[1, 1, 0, 0, 0], len('blue_light') + len('right'))
+        self.assertTrue((batch.isos > 0).all())
@@ -0,0 +1,70 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from weaving_analyser.capture_pipeline import CapturePipeline
+from weaving_analyser.camera_handler import CameraHandler
+from hardware_controllers.cameras_controller import CamerasController
+from hardware_controllers.clock import VirtualClock
+from weaving_analyser.batch_codec import BATCH_CONTENT_TYPE
+from server.server import app
+
+class TestCapturePipeline(unittest.TestCase):
+    def test_stages_overlap_the_captures(self):
+        uploaded = []
+        def upload(item):
+            time.sleep(0.1)
+            uploaded.append(item)
+        pipeline = CapturePipeline([("encode", lambda item: item * 2), ("upload", upload)], queue_size=2)
+
+        start = time.monotonic()
+        for item in range(3):
+            self.assertTrue(pipeline.submit(item))
+        self.assertLess(time.monotonic() - start, 0.1) # the captures do not wait for the uploads
+
+        pipeline.close(wait=True)
+        self.assertEqual(uploaded, [0, 2, 4])
+        self.assertFalse(pipeline.submit(3))
+        metrics = pipeline.metrics()
+        self.assertEqual(metrics["upload"]["count"], 3)
+        self.assertGreaterEqual(metrics["upload"]["latency_max"], 0.1)
+        self.assertEqual(metrics["encode"]["queue_depth"], 0)
+
+    def test_failed_items_are_dropped(self):
+        uploaded = []
+        pipeline = CapturePipeline([("encode", lambda item: 1 / item), ("upload", uploaded.append)])
+        for item in (0, 1):
+            pipeline.submit(item)
+        pipeline.close()
+        self.assertEqual(uploaded, [1])
+        self.assertEqual(pipeline.metrics()["encode"]["failed"], 1)
+
+class TestCameraHandlerPipeline(unittest.TestCase):
+    def setUp(self):
+        self.camera_handler = CameraHandler()
+        picture_source = MagicMock()
+        picture_source.get_picture.return_value = np.zeros((4, 4, 3), np.uint8)
+        self.camera_handler.cameras_controller = CamerasController(clock=VirtualClock(), picture_source=picture_source)
+        self.camera_handler.start()
+        self.client = app.test_client()
+        self.responses = []
+        def send(body):
+            self.responses.append(self.client.post('/pictures_batch', data=body, content_type=BATCH_CONTENT_TYPE))
+            return self.responses[-1]
+        self.camera_handler.api_handler.send_encoded_pictures_batch = MagicMock(side_effect=send)
+
+    def test_call_uploads_each_light(self):
+        self.camera_handler()
+        self.camera_handler.stop()
+        send = self.camera_handler.api_handler.send_encoded_pictures_batch
+        self.assertEqual(send.call_count, len(CameraHandler.LIGHT_SEQUENCE))
+        self.assertEqual([response.status_code for response in self.responses], [201, 201])
+        metrics = self.camera_handler.pipeline.metrics()
+        self.assertEqual(metrics["capture"]["count"], 2)
+        self.assertEqual(metrics["upload"]["failed"], 0)
+
+    def test_trigger_fail(self):
+        self.camera_handler.cameras_controller.trigger = MagicMock(return_value=False)
+        self.camera_handler()
+        self.camera_handler.stop()
+        self.camera_handler.api_handler.send_encoded_pictures_batch.assert_not_called()
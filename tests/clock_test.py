@@ -0,0 +1,67 @@
+import time
+import unittest
+from threading import Thread
+from unittest.mock import MagicMock
+from hardware_controllers.clock import VirtualClock
+from hardware_controllers.velocity_sensor_controller import VelocitySensorController
+from weaving_analyser.analyser import WeavingAnalyser
+
+class TestVirtualClock(unittest.TestCase):
+    def test_sleep_advances_instantly(self):
+        clock = VirtualClock(epoch=1000)
+        start = time.monotonic()
+        clock.sleep(3600)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(clock.monotonic(), 3600)
+        self.assertEqual(clock.time(), 4600)
+
+    def test_other_threads_wait_for_the_driver(self):
+        clock = VirtualClock()
+        clock.drive()
+        woken_at = []
+        sleeper = Thread(target=lambda: woken_at.append(clock.sleep(4) or clock.monotonic()))
+        sleeper.start()
+        for _ in range(300):
+            clock.sleep(0.02)
+            time.sleep(0.001)
+        sleeper.join(1)
+        self.assertEqual(len(woken_at), 1)
+        self.assertGreaterEqual(woken_at[0], 4)
+        self.assertAlmostEqual(clock.monotonic(), 6)
+
+    def test_seeded_random_streams(self):
+        self.assertEqual(VirtualClock(seed=1).random('a').random(), VirtualClock(seed=1).random('a').random())
+        self.assertNotEqual(VirtualClock(seed=1).random('a').random(), VirtualClock(seed=1).random('b').random())
+
+class TestSimulation(unittest.TestCase):
+    def velocities(self, seed):
+        clock = VirtualClock(seed=seed)
+        sensor = VelocitySensorController(clock)
+        sensor.start_sensor()
+        velocities = []
+        for _ in range(500):
+            clock.sleep(0.02)
+            velocities.append(sensor.get_velocity())
+        sensor.stop_sensor()
+        return velocities
+
+    def test_sensor_is_deterministic(self):
+        self.assertEqual(self.velocities(7), self.velocities(7))
+        self.assertNotEqual(self.velocities(7), self.velocities(8))
+
+    def simulate(self, seed, ttl):
+        weaving_analyser = WeavingAnalyser(clock=VirtualClock(seed=seed))
+        weaving_analyser.velocity_handler.api_handler = MagicMock()
+        weaving_analyser.camera_handler.api_handler = MagicMock()
+        weaving_analyser.camera_handler.api_handler.send_encoded_pictures_batch.return_value.status_code = 201
+        weaving_analyser.start(ttl)
+        return weaving_analyser
+
+    def test_analyser_runs_faster_than_real_time(self):
+        start = time.monotonic()
+        weaving_analyser = self.simulate(seed=3, ttl=60)
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertGreaterEqual(weaving_analyser.clock.monotonic(), 60)
+        self.assertEqual(weaving_analyser.metrics()["sampling"]["missed"], 0)
+        self.assertEqual(weaving_analyser.velocity_handler.total_displacement,
+                         self.simulate(seed=3, ttl=60).velocity_handler.total_displacement)
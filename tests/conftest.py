@@ -0,0 +1,13 @@
+"""
+The logs of the analyser, and of the processes started by the tests, are written to a temporary directory rather
+than to logs/ in the source tree.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+if "WEAVING_LOG_DIRECTORY" not in os.environ: # before weaving_analyser.config is imported
+    os.environ["WEAVING_LOG_DIRECTORY"] = tempfile.mkdtemp(prefix="weaving_logs_")
+    atexit.register(shutil.rmtree, os.environ["WEAVING_LOG_DIRECTORY"], ignore_errors=True)
@@ -0,0 +1,50 @@
+import unittest
+import numpy as np
+from weaving_analyser.filters import RingBuffer, MovingAverageFilter, MedianFilter, ExponentialFilter, \
+    KalmanFilter1D, FilterChain
+from weaving_analyser.velocity_handler import VelocityHandler
+
+class TestRingBuffer(unittest.TestCase):
+    def test_running_sum(self):
+        ring_buffer = RingBuffer(3)
+        self.assertIsNone(ring_buffer.append(1))
+        ring_buffer.append(2)
+        ring_buffer.append(3)
+        self.assertEqual(ring_buffer.append(4), 1)
+        self.assertEqual(ring_buffer.values(), [2, 3, 4])
+        self.assertEqual(ring_buffer.mean(), 3)
+
+class TestFilters(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = rng.normal(50, 5, 2000)
+        outliers = rng.random(len(self.values)) < 0.1
+        self.values[outliers] = rng.uniform(-150, 400, outliers.sum())
+
+    def assert_batch_matches_scalar(self, make_filter):
+        scalar_filter = make_filter()
+        scalar = [scalar_filter.update(value) for value in self.values]
+        np.testing.assert_allclose(make_filter().apply(self.values), scalar, rtol=1e-9, atol=1e-9)
+
+    def test_batch_matches_scalar(self):
+        for make_filter in (lambda: MovingAverageFilter(5), lambda: MedianFilter(5), lambda: MedianFilter(4),
+                            lambda: ExponentialFilter(0.2), lambda: KalmanFilter1D(0.01, 25),
+                            lambda: FilterChain(MedianFilter(5), MovingAverageFilter(5))):
+            with self.subTest(make_filter()):
+                self.assert_batch_matches_scalar(make_filter)
+
+    def test_median_rejects_outliers(self):
+        median_filter = MedianFilter(5)
+        outputs = [median_filter.update(value) for value in (10, 10, 400, 10, -150, 10)]
+        self.assertEqual(outputs[2:], [10, 10, 10, 10])
+
+    def test_reset(self):
+        exponential_filter = ExponentialFilter(0.5)
+        exponential_filter.update(10)
+        exponential_filter.reset()
+        self.assertEqual(exponential_filter.update(2), 2)
+
+    def test_velocity_handler_filter(self):
+        velocity_handler = VelocityHandler(velocity_filter=ExponentialFilter(0.5))
+        velocity_handler.handle_velocity(10)
+        self.assertEqual(velocity_handler.handle_velocity(20), 15)
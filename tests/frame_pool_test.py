@@ -0,0 +1,83 @@
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from weaving_analyser.camera_handler import CameraHandler
+from hardware_controllers.cameras_controller import CamerasController, CaptureBatch, FramePool, CameraPosition
+from hardware_controllers.cameras_controller.errors import FramePoolExhaustedError
+from hardware_controllers.clock import VirtualClock
+
+class TestFramePool(unittest.TestCase):
+    def setUp(self):
+        self.allocate = MagicMock(side_effect=lambda: CaptureBatch.allocate(CameraHandler.LIGHT_SEQUENCE,
+                                                                            list(CameraPosition), (4, 4, 3)))
+        self.pool = FramePool(self.allocate, size=2)
+
+    def test_batches_are_reused(self):
+        batch = self.pool.acquire("capture")
+        batch.collected[0] = True
+        self.pool.release(batch, "capture")
+        self.assertIs(self.pool.acquire("capture"), batch)
+        self.assertFalse(batch.collected.any())
+        self.assertEqual(self.allocate.call_count, 1)
+        stats = self.pool.stats()
+        self.assertEqual((stats['checkouts'], stats['in_use'], stats['bytes']), (2, 1, batch.frames.nbytes))
+
+    def test_released_after_the_last_holder(self):
+        batch = self.pool.acquire("capture")
+        self.pool.retain(batch, "pipeline")
+        self.pool.retain(batch, "pipeline")
+        self.pool.release(batch, "capture")
+        self.pool.release(batch, "pipeline")
+        self.assertEqual(self.pool.stats()['in_use'], 1)
+        self.pool.release(batch, "pipeline")
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+        with self.assertRaises(ValueError): # released twice
+            self.pool.release(batch, "pipeline")
+
+    def test_exhausted(self):
+        self.pool.acquire("capture")
+        self.pool.acquire("capture")
+        with self.assertRaises(FramePoolExhaustedError):
+            self.pool.acquire("capture", timeout=0.01)
+        self.assertEqual(self.pool.stats()['exhausted'], 1)
+        self.assertEqual(self.allocate.call_count, 2)
+
+    def test_leaks(self):
+        self.pool.leak_timeout = 0
+        batch = self.pool.acquire("capture")
+        self.pool.retain(batch, "pipeline")
+        holders, age = self.pool.leaks()[0]
+        self.assertEqual(holders, ("capture", "pipeline"))
+        self.assertGreaterEqual(age, 0)
+        self.assertEqual(self.pool.stats()['leaked'], 1)
+
+class TestCameraHandlerFramePool(unittest.TestCase):
+    def setUp(self):
+        self.camera_handler = CameraHandler()
+        picture_source = MagicMock()
+        picture_source.get_picture.return_value = np.zeros((4, 4, 3), np.uint8)
+        self.camera_handler.cameras_controller = CamerasController(clock=VirtualClock(), picture_source=picture_source)
+        self.camera_handler.start()
+        self.camera_handler.api_handler = MagicMock()
+        self.camera_handler.api_handler.send_encoded_pictures_batch.return_value.status_code = 201
+
+    def test_batches_return_to_the_pool(self):
+        for _ in range(10):
+            self.camera_handler()
+        self.camera_handler.stop()
+        stats = self.camera_handler.frame_pool.stats()
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['checkouts'], 10)
+        self.assertLessEqual(stats['allocated'], stats['size'])
+
+    def test_failed_upload_releases_the_batch(self):
+        self.camera_handler.api_handler.send_encoded_pictures_batch.side_effect = ConnectionError
+        self.camera_handler()
+        self.camera_handler.stop()
+        self.assertEqual(self.camera_handler.frame_pool.stats()['in_use'], 0)
+
+    def test_make_batch_is_released_by_the_caller(self):
+        batch = self.camera_handler.make_batch()
+        self.assertEqual(self.camera_handler.frame_pool.stats()['in_use'], 1)
+        self.camera_handler.release_batch(batch)
+        self.assertEqual(self.camera_handler.frame_pool.stats()['in_use'], 0)
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import socket
+import threading
+import time
+import unittest
+import requests
+from hardware_controllers.cameras_controller import CaptureBatch, LightType, CameraPosition
+from weaving_analyser.api import APIhandler
+from weaving_analyser.picture_codecs import PictureEncoder
+from server.ingestion_server import IngestionServer, JsonFormatter, bind_socket, start_workers, stop_workers
+from benchmarks.ingestion_benchmark import generate_load, wait_ready
+
+def start_server(test, **options):
+    server = IngestionServer(stats_period=None, **options)
+    sock = bind_socket('127.0.0.1', 0)
+    thread = threading.Thread(target=asyncio.run, args=(server.serve(sock),), daemon=True)
+    thread.start()
+    while server._stopped is None:
+        time.sleep(0.01)
+
+    def stop():
+        server.stop()
+        thread.join()
+        sock.close()
+    test.addCleanup(stop)
+    return server, sock.getsockname()[1], stop
+
+def raw_request(port, request):
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as connection:
+        connection.sendall(request)
+        connection.shutdown(socket.SHUT_WR)
+        response = b''
+        while chunk := connection.recv(65536):
+            response += chunk
+    return response
+
+class TestIngestionServer(unittest.TestCase):
+    def test_routes(self):
+        server, port, stop = start_server(self)
+        api_handler = APIhandler()
+        api_handler.port = port
+        self.addCleanup(api_handler.close)
+        batch = CaptureBatch.allocate([LightType.GREEN, LightType.BLUE], [CameraPosition.LEFT, CameraPosition.RIGHT],
+                                      (76, 100, 3))
+        batch.frames[:] = 5
+        batch.collected[:] = True
+
+        self.assertEqual(api_handler.ping().status_code, 204)
+        self.assertEqual(api_handler.send_surface_movement(1.5, 10).status_code, 201)
+        self.assertEqual(api_handler.send_surface_movement_batch([{'velocity': 1, 'displacement': 2}] * 3).status_code,
+                         201)
+        self.assertEqual(api_handler.send_pictures_batch(batch).status_code, 201)
+        self.assertEqual(api_handler.stream_pictures_batch(batch, [0], PictureEncoder('zlib')).status_code, 201)
+        self.assertEqual(api_handler.connection_stats()['new_connections'], 1) # kept alive
+        stop()
+
+        self.assertEqual(server.stats()['analysis'],
+                         {'batches': 1, 'requests': 4, 'samples': 4, 'pictures': 6, 'queued': 0})
+
+    def test_malformed_requests(self):
+        server, port, _ = start_server(self)
+        url = f'http://127.0.0.1:{port}'
+        self.assertEqual(requests.post(f'{url}/fabric_movement', json=[{'velocity': 1}]).status_code, 400)
+        self.assertEqual(requests.post(f'{url}/fabric_movement', data='{', headers={
+            'Content-Type': 'application/json'}).status_code, 400)
+        self.assertEqual(requests.post(f'{url}/fabric_movement', data={'velocity': 1, 'displacement': 2}).status_code,
+                         201)
+        self.assertEqual(requests.post(f'{url}/pictures_batch', data=b'garbage', headers={
+            'Content-Type': 'application/x-weaving-batch'}).status_code, 400)
+        self.assertEqual(requests.get(f'{url}/unknown').status_code, 404)
+        self.assertEqual(requests.get(f'{url}/fabric_movement').status_code, 405)
+        self.assertTrue(raw_request(port, b'garbage\r\n\r\n').startswith(b'HTTP/1.1 400 Bad Request'))
+        self.assertEqual(server.stats()['batcher']['accepted'], 1)
+
+    def test_keep_alive_and_chunked_bodies(self):
+        _, port, _ = start_server(self)
+        body = json.dumps({'velocity': 1, 'displacement': 2}).encode()
+        response = raw_request(port, b'GET /ping HTTP/1.1\r\nHost: x\r\n\r\n'
+                                     b'POST /fabric_movement HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\n'
+                                     b'Transfer-Encoding: chunked\r\n\r\n' +
+                                     b'%x\r\n%s\r\n0\r\n\r\n' % (len(body), body) +
+                                     b'GET /ping HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+        self.assertEqual([line.split(b' ')[1] for line in response.split(b'\r\n') if line.startswith(b'HTTP/1.1')],
+                         [b'204', b'201', b'204'])
+        self.assertIn(b'Connection: close', response)
+
+    def test_requests_are_batched(self):
+        sizes = []
+        server, port, stop = start_server(self, batch_size=3, batch_latency=60, analyse=lambda batch: sizes.append(
+            [len(payload) for _, payload in batch]))
+        url = f'http://127.0.0.1:{port}/fabric_movement'
+        with requests.Session() as session:
+            for i in range(7):
+                session.post(url, json=[{'velocity': 1, 'displacement': i}] * (i + 1))
+        stop()
+        self.assertEqual(sizes, [[1, 2, 3], [4, 5, 6], [7]]) # the last one is flushed on stop
+        self.assertEqual(server.stats()['batcher']['batches'], 3)
+
+    def test_full_queue_is_rejected(self):
+        analysing, release = threading.Event(), threading.Event()
+
+        def analyse(batch):
+            analysing.set()
+            release.wait()
+
+        server, port, _ = start_server(self, batch_size=1, queue_size=1, analyse=analyse)
+        self.addCleanup(release.set) # before the server stops
+        url = f'http://127.0.0.1:{port}/fabric_movement'
+        sample = {'velocity': 1, 'displacement': 2}
+        self.assertEqual(requests.post(url, json=sample).status_code, 201)
+        self.assertTrue(analysing.wait(5))
+        self.assertEqual(requests.post(url, json=sample).status_code, 201) # waits in the queue
+        self.assertEqual(requests.post(url, json=sample).status_code, 503)
+        self.assertEqual(server.stats()['batcher']['rejected'], 1)
+
+    def test_load_generator(self):
+        _, port, _ = start_server(self)
+        results = asyncio.run(generate_load('127.0.0.1', port, looms=2, rate=50, duration=1, connections=4,
+                                            pictures_period=0.5))
+        self.assertEqual(results['errors'], 0)
+        self.assertEqual(results['statuses'], {'201': 104})
+        self.assertEqual(results['fabric_movement']['count'], 100)
+        self.assertGreater(results['fabric_movement']['p99'], 0)
+        self.assertGreater(results['requests_per_second'], 50)
+
+    def test_workers_share_the_socket(self):
+        sock = bind_socket('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        workers = start_workers(sock, 2, {'stats_period': None})
+        try:
+            wait_ready('127.0.0.1', sock.getsockname()[1], timeout=60) # pings until a worker answers
+        finally:
+            stop_workers(workers)
+        self.assertEqual([worker.process.exitcode for worker in workers], [0, 0])
+
+    def test_workers_stopped_while_starting(self):
+        sock = bind_socket('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        workers = start_workers(sock, 2, {'stats_period': None})
+        stop_workers(workers, timeout=60) # SIGTERM before the workers installed their handler
+        self.assertEqual([worker.process.exitcode for worker in workers], [0, 0])
+
+    def test_json_logs(self):
+        record = logging.LogRecord('ingestion_server', logging.INFO, __file__, 1, 'request', None, None)
+        record.fields = {'status': 201, 'path': '/ping'}
+        line = json.loads(JsonFormatter().format(record))
+        self.assertEqual((line['event'], line['status'], line['level']), ('request', 201, 'INFO'))
@@ -0,0 +1,28 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in of the API that keeps connections alive (the Flask development server closes them).
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_keep_alive_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
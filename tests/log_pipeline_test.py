@@ -0,0 +1,74 @@
+import logging
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from weaving_analyser.log_pipeline import BufferedRotatingFileHandler, LogWriter
+
+class FormattedOn:
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        return "value"
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / 'test.log'
+        self.logger = logging.getLogger(f'log_pipeline_test_{id(self)}')
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.handler = BufferedRotatingFileHandler(self.path, maxBytes=1000, backupCount=2)
+        self.writer = LogWriter(queue_size=1000, batch_size=10)
+        self.writer.add_logger(self.logger, self.handler)
+
+    def tearDown(self):
+        self.writer.stop()
+        self.handler.close()
+        self.directory.cleanup()
+
+    def test_formatted_by_the_writer(self):
+        argument = FormattedOn()
+        self.writer.start()
+        self.logger.debug("argument: %s", argument)
+        self.writer.stop()
+        self.assertEqual(argument.threads, ['log_writer'])
+        self.assertEqual(self.path.read_text(), "argument: value\n")
+
+    def test_rotation(self):
+        self.writer.start()
+        for i in range(300):
+            self.logger.info("record %03d", i) # 11 bytes
+        self.writer.stop()
+        files = sorted(Path(self.directory.name).glob('test.log*'))
+        self.assertEqual(len(files), 3) # test.log, test.log.1 and test.log.2
+        self.assertTrue(all(path.stat().st_size < 1000 for path in files))
+        self.assertTrue(self.path.read_text().endswith("record 299\n"))
+
+    def test_full_queue_drops(self):
+        writing = threading.Event()
+        logger = logging.getLogger(f'log_pipeline_test_blocked_{id(self)}')
+        logger.propagate = False
+        self.writer.add_logger(logger, lambda: (writing.wait(), logging.NullHandler())[1]) # blocks the writer
+        for i in range(1050):
+            logger.warning("record %d", i)
+        self.assertGreater(self.writer.stats()['dropped'], 0)
+        writing.set()
+        self.writer.stop()
+        self.assertEqual(self.writer.stats()['written'] + self.writer.stats()['dropped'], 1050)
+
+    def test_handlers_created_by_the_first_record(self):
+        path = Path(self.directory.name) / 'lazy' / 'lazy.log'
+        logger = logging.getLogger(f'log_pipeline_test_lazy_{id(self)}')
+        logger.propagate = False
+        def create():
+            path.parent.mkdir()
+            return BufferedRotatingFileHandler(path)
+        self.writer.add_logger(logger, create)
+        self.assertFalse(path.parent.exists())
+        logger.warning("first")
+        self.writer.stop() # started by the record
+        self.writer.handlers[logger.name][0].close()
+        self.assertEqual(path.read_text(), "first\n")
@@ -0,0 +1,91 @@
+import timeit
+import unittest
+import urllib.request
+from threading import Thread
+from unittest.mock import MagicMock
+from weaving_analyser.metrics import MetricsRegistry, MetricsServer, REGISTRY
+from weaving_analyser.velocity_handler import VelocityHandler
+
+class Plain:
+    value = 0
+
+    def inc(self):
+        self.value += 1
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_accumulates_per_thread(self):
+        counter = self.registry.counter("events_total", "Events.")
+        threads = [Thread(target=lambda: [counter.inc() for _ in range(10000)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.value(), 40000)
+        self.assertIs(self.registry.counter("events_total", "Events."), counter)
+
+    def test_exposition(self):
+        self.registry.counter("requests_total", "Requests.", labels={"endpoint": "ping"}).inc(3)
+        self.registry.gauge("depth", "Queue depth.", function=lambda: 2)
+        histogram = self.registry.histogram("duration_seconds", "Durations.", bounds=[0.1, 1])
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        lines = self.registry.exposition().splitlines()
+        self.assertIn('# TYPE requests_total counter', lines)
+        self.assertIn('requests_total{endpoint="ping"} 3', lines)
+        self.assertIn('depth 2', lines)
+        self.assertIn('duration_seconds_bucket{le="0.1"} 2', lines) # the bounds are inclusive
+        self.assertIn('duration_seconds_bucket{le="1"} 3', lines)
+        self.assertIn('duration_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('duration_seconds_sum 5.65', lines)
+        self.assertIn('duration_seconds_count 4', lines)
+
+    def test_type_mismatch(self):
+        self.registry.counter("events_total", "Events.")
+        with self.assertRaises(ValueError):
+            self.registry.gauge("events_total", "Events.")
+
+    def test_overhead(self):
+        counter = self.registry.counter("events_total", "Events.")
+        histogram = self.registry.histogram("duration_seconds", "Durations.")
+        plain = Plain()
+        baseline = min(timeit.repeat(lambda: plain.inc(), number=10000, repeat=5))
+        for metric_update in (lambda: counter.inc(), lambda: histogram.observe(0.002)):
+            # relative to a plain increment, so that it does not depend on the speed of the machine
+            self.assertLess(min(timeit.repeat(metric_update, number=10000, repeat=5)), 20 * baseline)
+
+    def test_cells_of_ended_threads_are_folded(self):
+        counter = self.registry.counter("events_total", "Events.")
+        histogram = self.registry.histogram("duration_seconds", "Durations.")
+        for _ in range(10):
+            thread = Thread(target=lambda: counter.inc() or histogram.observe(0.002))
+            thread.start()
+            thread.join()
+        self.assertEqual(counter.value(), 10)
+        self.assertEqual(histogram.snapshot()[1], 10)
+        self.assertEqual(len(counter._cells._cells), 0)
+        self.assertEqual(len(histogram._cells._cells), 0)
+
+    def test_server(self):
+        self.registry.counter("events_total", "Events.").inc()
+        server = MetricsServer(self.registry)
+        server.start()
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+                self.assertIn("events_total 1", response.read().decode())
+        finally:
+            server.stop()
+
+    def test_velocity_handler_samples(self):
+        velocity_handler = VelocityHandler()
+        velocity_handler.velocity_sensor_controller = MagicMock()
+        velocity_handler.velocity_sensor_controller.get_velocity.return_value = 60
+        update_seconds = REGISTRY.get("weaving_velocity_update_seconds")
+        samples = update_seconds.snapshot()[1]
+        for _ in range(3):
+            velocity_handler.update()
+        self.assertEqual(update_seconds.snapshot()[1], samples + 3)
+        self.assertEqual(REGISTRY.get("weaving_velocity_cm_per_second").value(), 1)
@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+from weaving_analyser.batch_codec import encode_capture_batch, BATCH_CONTENT_TYPE
+from weaving_analyser.picture_codecs import PictureEncoder, LOSSLESS_CODECS, available_codecs, benchmark, \
+    check_codec
+from hardware_controllers.cameras_controller import CaptureBatch, LightType, CameraPosition
+from server.server import app, decode_pictures_batch
+
+class TestPictureCodecs(unittest.TestCase):
+    def setUp(self):
+        gradient = np.linspace(0, 255, 64 * 80, dtype=np.uint8).reshape(64, 80, 1)
+        self.batch = CaptureBatch.allocate([LightType.GREEN, LightType.BLUE], list(CameraPosition), (64, 80, 3))
+        self.batch.frames[:] = gradient
+        self.batch.frames[1, 1] = 255 - gradient
+        self.batch.collected[:] = True
+
+    def decoded_pictures(self, body):
+        return [picture['picture'] for light in decode_pictures_batch(body)['lights']
+                for picture in light['pictures'].values()]
+
+    def test_lossless_round_trip(self):
+        for codec in set(LOSSLESS_CODECS) & set(available_codecs()):
+            with self.subTest(codec=codec):
+                body = encode_capture_batch(self.batch, encoder=PictureEncoder(codec))
+                for picture, frame in zip(self.decoded_pictures(body), self.batch.frames.reshape(4, 64, 80, 3)):
+                    np.testing.assert_array_equal(picture, frame)
+
+    def test_lossy_round_trip(self):
+        for codec in ('jpeg', 'webp'):
+            with self.subTest(codec=codec):
+                body = encode_capture_batch(self.batch, encoder=PictureEncoder(codec, quality=90))
+                self.assertLess(len(body), self.batch.frames.nbytes / 4)
+                for picture, frame in zip(self.decoded_pictures(body), self.batch.frames.reshape(4, 64, 80, 3)):
+                    self.assertEqual(picture.shape, frame.shape)
+                    self.assertLess(np.abs(picture.astype(int) - frame).mean(), 4)
+
+    def test_process_pool(self):
+        encoder = PictureEncoder('zlib', processes=2)
+        try:
+            body = encode_capture_batch(self.batch, [1], encoder=encoder)
+        finally:
+            encoder.close()
+        np.testing.assert_array_equal(self.decoded_pictures(body)[1], self.batch.frames[1, 1])
+
+    def test_check_codec(self):
+        with self.assertRaises(ValueError):
+            check_codec('gif')
+        with self.assertRaises(ValueError):
+            check_codec('jpeg', quality=0)
+
+    def test_server_rejects_unknown_codec(self):
+        body = encode_capture_batch(self.batch, encoder=PictureEncoder('zlib')).replace(b'"zlib"', b'"lzma"')
+        response = app.test_client().post('/pictures_batch', data=body, content_type=BATCH_CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
+
+    def test_benchmark(self):
+        results = benchmark([self.batch.frames[0, 0]], codecs=['raw', 'png'], repeat=1)
+        self.assertEqual([result['codec'] for result in results], ['raw', 'png'])
+        self.assertEqual(results[1]['max_error'], 0)
+        self.assertGreater(results[1]['ratio'], 1)
@@ -0,0 +1,89 @@
+import time
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from hardware_controllers.cameras_controller import CamerasController, CachedPictureSource, FilePictureSource, \
+    LightType, CameraPosition
+from hardware_controllers.cameras_controller.errors import PictureNotFoundError
+from hardware_controllers.clock import VirtualClock
+
+class TestCachedPictureSource(unittest.TestCase):
+    def setUp(self):
+        self.source = MagicMock()
+        self.source.get_picture.side_effect = lambda light_type, camera_position: np.zeros((10, 10, 3), np.uint8)
+
+    def test_decodes_once(self):
+        cache = CachedPictureSource(self.source)
+        first = cache.get_picture(LightType.GREEN, CameraPosition.LEFT)
+        self.assertIs(cache.get_picture(LightType.GREEN, CameraPosition.LEFT), first)
+        self.assertFalse(first.flags.writeable)
+        self.assertEqual(self.source.get_picture.call_count, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_lru_eviction(self):
+        cache = CachedPictureSource(self.source, byte_budget=2 * 300)
+        cache.get_picture(LightType.GREEN, CameraPosition.LEFT)
+        cache.get_picture(LightType.GREEN, CameraPosition.RIGHT)
+        cache.get_picture(LightType.GREEN, CameraPosition.LEFT)
+        cache.get_picture(LightType.BLUE, CameraPosition.LEFT) # evicts green right, the least recently used
+        cache.get_picture(LightType.GREEN, CameraPosition.LEFT)
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 3, 'evictions': 1, 'frames': 2, 'bytes': 600})
+
+    def test_memory_mapped_frames(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CachedPictureSource(self.source, byte_budget=300, directory=directory)
+            cache.get_picture(LightType.GREEN, CameraPosition.LEFT)
+            cache.get_picture(LightType.GREEN, CameraPosition.RIGHT)
+            frame = cache.get_picture(LightType.GREEN, CameraPosition.LEFT) # mapped again, not decoded again
+            self.assertIsInstance(frame, np.memmap)
+            self.assertFalse(frame.flags.writeable)
+            self.assertEqual(self.source.get_picture.call_count, 2)
+            self.assertEqual(cache.stats()['evictions'], 2)
+            del frame, cache
+
+    def test_missing_picture(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(PictureNotFoundError):
+                CachedPictureSource(FilePictureSource(directory)).get_picture(LightType.GREEN, CameraPosition.LEFT)
+
+class TestCamerasControllerPictures(unittest.TestCase):
+    def test_collect_pictures_uses_cache(self):
+        cameras_controller = CamerasController(clock=VirtualClock())
+        cameras_controller.open_cameras()
+        pictures = []
+        for _ in range(2):
+            cameras_controller.trigger()
+            pictures.append(cameras_controller.collect_pictures(LightType.GREEN))
+        self.assertEqual(pictures[0][0].shape, (760, 1000, 3))
+        self.assertIs(pictures[0][0], pictures[1][0])
+        self.assertIs(pictures[0][4], pictures[1][4])
+
+class TestConcurrentAcquisition(unittest.TestCase):
+    def setUp(self):
+        def get_picture(light_type, camera_position):
+            time.sleep(0.2) # slow camera
+            return np.zeros((10, 10, 3), np.uint8)
+        self.source = MagicMock()
+        self.source.get_picture.side_effect = get_picture
+
+    def collect(self, **kwargs):
+        cameras_controller = CamerasController(clock=VirtualClock(seed=1), picture_source=self.source, **kwargs)
+        cameras_controller.open_cameras()
+        cameras_controller.trigger()
+        start = time.monotonic()
+        pictures = cameras_controller.collect_pictures(LightType.GREEN)
+        return pictures, time.monotonic() - start
+
+    def test_latency_of_the_slowest_camera(self):
+        concurrent, concurrent_time = self.collect()
+        sequential, sequential_time = self.collect(concurrent_acquisition=False)
+        self.assertLess(concurrent_time, 0.35)
+        self.assertGreaterEqual(sequential_time, 0.4)
+        self.assertEqual(len(concurrent), 8)
+        self.assertEqual(concurrent[1:4] + concurrent[5:], sequential[1:4] + sequential[5:])
+
+    def test_camera_positions(self):
+        pictures, _ = self.collect(camera_positions=[CameraPosition.RIGHT])
+        self.assertEqual(len(pictures), 4)
+        self.source.get_picture.assert_called_once_with(LightType.GREEN, CameraPosition.RIGHT)
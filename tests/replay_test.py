@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from weaving_analyser.analyser import WeavingAnalyser
+from weaving_analyser.replay import replay, load_trace
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.velocities = rng.normal(600, 50, 3000) # cm/min
+        self.velocities[rng.random(len(self.velocities)) < 0.05] = 5000
+        self.timestamps = np.cumsum(rng.uniform(0.018, 0.022, len(self.velocities)))
+
+    def run_analyser(self, dts):
+        weaving_analyser = WeavingAnalyser()
+        weaving_analyser.velocity_handler.velocity_sensor_controller = MagicMock()
+        weaving_analyser.velocity_handler.velocity_sensor_controller.get_velocity.side_effect = list(self.velocities)
+        averages, triggers = [], []
+        for i, dt in enumerate(dts):
+            _, camera_due = weaving_analyser.tick(dt)
+            averages.append(weaving_analyser.velocity_handler.average_displacement)
+            if camera_due:
+                triggers.append(i)
+        return averages, triggers
+
+    def test_matches_analyser(self):
+        averages, triggers = self.run_analyser([None] * len(self.velocities))
+        result = replay(self.velocities)
+        np.testing.assert_allclose(result.average_displacement, averages, rtol=1e-9)
+        np.testing.assert_array_equal(result.trigger_indices, triggers)
+        self.assertGreater(len(triggers), 0)
+
+    def test_matches_analyser_with_timestamps(self):
+        dts = np.diff(self.timestamps, prepend=self.timestamps[0] - 0.02)
+        averages, triggers = self.run_analyser(dts)
+        result = replay(self.velocities, self.timestamps)
+        np.testing.assert_allclose(result.average_displacement, averages, rtol=1e-9)
+        np.testing.assert_array_equal(result.trigger_indices, triggers)
+        np.testing.assert_array_equal(result.trigger_timestamps, self.timestamps[triggers])
+
+    def test_catches_up_one_frame_per_sample(self):
+        velocities = np.full(20, 60 * 60 * 100 * 50.0) # 5000 cm per sample
+        result = replay(velocities)
+        np.testing.assert_array_equal(result.trigger_indices, np.arange(20))
+
+    def test_load_trace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.csv")
+            np.savetxt(path, np.column_stack((self.timestamps, self.velocities)), delimiter=",",
+                       header="timestamp,velocity", comments="")
+            timestamps, velocities = load_trace(path)
+            np.testing.assert_allclose(timestamps, self.timestamps)
+            np.testing.assert_allclose(velocities, self.velocities)
+
+            path = os.path.join(directory, "trace.npy")
+            np.save(path, self.velocities)
+            timestamps, velocities = load_trace(path)
+            self.assertIsNone(timestamps)
+            np.testing.assert_array_equal(velocities, self.velocities)
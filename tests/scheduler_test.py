@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+from weaving_analyser.scheduler import PeriodicScheduler, CatchUpPolicy, JitterHistogram
+from weaving_analyser.velocity_handler import VelocityHandler
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, duration):
+        self.now += duration + 0.001 # every sleep overshoots by 1 ms
+
+class TestPeriodicScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_no_drift(self):
+        scheduler = PeriodicScheduler(0.02, clock=self.clock, sleep=self.clock.sleep)
+        ticks = [scheduler.wait() for _ in range(501)]
+        self.assertAlmostEqual(ticks[-1].deadline, 110.0)
+        self.assertAlmostEqual(ticks[-1].time, 110.001) # overshoots do not accumulate
+        self.assertAlmostEqual(sum(tick.dt for tick in ticks[1:]), ticks[-1].time - ticks[0].time)
+
+    def test_skip_missed_ticks(self):
+        scheduler = PeriodicScheduler(0.02, policy=CatchUpPolicy.SKIP, clock=self.clock, sleep=self.clock.sleep)
+        scheduler.wait()
+        self.clock.now += 0.105 # the caller stalls
+        tick = scheduler.wait()
+        self.assertEqual(tick.missed, 4)
+        self.assertAlmostEqual(tick.dt, 0.105)
+        self.assertAlmostEqual(scheduler.wait().deadline, 100.12)
+        self.assertEqual(scheduler.stats()['missed'], 4)
+
+    def test_burst_catches_up(self):
+        scheduler = PeriodicScheduler(0.02, policy=CatchUpPolicy.BURST, clock=self.clock, sleep=self.clock.sleep)
+        scheduler.wait()
+        self.clock.now += 0.105
+        ticks = [scheduler.wait() for _ in range(6)]
+        self.assertEqual([tick.missed for tick in ticks], [0] * 6)
+        self.assertEqual([tick.time for tick in ticks[:5]], [100.105] * 5) # missed ticks run back to back
+        self.assertAlmostEqual(ticks[5].deadline, 100.12)
+
+    def test_wait_async(self):
+        scheduler = PeriodicScheduler(0.01)
+        async def run():
+            return [await scheduler.wait_async() for _ in range(10)]
+        ticks = asyncio.run(run())
+        self.assertAlmostEqual(ticks[-1].deadline - ticks[0].deadline, 0.09)
+        self.assertGreater(scheduler.stats()['rate'], 0)
+
+    def test_jitter_histogram(self):
+        histogram = JitterHistogram()
+        for _ in range(99):
+            histogram.record(30e-6)
+        histogram.record(0.015)
+        self.assertEqual(histogram.percentile(50), 50e-6) # upper bound of the bucket
+        self.assertEqual(histogram.percentile(99), 50e-6)
+        self.assertEqual(histogram.percentile(100), 0.015)
+        self.assertEqual(histogram.max, 0.015)
+
+    def test_measured_dt_displacement(self):
+        velocity_handler = VelocityHandler()
+        velocity_handler.velocity = 10
+        self.assertEqual(velocity_handler.get_displacement(0.05), 0.5)
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from hardware_controllers.cameras_controller import CamerasController, CaptureBatch, CameraPosition, LightType, \
+    SharedFrameRing
+from hardware_controllers.cameras_controller.shared_frame_ring import attach_frame
+from hardware_controllers.clock import VirtualClock
+from weaving_analyser.batch_codec import encode_capture_batch, BATCH_CONTENT_TYPE
+from weaving_analyser.camera_handler import CameraHandler
+from weaving_analyser.picture_codecs import PictureEncoder
+from server.server import app, decode_pictures_batch
+
+class TestSharedFrameRing(unittest.TestCase):
+    def setUp(self):
+        self.ring = SharedFrameRing(2)
+        self.addCleanup(self.ring.close)
+
+    def allocate(self):
+        return CaptureBatch.allocate([LightType.GREEN, LightType.BLUE], list(CameraPosition), (64, 80, 3),
+                                     allocate_frames=self.ring.allocate_frames)
+
+    def test_pictures_are_read_in_place(self):
+        first, second = self.allocate(), self.allocate()
+        slot, offset = self.ring.locate(second.frames[1, 0])
+        self.assertEqual(slot, 1)
+        picture = attach_frame(self.ring.name, offset, (64, 80, 3), '|u1')
+        second.frames[1, 0] = 7 # written after the attach: nothing was copied
+        self.assertTrue((picture == 7).all())
+        self.assertFalse(picture.flags.writeable)
+        self.assertIsNone(self.ring.locate(np.zeros((64, 80, 3), np.uint8)))
+        self.assertIsNone(self.ring.locate(first.frames[:, 0])) # not contiguous
+
+    def test_slots_are_bounded(self):
+        self.allocate()
+        with self.assertRaises(ValueError):
+            self.ring.allocate_frames((2, 2, 32, 80, 3), np.uint8)
+        self.allocate()
+        with self.assertRaises(ValueError):
+            self.allocate()
+
+    def test_encoder_processes_read_the_slots(self):
+        batch = self.allocate()
+        batch.frames[:] = np.linspace(0, 255, 64 * 80 * 3, dtype=np.uint8).reshape(64, 80, 3)
+        batch.frames[1, 1] = 255 - batch.frames[1, 1]
+        batch.collected[:] = True
+        encoder = PictureEncoder('zlib', processes=2)
+        encoder.frame_ring = self.ring
+        try:
+            body = encode_capture_batch(batch, encoder=encoder)
+        finally:
+            encoder.close()
+
+        pictures = [picture['picture'] for light in decode_pictures_batch(body)['lights']
+                    for picture in light['pictures'].values()]
+        for picture, frame in zip(pictures, batch.frames.reshape(4, 64, 80, 3)):
+            np.testing.assert_array_equal(picture, frame)
+        stats = encoder.handoff_stats()
+        self.assertEqual((stats['handed_off'], stats['pickled'], stats['in_flight']), (4, 0, 0))
+        self.assertGreater(stats['latency_max'], 0)
+        self.assertEqual(self.ring.stats()['slot_handoffs'], [4, 0])
+
+class TestCameraHandlerFrameRing(unittest.TestCase):
+    def test_captures_are_encoded_from_the_ring(self):
+        camera_handler = CameraHandler(picture_encoder=PictureEncoder('zlib', processes=1))
+        picture_source = MagicMock()
+        picture_source.get_picture.return_value = np.full((4, 4, 3), 9, np.uint8)
+        camera_handler.cameras_controller = CamerasController(clock=VirtualClock(), picture_source=picture_source)
+        client = app.test_client()
+        camera_handler.api_handler.send_encoded_pictures_batch = MagicMock(
+            side_effect=lambda body: client.post('/pictures_batch', data=body, content_type=BATCH_CONTENT_TYPE))
+        camera_handler.start()
+        for _ in range(3):
+            camera_handler()
+        camera_handler.stop()
+
+        self.assertEqual(camera_handler.api_handler.send_encoded_pictures_batch.call_count, 6)
+        stats = camera_handler.frame_ring_stats()
+        self.assertEqual((stats['handoffs'], stats['pickled'], stats['in_use']), (12, 0, 0))
+        self.assertEqual(stats['reuses'], 3 - stats['allocated'])
+        self.assertIsNone(CameraHandler().frame_ring) # raw pictures are not encoded in processes
@@ -0,0 +1,131 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from threading import Lock
+from unittest.mock import MagicMock
+import numpy as np
+from weaving_analyser.spool import PictureSpool, SpoolDrainer
+from weaving_analyser.camera_handler import CameraHandler
+from hardware_controllers.cameras_controller import CamerasController
+from hardware_controllers.clock import VirtualClock
+
+class TestPictureSpool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool = PictureSpool(self.directory.name, segment_bytes=100, max_bytes=1000)
+
+    def tearDown(self):
+        self.spool.close()
+        self.directory.cleanup()
+
+    def test_delivered_segments_are_deleted(self):
+        for body in (b'a' * 60, b'b' * 60, b'c' * 10):
+            self.spool.append(body)
+        self.assertEqual(self.spool.stats()['segments'], 2) # the first one is sealed at 100 bytes
+        records = self.spool.take(10)
+        self.assertEqual([record.body for record in records], [b'a' * 60, b'b' * 60, b'c' * 10])
+        for record in records[:2]:
+            self.spool.ack(record)
+        self.assertEqual(self.spool.stats()['segments'], 1)
+        self.assertEqual(len(list(Path(self.directory.name).glob('*.log'))), 1)
+        self.spool.nack(records[2])
+        self.assertEqual(self.spool.take(10)[0].body, b'c' * 10)
+
+    def test_recovery(self):
+        for body in (b'a' * 10, b'b' * 10, b'c' * 10):
+            self.spool.append(body)
+        self.spool.ack(self.spool.take(1)[0])
+        self.spool.close()
+        segment = next(Path(self.directory.name).glob('*.log'))
+        with open(segment, 'ab') as segment_file:
+            segment_file.write(b'\x00\x00\x01\x00torn') # crash during an append
+
+        self.spool = PictureSpool(self.directory.name, segment_bytes=100, max_bytes=1000)
+        self.assertEqual([record.body for record in self.spool.take(10)], [b'b' * 10, b'c' * 10])
+        self.spool.append(b'd')
+        self.assertEqual(self.spool.stats()['segments'], 2)
+
+    def test_eviction(self):
+        for _ in range(12):
+            self.spool.append(b'x' * 92)
+        stats = self.spool.stats()
+        self.assertLessEqual(stats['bytes'], 1000)
+        self.assertEqual(stats['evicted'], 12 - stats['pending'])
+        self.assertGreater(stats['evicted'], 0)
+
+    def test_corrupted_record(self):
+        self.spool.append(b'a' * 10)
+        segment = next(Path(self.directory.name).glob('*.log'))
+        with open(segment, 'r+b') as segment_file:
+            segment_file.seek(8)
+            segment_file.write(b'b')
+        self.assertEqual(self.spool.take(1), [])
+        self.assertEqual(self.spool.stats()['corrupted'], 1)
+        self.assertEqual(self.spool.stats()['delivered'], 0)
+        self.assertTrue(self.spool.wait_empty(0))
+
+class TestSpoolDrainer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool = PictureSpool(self.directory.name)
+        self.delivered = []
+        self.concurrent, self.max_concurrent = 0, 0
+        self.lock = Lock()
+
+    def tearDown(self):
+        self.spool.close()
+        self.directory.cleanup()
+
+    def send(self, body):
+        with self.lock:
+            if self.outage:
+                raise ConnectionError
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        time.sleep(0.02)
+        with self.lock:
+            self.concurrent -= 1
+            self.delivered.append(body)
+        return MagicMock(status_code=201 if body != b'rejected' else 400)
+
+    def test_replays_after_an_outage(self):
+        self.outage = True
+        drainer = SpoolDrainer(self.spool, self.send, concurrency=4, backoff=0.01, max_backoff=0.05)
+        drainer.start()
+        for index in range(20):
+            self.spool.append(str(index).encode())
+        time.sleep(0.2)
+        self.assertEqual(self.delivered, [])
+        self.outage = False
+        self.assertTrue(drainer.stop(timeout=5))
+        self.assertEqual(sorted(self.delivered), sorted(str(index).encode() for index in range(20)))
+        self.assertGreater(self.max_concurrent, 1) # not one batch at a time once the API is back
+        self.assertGreater(drainer.stats()['failed'], 0)
+
+    def test_rejected_batches_are_dropped(self):
+        self.outage = False
+        drainer = SpoolDrainer(self.spool, self.send, concurrency=1)
+        drainer.start()
+        self.spool.append(b'rejected')
+        self.assertTrue(drainer.stop(timeout=5))
+        self.assertEqual(drainer.stats()['rejected'], 1)
+        self.assertEqual(self.spool.stats()['delivered'], 0)
+        self.assertTrue(self.spool.wait_empty(0))
+
+class TestCameraHandlerSpool(unittest.TestCase):
+    def test_pictures_are_spooled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            camera_handler = CameraHandler(spool=PictureSpool(directory))
+            picture_source = MagicMock()
+            picture_source.get_picture.return_value = np.zeros((4, 4, 3), np.uint8)
+            camera_handler.cameras_controller = CamerasController(clock=VirtualClock(), picture_source=picture_source)
+            camera_handler.api_handler = MagicMock()
+            camera_handler.api_handler.send_encoded_pictures_batch.return_value.status_code = 201
+            camera_handler.start()
+            camera_handler()
+            camera_handler.stop()
+            self.assertEqual(camera_handler.api_handler.send_encoded_pictures_batch.call_count,
+                             len(CameraHandler.LIGHT_SEQUENCE))
+            stats = camera_handler.spool_stats()
+            self.assertEqual((stats['delivered'], stats['pending'], stats['segments']), (2, 0, 1))
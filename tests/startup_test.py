@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from benchmarks.startup_benchmark import measure
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def run_python(code, cwd):
+    environment = {**os.environ, "PYTHONPATH": str(ROOT)}
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=environment, capture_output=True, text=True,
+                            check=True)
+    return json.loads(result.stdout)
+
+class TestStartup(unittest.TestCase):
+    def test_import_has_no_side_effects(self):
+        with tempfile.TemporaryDirectory() as directory:
+            loaded = run_python("import json, sys, threading\n"
+                                "import weaving_analyser.config, hardware_controllers.cameras_controller\n"
+                                "heavy = [name for name in ('numpy', 'requests', 'PIL') if name in sys.modules]\n"
+                                "print(json.dumps([heavy, threading.active_count()]))", directory)
+            self.assertEqual(loaded, [[], 1]) # no heavy dependency, no thread
+            self.assertEqual(os.listdir(directory), []) # no log file
+
+    def test_package_attributes_are_lazy(self):
+        with tempfile.TemporaryDirectory() as directory:
+            loaded = run_python("import json, sys, weaving_analyser\n"
+                                "before = 'weaving_analyser.analyser' in sys.modules\n"
+                                "weaving_analyser.WeavingAnalyser\n"
+                                "print(json.dumps([before, 'weaving_analyser.analyser' in sys.modules, "
+                                "'requests' in sys.modules]))", directory)
+            self.assertEqual(loaded, [False, True, False])
+
+    def test_cold_start(self):
+        measures = measure()
+        self.assertEqual(measures["threads_after_import"], 1)
+        self.assertNotIn("requests", measures["modules_after_import"]) # import application
+        self.assertNotIn("numpy", measures["modules_after_import"])
+        self.assertLess(measures["first_sample_seconds"], 1)
@@ -0,0 +1,168 @@
+import contextlib
+import io
+import os
+import tempfile
+import signal
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from threading import Thread
+from werkzeug.serving import make_server
+from server.server import app
+import numpy as np
+from hardware_controllers.cameras_controller import CaptureBatch, LightType, CameraPosition
+from weaving_analyser.metrics import MetricsRegistry
+from weaving_analyser.supervisor import FloorUploader, LoomConfig, LoomSupervisor, LoomWorker, MetricsBoard, \
+    QueuedAPIhandler, choose_core
+
+def hang(stop_event, ignore_sigterm):
+    if ignore_sigterm:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    else:
+        signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+        stop_event.wait() # wakes up on SIGTERM
+    time.sleep(60) # hung, the stop event is not checked
+
+class TestMetricsBoard(unittest.TestCase):
+    def setUp(self):
+        self.board = MetricsBoard(2)
+        self.addCleanup(self.board.unlink)
+        self.addCleanup(self.board.close)
+
+    def test_rows_are_shared(self):
+        self.assertIsNone(self.board.read(0))
+        writer = MetricsBoard.attach(self.board.name, 2)
+        writer.write(1, {"samples": 10, "frames": 2})
+        writer.write(1, {"samples": 11})
+        writer.close()
+        metrics = self.board.read(1)
+        self.assertEqual((metrics["samples"], metrics["frames"]), (11, 2))
+        self.assertIsNone(self.board.read(0))
+        self.board.clear(1)
+        self.assertIsNone(self.board.read(1))
+
+    def test_row_being_written_is_not_read(self):
+        self.board.write(0, {"samples": 1})
+        self.board.rows[0][0] += 1 # writer died while writing
+        self.assertIsNone(self.board.read(0))
+
+class TestQueuedAPIhandler(unittest.TestCase):
+    def test_full_queue_drops(self):
+        import queue
+        api_handler = QueuedAPIhandler(queue.Queue(1), "loom_0")
+        self.assertEqual(api_handler.send_encoded_pictures_batch(b"pictures").status_code, 201)
+        self.assertEqual(api_handler.send_surface_movement_batch([]).status_code, 503)
+        self.assertEqual(api_handler.connection_stats(), {"queued": 1, "dropped": 1})
+        self.assertEqual(api_handler.upload_queue.get(), ("pictures_batch", "loom_0", b"pictures"))
+
+    def test_streamed_pictures_are_queued_encoded(self):
+        import queue
+        from server.server import decode_pictures_batch
+        api_handler = QueuedAPIhandler(queue.Queue(1), "loom_0")
+        batch = CaptureBatch.allocate([LightType.GREEN], [CameraPosition.LEFT], (4, 4, 3))
+        batch.frames[:] = 3
+        batch.collected[:] = True
+        self.assertEqual(api_handler.stream_pictures_batch(batch, [0]).status_code, 201)
+        kind, _, body = api_handler.upload_queue.get()
+        self.assertEqual(kind, "pictures_batch")
+        picture = decode_pictures_batch(body)["lights"][0]["pictures"]["left"]["picture"]
+        np.testing.assert_array_equal(picture, batch.frames[0, 0])
+
+class TestFloorUploader(unittest.TestCase):
+    def test_unexpected_errors_do_not_stop_the_uploader(self):
+        import queue
+        uploader = FloorUploader(queue.Queue(), workers=1)
+        uploader.api_handler = MagicMock()
+        uploader.api_handler.send_surface_movement_batch.side_effect = [TypeError("malformed"), MagicMock(
+            status_code=201)]
+        uploader.start()
+        for _ in range(2):
+            uploader.upload_queue.put(("fabric_movement", "loom_0", []))
+        uploader.stop()
+        self.assertEqual(uploader.stats(), {"loom_0": {"sent": 1, "rejected": 0, "failed": 1}})
+
+class TestLoomSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.shutdown)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.directory.name) # the workers write their logs under looms/
+        self.addCleanup(os.chdir, cwd)
+
+    def supervise(self, looms, **kwargs):
+        supervisor = LoomSupervisor(looms, ttl=60, uploader_workers=2, **kwargs)
+        supervisor.uploader.api_handler.port = self.server.port
+        with contextlib.redirect_stdout(io.StringIO()): # the server prints every request
+            supervisor.run()
+        metrics = supervisor.metrics()
+        supervisor.close()
+        return metrics
+
+    def test_looms_share_the_uploader(self):
+        metrics = self.supervise([LoomConfig("loom_0", virtual_clock_seed=0),
+                                  LoomConfig("loom_1", camera_positions=["left"], concurrent_acquisition=False,
+                                             virtual_clock_seed=1)])
+        for name in ("loom_0", "loom_1"):
+            loom = metrics["looms"][name]
+            self.assertTrue(loom["finished"])
+            self.assertEqual(loom["restarts"], 0)
+            self.assertGreater(loom["samples"], 2900) # 50 Hz for 60 seconds
+            self.assertGreater(loom["frames"], 0)
+            self.assertEqual(metrics["uploader"][name]["sent"], loom["requests_queued"])
+            self.assertEqual(metrics["uploader"][name]["failed"], 0)
+        self.assertTrue(os.path.isdir(os.path.join("looms", "loom_1")))
+        self.assertEqual(metrics["floor"]["samples"], metrics["looms"]["loom_0"]["samples"] +
+                         metrics["looms"]["loom_1"]["samples"])
+
+    def test_crashed_worker_is_restarted(self):
+        supervisor = LoomSupervisor([LoomConfig("broken", camera_positions=["nowhere"], virtual_clock_seed=0)],
+                                    ttl=20, restart_backoff=0.05, max_backoff=0.1)
+        self.addCleanup(supervisor.close)
+        supervisor.start()
+        deadline = time.monotonic() + 60
+        try:
+            while supervisor.workers[0].restarts < 2 and time.monotonic() < deadline:
+                supervisor.check()
+                time.sleep(0.05)
+        finally:
+            supervisor.stop()
+        self.assertGreaterEqual(supervisor.metrics()["looms"]["broken"]["restarts"], 2)
+        self.assertFalse(supervisor.workers[0].finished)
+
+    @patch("weaving_analyser.supervisor.SUPERVISOR_STOP_GRACE", 0.5)
+    def test_hung_worker_is_terminated_before_being_killed(self):
+        supervisor = LoomSupervisor([LoomConfig("loom_0")])
+        self.addCleanup(supervisor.close)
+        for ignore_sigterm, exitcode in ((False, -signal.SIGTERM), (True, -signal.SIGKILL)):
+            worker = LoomWorker(LoomConfig("loom_0"), 0, stop_event=supervisor._context.Event())
+            worker.process = supervisor._context.Process(target=hang, args=(worker.stop_event, ignore_sigterm))
+            worker.process.start()
+            time.sleep(0.5 if ignore_sigterm else 0) # let it ignore SIGTERM
+            with patch.object(worker.process, "kill", wraps=worker.process.kill) as kill:
+                supervisor._stop_worker(worker, 0.1)
+            self.assertTrue(worker.stop_event.is_set())
+            self.assertEqual(kill.called, ignore_sigterm)
+
+    def test_registered_metrics(self):
+        supervisor = LoomSupervisor([LoomConfig("loom_0")])
+        self.addCleanup(supervisor.close)
+        supervisor.board.write(0, {"samples": 5, "heartbeat": 1})
+        registry = MetricsRegistry()
+        supervisor.register_metrics(registry)
+        self.assertIn('weaving_loom_samples{loom="loom_0"} 5.0', registry.exposition().splitlines())
+
+    def test_duplicate_names(self):
+        with self.assertRaises(ValueError):
+            LoomSupervisor([LoomConfig("loom_0"), LoomConfig("loom_0")])
+
+    def test_core_choice(self):
+        if not hasattr(os, "sched_getaffinity"):
+            self.skipTest("no CPU affinity on this platform")
+        cores = sorted(os.sched_getaffinity(0))
+        self.assertEqual(choose_core(0, core=cores[0]), cores[0])
+        self.assertIn(choose_core(5), cores)
+        if len(cores) > 1:
+            self.assertNotIn(cores[0], {choose_core(slot) for slot in range(len(cores))})
@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from weaving_analyser.telemetry_batcher import TelemetryBatcher
+from weaving_analyser.velocity_handler import VelocityHandler
+from server.server import app
+
+class TestTelemetryBatcher(unittest.TestCase):
+    def setUp(self):
+        self.batcher = TelemetryBatcher(max_samples=3, max_latency=10, capacity=5)
+
+    def test_size_bound(self):
+        self.assertFalse(self.batcher.add(0, 1, 1))
+        self.assertFalse(self.batcher.add(1, 1, 2))
+        self.assertTrue(self.batcher.add(2, 1, 3))
+        self.assertFalse(self.batcher.add(3, 1, 4)) # already reported, waiting to be drained
+        self.assertEqual([sample['timestamp'] for sample in self.batcher.drain()], [0, 1, 2, 3])
+        self.assertEqual(len(self.batcher), 0)
+
+    def test_cancelled_batch_is_reported_again(self):
+        for i in range(3):
+            self.batcher.add(i, 1, i)
+        self.batcher.cancel() # the flush was dropped
+        self.assertTrue(self.batcher.add(3, 1, 3))
+        self.assertEqual(len(self.batcher.drain()), 4)
+
+    def test_latency_bound(self):
+        mock_monotonic = MagicMock(return_value=100)
+        self.batcher = TelemetryBatcher(max_samples=3, max_latency=10, capacity=5, clock=mock_monotonic)
+        self.assertFalse(self.batcher.add(0, 1, 1))
+        mock_monotonic.return_value = 110
+        self.assertTrue(self.batcher.add(1, 1, 2))
+
+    def test_drop_oldest_when_full(self):
+        for i in range(7):
+            self.batcher.add(i, 1, i)
+        self.assertEqual(self.batcher.dropped, 2)
+        self.assertEqual([sample['timestamp'] for sample in self.batcher.drain()], [2, 3, 4, 5, 6])
+
+    def test_velocity_handler_sends_one_request(self):
+        velocity_handler = VelocityHandler()
+        velocity_handler.velocity_sensor_controller = MagicMock()
+        velocity_handler.velocity_sensor_controller.get_velocity.return_value = 60
+        velocity_handler.api_handler = MagicMock()
+        due = [velocity_handler.update() for _ in range(25)]
+        self.assertEqual(due, [False] * 24 + [True])
+        velocity_handler()
+        velocity_handler.api_handler.send_surface_movement_batch.assert_called_once()
+        self.assertEqual(len(velocity_handler.api_handler.send_surface_movement_batch.call_args.args[0]), 25)
+
+    def test_server_accepts_arrays(self):
+        client = app.test_client()
+        samples = [{"timestamp": i, "velocity": 1, "displacement": i} for i in range(25)]
+        self.assertEqual(client.post('/fabric_movement', json={"samples": samples}).status_code, 201)
+        self.assertEqual(client.post('/fabric_movement', json=samples).status_code, 201)
+        self.assertEqual(client.post('/fabric_movement', data={"velocity": 1, "displacement": 2}).status_code, 201)
+        self.assertEqual(client.post('/fabric_movement', json=[{"velocity": 1}]).status_code, 400)
@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from weaving_analyser.trigger_scheduler import TriggerScheduler
+from weaving_analyser.replay import replay
+
+class TestTriggerScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = MagicMock(return_value=0.0)
+        self.scheduler = TriggerScheduler(25, clock=self.clock)
+
+    def test_triggers_ahead_of_the_latency(self):
+        self.scheduler.latency = 2
+        self.assertFalse(self.scheduler.update(14.9, 5))
+        self.assertTrue(self.scheduler.update(15, 5)) # 25 cm in 2 seconds at 5 cm/s
+        self.assertFalse(self.scheduler.update(16, 5))
+        self.assertEqual(self.scheduler.frame, 1)
+
+    def test_measures_the_latency_without_the_previous_iteration(self):
+        self.scheduler.update(25, 0)
+        self.clock.return_value = 1.5
+        self.scheduler.record_trigger(25)
+        self.assertEqual(self.scheduler.latency, 1.5)
+
+        self.clock.return_value = 8.0
+        self.scheduler.update(50, 0) # decided while the cameras are still busy
+        self.clock.return_value = 10.0
+        self.scheduler.record_iteration_end()
+        self.clock.return_value = 10.5
+        self.scheduler.record_trigger(50)
+        self.assertAlmostEqual(self.scheduler.latency, 1.5 + 0.2 * (0.5 - 1.5))
+        self.assertEqual(self.scheduler.iteration_time, 8.5) # from the trigger at 1.5 to the end at 10
+        self.assertEqual(self.scheduler.max_velocity(), 25 / 8.5)
+
+    def test_coverage_error(self):
+        for displacement in (25, 52, 74):
+            self.scheduler.record_trigger(displacement)
+        coverage = self.scheduler.stats()["coverage"]
+        self.assertEqual((coverage["frames"], coverage["gaps"], coverage["overlaps"]), (2, 1, 1))
+        self.assertEqual((coverage["max_gap"], coverage["max_overlap"]), (2, 3))
+        self.assertEqual((coverage["last_error"], coverage["mean_error"]), (-3, -0.5))
+
+    def test_dropped_and_missed_iterations(self):
+        self.scheduler.update(25, 0)
+        self.scheduler.update(50, 0)
+        self.scheduler.cancel()
+        self.scheduler.record_miss()
+        self.clock.return_value = 3.0
+        self.scheduler.record_trigger(50) # no iteration waiting: the latency is not measured
+        self.assertEqual(self.scheduler.latency, 0)
+        self.assertEqual(self.scheduler.stats()["missed"], 1)
+
+    def test_evicted_iteration(self):
+        for displacement in (25, 50, 75):
+            self.scheduler.update(displacement, 0)
+        self.scheduler.cancel(2) # evicted from the queue, the iterations of the frames 1 and 3 run
+        self.clock.return_value = 3.0
+        self.scheduler.record_trigger(25)
+        self.assertEqual(self.scheduler.latency, 3)
+        self.assertEqual([frame for frame, _ in self.scheduler._decisions], [3])
+
+    def test_replay_latency(self):
+        velocities = np.full(5000, 600.0) # 10 cm/s
+        on_time = replay(velocities).trigger_indices
+        ahead = replay(velocities, trigger_latency=0.5).trigger_indices
+        np.testing.assert_array_equal(on_time - ahead, np.full(len(on_time), 25)) # 0.5 s at 50 Hz
@@ -14,7 +14,8 @@ class TestVelocityHandler(unittest.TestCase):
         self.assertEqual(self.velocity_handler.get_displacement(), 0.2)
 
     def test_noise(self):
-        self.velocity_handler.velocity_buffer = [10, 10, 10, 10]
+        for _ in range(4):
+            self.velocity_handler.handle_velocity(10)
         self.assertLess(self.velocity_handler.handle_velocity(100), 100)
 
     @patch('hardware_controllers.velocity_sensor_controller.VelocitySensorController')
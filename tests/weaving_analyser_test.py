@@ -1,4 +1,5 @@
 import unittest
+from concurrent.futures import Future
 from unittest.mock import patch, MagicMock
 from weaving_analyser.velocity_handler import VelocityHandler
 from weaving_analyser.camera_handler import CameraHandler
@@ -21,3 +22,12 @@ class TestWeavingAnalyser(unittest.TestCase):
         self.weaving_analyzer.camera_handler()
         mock_call.assert_called_once_with()
 
+    def test_evicted_iteration_is_forgotten(self):
+        trigger_scheduler = self.weaving_analyzer.trigger_scheduler
+        for frame in (1, 2):
+            trigger_scheduler.update(frame * trigger_scheduler.vertical_fov, 0)
+        evicted, queued = Future(), Future()
+        evicted.cancel()
+        self.weaving_analyzer._iteration_evicted(evicted, 1)
+        self.weaving_analyzer._iteration_evicted(queued, 2)
+        self.assertEqual([frame for frame, _ in trigger_scheduler._decisions], [2])
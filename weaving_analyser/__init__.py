@@ -0,0 +1,28 @@
+from importlib import import_module
+
+# imported on first access, so that importing the package (or one of its light modules) stays cheap
+_LAZY_ATTRIBUTES = {
+    "WeavingAnalyser": ".analyser",
+    "AsyncWeavingAnalyser": ".async_analyser",
+    "VelocityHandler": ".velocity_handler",
+    "CameraHandler": ".camera_handler",
+    "APIhandler": ".api",
+    "AsyncAPIhandler": ".async_api",
+    "PictureEncoder": ".picture_codecs",
+    "PictureSpool": ".spool",
+    "TriggerScheduler": ".trigger_scheduler",
+    "MetricsServer": ".metrics",
+    "REGISTRY": ".metrics",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -1,16 +1,22 @@
 #! /usr/bin/env python3
-from .config import console_logger
-import time
+from .config import console_logger, error_logger, warning_logger, VELOCITY_WORKERS, PICTURE_WORKERS, \
+    VELOCITY_QUEUE_SIZE, VELOCITY_QUEUE_POLICY, PICTURE_QUEUE_SIZE, PICTURE_QUEUE_POLICY, SAMPLING_CATCH_UP_POLICY, \
+    STREAM_PICTURE_UPLOADS
+from concurrent.futures import Future
 from threading import Thread
-from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from signal import signal, SIGINT
 
-# use the following line to import the hardware_controllers package from the parent directory
-import sys, os
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from hardware_controllers.clock import Clock, SystemClock
 
 from .velocity_handler import VelocityHandler
 from .camera_handler import CameraHandler
+from .picture_codecs import PictureEncoder
+from .spool import PictureSpool
+from .bounded_executor import BoundedExecutor, SubmitPolicy
+from .scheduler import PeriodicScheduler, CatchUpPolicy
+from .trigger_scheduler import TriggerScheduler
+from .metrics import REGISTRY
 
     
 class WeavingAnalyser:
@@ -25,14 +31,20 @@ class WeavingAnalyser:
         Instance of the camera handler.
     updateThread : Thread
         Thread that updates the velocity handler.
-    threadPoolVelocity : ThreadPoolExecutor
-        Thread pool for the velocity handler.
-    threadPoolPictures : ThreadPoolExecutor
-        Thread pool for the camera handler.
-    _current_frame : int
-        Current frame number.
+    sampling_scheduler : PeriodicScheduler
+        Scheduler of the velocity samples, at VelocityHandler.SAMPLING_RATE.
+    threadPoolVelocity : BoundedExecutor
+        Thread pool for the velocity handler, with a bounded queue.
+    threadPoolPictures : BoundedExecutor
+        Thread pool for the camera handler, with a bounded queue.
+    trigger_scheduler : TriggerScheduler
+        Decides when to start the camera iterations, from the predicted displacement.
     do_run : bool
         Whether the WeavingAnalyser should run or not.
+    clock : Clock
+        Clock of the analyser and of the hardware controllers.
+    stop_time : float
+        Clock time at which the sampling loop ends, None to run until stopped.
 
     Methods
     -------
@@ -42,29 +54,52 @@ class WeavingAnalyser:
         Stop the WeavingAnalyser.
     update()
         Update the velocity and camera handlers.
+    tick(dt: float)
+        Read a velocity sample and decide what has to be sent.
+    metrics()
+        Get the metrics of the thread pools.
         
     """
 
-    def __init__(self) -> None:
+    def __init__(self, clock: Optional[Clock] = None, picture_encoder: Optional[PictureEncoder] = None,
+                 spool: Optional[PictureSpool] = None, stream_uploads: bool = STREAM_PICTURE_UPLOADS) -> None:
         """
         Initialize the WeavingAnalyser.
 
+        Args:
+            clock (Clock, optional): clock of the analyser and of the hardware controllers. Defaults to the system
+                clock; with a VirtualClock, the sampling loop drives the time and runs as fast as it can.
+            picture_encoder (PictureEncoder, optional): compression of the pictures. Defaults to PICTURE_CODEC.
+            spool (PictureSpool, optional): write-ahead spool of the pictures. Defaults to sending them directly.
+            stream_uploads (bool): stream the pictures to the API as they are encoded, without a spool.
+
         Returns
         -------
         None
         """
 
         self.do_run = False
-        self.velocity_handler = VelocityHandler()
-        self.camera_handler = CameraHandler()
+        self.clock = clock or SystemClock()
+        self.velocity_handler = VelocityHandler(clock=self.clock)
+        self.trigger_scheduler = TriggerScheduler(CameraHandler.VERTICAL_FOV, clock=self.clock.monotonic)
+        self.camera_handler = CameraHandler(clock=self.clock, picture_encoder=picture_encoder, spool=spool,
+                                            trigger_scheduler=self.trigger_scheduler, stream_uploads=stream_uploads)
         
         self.velocity_handler.register_observer(self.camera_handler)
         self.updateThread = Thread(target=self.update, name='update_thread', daemon=True)
         
         console_logger.info("WeavingAnalyser initialized.")
-        self.threadPoolVelocity = ThreadPoolExecutor(max_workers=50, thread_name_prefix='velocity_thread_')
-        self.threadPoolPictures = ThreadPoolExecutor(max_workers=2, thread_name_prefix='picture_thread_')
-        self.current_frame = 0
+        self.threadPoolVelocity = BoundedExecutor(max_workers=VELOCITY_WORKERS, max_queue_size=VELOCITY_QUEUE_SIZE,
+                                                  policy=SubmitPolicy(VELOCITY_QUEUE_POLICY),
+                                                  thread_name_prefix='velocity_thread_')
+        self.threadPoolPictures = BoundedExecutor(max_workers=PICTURE_WORKERS, max_queue_size=PICTURE_QUEUE_SIZE,
+                                                  policy=SubmitPolicy(PICTURE_QUEUE_POLICY),
+                                                  thread_name_prefix='picture_thread_')
+        self.sampling_scheduler = PeriodicScheduler(1 / VelocityHandler.SAMPLING_RATE,
+                                                    policy=CatchUpPolicy(SAMPLING_CATCH_UP_POLICY),
+                                                    clock=self.clock.monotonic, sleep=self.clock.sleep)
+        self.stop_time = None
+        self._register_metrics()
         
 
 
@@ -73,7 +108,7 @@ class WeavingAnalyser:
         Start the WeavingAnalyser.
 
         Args:
-            ttl (int, optional): time to live. Defaults to None.
+            ttl (int, optional): time to live (seconds of the analyser clock). Defaults to None.
 
         Returns
         -------
@@ -87,10 +122,13 @@ class WeavingAnalyser:
         self.do_run = True
         self.velocity_handler.start()
         self.camera_handler.start()
+        if ttl is not None:
+            self.stop_time = self.clock.monotonic() + ttl
+        self.clock.drive(self.updateThread)
         self.updateThread.start()
         
         if ttl is not None:
-            time.sleep(ttl) 
+            self.clock.sleep(ttl)
             self.stop()
         
         
@@ -107,9 +145,20 @@ class WeavingAnalyser:
         self.do_run = False
         self.velocity_handler.stop()
 
+        self.updateThread.join() # no task is submitted once the update thread is done
         self.threadPoolVelocity.shutdown(wait=False)
         self.threadPoolPictures.shutdown(wait=False)
-        self.updateThread.join()
+
+        import requests # imported by the API handlers on their first request
+
+        try:
+            self.velocity_handler() # send the samples still buffered
+        except requests.exceptions.RequestException as e:
+            error_logger.error("Failed to send the last velocity samples: %s", e)
+        self.camera_handler.stop() # send the pictures still in the capture pipeline
+
+        self.velocity_handler.api_handler.close()
+        self.camera_handler.api_handler.close()
 
     
     def update(self) -> None:
@@ -122,16 +171,133 @@ class WeavingAnalyser:
         """
 
         while self.do_run:
-            start_time = time.time()
-            
-            self.velocity_handler.update()
-
-            self.threadPoolVelocity.submit(self.velocity_handler)
-            avg_total_disp = sum(self.velocity_handler.displacement_buffer) / len(self.velocity_handler.displacement_buffer)
-            if (avg_total_disp // CameraHandler.VERTICAL_FOV) > self.current_frame: # displacement is large enough for a camera iteration
-                self.current_frame += 1
-                self.threadPoolPictures.submit(self.camera_handler)
-
-            elapsed_time = time.time() - start_time
-            sleep_duration = max(0, 1 / VelocityHandler.SAMPLING_RATE - elapsed_time) # account for the time taken to read the sensor
-            time.sleep(sleep_duration)
+            tick = self.sampling_scheduler.wait()
+            if self.stop_time is not None and tick.time >= self.stop_time:
+                break
+
+            samples_due, camera_due = self.tick(tick.dt)
+            if samples_due and self.threadPoolVelocity.submit(self.velocity_handler) is None:
+                self.velocity_handler.telemetry_batcher.cancel()
+
+            if camera_due:
+                frame = self.trigger_scheduler.frame
+                future = self.threadPoolPictures.submit(self.camera_handler)
+                if future is None:
+                    self.trigger_scheduler.cancel(frame)
+                    warning_logger.warning("Camera iteration %s dropped: pictures queue is full.", frame)
+                else: # evicted by a newer iteration with the drop_oldest and coalesce_latest policies
+                    future.add_done_callback(lambda future, frame=frame: self._iteration_evicted(future, frame))
+
+    def _iteration_evicted(self, future: Future, frame: int) -> None:
+        """
+        Forget the decision of a camera iteration evicted from the pictures queue before being run, so that the trigger
+        latency is not measured from it. Done callback of the camera iterations.
+
+        Args:
+            future (Future): future of the camera iteration.
+            frame (int): frame of the iteration.
+
+        Returns
+        -------
+        None
+        """
+        if not future.cancelled():
+            return
+
+        self.trigger_scheduler.cancel(frame)
+        if self.do_run: # not cancelled by the shutdown
+            warning_logger.warning("Camera iteration %s dropped: evicted from the pictures queue.", frame)
+
+    def tick(self, dt: Optional[float] = None) -> Tuple[bool, bool]:
+        """
+        Read a velocity sample and decide what has to be sent. Shared by the threaded and the asyncio engines.
+
+        Args:
+            dt (float, optional): measured time since the previous sample (seconds). Defaults to the sampling period.
+
+        Returns:
+            Tuple[bool, bool]: whether a batch of velocity samples is due and whether a camera iteration is due.
+        """
+        samples_due = self.velocity_handler.update(dt)
+        camera_due = self.trigger_scheduler.update(self.velocity_handler.total_displacement,
+                                                   self.velocity_handler.velocity)
+
+        return samples_due, camera_due
+
+    def _register_metrics(self) -> None:
+        """
+        Expose the sampling loop, the thread pools, the camera triggers, the frame pool and the spool in the metrics
+        registry. The gauges are read from their stats when the metrics are collected.
+
+        Returns
+        -------
+        None
+        """
+        sampling = self.sampling_scheduler
+        REGISTRY.gauge("weaving_sampling_ticks", "Ticks of the sampling loop.", function=lambda: sampling.ticks)
+        REGISTRY.gauge("weaving_sampling_missed_ticks", "Ticks of the sampling loop missed.",
+                       function=lambda: sampling.missed)
+        for quantile in (50, 99):
+            REGISTRY.gauge("weaving_sampling_lateness_seconds", "Lateness of the sampling ticks (seconds).",
+                           labels={"quantile": str(quantile / 100)},
+                           function=lambda quantile=quantile: sampling.jitter.percentile(quantile))
+
+        for name, pool in (("velocity", self.threadPoolVelocity), ("pictures", self.threadPoolPictures)):
+            labels = {"pool": name}
+            REGISTRY.gauge("weaving_pool_queue_depth", "Tasks waiting in the queue of a pool.", labels=labels,
+                           function=lambda pool=pool: pool.metrics()["queue_depth"])
+            REGISTRY.gauge("weaving_pool_workers", "Worker threads of a pool.", labels=labels,
+                           function=lambda pool=pool: pool.metrics()["workers"])
+            REGISTRY.gauge("weaving_pool_wait_seconds_max", "Longest time a task waited in the queue (seconds).",
+                           labels=labels, function=lambda pool=pool: pool.metrics()["wait_time_max"])
+            for state in ("submitted", "completed", "failed", "dropped", "coalesced"):
+                REGISTRY.gauge("weaving_pool_tasks", "Tasks of a pool, by state.", labels={**labels, "state": state},
+                               function=lambda pool=pool, state=state: pool.metrics()[state])
+
+        triggers = self.trigger_scheduler
+        REGISTRY.gauge("weaving_trigger_latency_seconds", "Smoothed trigger latency of the cameras (seconds).",
+                       function=lambda: triggers.latency)
+        REGISTRY.gauge("weaving_camera_iteration_seconds", "Smoothed camera iteration time (seconds).",
+                       function=lambda: triggers.iteration_time)
+        REGISTRY.gauge("weaving_coverage_error_cm", "Coverage error of the last frame (cm), positive for a gap.",
+                       function=lambda: triggers.stats()["coverage"]["last_error"])
+
+        frame_pool = self.camera_handler.frame_pool
+        REGISTRY.gauge("weaving_frame_pool_in_use", "Frame buffers checked out of the pool.",
+                       function=lambda: frame_pool.stats()["in_use"])
+        if self.camera_handler.frame_ring is not None:
+            camera_handler = self.camera_handler
+            REGISTRY.gauge("weaving_frame_ring_handoffs", "Pictures handed to the encoder processes in shared memory.",
+                           function=lambda: camera_handler.frame_ring_stats()["handoffs"])
+            REGISTRY.gauge("weaving_frame_ring_reuses", "Frame ring slots reused by a new capture.",
+                           function=lambda: camera_handler.frame_ring_stats()["reuses"])
+            REGISTRY.gauge("weaving_frame_ring_in_flight", "Pictures of the frame ring being encoded.",
+                           function=lambda: camera_handler.picture_encoder.handoff_stats()["in_flight"])
+        if self.camera_handler.spool is not None:
+            spool = self.camera_handler.spool
+            REGISTRY.gauge("weaving_spool_pending", "Batches of pictures waiting in the spool.",
+                           function=lambda: spool.stats()["pending"])
+            REGISTRY.gauge("weaving_spool_bytes", "Size of the spool (bytes).", function=lambda: spool.stats()["bytes"])
+
+    def metrics(self) -> dict:
+        """
+        Get the metrics of the sampling loop (rate, missed ticks, lateness), of the thread pools (queue depth,
+        dropped tasks, queue wait time), of the camera triggers (latency, coverage error), of the capture pipeline
+        (latency of each stage), of the frame pool (occupancy), of the frame ring (handoffs to the encoder processes)
+        and of the spool (backlog and deliveries).
+
+        Returns:
+            dict: metrics of the sampling loop, of the camera triggers, of the velocity and pictures pools, of the
+                capture pipeline, of the frame pool, of the frame ring (None without a frame ring) and of the spool
+                (None without a spool).
+        """
+        return {
+            "sampling": self.sampling_scheduler.stats(),
+            "triggers": self.trigger_scheduler.stats(),
+            "velocity_pool": self.threadPoolVelocity.metrics(),
+            "pictures_pool": self.threadPoolPictures.metrics(),
+            "capture_pipeline": self.camera_handler.pipeline.metrics(),
+            "frame_pool": self.camera_handler.frame_pool.stats(),
+            "frame_ring": self.camera_handler.frame_ring_stats(),
+            "spool": self.camera_handler.spool_stats()
+        }
@@ -1,10 +1,105 @@
-import requests
-from typing import List
+from __future__ import annotations # requests is imported on first use, see APIhandler.session
+from functools import lru_cache
+from itertools import count
+from threading import Lock
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Sequence, Union
 import time
-from hardware_controllers.cameras_controller import LightType
-from .config import light_dict
-import base64
-import numpy as np
+from hardware_controllers.cameras_controller import CaptureBatch
+from .config import API_CONNECT_TIMEOUT, API_READ_TIMEOUT, API_RETRIES, API_BACKOFF_FACTOR
+from .batch_codec import encode_capture_batch, stream_capture_batch, BATCH_CONTENT_TYPE, BATCH_STREAM_CONTENT_TYPE
+from .metrics import REGISTRY
+from .picture_codecs import PictureEncoder
+
+if TYPE_CHECKING:
+    import requests
+
+
+def record_request(endpoint: str, start: float, status_code: Optional[int], body_size: int = 0) -> None:
+    """
+    Record a request to the API in the metrics registry. Shared by APIhandler and AsyncAPIhandler.
+
+    Args:
+        endpoint (str): path of the request, without the leading slash.
+        start (float): time.perf_counter() when the request was sent.
+        status_code (int, optional): status of the response, None if no response was received.
+        body_size (int): size of the request body (bytes).
+    """
+    labels = {"endpoint": endpoint}
+    REGISTRY.histogram("weaving_api_request_seconds", "Duration of the requests to the API (seconds).",
+                       labels=labels).observe(time.perf_counter() - start)
+    REGISTRY.counter("weaving_api_requests_total", "Requests to the API, by response status.",
+                     labels={**labels, "status": str(status_code) if status_code is not None else "error"}).inc()
+    REGISTRY.counter("weaving_api_request_bytes_total", "Size of the request bodies sent to the API (bytes).",
+                     labels=labels).inc(body_size)
+
+class StreamedBody:
+    """
+    Request body sent with chunked transfer-encoding as its chunks are produced, counting the bytes sent. The chunks
+    are produced again when the request is retried.
+
+    Attributes
+    ----------
+    sent : int
+        Number of bytes sent by the last attempt.
+    """
+
+    def __init__(self, chunks: Callable[[], Iterable[Union[bytes, memoryview]]]) -> None:
+        self._chunks = chunks
+        self.sent = 0
+
+    def __iter__(self) -> Iterator[Union[bytes, memoryview]]:
+        self.sent = 0
+        for chunk in self._chunks():
+            self.sent += len(chunk)
+            yield chunk
+
+
+@lru_cache(maxsize=None)
+def counting_http_adapter() -> type:
+    """
+    Get the CountingHTTPAdapter class, defined on first use so that requests and urllib3 are only imported once a
+    handler sends its first request.
+
+    Returns:
+        type: CountingHTTPAdapter, a requests HTTPAdapter.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection
+    from urllib3.connectionpool import HTTPConnectionPool
+
+    class CountingHTTPAdapter(HTTPAdapter):
+        """
+        HTTPAdapter that counts the TCP connections it opens, including the reconnections of pooled connections that
+        were closed by the server (urllib3 only counts the connection objects it creates).
+
+        Attributes
+        ----------
+        new_connections : int
+            Number of TCP connections opened.
+        """
+
+        def __init__(self, *args, **kwargs) -> None:
+            self._connections_counter = count()
+            self.new_connections = 0
+            super().__init__(*args, **kwargs)
+
+        def init_poolmanager(self, *args, **kwargs) -> None:
+            super().init_poolmanager(*args, **kwargs)
+            adapter = self
+
+            class CountingHTTPConnection(HTTPConnection):
+                def connect(self) -> None:
+                    adapter.new_connections = next(adapter._connections_counter) + 1
+                    super().connect()
+
+            class CountingHTTPConnectionPool(HTTPConnectionPool):
+                ConnectionCls = CountingHTTPConnection
+
+            self.poolmanager.pool_classes_by_scheme = {**self.poolmanager.pool_classes_by_scheme,
+                                                       "http": CountingHTTPConnectionPool}
+
+    return CountingHTTPAdapter
+
 
 class APIhandler:
     """
@@ -16,28 +111,48 @@ class APIhandler:
         Domain of the API.
     port : int
         Port of the API.
+    timeout : Tuple[float, float]
+        Connect and read timeouts of every request (seconds).
+    session : requests.Session
+        Session holding the pool of keep-alive connections to the API.
 
     Methods
     -------
     ping()
         Ping the API.
-    encode_image(image: np.ndarray)
-        Encode an image to base64.
-    prepare_body(light: np.ndarray, velocity: float, displacement: float, light_type: LightType)
-        Prepare the body of the request to the API.
+    connection_stats()
+        Get the number of requests sent and how many of them reused a pooled connection.
+    close()
+        Close the pooled connections.
     surface_movement_body(velocity: float, displacement: float)
         Prepare the body of the request to the API.
     send_surface_movement(velocity: float, displacement: float)
         Send the surface movement to the API.    
-    send_pictures_batch(pictures_batch: List)
+    send_surface_movement_batch(samples: List[dict])
+        Send a batch of timestamped surface movement samples to the API.
+    send_pictures_batch(batch: CaptureBatch, light_indices: Sequence[int])
         Send a batch of pictures to the API.
+    send_encoded_pictures_batch(body: bytes)
+        Send an encoded batch of pictures to the API.
+    stream_pictures_batch(batch: CaptureBatch, light_indices: Sequence[int], encoder: PictureEncoder)
+        Stream a batch of pictures to the API, encoding each picture as it is sent.
 
     """
 
-    def __init__(self):
+    def __init__(self, pool_size: int = 1, connect_timeout: float = API_CONNECT_TIMEOUT,
+                 read_timeout: float = API_READ_TIMEOUT, retries: int = API_RETRIES,
+                 backoff_factor: float = API_BACKOFF_FACTOR):
         """
         Initialize the APIhandler.
 
+        Args:
+            pool_size (int): maximum number of connections kept alive, should match the number of threads using
+                this handler.
+            connect_timeout (float): timeout to establish a connection (seconds).
+            read_timeout (float): timeout to wait for a response (seconds).
+            retries (int): number of retries on connection errors and 502/503/504 responses.
+            backoff_factor (float): backoff factor between retries (seconds).
+
         Returns
         -------
         None
@@ -45,6 +160,29 @@ class APIhandler:
 
         self.domain = "127.0.0.1"
         self.port = 5000
+        self.timeout = (connect_timeout, read_timeout)
+        self._pool_size = pool_size
+        self._retries, self._backoff_factor = retries, backoff_factor
+        self._session = None
+        self._session_lock = Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        # created on first use: requests is only imported when the first request is sent
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from urllib3.util.retry import Retry
+
+                    retry = Retry(total=self._retries, read=0, backoff_factor=self._backoff_factor,
+                                  status_forcelist=(502, 503, 504), allowed_methods=None, raise_on_status=False)
+                    session = requests.Session()
+                    session.headers["Connection"] = "keep-alive"
+                    session.mount("http://", counting_http_adapter()(pool_connections=1, pool_maxsize=self._pool_size,
+                                                                     max_retries=retry))
+                    self._session = session
+        return self._session
 
 
     def ping(self):
@@ -55,52 +193,40 @@ class APIhandler:
             requests.Response: response from the API.
         """
         url = f"http://{self.domain}:{self.port}/ping"
-        response = requests.get(url)
+        response = self.session.get(url, timeout=self.timeout)
         return response
-    
-    def encode_image(self, image: np.ndarray):
-        """
-        Encode an image to base64.
 
-        Args:
-            image (np.ndarray): image array
+    def connection_stats(self) -> dict:
+        """
+        Get the number of requests sent and how many of them reused a pooled connection.
 
         Returns:
-            bytes: base64 encoded image.
+            dict: requests sent, new connections opened and connections reused.
         """
-        return base64.b64encode(image)
+        if self._session is None:
+            return {"requests": 0, "new_connections": 0, "reused_connections": 0}
 
+        adapter = self.session.get_adapter(f"http://{self.domain}")
+        pools = adapter.poolmanager.pools
+        requests_sent = sum(pools[key].num_requests for key in pools.keys())
+        new_connections = adapter.new_connections
 
-    def prepare_body(self, light: np.ndarray, velocity: float, displacement: float, light_type: LightType) -> dict:
+        return {
+            "requests": requests_sent,
+            "new_connections": new_connections,
+            "reused_connections": requests_sent - new_connections
+        }
 
+    def close(self) -> None:
         """
-        Prepare the body of the request to the API.
+        Close the pooled connections.
 
-        Returns:
-            Dict: body of the request.
+        Returns
+        -------
+        None
         """
-        return {
-            "light": light_dict[light_type],
-            "creation_date": time.time(),
-            "velocity": velocity,
-            "displacement": displacement,
-            "pictures": {
-                "left:": {
-                    "picture": self.encode_image(light[0]),
-                    "iso": light[3],
-                    "exposure_time": light[1],
-                    "diaphragm_opening": light[2],
-                    "picture_shape": light[0].shape
-                    }
-                },
-                "right": {
-                    "picture": self.encode_image(light[4]),
-                    "iso": light[7],
-                    "exposure_time": light[5],
-                    "diaphragm_opening": light[6],
-                    "picture_shape": light[4].shape
-                }
-        }
+        if self._session is not None:
+            self._session.close()
     
     def surface_movement_body(self, velocity: float, displacement: float) -> dict:
         """
@@ -118,23 +244,53 @@ class APIhandler:
             "displacement": displacement
         }
 
-    def send_pictures_batch(self, pictures_batch: List) -> requests.Response:
+    def send_pictures_batch(self, batch: CaptureBatch,
+                            light_indices: Optional[Sequence[int]] = None) -> requests.Response:
         """
-        Send a batch of pictures to the API.
+        Send a batch of pictures to the API, encoded in the binary batch format (see batch_codec).
 
         Args:
-            pictures_batch (List): batch of pictures.
+            batch (CaptureBatch): batch of pictures.
+            light_indices (Sequence[int], optional): indices of the light types to send. Defaults to every light
+                type whose pictures were collected.
 
         Returns:
             requests.Response: response from the API.
         """
-        url = f"http://{self.domain}:{self.port}/pictures_batch"
-        data = {
-            "lights": pictures_batch
-        }
-        response = requests.post(url, data=data)
-        return response
+        return self.send_encoded_pictures_batch(encode_capture_batch(batch, light_indices))
+
+    def send_encoded_pictures_batch(self, body: bytes) -> requests.Response:
+        """
+        Send a batch of pictures already encoded with batch_codec.encode_capture_batch to the API.
+
+        Args:
+            body (bytes): encoded batch of pictures.
+
+        Returns:
+            requests.Response: response from the API.
+        """
+        return self._post("pictures_batch", data=body, headers={"Content-Type": BATCH_CONTENT_TYPE})
     
+    def stream_pictures_batch(self, batch: CaptureBatch, light_indices: Optional[Sequence[int]] = None,
+                              encoder: Optional[PictureEncoder] = None) -> requests.Response:
+        """
+        Stream a batch of pictures to the API with chunked transfer-encoding (see stream_capture_batch): each picture
+        is encoded while the previous one is sent, and a single encoded picture is held at once.
+
+        The pictures are encoded again when the request is retried.
+
+        Args:
+            batch (CaptureBatch): batch of pictures, which must not be overwritten until the response is received.
+            light_indices (Sequence[int], optional): indices of the light types to send. Defaults to every light
+                type whose pictures were collected.
+            encoder (PictureEncoder, optional): compression of the pictures. Defaults to raw pictures.
+
+        Returns:
+            requests.Response: response from the API.
+        """
+        body = StreamedBody(lambda: stream_capture_batch(batch, light_indices, encoder))
+        return self._post("pictures_batch", data=body, headers={"Content-Type": BATCH_STREAM_CONTENT_TYPE})
+
     def send_surface_movement(self, velocity: float, displacement: float) -> requests.Response:
         """
         Send the surface movement to the API.
@@ -146,6 +302,43 @@ class APIhandler:
         Returns:
             requests.Response: response from the API.
         """
-        url = f"http://{self.domain}:{self.port}/fabric_movement"
-        response = requests.post(url, data=self.surface_movement_body(velocity, displacement))
-        return response
\ No newline at end of file
+        return self._post("fabric_movement", data=self.surface_movement_body(velocity, displacement))
+
+    def send_surface_movement_batch(self, samples: List[dict]) -> requests.Response:
+        """
+        Send a batch of timestamped surface movement samples to the API, as a JSON array.
+
+        Args:
+            samples (List[dict]): samples with timestamp, velocity and displacement.
+
+        Returns:
+            requests.Response: response from the API.
+        """
+        return self._post("fabric_movement", json={"samples": samples})
+
+    def _post(self, endpoint: str, **kwargs) -> requests.Response:
+        """
+        Post a request to an endpoint of the API and record it in the metrics.
+
+        Args:
+            endpoint (str): path of the endpoint, without the leading slash.
+            **kwargs: arguments of requests.Session.post.
+
+        Returns:
+            requests.Response: response from the API.
+        """
+        session = self.session
+        import requests # already imported by the session
+
+        url = f"http://{self.domain}:{self.port}/{endpoint}"
+        start = time.perf_counter()
+        try:
+            response = session.post(url, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            record_request(endpoint, start, None)
+            raise
+
+        body = response.request.body
+        body_size = body.sent if isinstance(body, StreamedBody) else len(body) if body else 0
+        record_request(endpoint, start, response.status_code, body_size)
+        return response
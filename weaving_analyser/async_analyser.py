@@ -0,0 +1,263 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from signal import SIGINT
+from typing import Optional
+
+from .config import console_logger, info_logger, error_logger, warning_logger, PICTURE_WORKERS, \
+    PICTURE_QUEUE_SIZE, ASYNC_MAX_IN_FLIGHT, ASYNC_STOP_TIMEOUT
+from .analyser import WeavingAnalyser
+from .async_api import AsyncAPIhandler
+from .picture_codecs import PictureEncoder
+from .spool import PictureSpool
+
+
+class AsyncWeavingAnalyser(WeavingAnalyser):
+    """
+    AsyncWeavingAnalyser runs the WeavingAnalyser on an asyncio event loop instead of the update thread and the
+    velocity and pictures thread pools.
+
+    The sampling loop, the sampling decisions (WeavingAnalyser.tick) and the VelocityHandler/CameraHandler logic are
+    the same as in the threaded engine. The API requests are sent with a non-blocking HTTP client, so thousands of
+    them can be in flight on a single thread; only the blocking camera collection runs in an executor.
+
+    Attributes
+    ----------
+    async_api_handler : AsyncAPIhandler
+        Non-blocking API handler shared by all the requests.
+    _camera_executor : ThreadPoolExecutor
+        Executor running the blocking camera iterations.
+    _in_flight : asyncio.Semaphore
+        Limits the number of requests in flight.
+    _pending_iterations : int
+        Number of camera iterations waiting for or using the cameras.
+    _tasks : Set[asyncio.Task]
+        Running tasks (requests and camera iterations).
+    _stopped : asyncio.Event
+        Set when the analyser is stopped.
+
+    Methods
+    -------
+    start(ttl: int)
+        Start the AsyncWeavingAnalyser and block until it stops.
+    run(ttl: int)
+        Run the AsyncWeavingAnalyser on the running event loop.
+    stop()
+        Stop the AsyncWeavingAnalyser.
+    sample()
+        Sampling loop.
+    """
+
+    MAX_PENDING_ITERATIONS = PICTURE_WORKERS + PICTURE_QUEUE_SIZE # same bound as the threaded pictures pool
+
+    def __init__(self, picture_encoder: Optional[PictureEncoder] = None, spool: Optional[PictureSpool] = None) -> None:
+        """
+        Initialize the AsyncWeavingAnalyser.
+
+        Args:
+            picture_encoder (PictureEncoder, optional): compression of the pictures. Defaults to PICTURE_CODEC.
+            spool (PictureSpool, optional): write-ahead spool of the pictures. Defaults to sending them directly.
+
+        Returns
+        -------
+        None
+        """
+        super().__init__(picture_encoder=picture_encoder, spool=spool)
+        self.async_api_handler = AsyncAPIhandler()
+        self._camera_executor = ThreadPoolExecutor(max_workers=PICTURE_WORKERS, thread_name_prefix='camera_thread_')
+        self._in_flight = None
+        self._pending_iterations = 0
+        self._tasks = set()
+        self._stopped = None
+
+    def start(self, ttl=None) -> None:
+        """
+        Start the AsyncWeavingAnalyser and block until it stops.
+
+        Args:
+            ttl (int, optional): time to live. Defaults to None.
+
+        Returns
+        -------
+        None
+        """
+        asyncio.run(self.run(ttl))
+
+    async def run(self, ttl=None) -> None:
+        """
+        Run the AsyncWeavingAnalyser on the running event loop until it is stopped or its ttl expires, then let the
+        camera iterations and requests in flight finish, for up to ASYNC_STOP_TIMEOUT seconds.
+
+        Args:
+            ttl (int, optional): time to live. Defaults to None.
+
+        Returns
+        -------
+        None
+        """
+        console_logger.info("Starting handlers (asyncio engine).")
+        loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._in_flight = asyncio.Semaphore(ASYNC_MAX_IN_FLIGHT)
+
+        try:
+            loop.add_signal_handler(SIGINT, self.stop) # ends the program when ctrl+c is pressed
+        except (NotImplementedError, RuntimeError): # not on the main thread or not supported by the platform
+            pass
+
+        self.do_run = True
+        self.velocity_handler.start()
+        self.camera_handler.start()
+        sampling_task = asyncio.create_task(self.sample())
+
+        try:
+            await asyncio.wait_for(self._stopped.wait(), ttl)
+        except asyncio.TimeoutError:
+            pass
+
+        console_logger.info("Stopping all handlers.")
+        self.do_run = False
+        await sampling_task
+        self.velocity_handler.stop()
+
+        await self._send_samples() # send the samples still buffered
+        # the camera iterations and requests in flight finish, like the pipeline of the threaded engine is flushed
+        running = set()
+        if self._tasks:
+            _, running = await asyncio.wait(list(self._tasks), timeout=ASYNC_STOP_TIMEOUT)
+        if running:
+            warning_logger.warning("%s tasks still running after %s seconds, cancelled.", len(running),
+                                   ASYNC_STOP_TIMEOUT)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+        self._camera_executor.shutdown(wait=False)
+        self.camera_handler.stop() # stop the encoder processes
+        await self.async_api_handler.close()
+
+    def stop(self) -> None:
+        """
+        Stop the AsyncWeavingAnalyser.
+
+        Returns
+        -------
+        None
+        """
+        self.do_run = False
+        if self._stopped is not None:
+            self._stopped.set()
+
+    async def sample(self) -> None:
+        """
+        Sampling loop: reads the velocity at SAMPLING_RATE, on the sampling scheduler deadlines, and starts the
+        requests and camera iterations that are due.
+
+        Returns
+        -------
+        None
+        """
+        while self.do_run:
+            tick = await self.sampling_scheduler.wait_async()
+            samples_due, camera_due = self.tick(tick.dt)
+            if samples_due:
+                self._spawn(self._send_samples())
+
+            if camera_due:
+                if self._pending_iterations >= AsyncWeavingAnalyser.MAX_PENDING_ITERATIONS:
+                    self.trigger_scheduler.cancel()
+                    warning_logger.warning("Camera iteration %s dropped: cameras are busy.",
+                                           self.trigger_scheduler.frame)
+                else:
+                    self._spawn(self._camera_iteration())
+
+    def _spawn(self, coroutine) -> None:
+        """
+        Run a coroutine as a task, keeping a reference to it until it is done.
+
+        Returns
+        -------
+        None
+        """
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        """
+        Forget a finished task and log its error, if any.
+
+        Returns
+        -------
+        None
+        """
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            error_logger.error("Task failed: %r", task.exception())
+
+    async def _send_samples(self) -> None:
+        """
+        Send the buffered velocity samples to the API.
+
+        Returns
+        -------
+        None
+        """
+        samples = self.velocity_handler.take_samples()
+        if not samples:
+            return
+
+        async with self._in_flight:
+            await self.async_api_handler.send_surface_movement_batch(samples)
+
+    async def _camera_iteration(self) -> None:
+        """
+        Take and encode a batch of pictures in the camera executor, then send it to the API (or append it to the
+        spool, whose drainer sends it).
+
+        Returns
+        -------
+        None
+        """
+        self._pending_iterations += 1
+        try:
+            batch = await asyncio.get_running_loop().run_in_executor(self._camera_executor,
+                                                                     self.camera_handler.make_batch)
+        finally:
+            self._pending_iterations -= 1
+
+        if batch is None:
+            return
+
+        try:
+            body = await asyncio.get_running_loop().run_in_executor(self._camera_executor,
+                                                                    self.camera_handler.encode_batch, batch)
+        finally:
+            self.camera_handler.release_batch(batch) # the pictures were copied into the body
+
+        if self.camera_handler.spool is not None:
+            await asyncio.get_running_loop().run_in_executor(self._camera_executor, self.camera_handler.spool.append,
+                                                             body)
+            return
+
+        console_logger.info("Sending batch of pictures to API.")
+        info_logger.info("Sending batch request to API.")
+        async with self._in_flight:
+            await self.async_api_handler.send_encoded_pictures_batch(body)
+
+    def metrics(self) -> dict:
+        """
+        Get the metrics of the asyncio engine.
+
+        Returns:
+            dict: sampling loop metrics, requests in flight, pending camera iterations, camera triggers, frame pool
+                occupancy, spool statistics and API connection stats.
+        """
+        return {
+            "sampling": self.sampling_scheduler.stats(),
+            "tasks": len(self._tasks),
+            "pending_camera_iterations": self._pending_iterations,
+            "triggers": self.trigger_scheduler.stats(),
+            "frame_pool": self.camera_handler.frame_pool.stats(),
+            "spool": self.camera_handler.spool_stats(),
+            "api_connections": self.async_api_handler.connection_stats()
+        }
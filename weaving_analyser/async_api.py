@@ -0,0 +1,414 @@
+import asyncio
+import json
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from .config import API_CONNECT_TIMEOUT, API_READ_TIMEOUT, API_RETRIES, API_BACKOFF_FACTOR, ASYNC_API_POOL_SIZE
+from hardware_controllers.cameras_controller import CaptureBatch
+
+from .api import record_request
+from .batch_codec import encode_capture_batch, BATCH_CONTENT_TYPE
+
+
+class AsyncResponse(NamedTuple):
+    """
+    Response of the AsyncHTTPClient.
+    """
+    status_code: int
+    headers: dict
+    content: bytes
+
+
+class ConnectError(OSError):
+    """
+    The connection to the server could not be opened (refused or timed out): the request was not sent.
+    """
+
+
+class StaleConnectionError(ConnectionError):
+    """
+    The connection was closed before any byte of the response was received (e.g. by the server while it was idle):
+    the request can be sent again.
+    """
+
+
+class AsyncHTTPClient:
+    """
+    AsyncHTTPClient is a minimal non-blocking HTTP/1.1 client, built on asyncio streams, with a pool of keep-alive
+    connections to a single host.
+
+    Like APIhandler, requests are retried when the connection cannot be opened and on 502/503/504 responses, with an
+    exponential backoff, but not once they may have reached the server otherwise.
+
+    Attributes
+    ----------
+    host : str
+        Host of the server.
+    port : int
+        Port of the server.
+    timeout : Tuple[float, float]
+        Connect and read timeouts of every request (seconds).
+    retries : int
+        Number of retries of a request.
+    backoff_factor : float
+        Backoff factor between retries (seconds).
+    requests : int
+        Number of requests sent.
+    new_connections : int
+        Number of connections opened.
+    _idle : List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]
+        Idle keep-alive connections.
+    _semaphore : asyncio.Semaphore
+        Limits the number of open connections to the pool size.
+
+    Methods
+    -------
+    request(method: str, path: str, body: bytes, headers: dict)
+        Send a request and wait for its response.
+    close()
+        Close the idle connections.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, host: str, port: int, pool_size: int = ASYNC_API_POOL_SIZE,
+                 connect_timeout: float = API_CONNECT_TIMEOUT, read_timeout: float = API_READ_TIMEOUT,
+                 retries: int = API_RETRIES, backoff_factor: float = API_BACKOFF_FACTOR) -> None:
+        """
+        Initialize the AsyncHTTPClient.
+
+        Args:
+            host (str): host of the server.
+            port (int): port of the server.
+            pool_size (int): maximum number of open connections, requests above it wait for a free connection.
+            connect_timeout (float): timeout to establish a connection (seconds).
+            read_timeout (float): timeout to wait for a response (seconds).
+            retries (int): number of retries when the connection fails to open and on 502/503/504 responses.
+            backoff_factor (float): backoff factor between retries (seconds).
+        """
+        self.host = host
+        self.port = port
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.requests = 0
+        self.new_connections = 0
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(pool_size)
+
+    async def request(self, method: str, path: str, body: bytes = b"", headers: Optional[dict] = None) -> AsyncResponse:
+        """
+        Send a request and wait for its response.
+
+        Notes
+        -----
+        A request whose reused connection is closed before any byte of the response (e.g. by the server while idle)
+        is retried once on a new connection; never after a read timeout, the server may be processing it. A request
+        whose connection cannot be opened, or answered with 502/503/504, is retried up to retries times, after
+        backoff_factor * 2 ** (retry - 1) seconds from the second retry; the last response is returned.
+
+        Args:
+            method (str): HTTP method.
+            path (str): path of the resource.
+            body (bytes): body of the request.
+            headers (dict, optional): additional headers.
+
+        Raises:
+            OSError: the connection failed (ConnectError when it could not be opened, StaleConnectionError when it was
+                closed before any byte of the response).
+            asyncio.TimeoutError: the server did not answer in time.
+
+        Returns:
+            AsyncResponse: response from the server.
+        """
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive",
+                f"Content-Length: {len(body)}"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        request = ("\r\n".join(head) + "\r\n\r\n").encode("latin-1")
+
+        for retry in range(self.retries + 1):
+            if retry > 1: # the first retry is immediate, as with urllib3
+                await asyncio.sleep(self.backoff_factor * 2 ** (retry - 1))
+            try:
+                response = await self._request_once(request, body)
+            except ConnectError:
+                if retry == self.retries:
+                    raise
+                continue
+            if response.status_code not in AsyncHTTPClient.RETRY_STATUSES or retry == self.retries:
+                return response
+
+    async def _request_once(self, request: bytes, body: bytes) -> AsyncResponse:
+        """
+        Send a request on a pooled connection, or on a new one, and wait for its response.
+
+        Notes
+        -----
+        A connection whose request did not complete (failed, timed out or cancelled) is closed, never returned to
+        the pool.
+
+        Returns:
+            AsyncResponse: response from the server.
+        """
+        async with self._semaphore:
+            reused = bool(self._idle)
+            reader, writer = self._idle.pop() if reused else await self._connect()
+
+            try:
+                try:
+                    response = await self._send(reader, writer, request, body)
+                except StaleConnectionError:
+                    writer.close()
+                    if not reused:
+                        raise
+                    reader, writer = await self._connect()
+                    response = await self._send(reader, writer, request, body)
+            except BaseException: # including asyncio.CancelledError, the response may still be on its way
+                writer.close()
+                raise
+
+            if response.headers.get("connection", "").lower() == "close":
+                writer.close()
+            else:
+                self._idle.append((reader, writer))
+
+            return response
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """
+        Open a new connection to the server.
+
+        Raises:
+            ConnectError: the connection was refused or timed out.
+
+        Returns:
+            Tuple[asyncio.StreamReader, asyncio.StreamWriter]: the connection streams.
+        """
+        try:
+            connection = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout[0])
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ConnectError(f"Could not connect to {self.host}:{self.port}: {e!r}") from e
+        self.new_connections += 1
+        return connection
+
+    async def _send(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: bytes,
+                    body: bytes) -> AsyncResponse:
+        """
+        Write a request on a connection and read its response.
+
+        Raises:
+            StaleConnectionError: the connection was closed before any byte of the response.
+
+        Returns:
+            AsyncResponse: response from the server.
+        """
+        self.requests += 1
+        try:
+            writer.write(request)
+            if body:
+                writer.write(body)
+            await writer.drain()
+        except (ConnectionResetError, BrokenPipeError) as e:
+            raise StaleConnectionError(f"Connection closed while sending the request: {e!r}") from e
+
+        return await asyncio.wait_for(self._read_response(reader), self.timeout[1])
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader) -> AsyncResponse:
+        """
+        Read a response: status line, headers and a Content-Length, chunked or connection-delimited body.
+
+        Raises:
+            StaleConnectionError: the connection was closed before any byte of the response.
+
+        Returns:
+            AsyncResponse: response from the server.
+        """
+        try:
+            status_line = await reader.readuntil(b"\r\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise
+            raise StaleConnectionError("Connection closed before the response") from e
+        except ConnectionResetError as e:
+            raise StaleConnectionError(f"Connection reset before the response: {e!r}") from e
+        status_code = int(status_line.split()[1])
+
+        headers = {}
+        while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if status_code in (204, 304) or 100 <= status_code < 200:
+            content = b""
+        elif "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while (size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)) > 0:
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            while await reader.readuntil(b"\r\n") != b"\r\n": # trailers
+                pass
+            content = b"".join(chunks)
+        else:
+            content = await reader.read()
+            headers["connection"] = "close"
+
+        return AsyncResponse(status_code, headers, content)
+
+    async def close(self) -> None:
+        """
+        Close the idle connections.
+
+        Returns
+        -------
+        None
+        """
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+
+class AsyncAPIhandler:
+    """
+    AsyncAPIhandler is the non-blocking counterpart of APIhandler, used by the asyncio engine.
+    Requests are encoded exactly like APIhandler does.
+
+    Attributes
+    ----------
+    domain : str
+        Domain of the API.
+    port : int
+        Port of the API.
+    client : AsyncHTTPClient
+        HTTP client holding the pool of keep-alive connections to the API.
+
+    Methods
+    -------
+    ping()
+        Ping the API.
+    send_surface_movement_batch(samples: List[dict])
+        Send a batch of timestamped surface movement samples to the API.
+    send_pictures_batch(batch: CaptureBatch)
+        Send a batch of pictures to the API.
+    send_encoded_pictures_batch(body: bytes)
+        Send a batch of pictures already encoded to the API.
+    connection_stats()
+        Get the number of requests sent and how many of them reused a pooled connection.
+    close()
+        Close the pooled connections.
+    """
+
+    def __init__(self, pool_size: int = ASYNC_API_POOL_SIZE) -> None:
+        """
+        Initialize the AsyncAPIhandler.
+
+        Args:
+            pool_size (int): maximum number of open connections to the API.
+        """
+        self.domain = "127.0.0.1"
+        self.port = 5000
+        self._pool_size = pool_size
+        self._client = None
+
+    @property
+    def client(self) -> AsyncHTTPClient:
+        # created on first use, so that it is bound to the running event loop
+        if self._client is None:
+            self._client = AsyncHTTPClient(self.domain, self.port, pool_size=self._pool_size)
+        return self._client
+
+    async def ping(self) -> AsyncResponse:
+        """
+        Ping the API.
+
+        Returns:
+            AsyncResponse: response from the API.
+        """
+        return await self.client.request("GET", "/ping")
+
+    async def send_surface_movement_batch(self, samples: List[dict]) -> AsyncResponse:
+        """
+        Send a batch of timestamped surface movement samples to the API, as a JSON array.
+
+        Args:
+            samples (List[dict]): samples with timestamp, velocity and displacement.
+
+        Returns:
+            AsyncResponse: response from the API.
+        """
+        body = json.dumps({"samples": samples}).encode()
+        return await self._post("fabric_movement", body, "application/json")
+
+    async def send_pictures_batch(self, batch: CaptureBatch) -> AsyncResponse:
+        """
+        Send a batch of pictures to the API, encoded in the binary batch format (see batch_codec).
+
+        Args:
+            batch (CaptureBatch): batch of pictures.
+
+        Returns:
+            AsyncResponse: response from the API.
+        """
+        return await self.send_encoded_pictures_batch(encode_capture_batch(batch))
+
+    async def send_encoded_pictures_batch(self, body: bytes) -> AsyncResponse:
+        """
+        Send a batch of pictures already encoded in the binary batch format to the API.
+
+        Args:
+            body (bytes): encoded batch of pictures.
+
+        Returns:
+            AsyncResponse: response from the API.
+        """
+        return await self._post("pictures_batch", body, BATCH_CONTENT_TYPE)
+
+    async def _post(self, endpoint: str, body: bytes, content_type: str) -> AsyncResponse:
+        """
+        Post a request to an endpoint of the API and record it in the metrics.
+
+        Args:
+            endpoint (str): path of the endpoint, without the leading slash.
+            body (bytes): body of the request.
+            content_type (str): content type of the body.
+
+        Returns:
+            AsyncResponse: response from the API.
+        """
+        start = time.perf_counter()
+        try:
+            response = await self.client.request("POST", f"/{endpoint}", body, {"Content-Type": content_type})
+        except Exception:
+            record_request(endpoint, start, None)
+            raise
+
+        record_request(endpoint, start, response.status_code, len(body))
+        return response
+
+    def connection_stats(self) -> dict:
+        """
+        Get the number of requests sent and how many of them reused a pooled connection.
+
+        Returns:
+            dict: requests sent, new connections opened and connections reused.
+        """
+        requests_sent = self._client.requests if self._client else 0
+        new_connections = self._client.new_connections if self._client else 0
+        return {
+            "requests": requests_sent,
+            "new_connections": new_connections,
+            "reused_connections": requests_sent - new_connections
+        }
+
+    async def close(self) -> None:
+        """
+        Close the pooled connections.
+
+        Returns
+        -------
+        None
+        """
+        if self._client is not None:
+            await self._client.close()
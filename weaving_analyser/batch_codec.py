@@ -0,0 +1,172 @@
+"""
+Binary encoding of the picture batches sent to the /pictures_batch endpoint.
+
+Body layout:
+    [header length: uint32, big endian][JSON header][picture buffer 0][picture buffer 1]...
+
+The JSON header keeps the batch structure and the metadata of each picture (shape, dtype, iso, exposure time,
+diaphragm opening) together with the codec, offset and size of its buffer in the payload that follows the header.
+Uncompressed (raw) pictures of a CaptureBatch are contiguous, so the payload is a single buffer; compressed pictures
+(see picture_codecs) are laid out one after the other.
+
+Streamed layout (sent with chunked transfer-encoding, see stream_capture_batch):
+    [header length: uint32][JSON header of picture 0][picture buffer 0][header length][JSON header of picture 1]...
+    [0: uint32]
+
+Each picture carries its own header, with the metadata of its light type and its size, so every picture can be
+encoded, sent and decoded before the next one is encoded. The 0 header length ends the stream.
+"""
+
+import json
+import struct
+from typing import Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+from hardware_controllers.cameras_controller import CaptureBatch
+
+from .config import light_dict
+from .picture_codecs import PictureEncoder
+
+BATCH_CONTENT_TYPE = 'application/x-weaving-batch'
+BATCH_STREAM_CONTENT_TYPE = 'application/x-weaving-batch-stream'
+HEADER_LENGTH = struct.Struct('!I')
+
+
+def picture_buffer(picture: np.ndarray) -> memoryview:
+    """
+    Get the raw buffer of a picture without copying it.
+
+    Args:
+        picture (np.ndarray): picture array.
+
+    Returns:
+        memoryview: flat byte view over the picture data.
+    """
+    return memoryview(np.ascontiguousarray(picture)).cast('B')
+
+
+def encode_capture_batch(batch: CaptureBatch, light_indices: Optional[Sequence[int]] = None,
+                         encoder: Optional[PictureEncoder] = None) -> bytes:
+    """
+    Encode the pictures of a CaptureBatch into the binary batch format.
+
+    Args:
+        batch (CaptureBatch): batch of pictures.
+        light_indices (Sequence[int], optional): indices of the light types to encode. Defaults to every light type
+            whose pictures were collected.
+        encoder (PictureEncoder, optional): compression of the pictures. Defaults to raw pictures.
+
+    Returns:
+        bytes: encoded batch.
+    """
+    if light_indices is None:
+        light_indices = np.flatnonzero(batch.collected).tolist()
+    light_indices = list(light_indices)
+
+    first = light_indices[0] if light_indices else 0
+    if light_indices == list(range(first, first + len(light_indices))):
+        frames = batch.frames[first:first + len(light_indices)] # consecutive light types: a view, nothing is copied
+    else:
+        frames = batch.frames[light_indices]
+    frame_shape = list(batch.frames.shape[2:])
+    codec = encoder.codec if encoder is not None else 'raw'
+
+    if codec == 'raw':
+        frame_nbytes = int(np.prod(frame_shape)) * batch.frames.itemsize
+        buffers = [picture_buffer(frames)]
+        sizes = [frame_nbytes] * (len(light_indices) * len(batch.camera_positions))
+    else:
+        buffers = encoder.encode([picture for light_frames in frames for picture in light_frames])
+        sizes = [len(buffer) for buffer in buffers]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).tolist()
+
+    header_lights = []
+    for position, light_index in enumerate(light_indices):
+        header_pictures = {}
+        for camera_index, camera_position in enumerate(batch.camera_positions):
+            picture_index = position * len(batch.camera_positions) + camera_index
+            header_pictures[camera_position.value] = {**_picture_header(batch, light_index, camera_index, codec),
+                                                      "offset": offsets[picture_index],
+                                                      "nbytes": sizes[picture_index]}
+
+        header_lights.append({**_light_header(batch, light_index), "pictures": header_pictures})
+
+    header = json.dumps({"lights": header_lights}).encode()
+
+    # bytes.join copies the pictures exactly once, straight into the request body
+    return b"".join([HEADER_LENGTH.pack(len(header)), header, *buffers])
+
+
+def stream_capture_batch(batch: CaptureBatch, light_indices: Optional[Sequence[int]] = None,
+                         encoder: Optional[PictureEncoder] = None) -> Iterator[Union[bytes, memoryview]]:
+    """
+    Encode the pictures of a CaptureBatch into the streamed batch format, one picture at a time: each picture is only
+    encoded when the previous one was consumed, so a single encoded picture is held at once.
+
+    Args:
+        batch (CaptureBatch): batch of pictures, which must not be overwritten until the stream is consumed.
+        light_indices (Sequence[int], optional): indices of the light types to encode. Defaults to every light type
+            whose pictures were collected.
+        encoder (PictureEncoder, optional): compression of the pictures. Defaults to raw pictures.
+
+    Returns:
+        Iterator[Union[bytes, memoryview]]: the header and the buffer of each picture, then the end of the stream.
+    """
+    if light_indices is None:
+        light_indices = np.flatnonzero(batch.collected).tolist()
+    codec = encoder.codec if encoder is not None else 'raw'
+
+    for light_index in light_indices:
+        light_header = _light_header(batch, light_index)
+        for camera_index, camera_position in enumerate(batch.camera_positions):
+            picture = batch.frames[light_index, camera_index]
+            buffer = picture_buffer(picture) if codec == 'raw' else encoder.encode([picture])[0]
+            header = json.dumps({**light_header, **_picture_header(batch, light_index, camera_index, codec),
+                                 "camera": camera_position.value, "nbytes": len(buffer)}).encode()
+            yield HEADER_LENGTH.pack(len(header)) + header
+            yield buffer
+
+    yield HEADER_LENGTH.pack(0)
+
+
+def _light_header(batch: CaptureBatch, light_index: int) -> dict:
+    """
+    Get the metadata of a light type of a batch, for the batch headers.
+
+    Args:
+        batch (CaptureBatch): batch of pictures.
+        light_index (int): index of the light type.
+
+    Returns:
+        dict: light type, creation date, velocity and displacement.
+    """
+    return {
+        "light": light_dict[batch.light_types[light_index]],
+        "creation_date": float(batch.creation_dates[light_index]),
+        "velocity": float(batch.velocities[light_index]),
+        "displacement": float(batch.displacements[light_index])
+    }
+
+
+def _picture_header(batch: CaptureBatch, light_index: int, camera_index: int, codec: str) -> dict:
+    """
+    Get the metadata of a picture of a batch, for the batch headers.
+
+    Args:
+        batch (CaptureBatch): batch of pictures.
+        light_index (int): index of the light type of the picture.
+        camera_index (int): index of the camera of the picture.
+        codec (str): codec of the picture buffer.
+
+    Returns:
+        dict: iso, exposure time, diaphragm opening, shape, dtype and codec of the picture.
+    """
+    return {
+        "iso": int(batch.isos[light_index, camera_index]),
+        "exposure_time": float(batch.exposure_times[light_index, camera_index]),
+        "diaphragm_opening": float(batch.diaphragm_openings[light_index, camera_index]),
+        "shape": list(batch.frames.shape[2:]),
+        "dtype": batch.frames.dtype.str,
+        "codec": codec
+    }
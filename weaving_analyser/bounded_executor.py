@@ -0,0 +1,264 @@
+from collections import deque
+from concurrent.futures import Future
+from enum import Enum
+from threading import Condition, Thread
+from typing import Callable, Optional
+import time
+
+from .config import error_logger
+
+
+class SubmitPolicy(Enum):
+    """
+    What BoundedExecutor.submit does when the queue is full.
+
+    BLOCK waits for a free slot, DROP_OLDEST cancels the oldest pending task, DROP_NEWEST rejects the new task and
+    COALESCE_LATEST replaces the pending task of the same callable (or drops the oldest one if there is none).
+    """
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    COALESCE_LATEST = 'coalesce_latest'
+
+
+class _Task:
+    __slots__ = ('future', 'fn', 'args', 'kwargs', 'submit_time')
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict) -> None:
+        self.future = Future()
+        self.fn, self.args, self.kwargs = fn, args, kwargs
+        self.submit_time = time.monotonic()
+
+
+class BoundedExecutor:
+    """
+    BoundedExecutor is a thread pool with a bounded queue of pending tasks and an explicit policy for a full queue.
+
+    Unlike ThreadPoolExecutor, pending tasks cannot pile up forever when the workers are stuck (e.g. the API is
+    down), so memory stays flat. Worker threads are started on demand, up to max_workers.
+
+    Attributes
+    ----------
+    max_workers : int
+        Maximum number of worker threads.
+    max_queue_size : int
+        Maximum number of pending tasks.
+    policy : SubmitPolicy
+        What to do when a task is submitted to a full queue.
+    _queue : deque
+        Pending tasks.
+    _condition : Condition
+        Condition protecting the queue and the counters.
+    _threads : List[Thread]
+        Worker threads.
+    _idle_workers : int
+        Number of workers waiting for a task.
+
+    Methods
+    -------
+    submit(fn: Callable, *args, **kwargs)
+        Submit a task.
+    shutdown(wait: bool)
+        Stop the workers and cancel the pending tasks.
+    metrics()
+        Get the queue metrics.
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int, policy: SubmitPolicy = SubmitPolicy.BLOCK,
+                 thread_name_prefix: str = 'bounded_executor_') -> None:
+        """
+        Initialize the BoundedExecutor.
+
+        Args:
+            max_workers (int): maximum number of worker threads.
+            max_queue_size (int): maximum number of pending tasks.
+            policy (SubmitPolicy): what to do when a task is submitted to a full queue.
+            thread_name_prefix (str): prefix of the worker thread names.
+        """
+        if max_workers <= 0 or max_queue_size <= 0:
+            raise ValueError("max_workers and max_queue_size must be greater than 0")
+
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        self._thread_name_prefix = thread_name_prefix
+        self._queue = deque()
+        self._condition = Condition()
+        self._threads = []
+        self._idle_workers = 0
+        self._shutdown = False
+
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._coalesced = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._blocked_time_total = 0.0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Optional[Future]:
+        """
+        Submit a task, applying the queue policy if the queue is full.
+
+        Args:
+            fn (Callable): callable to run.
+            *args: positional arguments of the callable.
+            **kwargs: keyword arguments of the callable.
+
+        Raises:
+            RuntimeError: the executor was shut down.
+
+        Returns:
+            Optional[Future]: future of the task, None if it was dropped (DROP_NEWEST). The future is cancelled if the
+                task is evicted later by a newer one (DROP_OLDEST, COALESCE_LATEST) or by the shutdown, so that the
+                caller can roll back what it did for the task in a done callback.
+        """
+        task = _Task(fn, args, kwargs)
+
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot submit tasks after shutdown")
+
+            if self.policy is SubmitPolicy.COALESCE_LATEST and self._coalesce(task):
+                return task.future
+
+            if len(self._queue) >= self.max_queue_size:
+                if self.policy is SubmitPolicy.BLOCK:
+                    blocked_since = time.monotonic()
+                    self._condition.wait_for(lambda: len(self._queue) < self.max_queue_size or self._shutdown)
+                    self._blocked_time_total += time.monotonic() - blocked_since
+                    if self._shutdown:
+                        raise RuntimeError("cannot submit tasks after shutdown")
+                elif self.policy is SubmitPolicy.DROP_NEWEST:
+                    self._dropped += 1
+                    return None
+                else:
+                    self._queue.popleft().future.cancel()
+                    self._dropped += 1
+
+            self._queue.append(task)
+            self._submitted += 1
+            self._condition.notify_all()
+
+            if len(self._queue) > self._idle_workers and len(self._threads) < self.max_workers:
+                self._start_worker()
+
+        return task.future
+
+    def _coalesce(self, task: _Task) -> bool:
+        """
+        Replace the pending task of the same callable with the new one. Must be called holding the condition.
+
+        Args:
+            task (_Task): new task.
+
+        Returns:
+            bool: True if a pending task was replaced.
+        """
+        for i, pending in enumerate(self._queue):
+            if pending.fn == task.fn:
+                pending.future.cancel()
+                del self._queue[i]
+                self._queue.append(task)
+                self._submitted += 1
+                self._coalesced += 1
+                return True
+
+        return False
+
+    def _start_worker(self) -> None:
+        """
+        Start a new worker thread. Must be called holding the condition.
+
+        Returns
+        -------
+        None
+        """
+        thread = Thread(target=self._worker, name=f'{self._thread_name_prefix}{len(self._threads)}', daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _worker(self) -> None:
+        """
+        Run pending tasks until the executor is shut down.
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            with self._condition:
+                self._idle_workers += 1
+                self._condition.wait_for(lambda: self._queue or self._shutdown)
+                self._idle_workers -= 1
+
+                if not self._queue:
+                    return
+
+                task = self._queue.popleft()
+                self._condition.notify_all() # wake up blocked submitters
+
+                wait_time = time.monotonic() - task.submit_time
+                self._wait_time_total += wait_time
+                self._wait_time_max = max(self._wait_time_max, wait_time)
+
+            if not task.future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result = task.fn(*task.args, **task.kwargs)
+            except BaseException as e:
+                task.future.set_exception(e)
+                error_logger.error("Task %s failed: %r", getattr(task.fn, '__name__', task.fn), e)
+                with self._condition:
+                    self._failed += 1
+            else:
+                task.future.set_result(result)
+                with self._condition:
+                    self._completed += 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the workers and cancel the pending tasks.
+
+        Args:
+            wait (bool): whether to wait for the running tasks to finish.
+
+        Returns
+        -------
+        None
+        """
+        with self._condition:
+            self._shutdown = True
+            while self._queue:
+                self._queue.popleft().future.cancel()
+            self._condition.notify_all()
+            threads = list(self._threads)
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def metrics(self) -> dict:
+        """
+        Get the queue metrics.
+
+        Returns:
+            dict: queue depth, task counters and time spent by tasks waiting in the queue (seconds).
+        """
+        with self._condition:
+            started = self._completed + self._failed
+            return {
+                "queue_depth": len(self._queue),
+                "max_queue_size": self.max_queue_size,
+                "workers": len(self._threads),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "dropped": self._dropped,
+                "coalesced": self._coalesced,
+                "wait_time_avg": self._wait_time_total / started if started else 0.0,
+                "wait_time_max": self._wait_time_max,
+                "blocked_time_total": self._blocked_time_total
+            }
@@ -1,9 +1,35 @@
-from hardware_controllers.cameras_controller import CamerasController, LightType
+from hardware_controllers.cameras_controller import CamerasController, CaptureBatch, FramePool, LightType, \
+    SharedFrameRing
+from hardware_controllers.cameras_controller.errors import FramePoolExhaustedError
+from hardware_controllers.clock import Clock
 
-from .config import info_logger, error_logger, console_logger, debug_logger
+from .config import info_logger, error_logger, console_logger, debug_logger, warning_logger, PICTURE_WORKERS, \
+    FRAME_POOL_SIZE, FRAME_POOL_ACQUIRE_TIMEOUT, FRAME_POOL_LEAK_TIMEOUT, PICTURE_CODEC, PICTURE_CODEC_QUALITY, \
+    PICTURE_ENCODER_PROCESSES, SPOOL_STOP_TIMEOUT, STREAM_PICTURE_UPLOADS
 from .api import APIhandler
+from .batch_codec import encode_capture_batch
+from .capture_pipeline import CapturePipeline
+from .picture_codecs import PictureEncoder
+from .spool import PictureSpool, SpoolDrainer
+from .trigger_scheduler import TriggerScheduler
 from .errors.pictures_not_collected_error import PicturesNotCollectedError
+from .metrics import REGISTRY
 from threading import Lock
+from typing import Optional, Tuple
+import time
+
+# the count of the trigger histogram of a light type is the number of triggers
+TRIGGER_SECONDS = {light_type: REGISTRY.histogram("weaving_camera_trigger_seconds",
+                                                  "Time to trigger the cameras and collect the pictures (seconds).",
+                                                  labels={"light": light_type.name.lower()})
+                   for light_type in LightType}
+TRIGGER_FAILURES = {light_type: REGISTRY.counter("weaving_camera_trigger_failures_total",
+                                                 "Camera triggers whose pictures were not collected.",
+                                                 labels={"light": light_type.name.lower()})
+                    for light_type in LightType}
+ITERATIONS = {result: REGISTRY.counter("weaving_camera_iterations_total", "Camera iterations, by result.",
+                                       labels={"result": result})
+              for result in ("complete", "incomplete", "skipped")}
 
 class Observer:
     """
@@ -32,6 +58,23 @@ class CameraHandler(Observer):
         Current fabric displacement (cm).
     camera_lock : Lock
         Lock the camera to prevent multiple threads from accessing it at the same time
+    pipeline : CapturePipeline
+        Encode and upload stages of the captured pictures, overlapping the next captures.
+    frame_pool : FramePool
+        Batches reused by the captures, each one returned to the pool once its pictures are uploaded.
+    picture_encoder : PictureEncoder
+        Compression of the pictures before the upload.
+    frame_ring : SharedFrameRing
+        Shared memory holding the frames of the pool, read in place by the encoder processes. None when the pictures
+        are encoded in this process.
+    spool : PictureSpool
+        Write-ahead spool of the encoded pictures, None to send them directly.
+    spool_drainer : SpoolDrainer
+        Sends the spooled pictures to the API, None without a spool.
+    trigger_scheduler : TriggerScheduler
+        Scheduler of the camera iterations, told when the cameras trigger and when the iterations end.
+    stream_uploads : bool
+        Whether the pictures are encoded while they are streamed to the API, instead of before their upload.
     
     Methods
     -------
@@ -39,30 +82,77 @@ class CameraHandler(Observer):
         Update the current fabric velocity and displacement.
     start()
         Start the cameras.
-    trigger_camera(light_type: LightType)
-        Trigger the cameras.
+    stop()
+        Send the pictures still in the pipeline and stop it.
+    new_batch()
+        Allocate a batch for the pictures of every light type.
+    release_batch(batch: CaptureBatch)
+        Return a batch made by make_batch to the frame pool.
+    trigger_camera(batch: CaptureBatch, light_type: LightType)
+        Trigger the cameras and collect the pictures into the batch.
     make_batch()
         Make a batch of pictures. Pictures are taken sequentially.
+    encode_batch(batch: CaptureBatch)
+        Encode the collected pictures of a batch for the API.
+    encode(capture: Tuple[CaptureBatch, int])
+        Encode the pictures of a light type for the API.
+    upload(encoded: Tuple[CaptureBatch, bytes])
+        Spool or send encoded pictures and release their batch.
+    stream_upload(capture: Tuple[CaptureBatch, int])
+        Stream the pictures of a light type to the API and release their batch.
+    send(body: bytes)
+        Append encoded pictures to the spool, or send them to the API without a spool.
+    spool_stats()
+        Get the statistics of the spool and of its delivery.
+    frame_ring_stats()
+        Get the statistics of the frame ring and of the handoffs to the encoder processes.
     __call__()
         Call the CameraHandler to use the cameras and send the pictures to the API.
 
     """
 
     VERTICAL_FOV = 25
+    LIGHT_SEQUENCE = (LightType.GREEN, LightType.BLUE)
 
-    def __init__(self) -> None:
+    def __init__(self, clock: Optional[Clock] = None, picture_encoder: Optional[PictureEncoder] = None,
+                 spool: Optional[PictureSpool] = None, trigger_scheduler: Optional[TriggerScheduler] = None,
+                 stream_uploads: bool = STREAM_PICTURE_UPLOADS) -> None:
         """
         Initialize the CameraHandler.
 
+        Args:
+            clock (Clock, optional): clock of the cameras. Defaults to the system clock.
+            picture_encoder (PictureEncoder, optional): compression of the pictures. Defaults to PICTURE_CODEC.
+            spool (PictureSpool, optional): write-ahead spool of the encoded pictures. Defaults to sending them
+                directly, a batch that fails to be sent is lost.
+            trigger_scheduler (TriggerScheduler, optional): scheduler of the camera iterations, to measure their
+                trigger latency and coverage.
+            stream_uploads (bool): stream the pictures to the API with chunked transfer-encoding, encoding each one
+                as it is sent. Ignored with a spool, which needs the encoded pictures.
+
         Returns
         -------
         None
         """
 
-        self.cameras_controller = CamerasController()
-        self.api_handler = APIhandler()
+        self.cameras_controller = CamerasController(clock)
+        self.api_handler = APIhandler(pool_size=PICTURE_WORKERS)
         self.velocity, self.displacement = 0, 0
         self.camera_lock = Lock() # lock the camera to prevent multiple threads from accessing it at the same time
+        self.stream_uploads = stream_uploads and spool is None
+        # streamed pictures are encoded by the upload stage, as they are sent
+        stages = [("encode", lambda capture: capture), ("upload", self.stream_upload)] if self.stream_uploads \
+            else [("encode", self.encode), ("upload", self.upload)]
+        self.pipeline = CapturePipeline(stages, thread_name_prefix='capture_pipeline_')
+        self.frame_pool = FramePool(self.new_batch, FRAME_POOL_SIZE, leak_timeout=FRAME_POOL_LEAK_TIMEOUT)
+        self.picture_encoder = picture_encoder or PictureEncoder(PICTURE_CODEC, PICTURE_CODEC_QUALITY,
+                                                                 processes=PICTURE_ENCODER_PROCESSES)
+        self.frame_ring = SharedFrameRing(FRAME_POOL_SIZE) if self.picture_encoder.uses_processes() else None
+        self.picture_encoder.frame_ring = self.frame_ring
+        self.spool = spool
+        self.spool_drainer = SpoolDrainer(spool, lambda body: self.api_handler.send_encoded_pictures_batch(body)) \
+            if spool is not None else None
+        self.trigger_scheduler = trigger_scheduler
 
     def update(self, velocity: float, displacement: float) -> None:
         """
@@ -79,7 +169,7 @@ class CameraHandler(Observer):
     
     def start(self) -> None:
         """
-        Start the cameras.
+        Start the cameras, and the delivery of the spooled pictures (including the ones left by a previous run).
 
         Returns
         -------
@@ -88,80 +178,316 @@ class CameraHandler(Observer):
         try:
             self.cameras_controller.open_cameras()
         except Exception as e:
-            error_logger.error(f"Cameras failed to open: {e}")
+            error_logger.error("Cameras failed to open: %s", e)
 
-    def trigger_camera(self, light_type: LightType) -> None:
-        
+        if self.spool_drainer is not None:
+            self.spool_drainer.start()
+
+    def stop(self) -> None:
         """
-        Trigger the cameras for an individual light type.
+        Send the pictures still in the pipeline and stop it, then stop the encoder processes and destroy the frame
+        ring. Captures finishing afterwards are dropped. The spooled pictures get SPOOL_STOP_TIMEOUT seconds to be
+        delivered, the rest are sent by the next run.
 
-        Raises:
-            PicturesNotCollectedError: Pictures were not collected.
+        Returns
+        -------
+        None
+        """
+        self.pipeline.close(wait=True)
+        self.picture_encoder.close()
+        if self.frame_ring is not None:
+            self.frame_ring.close()
+        if self.spool_drainer is not None:
+            if not self.spool_drainer.stop(timeout=SPOOL_STOP_TIMEOUT):
+                warning_logger.warning("%s spooled batches left for the next run.", self.spool.stats()['pending'])
+            self.spool.close()
+        for holders, age in self.frame_pool.leaks():
+            warning_logger.warning("Frame buffer held by %s for %.1f seconds was not released.", ', '.join(holders),
+                                   age)
+
+    def new_batch(self) -> CaptureBatch:
+        """
+        Allocate a batch for the pictures of every light type of LIGHT_SEQUENCE, its frames in a slot of the frame
+        ring if there is one.
 
         Returns:
-            Tuple[np.ndarray, float, float, int, np.ndarray, float, float, int]
-            Pictures and their metadata.
+            CaptureBatch: the batch, with no picture collected.
         """
+        if self.frame_ring is None:
+            return self.cameras_controller.allocate_batch(CameraHandler.LIGHT_SEQUENCE)
+        return self.cameras_controller.allocate_batch(CameraHandler.LIGHT_SEQUENCE,
+                                                      allocate_frames=self.frame_ring.allocate_frames)
+
+    def release_batch(self, batch: CaptureBatch) -> None:
+        """
+        Return a batch made by make_batch to the frame pool, once its pictures are sent.
+
+        Args:
+            batch (CaptureBatch): batch returned by make_batch.
+
+        Returns
+        -------
+        None
+        """
+        self.frame_pool.release(batch, "make_batch")
+
+    def trigger_camera(self, batch: CaptureBatch, light_type: LightType) -> bool:
+        """
+        Trigger the cameras for an individual light type and collect the pictures into the batch, with the current
+        fabric velocity and displacement.
+
+        Args:
+            batch (CaptureBatch): batch receiving the pictures.
+            light_type (LightType): light type of the pictures.
+
+        Returns:
+            bool: whether the pictures were collected.
+        """
+        start = time.perf_counter()
+        light_index = batch.light_index(light_type)
+        batch.velocities[light_index], batch.displacements[light_index] = self.velocity, self.displacement
+
         try:
             if not self.cameras_controller.trigger():
                 raise PicturesNotCollectedError("Pictures were not collected.")
-        
-            picture = self.cameras_controller.collect_pictures(light_type)
-            return picture
+            if light_index == 0 and self.trigger_scheduler is not None:
+                self.trigger_scheduler.record_trigger(self.displacement)
+
+            self.cameras_controller.collect_into(batch, light_type)
+            return True
         except PicturesNotCollectedError as e:
-            error_logger.error(f"Cameras failed to trigger: pictures were not collected: {e}")
-            return None
+            TRIGGER_FAILURES[light_type].inc()
+            error_logger.error("Cameras failed to trigger: pictures were not collected: %s", e)
+            if light_index == 0 and self.trigger_scheduler is not None:
+                self.trigger_scheduler.record_miss()
+            return False
+        finally:
+            TRIGGER_SECONDS[light_type].observe(time.perf_counter() - start)
 
-    def make_batch(self) -> None:
+    def make_batch(self) -> Optional[CaptureBatch]:
         """
         Make a batch of pictures. Pictures are taken sequentially.
 
+        The batch is checked out of the frame pool: the caller gives it back with release_batch once it is sent.
+
         Returns:
-            List: List of pictures and their metadata.
+            CaptureBatch: pictures and their metadata, None if the pictures of a light type were not collected.
         """
 
-        self.camera_lock.acquire()
+        with self.camera_lock:
+            debug_logger.debug("Sending batch request.")
+            batch = self._acquire_batch("make_batch")
+            if batch is None:
+                return None
+
+            try:
+                for light_type in CameraHandler.LIGHT_SEQUENCE:
+                    if not self.trigger_camera(batch, light_type):
+                        self.release_batch(batch)
+                        return None
+                    self._log_collected(batch, light_type)
+            finally:
+                self._end_iteration(batch)
+
+        return batch
+
+    def _acquire_batch(self, owner: str) -> Optional[CaptureBatch]:
+        """
+        Check a batch out of the frame pool, waiting up to FRAME_POOL_ACQUIRE_TIMEOUT seconds for one.
 
-        debug_logger.debug(f"Sending batch request.")
-        velocity, displacement = self.velocity, self.displacement
-        batch = []
-        
-        green = self.trigger_camera(LightType.GREEN)
-        if green is None:
+        Args:
+            owner (str): holder of the batch.
+
+        Returns:
+            CaptureBatch: the batch, None if no batch was released in time.
+        """
+        try:
+            return self.frame_pool.acquire(owner, timeout=FRAME_POOL_ACQUIRE_TIMEOUT)
+        except FramePoolExhaustedError as e:
+            ITERATIONS["skipped"].inc()
+            error_logger.error("Capture skipped: %s", e)
+            if self.trigger_scheduler is not None:
+                self.trigger_scheduler.record_miss()
             return None
-        
-        batch.append(self.api_handler.prepare_body(green, velocity, displacement, LightType.GREEN))
-        info_logger.info(f"velocity: {velocity}, displacement: {displacement} after green picture.")
-        debug_logger.debug(f"Green picture collected.")
-        
-        blue = self.trigger_camera(LightType.BLUE)
-        debug_logger.debug(f"Blue picture collected.")
-        self.camera_lock.release()
-        info_logger.info(f"Displacement between pictures: {self.displacement - displacement}, ")
-        velocity, displacement = self.velocity, self.displacement
-
-        if blue is None:
+
+    def _end_iteration(self, batch: CaptureBatch) -> None:
+        """
+        Count the iteration, and tell the trigger scheduler that it ended if it triggered the cameras.
+
+        Returns
+        -------
+        None
+        """
+        ITERATIONS["complete" if batch.collected.all() else "incomplete"].inc()
+        if self.trigger_scheduler is not None and batch.collected[0]:
+            self.trigger_scheduler.record_iteration_end()
+
+    def _log_collected(self, batch: CaptureBatch, light_type: LightType) -> None:
+        """
+        Log the collection of the pictures of a light type, and the displacement since the first light type.
+
+        Returns
+        -------
+        None
+        """
+        light_index = batch.light_index(light_type)
+        velocity, displacement = batch.velocities[light_index], batch.displacements[light_index]
+
+        debug_logger.debug("%s picture collected.", light_type.name.capitalize())
+        if light_index == 0:
+            info_logger.info("velocity: %s, displacement: %s at the first picture.", velocity, displacement)
+        else:
+            info_logger.info("Displacement between pictures: %s", displacement - batch.displacements[0])
+
+    def encode_batch(self, batch: CaptureBatch) -> bytes:
+        """
+        Encode the collected pictures of a batch for the API.
+
+        Args:
+            batch (CaptureBatch): batch of pictures.
+
+        Returns:
+            bytes: pictures encoded with encode_capture_batch, compressed by the picture encoder.
+        """
+        return encode_capture_batch(batch, encoder=self.picture_encoder)
+
+    def encode(self, capture: Tuple[CaptureBatch, int]) -> Tuple[CaptureBatch, bytes]:
+        """
+        Encode the pictures of a light type for the API (first stage of the pipeline).
+
+        Args:
+            capture (Tuple[CaptureBatch, int]): batch and index of the light type to encode.
+
+        Returns:
+            Tuple[CaptureBatch, bytes]: the batch, still held by the pipeline, and the pictures of the light type
+            encoded with encode_capture_batch, compressed by the picture encoder.
+        """
+        batch, light_index = capture
+        try:
+            return batch, encode_capture_batch(batch, [light_index], encoder=self.picture_encoder)
+        except Exception:
+            self.frame_pool.release(batch, "pipeline")
+            raise
+
+    def upload(self, encoded: Tuple[CaptureBatch, bytes]) -> None:
+        """
+        Append encoded pictures to the spool, or send them to the API without a spool (second stage of the
+        pipeline), then release their batch.
+
+        Args:
+            encoded (Tuple[CaptureBatch, bytes]): batch and encoded pictures.
+
+        Returns
+        -------
+        None
+        """
+        batch, body = encoded
+        try:
+            self.send(body)
+        finally:
+            self.frame_pool.release(batch, "pipeline")
+
+    def stream_upload(self, capture: Tuple[CaptureBatch, int]) -> None:
+        """
+        Stream the pictures of a light type to the API, each one encoded as it is sent (upload stage of the pipeline
+        when the uploads are streamed), then release their batch.
+
+        Args:
+            capture (Tuple[CaptureBatch, int]): batch and index of the light type to send.
+
+        Returns
+        -------
+        None
+        """
+        batch, light_index = capture
+        try:
+            console_logger.info("Streaming batch of pictures to API.")
+            response = self.api_handler.stream_pictures_batch(batch, [light_index], self.picture_encoder)
+            if response.status_code != 201:
+                error_logger.error("API rejected the pictures: %s", response.status_code)
+        finally:
+            self.frame_pool.release(batch, "pipeline")
+
+    def send(self, body: bytes) -> None:
+        """
+        Append encoded pictures to the spool, or send them to the API without a spool.
+
+        Args:
+            body (bytes): encoded batch of pictures.
+
+        Returns
+        -------
+        None
+        """
+        if self.spool is not None:
+            self.spool.append(body)
+            return
+
+        console_logger.info("Sending batch of pictures to API.")
+        response = self.api_handler.send_encoded_pictures_batch(body)
+        if response.status_code != 201:
+            error_logger.error("API rejected the pictures: %s", response.status_code)
+
+    def spool_stats(self) -> Optional[dict]:
+        """
+        Get the statistics of the spool and of its delivery.
+
+        Returns:
+            dict: spool statistics (see PictureSpool.stats and SpoolDrainer.stats), None without a spool.
+        """
+        if self.spool is None:
             return None
+        return {**self.spool.stats(), **self.spool_drainer.stats()}
 
-        
-        batch.append(self.api_handler.prepare_body(blue, velocity, displacement, LightType.BLUE))
-        return batch
+    def frame_ring_stats(self) -> Optional[dict]:
+        """
+        Get the statistics of the frame ring and of the handoffs of its pictures to the encoder processes. The
+        occupancy of the slots is the one of the frame pool, a slot is reused at each checkout of its batch.
 
+        Returns:
+            dict: frame ring statistics (see SharedFrameRing.stats and PictureEncoder.handoff_stats), slots in use
+                and slot reuses, None without a frame ring.
+        """
+        if self.frame_ring is None:
+            return None
+        pool = self.frame_pool.stats()
+        return {**self.frame_ring.stats(), **self.picture_encoder.handoff_stats(), "in_use": pool["in_use"],
+                "peak_in_use": pool["peak_in_use"], "reuses": pool["checkouts"] - pool["allocated"]}
 
     def __call__(self) -> None:
         """
         Call the CameraHandler to use the cameras and send the pictures to the API.
 
-        Returns:
-            requests.Response: response from the API.
+        Notes
+        -----
+        The pictures of each light type are handed to the pipeline as soon as they are collected: they are encoded
+        and sent while the next light type is captured, and the upload of the last one overlaps the next iteration.
+        The batch comes from the frame pool; each light type in the pipeline holds it until its upload ends.
+
+        Returns
+        -------
+        None
         """
 
-        batch = self.make_batch()
-        
-        console_logger.info(f"Sending batch of pictures to API.")
-        info_logger.info("Sending batch request to API.")
-        
-        response = self.api_handler.send_pictures_batch(batch)
-        return response
+        with self.camera_lock:
+            batch = self._acquire_batch("capture")
+            if batch is None:
+                self.pipeline.record("capture", 0.0, failed=True)
+                return None
 
+            try:
+                for light_index, light_type in enumerate(CameraHandler.LIGHT_SEQUENCE):
+                    start = time.monotonic()
+                    collected = self.trigger_camera(batch, light_type)
+                    self.pipeline.record("capture", time.monotonic() - start, failed=not collected)
+                    if not collected:
+                        return None
 
+                    self._log_collected(batch, light_type)
+                    self.frame_pool.retain(batch, "pipeline")
+                    if not self.pipeline.submit((batch, light_index)):
+                        self.frame_pool.release(batch, "pipeline")
+                        warning_logger.warning("%s pictures dropped: cameras stopped.", light_type.name.capitalize())
+            finally:
+                self._end_iteration(batch)
+                self.frame_pool.release(batch, "capture")
@@ -0,0 +1,245 @@
+from queue import Queue
+from threading import Lock, Thread
+from typing import Any, Callable, List, Tuple
+import time
+
+from .config import error_logger, CAPTURE_PIPELINE_QUEUE_SIZE
+from .scheduler import JitterHistogram
+
+_STOP = object()
+
+
+class StageMetrics:
+    """
+    Latency of a pipeline stage.
+
+    Attributes
+    ----------
+    latency : JitterHistogram
+        Time spent processing each item (seconds).
+    count : int
+        Number of items processed.
+    failed : int
+        Number of items that raised an exception.
+    total_time : float
+        Total processing time (seconds).
+
+    Methods
+    -------
+    record(seconds: float, failed: bool)
+        Record the processing of an item.
+    to_dict()
+        Get the latency statistics.
+    """
+
+    LATENCY_BOUNDS = [1e-3, 5e-3, 10e-3, 50e-3, 100e-3, 250e-3, 500e-3, 1, 2, 5, 10, 30]
+
+    def __init__(self) -> None:
+        self.latency = JitterHistogram(StageMetrics.LATENCY_BOUNDS)
+        self.count = 0
+        self.failed = 0
+        self.total_time = 0.0
+        self._lock = Lock()
+
+    def record(self, seconds: float, failed: bool = False) -> None:
+        """
+        Record the processing of an item.
+
+        Args:
+            seconds (float): processing time (seconds).
+            failed (bool): whether the processing raised an exception.
+        """
+        with self._lock:
+            self.latency.record(seconds)
+            self.count += 1
+            self.failed += failed
+            self.total_time += seconds
+
+    def to_dict(self) -> dict:
+        """
+        Get the latency statistics.
+
+        Returns:
+            dict: items processed and failed, average, p50, p99 and max latency (seconds).
+        """
+        with self._lock:
+            return {
+                "count": self.count,
+                "failed": self.failed,
+                "latency_avg": self.total_time / self.count if self.count else 0.0,
+                "latency_p50": self.latency.percentile(50),
+                "latency_p99": self.latency.percentile(99),
+                "latency_max": self.latency.max
+            }
+
+
+class CapturePipeline:
+    """
+    CapturePipeline runs the stages that follow a capture (e.g. encode, then upload) on their own threads, connected
+    by bounded queues, so that they overlap the next captures.
+
+    Each stage takes the output of the previous one; a stage that returns None ends the processing of the item.
+    A stage that raises logs the error and drops the item. When a queue is full, the previous stage (or the
+    submitting capture thread) blocks until there is room, so at most queue_size items wait before each stage.
+
+    Attributes
+    ----------
+    stages : List[Tuple[str, Callable[[Any], Any]]]
+        Name and function of each stage, in order.
+    queue_size : int
+        Maximum number of items waiting before each stage.
+    _queues : List[Queue]
+        Input queue of each stage.
+    _threads : List[Thread]
+        Thread of each stage, started on the first submit.
+    _metrics : dict
+        Metrics of each stage, including the stages run by the submitting threads (see record).
+    _closed : bool
+        Whether the pipeline accepts new items.
+
+    Methods
+    -------
+    submit(item: Any)
+        Hand an item to the first stage.
+    record(stage: str, seconds: float)
+        Record the latency of a stage run outside the pipeline (e.g. the capture).
+    close(wait: bool)
+        Stop the stages once the submitted items are processed.
+    metrics()
+        Get the latency metrics and the queue depth of each stage.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Any], Any]]], queue_size: int = CAPTURE_PIPELINE_QUEUE_SIZE,
+                 thread_name_prefix: str = 'capture_pipeline_') -> None:
+        """
+        Initialize the CapturePipeline.
+
+        Args:
+            stages (List[Tuple[str, Callable[[Any], Any]]]): name and function of each stage, in order.
+            queue_size (int): maximum number of items waiting before each stage.
+            thread_name_prefix (str): prefix of the stage thread names.
+        """
+        if not stages or queue_size <= 0:
+            raise ValueError("a pipeline needs at least one stage and a queue_size greater than 0")
+
+        self.stages = stages
+        self.queue_size = queue_size
+        self._queues = [Queue(maxsize=queue_size) for _ in stages]
+        self._threads = []
+        self._thread_name_prefix = thread_name_prefix
+        self._metrics = {name: StageMetrics() for name, _ in stages}
+        self._closed = False
+        self._lock = Lock()
+        self._metrics_lock = Lock()
+
+    def submit(self, item: Any) -> bool:
+        """
+        Hand an item to the first stage, blocking while its queue is full.
+
+        Args:
+            item (Any): item to process.
+
+        Returns:
+            bool: False if the pipeline is closed and the item was dropped.
+        """
+        with self._lock: # held while blocked on a full queue, so that close cannot overtake the item
+            if self._closed:
+                return False
+            if not self._threads:
+                self._start()
+
+            self._queues[0].put(item)
+            return True
+
+    def record(self, stage: str, seconds: float, failed: bool = False) -> None:
+        """
+        Record the latency of a stage run outside the pipeline (e.g. the capture, run by the submitting thread).
+
+        Args:
+            stage (str): name of the stage.
+            seconds (float): processing time (seconds).
+            failed (bool): whether the processing failed.
+        """
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(stage, StageMetrics())
+        metrics.record(seconds, failed)
+
+    def _start(self) -> None:
+        """
+        Start the stage threads.
+
+        Returns
+        -------
+        None
+        """
+        for index, (name, _) in enumerate(self.stages):
+            thread = Thread(target=self._run_stage, args=(index,), name=f'{self._thread_name_prefix}{name}',
+                            daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run_stage(self, index: int) -> None:
+        """
+        Process the items of a stage until the pipeline is closed.
+
+        Args:
+            index (int): index of the stage.
+        """
+        name, function = self.stages[index]
+        metrics = self._metrics[name]
+        next_queue = self._queues[index + 1] if index + 1 < len(self._queues) else None
+
+        while (item := self._queues[index].get()) is not _STOP:
+            start = time.monotonic()
+            try:
+                output = function(item)
+            except Exception as e:
+                metrics.record(time.monotonic() - start, failed=True)
+                error_logger.error("Capture pipeline stage %s failed: %s", name, e)
+                continue
+
+            metrics.record(time.monotonic() - start)
+            if next_queue is not None and output is not None:
+                next_queue.put(output)
+
+        if next_queue is not None:
+            next_queue.put(_STOP)
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Stop accepting items and stop the stages once the submitted items are processed.
+
+        Args:
+            wait (bool): whether to wait for the submitted items to be processed.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        if not self._threads:
+            return
+
+        self._queues[0].put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def metrics(self) -> dict:
+        """
+        Get the latency metrics and the queue depth of each stage.
+
+        Returns:
+            dict: metrics of each stage, by name.
+        """
+        with self._metrics_lock:
+            stages_metrics = list(self._metrics.items())
+
+        metrics = {name: stage_metrics.to_dict() for name, stage_metrics in stages_metrics}
+        for (name, _), stage_queue in zip(self.stages, self._queues):
+            metrics[name]["queue_depth"] = stage_queue.qsize()
+        return metrics
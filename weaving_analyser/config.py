@@ -1,11 +1,122 @@
+import atexit
 import logging
+import os
+from typing import Callable
 from hardware_controllers.cameras_controller import LightType
+from .log_pipeline import BufferedRotatingFileHandler, LogWriter
+from .metrics import REGISTRY
 
 light_dict = {
     LightType.GREEN: "green_light",
     LightType.BLUE: "blue_light"
 }
 
+# Worker threads of the WeavingAnalyser pools, the API connection pools are sized after them
+VELOCITY_WORKERS = 50
+PICTURE_WORKERS = 2
+
+# What the sampling loop does when it misses ticks (see CatchUpPolicy)
+SAMPLING_CATCH_UP_POLICY = 'skip'
+
+# Pending tasks of the WeavingAnalyser pools and what to do when the queue is full (see SubmitPolicy).
+# Velocity tasks send every buffered sample, so coalescing them loses no data.
+VELOCITY_QUEUE_SIZE = 4
+VELOCITY_QUEUE_POLICY = 'coalesce_latest'
+PICTURE_QUEUE_SIZE = 2
+PICTURE_QUEUE_POLICY = 'drop_newest'
+
+# Captures waiting before each stage of the capture pipeline (encode, upload)
+CAPTURE_PIPELINE_QUEUE_SIZE = 2
+
+# Frame buffers reused by the captures: one per capture in progress and per capture waiting in the pipeline.
+# A capture waits up to FRAME_POOL_ACQUIRE_TIMEOUT seconds for a buffer, a buffer held for more than
+# FRAME_POOL_LEAK_TIMEOUT seconds is reported as leaked
+FRAME_POOL_SIZE = 4
+FRAME_POOL_ACQUIRE_TIMEOUT = 60
+FRAME_POOL_LEAK_TIMEOUT = 120
+
+# Weight of a new measure in the smoothed trigger latency and camera iteration time (see TriggerScheduler)
+TRIGGER_LATENCY_SMOOTHING = 0.2
+
+# Compression of the pictures before the upload (see picture_codecs): lossless raw, zlib, zstd or png, or lossy
+# jpeg or webp bounded by PICTURE_CODEC_QUALITY (1-100). The encoding runs on PICTURE_ENCODER_PROCESSES processes,
+# which read the frames in place from shared memory (see SharedFrameRing)
+PICTURE_CODEC = 'raw'
+PICTURE_CODEC_QUALITY = 90
+PICTURE_ENCODER_PROCESSES = 2
+
+# Stream the pictures to the API with chunked transfer-encoding, each one encoded as it is sent, so that a single
+# encoded picture is held per upload and the first one reaches the server before the others are encoded. Only without
+# a spool, which stores the encoded batches
+STREAM_PICTURE_UPLOADS = False
+
+# Write-ahead spool of the encoded pictures (see spool): segments of SPOOL_SEGMENT_BYTES in SPOOL_DIRECTORY, the
+# oldest evicted beyond SPOOL_MAX_BYTES. SPOOL_FSYNC syncs every append to the disk, to survive power losses.
+# The drainer sends SPOOL_DRAIN_CONCURRENCY batches at a time and backs off from SPOOL_BACKOFF up to
+# SPOOL_MAX_BACKOFF seconds while the API is unreachable; on stop, it gets SPOOL_STOP_TIMEOUT seconds to empty it
+SPOOL_DIRECTORY = 'spool'
+SPOOL_SEGMENT_BYTES = 64 * 1024 * 1024
+SPOOL_MAX_BYTES = 2 * 1024 * 1024 * 1024
+SPOOL_FSYNC = False
+SPOOL_DRAIN_CONCURRENCY = PICTURE_WORKERS
+SPOOL_BACKOFF = 0.5
+SPOOL_MAX_BACKOFF = 30
+SPOOL_STOP_TIMEOUT = 10
+
+# API connection settings (seconds)
+API_CONNECT_TIMEOUT = 2
+API_READ_TIMEOUT = 30
+API_RETRIES = 3
+API_BACKOFF_FACTOR = 0.2
+
+# Local endpoint exposing the metrics in the Prometheus text format (see metrics), on http://host:port/metrics
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9464
+
+# Asyncio engine: open connections to the API and in-flight requests (the rest wait for a slot). On stop, the camera
+# iterations and requests in flight get ASYNC_STOP_TIMEOUT seconds to finish before they are cancelled
+ASYNC_API_POOL_SIZE = 64
+ASYNC_MAX_IN_FLIGHT = 4096
+ASYNC_STOP_TIMEOUT = 10
+
+# Supervisor of the looms of a floor (see supervisor): each loom worker runs in SUPERVISOR_DIRECTORY/<loom> and
+# publishes its metrics every SUPERVISOR_METRICS_PERIOD seconds; a worker that crashed, or whose metrics are older than
+# SUPERVISOR_HEARTBEAT_TIMEOUT seconds, is restarted after a backoff from SUPERVISOR_RESTART_BACKOFF doubling up to
+# SUPERVISOR_MAX_RESTART_BACKOFF seconds. A hung worker is asked to stop, then terminated, then killed,
+# SUPERVISOR_STOP_GRACE seconds apart: killed while it writes to the uploader queue, it could corrupt the queue of the
+# whole floor. On stop, the workers get SUPERVISOR_STOP_TIMEOUT seconds to send what they hold. Their requests to the
+# API wait in a queue of UPLOADER_QUEUE_SIZE requests for the UPLOADER_WORKERS connections shared by the floor, the
+# next ones are dropped
+SUPERVISOR_DIRECTORY = 'looms'
+SUPERVISOR_METRICS_PERIOD = 1
+SUPERVISOR_HEARTBEAT_TIMEOUT = 15
+SUPERVISOR_RESTART_BACKOFF = 1
+SUPERVISOR_MAX_RESTART_BACKOFF = 60
+SUPERVISOR_STOP_TIMEOUT = 30
+SUPERVISOR_STOP_GRACE = 5
+UPLOADER_WORKERS = 8
+UPLOADER_QUEUE_SIZE = 256
+
+# Surface movement samples are sent in batches of up to TELEMETRY_BATCH_SIZE samples,
+# or as soon as the oldest buffered sample is TELEMETRY_BATCH_LATENCY seconds old
+TELEMETRY_BATCH_SIZE = 25
+TELEMETRY_BATCH_LATENCY = 0.5
+TELEMETRY_BUFFER_CAPACITY = 50 * 60 # one minute of samples at 50 Hz
+
+
+# Log records are queued by the threads that log them and written by a single writer thread (see log_pipeline), in
+# batches of up to LOG_BATCH_SIZE records flushed at once, so the sampling loop never waits for the disk. Records
+# logged while LOG_QUEUE_SIZE are waiting are dropped. Each log file is rotated at LOG_MAX_BYTES, keeping
+# LOG_BACKUP_COUNT old files
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 256
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Directory of the log files, relative to the working directory unless absolute. Set by the WEAVING_LOG_DIRECTORY
+# environment variable if defined, which the worker processes inherit (the tests point it at a temporary directory)
+LOG_DIRECTORY = os.environ.get('WEAVING_LOG_DIRECTORY', 'logs')
+
 
 # Create separate loggers for debug and warning levels
 debug_logger = logging.getLogger('debug_logger')
@@ -14,38 +125,59 @@ info_logger = logging.getLogger('info_logger')
 console_logger = logging.getLogger('console_logger')
 error_logger = logging.getLogger('error_logger')
 
+log_writer = LogWriter(LOG_QUEUE_SIZE, LOG_BATCH_SIZE)
+
+
+def log_file_handler(name: str, formatter: logging.Formatter) -> Callable[[], logging.Handler]:
+    """
+    Factory of the rotating handler of a log file, called by the log writer on the first record of its logger, so
+    that importing the configuration opens no file.
+
+    Args:
+        name (str): name of the log file in LOG_DIRECTORY, which is created if needed.
+        formatter (logging.Formatter): format of the records.
+
+    Returns:
+        Callable[[], logging.Handler]: the factory.
+    """
+    def create() -> logging.Handler:
+        os.makedirs(LOG_DIRECTORY, exist_ok=True)
+        handler = BufferedRotatingFileHandler(os.path.join(LOG_DIRECTORY, name), maxBytes=LOG_MAX_BYTES,
+                                              backupCount=LOG_BACKUP_COUNT)
+        handler.setFormatter(formatter)
+        return handler
+
+    return create
+
+
 # Configure the debug logger
 debug_logger.setLevel(logging.DEBUG)
-debug_handler = logging.FileHandler('logs/surface_inspection_debug.log')
 debug_formatter = logging.Formatter('%(asctime)s - %(levelname)s: %(message)s')
-debug_handler.setFormatter(debug_formatter)
-debug_logger.addHandler(debug_handler)
+log_writer.add_logger(debug_logger, log_file_handler('surface_inspection_debug.log', debug_formatter))
 
 # Configure the warning logger
 warning_logger.setLevel(logging.WARNING)
-warning_handler = logging.FileHandler('logs/surface_inspection_warning.log')
 warning_formatter = logging.Formatter('%(asctime)s - %(levelname)s: %(message)s')
-warning_handler.setFormatter(warning_formatter)
-warning_logger.addHandler(warning_handler)
+log_writer.add_logger(warning_logger, log_file_handler('surface_inspection_warning.log', warning_formatter))
 
 # Configure the info logger
 info_logger.setLevel(logging.INFO)
-info_handler = logging.FileHandler('logs/surface_inspection_info.log')
 info_formatter = logging.Formatter('%(asctime)s - %(levelname)s: %(message)s')
-info_handler.setFormatter(info_formatter)
-info_logger.addHandler(info_handler)
+log_writer.add_logger(info_logger, log_file_handler('surface_inspection_info.log', info_formatter))
 
 # Configure the console logger
 console_logger.setLevel(logging.INFO)
 console_handler = logging.StreamHandler()
 console_formatter = logging.Formatter('%(asctime)s - %(message)s')
 console_handler.setFormatter(console_formatter)
-console_logger.addHandler(console_handler)
+log_writer.add_logger(console_logger, console_handler)
 
 # Configure the error logger
 error_logger.setLevel(logging.ERROR)
-error_handler = logging.FileHandler('logs/surface_inspection_error.log')
 error_formatter = logging.Formatter('%(asctime)s - %(levelname)s: %(message)s')
-error_handler.setFormatter(error_formatter)
-error_logger.addHandler(error_handler)
+log_writer.add_logger(error_logger, log_file_handler('surface_inspection_error.log', error_formatter))
 
+# the writer thread starts with the first record
+atexit.register(log_writer.stop) # write the records still queued
+REGISTRY.gauge("weaving_log_records_dropped", "Log records dropped: writer queue full.",
+               function=lambda: log_writer.stats()["dropped"])
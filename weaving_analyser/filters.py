@@ -0,0 +1,351 @@
+"""
+Filters for the velocity readings.
+
+Every filter has a per-sample API, update(value), that costs O(1) (O(window) for the median, with a small fixed
+window) and a batch API, apply(values), that filters a whole recorded stream with NumPy operations. apply() starts
+from a fresh state and gives the same output as calling update() on each value of a fresh filter.
+"""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+import math
+from typing import List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class RingBuffer:
+    """
+    RingBuffer is a fixed-size, array-backed FIFO of floats that keeps a running sum of its values.
+
+    Attributes
+    ----------
+    size : int
+        Maximum number of values.
+    total : float
+        Sum of the values.
+    _values : np.ndarray
+        Storage of the values.
+    _start : int
+        Index of the oldest value.
+    _count : int
+        Number of values.
+    _appends : int
+        Number of appends since the running sum was last recomputed.
+
+    Methods
+    -------
+    append(value: float)
+        Append a value, evicting the oldest one if the buffer is full.
+    mean()
+        Mean of the values.
+    values()
+        Values, oldest first.
+    """
+
+    _RESUM_INTERVAL = 10_000 # appends between exact recomputations of the running sum (avoids rounding drift)
+
+    def __init__(self, size: int) -> None:
+        if size <= 0:
+            raise ValueError("size must be greater than 0")
+
+        self.size = size
+        self.total = 0.0
+        self._values = np.zeros(size)
+        self._start = 0
+        self._count = 0
+        self._appends = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, value: float) -> Optional[float]:
+        """
+        Append a value, evicting the oldest one if the buffer is full.
+
+        Args:
+            value (float): value to append.
+
+        Returns:
+            Optional[float]: evicted value, None if the buffer was not full.
+        """
+        evicted = None
+        if self._count == self.size:
+            evicted = float(self._values[self._start])
+            self._values[self._start] = value
+            self._start = (self._start + 1) % self.size
+            self.total += value - evicted
+        else:
+            self._values[(self._start + self._count) % self.size] = value
+            self._count += 1
+            self.total += value
+
+        self._appends += 1
+        if self._appends >= RingBuffer._RESUM_INTERVAL:
+            self.total = math.fsum(self.values())
+            self._appends = 0
+
+        return evicted
+
+    def mean(self) -> float:
+        """
+        Mean of the values.
+
+        Returns:
+            float: mean of the values, 0 if the buffer is empty.
+        """
+        return self.total / self._count if self._count else 0.0
+
+    def values(self) -> List[float]:
+        """
+        Values, oldest first.
+
+        Returns:
+            List[float]: values.
+        """
+        indices = (self._start + np.arange(self._count)) % self.size
+        return self._values[indices].tolist()
+
+    def clear(self) -> None:
+        """
+        Remove all the values.
+        """
+        self.total = 0.0
+        self._start = 0
+        self._count = 0
+
+
+class Filter(ABC):
+    """
+    Filter is the interface of the velocity filters.
+
+    Methods
+    -------
+    update(value: float)
+        Filter a new sample.
+    apply(values: np.ndarray)
+        Filter a whole recorded stream.
+    reset()
+        Forget the past samples.
+    """
+
+    @abstractmethod
+    def update(self, value: float) -> float:
+        ...
+
+    @abstractmethod
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def reset(self) -> None:
+        ...
+
+
+class MovingAverageFilter(Filter):
+    """
+    Mean of the last window samples (of all the samples while there are fewer than window).
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._buffer = RingBuffer(window)
+
+    def update(self, value: float) -> float:
+        self._buffer.append(value)
+        return self._buffer.mean()
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        cumulative = np.concatenate(([0.0], np.cumsum(values)))
+        ends = np.arange(1, len(values) + 1)
+        starts = np.maximum(ends - self.window, 0)
+        return (cumulative[ends] - cumulative[starts]) / (ends - starts)
+
+    def reset(self) -> None:
+        self._buffer.clear()
+
+
+class MedianFilter(Filter):
+    """
+    Median of the last window samples (of all the samples while there are fewer than window).
+    Rejects outliers that a moving average would smear over the window.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._buffer = RingBuffer(window)
+        self._sorted = []
+
+    def update(self, value: float) -> float:
+        evicted = self._buffer.append(value)
+        if evicted is not None:
+            del self._sorted[bisect_left(self._sorted, evicted)]
+        insort(self._sorted, value)
+
+        middle = len(self._sorted) // 2
+        if len(self._sorted) % 2:
+            return self._sorted[middle]
+        return (self._sorted[middle - 1] + self._sorted[middle]) / 2
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        warm_up = min(self.window - 1, len(values))
+        output = np.empty(len(values))
+        for i in range(warm_up):
+            output[i] = np.median(values[:i + 1])
+        if len(values) >= self.window:
+            output[warm_up:] = np.median(sliding_window_view(values, self.window), axis=1)
+        return output
+
+    def reset(self) -> None:
+        self._buffer.clear()
+        self._sorted.clear()
+
+
+class ExponentialFilter(Filter):
+    """
+    Exponential moving average: y = y + alpha * (x - y), initialized with the first sample.
+    """
+
+    _BLOCK_DYNAMIC_RANGE = 1e-8 # smallest decay factor inside a block of the batch computation
+    _MIN_LOOKAHEAD = 64
+    _MAX_LOOKAHEAD = 4096
+
+    def __init__(self, alpha: float) -> None:
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in ]0, 1]")
+
+        self.alpha = alpha
+        self._value = None
+
+    def update(self, value: float) -> float:
+        if self._value is None:
+            self._value = value
+        else:
+            self._value += self.alpha * (value - self._value)
+        return self._value
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        if not len(values) or self.alpha == 1:
+            return values.copy()
+        return _exponential_smoothing(values, np.full(len(values), self.alpha), values[0])
+
+    def reset(self) -> None:
+        self._value = None
+
+
+class KalmanFilter1D(Filter):
+    """
+    One-dimensional Kalman filter for a random-walk state measured with noise.
+
+    Attributes
+    ----------
+    process_variance : float
+        Variance of the state change between samples.
+    measurement_variance : float
+        Variance of the measurement noise.
+    initial_variance : float
+        Variance of the initial estimate (the first sample).
+    """
+
+    def __init__(self, process_variance: float, measurement_variance: float, initial_variance: float = 1.0) -> None:
+        self.process_variance = process_variance
+        self.measurement_variance = measurement_variance
+        self.initial_variance = initial_variance
+        self._value = None
+        self._variance = initial_variance
+
+    def update(self, value: float) -> float:
+        if self._value is None:
+            self._value = value
+            return value
+
+        self._variance += self.process_variance
+        gain = self._variance / (self._variance + self.measurement_variance)
+        self._value += gain * (value - self._value)
+        self._variance *= 1 - gain
+        return self._value
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return values.copy()
+
+        # the gains do not depend on the measurements: compute them until they converge, the rest of the stream is
+        # then an exponential moving average with the steady-state gain
+        gains = np.empty(len(values))
+        gains[0] = 1.0
+        variance = self.initial_variance
+        for i in range(1, len(values)):
+            variance += self.process_variance
+            gain = variance / (variance + self.measurement_variance)
+            variance *= 1 - gain
+            gains[i] = gain
+            if i > 1 and abs(gains[i] - gains[i - 1]) < 1e-12:
+                gains[i:] = gain
+                break
+
+        return _exponential_smoothing(values, gains, values[0])
+
+    def reset(self) -> None:
+        self._value = None
+        self._variance = self.initial_variance
+
+
+class FilterChain(Filter):
+    """
+    Filters applied one after the other, e.g. a median to reject outliers followed by a moving average.
+    """
+
+    def __init__(self, *filters: Filter) -> None:
+        self.filters = filters
+
+    def update(self, value: float) -> float:
+        for stage in self.filters:
+            value = stage.update(value)
+        return value
+
+    def apply(self, values: np.ndarray) -> np.ndarray:
+        for stage in self.filters:
+            values = stage.apply(values)
+        return values
+
+    def reset(self) -> None:
+        for stage in self.filters:
+            stage.reset()
+
+
+def _exponential_smoothing(values: np.ndarray, gains: np.ndarray, initial: float) -> np.ndarray:
+    """
+    Vectorized y[i] = y[i - 1] + gains[i] * (values[i] - y[i - 1]), with y[-1] = initial.
+
+    Notes
+    -----
+    Within a block, y[k] = D[k] * (y_prev + sum_{j <= k} gains[j] * values[j] / D[j]) with D[k] the product of the
+    (1 - gains[j]) for j <= k. Blocks are cut before D gets too small, to keep the division well conditioned.
+    """
+
+    output = np.empty(len(values))
+    previous = initial
+    start = 0
+    lookahead = ExponentialFilter._MIN_LOOKAHEAD
+
+    while start < len(values):
+        decays = np.cumprod(1 - gains[start:start + lookahead])
+        if decays[0] == 0: # a gain of 1 resets the estimate to the sample
+            output[start] = previous = values[start]
+            start += 1
+            continue
+
+        length = max(1, int(np.searchsorted(-decays, -ExponentialFilter._BLOCK_DYNAMIC_RANGE)))
+        block = slice(start, start + length)
+        output[block] = decays[:length] * (previous + np.cumsum(gains[block] * values[block] / decays[:length]))
+
+        previous = output[block.stop - 1]
+        start += length
+        lookahead = min(ExponentialFilter._MAX_LOOKAHEAD, max(ExponentialFilter._MIN_LOOKAHEAD, 2 * length))
+
+    return output
@@ -0,0 +1,253 @@
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, RotatingFileHandler
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Union
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that leaves the flushes to its caller: the records are written to the file buffer, and
+    flush_buffer writes them to the disk once per batch instead of once per record.
+
+    The size of the file is tracked as the records are written, RotatingFileHandler seeks to the end of the file
+    before every record, which flushes the buffer.
+
+    Methods
+    -------
+    flush_buffer()
+        Write the buffered records to the disk.
+    """
+
+    def _open(self):
+        stream = super()._open()
+        self._size = stream.seek(0, 2)
+        return stream
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            message = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self._size and self._size + len(message) >= self.maxBytes:
+                self.doRollover()
+            self.stream.write(message)
+            self._size += len(message)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        pass # see flush_buffer
+
+    def flush_buffer(self) -> None:
+        """
+        Write the buffered records to the disk.
+
+        Returns
+        -------
+        None
+        """
+        super().flush()
+
+    def close(self) -> None:
+        self.flush_buffer()
+        super().close()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the logging thread: when the queue is full, the record is dropped and counted.
+
+    The record is queued as it is, without formatting its message: the arguments of a %-style call are only formatted
+    by the writer thread, so the callers must not modify them after logging them.
+
+    Attributes
+    ----------
+    dropped : int
+        Number of records dropped because the queue was full.
+    """
+
+    def __init__(self, log_queue: queue.Queue, on_first_record: Optional[Callable[[], None]] = None) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock_dropped = Lock()
+        self._on_first_record = on_first_record
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record # formatted by the writer thread
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._on_first_record is not None:
+            on_first_record, self._on_first_record = self._on_first_record, None
+            on_first_record()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+
+class LogWriter:
+    """
+    LogWriter is the background thread writing the queued log records to the handler of their logger.
+
+    It takes every record waiting in the queue, up to batch_size, writes them, then flushes the handlers it wrote to
+    once, so the disk sees one write per batch rather than one per record.
+
+    Nothing happens until the first record: the thread is started by it, and the handlers given as factories are
+    created (and their files opened) by the first record of their logger.
+
+    Attributes
+    ----------
+    queue : queue.Queue
+        Records waiting to be written.
+    handlers : Dict[str, List[Union[logging.Handler, Callable[[], logging.Handler]]]]
+        Handlers of each logger (or their factories until they are created), by logger name.
+    batch_size : int
+        Maximum number of records written between two flushes.
+    queue_handler : DroppingQueueHandler
+        Handler to attach to the loggers, queueing their records.
+
+    Methods
+    -------
+    add_logger(logger: logging.Logger, handler: Union[logging.Handler, Callable[[], logging.Handler]])
+        Write the records of a logger to a handler, from the writer thread.
+    start()
+        Start the writer thread.
+    stop()
+        Write the records still queued and stop the writer thread.
+    stats()
+        Get the number of records written and dropped.
+    """
+
+    _STOP = object()
+
+    def __init__(self, queue_size: int, batch_size: int) -> None:
+        """
+        Initialize the LogWriter.
+
+        Args:
+            queue_size (int): maximum number of records waiting to be written, the next ones are dropped.
+            batch_size (int): maximum number of records written between two flushes.
+        """
+        self.queue = queue.Queue(queue_size)
+        self.handlers: Dict[str, List[Union[logging.Handler, Callable[[], logging.Handler]]]] = {}
+        self.batch_size = batch_size
+        self.queue_handler = DroppingQueueHandler(self.queue, on_first_record=self.start)
+        self.written = 0
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+
+    def add_logger(self, logger: logging.Logger,
+                   handler: Union[logging.Handler, Callable[[], logging.Handler]]) -> None:
+        """
+        Write the records of a logger to a handler, from the writer thread.
+
+        Args:
+            logger (logging.Logger): logger whose records are written.
+            handler (Union[logging.Handler, Callable[[], logging.Handler]]): handler writing them, or a factory
+                creating it on the first record of the logger.
+
+        Returns
+        -------
+        None
+        """
+        self.handlers.setdefault(logger.name, []).append(handler)
+        if self.queue_handler not in logger.handlers:
+            logger.addHandler(self.queue_handler)
+
+    def start(self) -> None:
+        """
+        Start the writer thread.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._write, name='log_writer', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Write the records still queued and stop the writer thread.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+
+        self.queue.put(LogWriter._STOP) # blocks only if the queue is full, until the writer makes room
+        thread.join()
+
+    def stats(self) -> dict:
+        """
+        Get the number of records written and dropped.
+
+        Returns:
+            dict: records written, dropped because the queue was full, and waiting in the queue.
+        """
+        return {"written": self.written, "dropped": self.queue_handler.dropped, "queued": self.queue.qsize()}
+
+    def _write(self) -> None:
+        """
+        Write the queued records in batches until stopped.
+
+        Returns
+        -------
+        None
+        """
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            written_to = set()
+            for record in batch:
+                if record is LogWriter._STOP:
+                    stop = True
+                    continue
+                for handler in self._logger_handlers(record.name):
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+                        written_to.add(handler)
+                self.written += 1
+
+            for handler in written_to:
+                try:
+                    getattr(handler, "flush_buffer", handler.flush)()
+                except OSError as e:
+                    print(f"Failed to write the {handler} logs: {e}", file=sys.stderr)
+
+            if stop:
+                return
+
+    def _logger_handlers(self, name: str) -> List[logging.Handler]:
+        """
+        Get the handlers of a logger, creating the ones given as factories.
+
+        Args:
+            name (str): name of the logger.
+
+        Returns:
+            List[logging.Handler]: handlers of the logger.
+        """
+        handlers = self.handlers.get(name, [])
+        for i, handler in enumerate(handlers):
+            if not isinstance(handler, logging.Handler):
+                try:
+                    handlers[i] = handler()
+                except OSError as e:
+                    print(f"Failed to open the {name} logs: {e}", file=sys.stderr)
+                    handlers[i] = logging.NullHandler()
+        return handlers
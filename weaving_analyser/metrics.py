@@ -0,0 +1,493 @@
+from bisect import bisect_left
+from threading import Lock, Thread, current_thread, local
+from typing import Callable, Dict, List, Optional, Tuple
+from weakref import ref
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the duration buckets (seconds), from a velocity sample to a picture upload
+DURATION_BOUNDS = [50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3, 500e-3,
+                   1, 2.5, 5, 10, 30]
+
+
+class _PerThreadCells:
+    """
+    Accumulators of a metric, one per thread that updates it: the updates take no lock and are never lost, the
+    collection sums the accumulators of every thread. The accumulators of the threads that ended are folded into a
+    base accumulator when the metric is collected, so that short-lived threads do not grow the list.
+    """
+
+    def __init__(self, new_cell: Callable[[], list]) -> None:
+        self._new_cell = new_cell
+        self.local = local() # the hot paths read local.cell directly, and call cell() on the first update
+        self._base = new_cell()
+        self._cells: List[Tuple[ref, list]] = []
+        self._lock = Lock()
+
+    def cell(self) -> list:
+        try:
+            return self.local.cell
+        except AttributeError:
+            cell = self._new_cell()
+            with self._lock:
+                self._cells.append((ref(current_thread()), cell))
+            self.local.cell = cell
+            return cell
+
+    def cells(self) -> List[list]:
+        with self._lock:
+            alive = []
+            for thread, cell in self._cells:
+                if (owner := thread()) is not None and owner.is_alive():
+                    alive.append((thread, cell))
+                else: # the thread will not update its cell anymore
+                    for i, value in enumerate(cell):
+                        self._base[i] += value
+            self._cells = alive
+            return [list(self._base)] + [cell for _, cell in alive]
+
+
+class Counter:
+    """
+    Counter is a monotonically increasing metric, accumulated per thread.
+
+    Attributes
+    ----------
+    name : str
+        Name of the metric.
+    labels : Dict[str, str]
+        Labels of the metric.
+
+    Methods
+    -------
+    inc(amount: float)
+        Increment the counter.
+    value()
+        Get the value of the counter.
+    """
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, labels: Optional[Dict[str, str]] = None) -> None:
+        self.name = name
+        self.labels = dict(labels or {})
+        self._cells = _PerThreadCells(lambda: [0])
+        self._local = self._cells.local
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        Increment the counter.
+
+        Args:
+            amount (float): increment, positive.
+        """
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cells.cell()
+        cell[0] += amount
+
+    def value(self) -> float:
+        """
+        Get the value of the counter.
+
+        Returns:
+            float: sum of the increments of every thread.
+        """
+        return sum(cell[0] for cell in self._cells.cells())
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [(self.name, self.labels, self.value())]
+
+
+class Gauge:
+    """
+    Gauge is a metric that goes up and down: set by the code, or read from a function when it is collected.
+
+    Attributes
+    ----------
+    name : str
+        Name of the metric.
+    labels : Dict[str, str]
+        Labels of the metric.
+
+    Methods
+    -------
+    set(value: float)
+        Set the gauge.
+    inc(amount: float)
+        Increment the gauge.
+    dec(amount: float)
+        Decrement the gauge.
+    set_function(function: Callable[[], float])
+        Read the gauge from a function when it is collected.
+    value()
+        Get the value of the gauge.
+    """
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, labels: Optional[Dict[str, str]] = None) -> None:
+        self.name = name
+        self.labels = dict(labels or {})
+        self._value = 0.0
+        self._function = None
+        self._lock = Lock()
+
+    def set(self, value: float) -> None:
+        """
+        Set the gauge.
+
+        Args:
+            value (float): new value.
+        """
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        Increment the gauge.
+
+        Args:
+            amount (float): increment.
+        """
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        """
+        Decrement the gauge.
+
+        Args:
+            amount (float): decrement.
+        """
+        self.inc(-amount)
+
+    def set_function(self, function: Optional[Callable[[], float]]) -> None:
+        """
+        Read the gauge from a function when it is collected, so that it costs nothing until then.
+
+        Args:
+            function (Callable[[], float], optional): function returning the value, None to go back to set.
+        """
+        self._function = function
+
+    def value(self) -> float:
+        """
+        Get the value of the gauge.
+
+        Returns:
+            float: value set, or returned by the function.
+        """
+        function = self._function
+        return function() if function is not None else self._value
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        try:
+            value = self.value()
+        except Exception: # a failing function must not break the whole exposition
+            value = None
+        return [(self.name, self.labels, value)]
+
+
+class Histogram:
+    """
+    Histogram counts values in fixed buckets, accumulated per thread.
+
+    Attributes
+    ----------
+    name : str
+        Name of the metric.
+    labels : Dict[str, str]
+        Labels of the metric.
+    bounds : List[float]
+        Upper bounds of the buckets (inclusive), the last bucket has no upper bound.
+
+    Methods
+    -------
+    observe(value: float)
+        Record a value.
+    snapshot()
+        Get the bucket counts, the count and the sum of the values.
+    """
+
+    TYPE = "histogram"
+
+    def __init__(self, name: str, bounds: Optional[List[float]] = None,
+                 labels: Optional[Dict[str, str]] = None) -> None:
+        self.name = name
+        self.labels = dict(labels or {})
+        self.bounds = sorted(bounds or DURATION_BOUNDS)
+        self._bounds = self.bounds
+        buckets = len(self.bounds) + 1
+        # bucket counts, then the sum of the values
+        self._cells = _PerThreadCells(lambda: [0] * buckets + [0.0])
+        self._local = self._cells.local
+
+    def observe(self, value: float) -> None:
+        """
+        Record a value.
+
+        Args:
+            value (float): value to record.
+        """
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cells.cell()
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], int, float]:
+        """
+        Get the bucket counts, the count and the sum of the values.
+
+        Returns:
+            Tuple[List[int], int, float]: count of each bucket (not cumulative), count and sum of the values.
+        """
+        counts = [0] * (len(self.bounds) + 1)
+        total = 0.0
+        for cell in self._cells.cells():
+            for i in range(len(counts)):
+                counts[i] += cell[i]
+            total += cell[-1]
+        return counts, sum(counts), total
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        counts, count, total = self.snapshot()
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + [float("inf")], counts):
+            cumulative += bucket_count
+            samples.append((f"{self.name}_bucket", {**self.labels, "le": _format_value(bound)}, cumulative))
+        samples.append((f"{self.name}_sum", self.labels, total))
+        samples.append((f"{self.name}_count", self.labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    MetricsRegistry holds the metrics of the analyser and renders them in the Prometheus text format.
+
+    Metrics of the same name with different labels belong to the same family. Asking for a metric that already
+    exists returns it, so the modules and the instances that share a metric do not need to coordinate.
+
+    Methods
+    -------
+    counter(name: str, documentation: str, labels: dict)
+        Get or create a counter.
+    gauge(name: str, documentation: str, labels: dict, function: Callable[[], float])
+        Get or create a gauge.
+    histogram(name: str, documentation: str, bounds: List[float], labels: dict)
+        Get or create a histogram.
+    get(name: str, labels: dict)
+        Get a metric.
+    exposition()
+        Render every metric in the Prometheus text format.
+    """
+
+    def __init__(self) -> None:
+        self._families: Dict[str, Tuple[str, str, Dict[tuple, object]]] = {}
+        self._lock = Lock()
+
+    def counter(self, name: str, documentation: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+        """
+        Get or create a counter.
+
+        Args:
+            name (str): name of the metric, ending with _total.
+            documentation (str): help text of the metric.
+            labels (dict, optional): labels of the metric.
+
+        Returns:
+            Counter: the counter.
+        """
+        return self._get_or_create(Counter, name, documentation, labels, lambda: Counter(name, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Optional[Dict[str, str]] = None,
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        """
+        Get or create a gauge.
+
+        Args:
+            name (str): name of the metric.
+            documentation (str): help text of the metric.
+            labels (dict, optional): labels of the metric.
+            function (Callable[[], float], optional): function the gauge is read from when it is collected (see
+                Gauge.set_function), replacing the previous one.
+
+        Returns:
+            Gauge: the gauge.
+        """
+        gauge = self._get_or_create(Gauge, name, documentation, labels, lambda: Gauge(name, labels))
+        if function is not None:
+            gauge.set_function(function)
+        return gauge
+
+    def histogram(self, name: str, documentation: str, bounds: Optional[List[float]] = None,
+                  labels: Optional[Dict[str, str]] = None) -> Histogram:
+        """
+        Get or create a histogram.
+
+        Args:
+            name (str): name of the metric.
+            documentation (str): help text of the metric.
+            bounds (List[float], optional): upper bounds of the buckets. Defaults to DURATION_BOUNDS (seconds).
+            labels (dict, optional): labels of the metric.
+
+        Returns:
+            Histogram: the histogram.
+        """
+        return self._get_or_create(Histogram, name, documentation, labels, lambda: Histogram(name, bounds, labels))
+
+    def get(self, name: str, labels: Optional[Dict[str, str]] = None):
+        """
+        Get a metric.
+
+        Args:
+            name (str): name of the metric.
+            labels (dict, optional): labels of the metric.
+
+        Returns:
+            Counter, Gauge or Histogram: the metric, None if it does not exist.
+        """
+        with self._lock:
+            family = self._families.get(name)
+            return family[2].get(_labels_key(labels)) if family is not None else None
+
+    def exposition(self) -> str:
+        """
+        Render every metric in the Prometheus text format (version 0.0.4).
+
+        Returns:
+            str: the metrics, one family after the other.
+        """
+        with self._lock:
+            families = [(name, kind, documentation, list(metrics.values()))
+                        for name, (kind, documentation, metrics) in sorted(self._families.items())]
+
+        lines = []
+        for name, kind, documentation, metrics in families:
+            lines.append(f"# HELP {name} {_escape(documentation, help_text=True)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics:
+                for sample_name, labels, value in metric.samples():
+                    lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _get_or_create(self, metric_class: type, name: str, documentation: str, labels: Optional[Dict[str, str]],
+                       create: Callable[[], object]):
+        key = _labels_key(labels)
+        with self._lock:
+            kind, _, metrics = self._families.setdefault(name, (metric_class.TYPE, documentation, {}))
+            if kind != metric_class.TYPE:
+                raise ValueError(f"Metric {name} is a {kind}, not a {metric_class.TYPE}")
+            if key not in metrics:
+                metrics[key] = create()
+            return metrics[key]
+
+
+class MetricsServer:
+    """
+    MetricsServer exposes a MetricsRegistry on /metrics, for Prometheus to pull.
+
+    Attributes
+    ----------
+    registry : MetricsRegistry
+        Metrics exposed.
+    host : str
+        Address the server listens on.
+    port : int
+        Port the server listens on (the port chosen by the system when 0 was asked).
+
+    Methods
+    -------
+    start()
+        Serve the metrics on a background thread.
+    stop()
+        Stop the server.
+    """
+
+    def __init__(self, registry: "MetricsRegistry", host: str = "127.0.0.1", port: int = 0) -> None:
+        """
+        Initialize the MetricsServer and bind its port.
+
+        Args:
+            registry (MetricsRegistry): metrics exposed.
+            host (str): address to listen on. Defaults to the local host only.
+            port (int): port to listen on, 0 for any free port.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer # only needed by the application
+
+        self.registry = registry
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass # scraped every few seconds, not worth a log line
+
+        self._server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = Thread(target=self._server.serve_forever, name='metrics_server', daemon=True)
+
+    def start(self) -> None:
+        """
+        Serve the metrics on a background thread.
+
+        Returns
+        -------
+        None
+        """
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the server.
+
+        Returns
+        -------
+        None
+        """
+        if self._thread.is_alive():
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+
+def _labels_key(labels: Optional[Dict[str, str]]) -> tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _escape(value: str, help_text: bool = False) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value if help_text else value.replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    if value is None:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Registry of the analyser metrics, exposed by the MetricsServer of the application
+REGISTRY = MetricsRegistry()
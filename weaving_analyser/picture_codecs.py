@@ -0,0 +1,371 @@
+"""
+Compression codecs of the pictures sent to the /pictures_batch endpoint.
+
+Lossless codecs: raw (no compression), zlib and zstd (compressed raw frames) and png.
+Lossy codecs: jpeg and webp, bounded by a quality between 1 and 100.
+zstd needs the optional zstandard package.
+
+usage: python -m weaving_analyser.picture_codecs [--quality 90] [--repeat 3]
+prints bytes/frame against CPU ms/frame of every available codec, on the pictures of the simulated cameras.
+"""
+
+import argparse
+import io
+import multiprocessing
+import time
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor, wait
+from threading import Lock
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .metrics import REGISTRY
+from .scheduler import JitterHistogram
+
+if TYPE_CHECKING:
+    from hardware_controllers.cameras_controller import SharedFrameRing
+
+try:
+    import zstandard
+except ImportError: # optional dependency, only needed by the zstd codec
+    zstandard = None
+
+LOSSLESS_CODECS = ('raw', 'zlib', 'zstd', 'png')
+LOSSY_CODECS = ('jpeg', 'webp')
+CODECS = LOSSLESS_CODECS + LOSSY_CODECS
+
+ZLIB_LEVEL = 1
+ZSTD_LEVEL = 3
+PNG_COMPRESS_LEVEL = 1
+_PIL_FORMATS = {'png': 'PNG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+HANDOFF_SECONDS = REGISTRY.histogram("weaving_frame_handoff_seconds",
+                                     "Time from the handoff of a picture in shared memory to its encoder process to "
+                                     "the start of its encoding (seconds).")
+
+
+def available_codecs() -> List[str]:
+    """
+    Get the codecs usable with the installed packages.
+
+    Returns:
+        List[str]: names of the codecs.
+    """
+    return [codec for codec in CODECS if codec != 'zstd' or zstandard is not None]
+
+
+def check_codec(codec: str, quality: Optional[int] = None) -> None:
+    """
+    Check that a codec can be used.
+
+    Args:
+        codec (str): name of the codec.
+        quality (int, optional): quality of the lossy codecs, between 1 and 100.
+
+    Raises:
+        ValueError: when the codec is unknown, not installed, or the quality is out of bounds.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"unknown picture codec {codec!r}, expected one of {', '.join(CODECS)}")
+    if codec == 'zstd' and zstandard is None:
+        raise ValueError("the zstd picture codec needs the zstandard package")
+    if codec in LOSSY_CODECS and not (quality is not None and 1 <= quality <= 100):
+        raise ValueError(f"the {codec} picture codec needs a quality between 1 and 100")
+
+
+def encode_picture(picture: np.ndarray, codec: str, quality: Optional[int] = None) -> Union[bytes, memoryview]:
+    """
+    Encode a picture with a codec. Runs in the encoder processes, so it only takes picklable arguments.
+
+    Args:
+        picture (np.ndarray): picture array; the image codecs (png, jpeg, webp) need 8-bit grayscale or RGB pictures.
+        codec (str): name of the codec.
+        quality (int, optional): quality of the lossy codecs, between 1 and 100.
+
+    Returns:
+        Union[bytes, memoryview]: encoded picture (a view over the picture for the raw codec).
+    """
+    if codec == 'raw':
+        return memoryview(np.ascontiguousarray(picture)).cast('B')
+    if codec == 'zlib':
+        return zlib.compress(np.ascontiguousarray(picture), ZLIB_LEVEL)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(np.ascontiguousarray(picture))
+
+    options = {'compress_level': PNG_COMPRESS_LEVEL} if codec == 'png' else {'quality': quality}
+    buffer = io.BytesIO()
+    from PIL import Image # imported by the image codecs only
+
+    Image.fromarray(picture).save(buffer, format=_PIL_FORMATS[codec], **options)
+    return buffer.getvalue()
+
+
+def encode_shared_picture(ring_name: str, offset: int, shape: Sequence[int], dtype: str, codec: str,
+                          quality: Optional[int], handed_off: float) -> Tuple[Union[bytes, memoryview], float]:
+    """
+    Encode a picture written in a SharedFrameRing, read in place. Runs in the encoder processes.
+
+    Args:
+        ring_name (str): name of the shared memory block of the ring.
+        offset (int): offset of the picture in the block (bytes).
+        shape (Sequence[int]): shape of the picture.
+        dtype (str): type of the picture values.
+        codec (str): name of the codec, not raw (a raw picture is a view that cannot leave the process).
+        quality (int, optional): quality of the lossy codecs, between 1 and 100.
+        handed_off (float): time.monotonic() when the picture was handed off.
+
+    Returns:
+        Tuple[Union[bytes, memoryview], float]: encoded picture, and the handoff latency (seconds).
+    """
+    latency = time.monotonic() - handed_off
+    from hardware_controllers.cameras_controller.shared_frame_ring import attach_frame
+
+    return encode_picture(attach_frame(ring_name, offset, shape, dtype), codec, quality), latency
+
+
+def decode_picture(buffer: Union[bytes, memoryview], codec: str, shape: Sequence[int], dtype: str) -> np.ndarray:
+    """
+    Decode a picture encoded by encode_picture.
+
+    Args:
+        buffer (Union[bytes, memoryview]): encoded picture.
+        codec (str): name of the codec.
+        shape (Sequence[int]): shape of the picture.
+        dtype (str): type of the picture values.
+
+    Returns:
+        np.ndarray: the picture.
+    """
+    if codec in ('raw', 'zlib', 'zstd'):
+        if codec == 'zlib':
+            buffer = zlib.decompress(buffer)
+        elif codec == 'zstd':
+            buffer = zstandard.ZstdDecompressor().decompress(buffer)
+        return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+
+    from PIL import Image
+
+    return np.asarray(Image.open(io.BytesIO(buffer))).reshape(shape)
+
+
+class PictureEncoder:
+    """
+    PictureEncoder compresses the pictures of a batch with a codec, on a pool of processes so that the encoding does
+    not contend for the GIL with the sampling loop.
+
+    Attributes
+    ----------
+    codec : str
+        Name of the codec.
+    quality : int
+        Quality of the lossy codecs, between 1 and 100.
+    processes : int
+        Number of encoder processes, 0 to encode on the calling thread.
+    frame_ring : SharedFrameRing
+        Shared memory holding the frames of the batches: its pictures are handed to the encoder processes by location
+        instead of being pickled. None to pickle every picture.
+    _executor : Executor
+        Pool of encoder processes, started on the first encode.
+    _handoff_latency : JitterHistogram
+        Latency of the handoffs of the pictures of the frame ring.
+
+    Methods
+    -------
+    uses_processes()
+        Whether the pictures are encoded by the encoder processes.
+    encode(pictures: Sequence[np.ndarray])
+        Encode pictures with the codec.
+    handoff_stats()
+        Get the number of pictures handed off through the frame ring or pickled, and the handoff latency.
+    close()
+        Stop the encoder processes.
+    """
+
+    def __init__(self, codec: str = 'raw', quality: Optional[int] = None, processes: int = 0) -> None:
+        """
+        Initialize the PictureEncoder.
+
+        Args:
+            codec (str): name of the codec.
+            quality (int, optional): quality of the lossy codecs, between 1 and 100.
+            processes (int): number of encoder processes, 0 to encode on the calling thread.
+
+        Raises:
+            ValueError: when the codec cannot be used.
+        """
+        check_codec(codec, quality)
+        self.codec = codec
+        self.quality = quality
+        self.processes = processes
+        self.frame_ring: Optional['SharedFrameRing'] = None
+        self._executor: Optional[Executor] = None
+        self._handoff_latency = JitterHistogram()
+        self._pickled, self._in_flight = 0, 0
+        self._lock = Lock()
+
+    def uses_processes(self) -> bool:
+        """
+        Whether the pictures are encoded by the encoder processes: the raw codec never leaves the calling thread.
+
+        Returns:
+            bool: True if the pictures are sent to the encoder processes.
+        """
+        return self.codec != 'raw' and self.processes > 0
+
+    def encode(self, pictures: Sequence[np.ndarray]) -> List[Union[bytes, memoryview]]:
+        """
+        Encode pictures with the codec. The raw codec never leaves the calling thread, nothing is copied.
+
+        The pictures of the frame ring are handed to the encoder processes by their location in the shared memory,
+        the others are pickled. The caller must not overwrite the pictures until they are encoded.
+
+        Args:
+            pictures (Sequence[np.ndarray]): pictures to encode.
+
+        Returns:
+            List[Union[bytes, memoryview]]: encoded pictures, in order.
+        """
+        if not self.uses_processes():
+            return [encode_picture(picture, self.codec, self.quality) for picture in pictures]
+
+        if self._executor is None:
+            # spawned, not forked: the analyser threads (and their locks) must not be copied into the workers
+            self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+
+        futures = []
+        for picture in pictures:
+            location = self.frame_ring.locate(picture) if self.frame_ring is not None else None
+            if location is None:
+                with self._lock:
+                    self._pickled += 1
+                futures.append((False, self._executor.submit(encode_picture, picture, self.codec, self.quality)))
+                continue
+
+            slot, offset = location
+            self.frame_ring.record_handoff(slot)
+            futures.append((True, self._executor.submit(encode_shared_picture, self.frame_ring.name, offset,
+                                                        picture.shape, picture.dtype.str, self.codec, self.quality,
+                                                        time.monotonic())))
+
+        with self._lock:
+            self._in_flight += len(futures)
+        try:
+            encoded = []
+            for shared, future in futures:
+                if not shared:
+                    encoded.append(future.result())
+                    continue
+                buffer, latency = future.result()
+                HANDOFF_SECONDS.observe(latency)
+                with self._lock:
+                    self._handoff_latency.record(latency)
+                encoded.append(buffer)
+            return encoded
+        finally:
+            wait([future for _, future in futures]) # the caller may reuse the pictures once this returns
+            with self._lock:
+                self._in_flight -= len(futures)
+
+    def handoff_stats(self) -> dict:
+        """
+        Get the number of pictures handed to the encoder processes through the frame ring or pickled, and the
+        latency of the handoffs (from the handoff to the start of the encoding).
+
+        Returns:
+            dict: pictures handed off, pictures pickled, pictures being encoded, and handoff latency p50, p99 and max
+                (seconds).
+        """
+        with self._lock:
+            return {
+                "handed_off": self._handoff_latency.count,
+                "pickled": self._pickled,
+                "in_flight": self._in_flight,
+                "latency_p50": self._handoff_latency.percentile(50),
+                "latency_p99": self._handoff_latency.percentile(99),
+                "latency_max": self._handoff_latency.max
+            }
+
+    def close(self) -> None:
+        """
+        Stop the encoder processes.
+
+        Returns
+        -------
+        None
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def benchmark(pictures: Sequence[np.ndarray], codecs: Optional[Sequence[str]] = None, quality: int = 90,
+              repeat: int = 3) -> List[dict]:
+    """
+    Measure the size and the encoding and decoding CPU time of each codec.
+
+    Args:
+        pictures (Sequence[np.ndarray]): pictures to encode.
+        codecs (Sequence[str], optional): codecs to measure. Defaults to every available codec.
+        quality (int): quality of the lossy codecs.
+        repeat (int): number of times each picture is encoded.
+
+    Returns:
+        List[dict]: codec, bytes/frame, compression ratio, encode and decode CPU ms/frame, and maximum absolute error.
+    """
+    results = []
+    raw_bytes = sum(picture.nbytes for picture in pictures) / len(pictures)
+
+    for codec in codecs or available_codecs():
+        start = time.process_time()
+        for _ in range(repeat):
+            encoded = [encode_picture(picture, codec, quality) for picture in pictures]
+        encode_time = (time.process_time() - start) / (repeat * len(pictures))
+
+        start = time.process_time()
+        decoded = [decode_picture(buffer, codec, picture.shape, picture.dtype.str)
+                   for buffer, picture in zip(encoded, pictures)]
+        decode_time = (time.process_time() - start) / len(pictures)
+
+        frame_bytes = sum(len(buffer) for buffer in encoded) / len(pictures)
+        results.append({
+            "codec": codec,
+            "bytes_per_frame": frame_bytes,
+            "ratio": raw_bytes / frame_bytes,
+            "encode_cpu_ms": encode_time * 1000,
+            "decode_cpu_ms": decode_time * 1000,
+            "max_error": max(int(np.abs(picture.astype(np.int16) - frame.astype(np.int16)).max())
+                             for picture, frame in zip(pictures, decoded))
+        })
+
+    return results
+
+
+def main() -> None:
+    """
+    Print the benchmark of every available codec on the pictures of the simulated cameras.
+
+    Returns
+    -------
+    None
+    """
+    from hardware_controllers.cameras_controller import FilePictureSource, LightType, CameraPosition
+
+    parser = argparse.ArgumentParser(description="Benchmark the picture codecs.")
+    parser.add_argument("--quality", type=int, default=90, help="quality of the lossy codecs (1-100)")
+    parser.add_argument("--repeat", type=int, default=3, help="encodings of each picture")
+    args = parser.parse_args()
+
+    source = FilePictureSource()
+    pictures = [source.get_picture(light_type, camera_position)
+                for light_type in LightType for camera_position in CameraPosition]
+
+    print(f"{'codec':<6} {'bytes/frame':>12} {'ratio':>6} {'encode ms':>10} {'decode ms':>10} {'max error':>10}")
+    for result in benchmark(pictures, quality=args.quality, repeat=args.repeat):
+        print(f"{result['codec']:<6} {result['bytes_per_frame']:>12.0f} {result['ratio']:>6.2f} "
+              f"{result['encode_cpu_ms']:>10.1f} {result['decode_cpu_ms']:>10.1f} {result['max_error']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Offline replay of recorded velocity traces through the sampling logic of the analyser.
+
+The trace goes through the same steps as VelocityHandler.update (unit conversion, velocity filter, displacement
+integration, displacement moving average) and the same camera trigger rule as the TriggerScheduler of
+WeavingAnalyser.tick, with a fixed trigger latency, but as NumPy operations over the whole trace, so hours of samples
+replay in seconds.
+
+usage: python -m weaving_analyser.replay <trace.csv|trace.npy> [--window N] [--latency S] [--output result.npz]
+"""
+
+import argparse
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .filters import Filter, MovingAverageFilter
+from .velocity_handler import VelocityHandler, default_velocity_filter
+from .camera_handler import CameraHandler
+
+
+class ReplayResult(NamedTuple):
+    """
+    Result of a replay, one value per sample except for the triggers.
+
+    timestamps: time of the samples (seconds). velocity: filtered velocity (cm/s). displacement: total displacement
+    (cm). average_displacement: moving average of the total displacement (cm). trigger_indices: samples on which a
+    camera iteration is triggered. trigger_timestamps: time of the triggers (seconds).
+    """
+    timestamps: np.ndarray
+    velocity: np.ndarray
+    displacement: np.ndarray
+    average_displacement: np.ndarray
+    trigger_indices: np.ndarray
+    trigger_timestamps: np.ndarray
+
+
+def load_trace(path: str) -> Tuple[Optional[np.ndarray], np.ndarray]:
+    """
+    Load a recorded velocity trace.
+
+    Notes
+    -----
+    Supported files: .npy with a (N,) array of velocities or a (N, 2) array of (timestamp, velocity) rows, and .csv
+    with one velocity column or timestamp and velocity columns, with or without a header row.
+    Velocities are in cm/min, as read from the velocity sensor; timestamps are in seconds.
+
+    Args:
+        path (str): path of the trace.
+
+    Raises:
+        ValueError: the file does not hold one or two columns.
+
+    Returns:
+        Tuple[Optional[np.ndarray], np.ndarray]: timestamps (None if the trace has none) and velocities.
+    """
+    path = Path(path)
+    if path.suffix == ".npy":
+        data = np.load(path)
+    else:
+        with open(path) as trace:
+            first_field = trace.readline().split(",")[0].strip()
+        try:
+            float(first_field)
+            header_rows = 0
+        except ValueError:
+            header_rows = 1
+        data = np.loadtxt(path, delimiter=",", skiprows=header_rows, ndmin=2)
+
+    data = np.asarray(data, dtype=float)
+    if data.ndim == 1:
+        return None, data
+    if data.ndim == 2 and data.shape[1] == 1:
+        return None, data[:, 0]
+    if data.ndim == 2 and data.shape[1] == 2:
+        return data[:, 0], data[:, 1]
+
+    raise ValueError(f"Expected one or two columns in {path}, got an array of shape {data.shape}")
+
+
+def replay(velocities: np.ndarray, timestamps: Optional[np.ndarray] = None,
+           velocity_filter: Optional[Filter] = None, window: int = VelocityHandler.WINDOW,
+           sampling_rate: float = VelocityHandler.SAMPLING_RATE,
+           vertical_fov: float = CameraHandler.VERTICAL_FOV, trigger_latency: float = 0.0) -> ReplayResult:
+    """
+    Replay a velocity trace through the analyser sampling logic.
+
+    Args:
+        velocities (np.ndarray): velocity readings (cm/min).
+        timestamps (np.ndarray, optional): time of the readings (seconds). When given, the displacement is
+            integrated over the measured time between samples, otherwise over the sampling period.
+        velocity_filter (Filter, optional): velocity filter. Defaults to the VelocityHandler one, over window samples.
+        window (int): window of the default velocity filter and of the displacement moving average (samples).
+        sampling_rate (float): sampling rate (Hz), used when there are no timestamps.
+        vertical_fov (float): vertical field of view of the cameras (cm).
+        trigger_latency (float): trigger latency of the cameras (seconds), the displacement is predicted this far
+            ahead with the filtered velocity.
+
+    Returns:
+        ReplayResult: filtered velocity, displacement curves and camera triggers.
+    """
+    velocities = np.asarray(velocities, dtype=float)
+    velocity_filter = velocity_filter or default_velocity_filter(window)
+    period = 1 / sampling_rate
+
+    velocity = velocity_filter.apply(velocities / 60) # convert from cm/min to cm/sec
+
+    if timestamps is None:
+        timestamps = np.arange(len(velocities)) * period
+        displacement = np.cumsum(velocity / sampling_rate)
+    else:
+        timestamps = np.asarray(timestamps, dtype=float)
+        dt = np.diff(timestamps, prepend=timestamps[0] - period) if len(timestamps) else timestamps
+        displacement = np.cumsum(velocity * dt)
+
+    average_displacement = MovingAverageFilter(window).apply(displacement)
+    trigger_indices = _trigger_indices((displacement + velocity * trigger_latency) // vertical_fov)
+
+    return ReplayResult(timestamps, velocity, displacement, average_displacement, trigger_indices,
+                        timestamps[trigger_indices])
+
+
+def _trigger_indices(frames: np.ndarray) -> np.ndarray:
+    """
+    Samples on which TriggerScheduler.update starts a camera iteration: it starts one when the frame of the predicted
+    displacement is above the current frame, and then moves the current frame up by one.
+
+    Args:
+        frames (np.ndarray): frame of the predicted displacement on each sample.
+
+    Returns:
+        np.ndarray: indices of the triggering samples.
+    """
+    levels = np.maximum.accumulate(np.maximum(frames, 0)) if len(frames) else frames
+    steps = np.diff(levels, prepend=0)
+
+    if not np.any(steps > 1):
+        return np.flatnonzero(steps)
+
+    # more than one frame in a single sample (never at realistic speeds): the analyser catches up one frame per sample
+    indices, current_frame = [], 0
+    for i, frame in enumerate(frames):
+        if frame > current_frame:
+            current_frame += 1
+            indices.append(i)
+
+    return np.array(indices, dtype=int)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a recorded velocity trace through the analyser logic.")
+    parser.add_argument("trace", help="velocity trace (.csv or .npy), velocities in cm/min")
+    parser.add_argument("-w", "--window", type=int, default=VelocityHandler.WINDOW, help="filters window (samples)")
+    parser.add_argument("-l", "--latency", type=float, default=0.0, help="trigger latency of the cameras (seconds)")
+    parser.add_argument("-o", "--output", help="save the replay result to this .npz file")
+    args = parser.parse_args()
+
+    timestamps, velocities = load_trace(args.trace)
+    result = replay(velocities, timestamps, window=args.window, trigger_latency=args.latency)
+
+    duration = result.timestamps[-1] - result.timestamps[0] if len(result.timestamps) else 0
+    print(f"Samples: {len(velocities)} ({duration:.1f} s)")
+    print(f"Total displacement: {result.displacement[-1] if len(velocities) else 0:.2f} cm")
+    print(f"Camera triggers: {len(result.trigger_indices)}")
+
+    if args.output:
+        np.savez(args.output, **result._asdict())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+from bisect import bisect_left
+from enum import Enum
+from typing import Callable, List, NamedTuple, Optional
+import time
+
+
+class CatchUpPolicy(Enum):
+    """
+    What PeriodicScheduler does when ticks were missed (the caller was late by more than a period).
+
+    SKIP drops the missed ticks and keeps the original deadline grid, BURST runs the missed ticks back to back until
+    the schedule is caught up and RESET starts a new deadline grid from the late tick.
+    """
+    SKIP = 'skip'
+    BURST = 'burst'
+    RESET = 'reset'
+
+
+class Tick(NamedTuple):
+    """
+    A tick of the PeriodicScheduler.
+
+    index: tick number. deadline: when the tick was due. time: when it actually happened. dt: measured time since the
+    previous tick (the period for the first one). lateness: time - deadline. missed: ticks dropped before this one.
+    """
+    index: int
+    deadline: float
+    time: float
+    dt: float
+    lateness: float
+    missed: int
+
+
+class JitterHistogram:
+    """
+    Fixed-bucket histogram of tick lateness, cheap enough to be updated on every tick.
+
+    Attributes
+    ----------
+    bounds : List[float]
+        Upper bounds of the buckets (seconds), the last bucket has no upper bound.
+    counts : List[int]
+        Number of values in each bucket.
+    count : int
+        Number of values recorded.
+    max : float
+        Largest value recorded.
+
+    Methods
+    -------
+    record(value: float)
+        Record a value.
+    percentile(q: float)
+        Get an upper bound of the q-th percentile.
+    """
+
+    BOUNDS = [50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, 250e-3, 1]
+
+    def __init__(self, bounds: Optional[List[float]] = None) -> None:
+        self.bounds = list(bounds or JitterHistogram.BOUNDS)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """
+        Record a value.
+
+        Args:
+            value (float): value to record (seconds).
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """
+        Get an upper bound of the q-th percentile: the upper bound of the bucket holding it, or the largest value
+        recorded if it is in the last bucket.
+
+        Args:
+            q (float): percentile, between 0 and 100.
+
+        Returns:
+            float: upper bound of the percentile (seconds), 0 if nothing was recorded.
+        """
+        if not self.count:
+            return 0.0
+
+        rank = q / 100 * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank and bucket_count:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+
+        return self.max
+
+
+class PeriodicScheduler:
+    """
+    PeriodicScheduler ticks at a fixed period on absolute deadlines of a monotonic clock, so errors in the sleeps
+    do not accumulate and the rate does not drift under load. It detects missed ticks and records the lateness of
+    every tick.
+
+    Attributes
+    ----------
+    period : float
+        Time between ticks (seconds).
+    policy : CatchUpPolicy
+        What to do when ticks were missed.
+    jitter : JitterHistogram
+        Lateness of the ticks.
+    ticks : int
+        Number of ticks.
+    missed : int
+        Number of ticks dropped (SKIP and RESET policies).
+    _clock : Callable[[], float]
+        Monotonic clock.
+    _sleep : Callable[[float], None]
+        Blocking sleep.
+    _next_deadline : float
+        Deadline of the next tick.
+    _first_time : float
+        Time of the first tick.
+    _last_time : float
+        Time of the previous tick.
+
+    Methods
+    -------
+    wait()
+        Block until the next tick.
+    wait_async()
+        Wait for the next tick without blocking the event loop.
+    stats()
+        Get the tick and lateness statistics.
+    """
+
+    def __init__(self, period: float, policy: CatchUpPolicy = CatchUpPolicy.SKIP,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep) -> None:
+        """
+        Initialize the PeriodicScheduler. The first tick happens as soon as it is waited for.
+
+        Args:
+            period (float): time between ticks (seconds).
+            policy (CatchUpPolicy): what to do when ticks were missed.
+            clock (Callable[[], float]): monotonic clock.
+            sleep (Callable[[float], None]): blocking sleep.
+        """
+        self.period = period
+        self.policy = policy
+        self.jitter = JitterHistogram()
+        self.ticks = 0
+        self.missed = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._next_deadline = None
+        self._first_time = None
+        self._last_time = None
+
+    def wait(self) -> Tick:
+        """
+        Block until the next tick.
+
+        Returns:
+            Tick: the tick.
+        """
+        if self._next_deadline is None:
+            self._next_deadline = self._clock()
+
+        delay = self._next_deadline - self._clock()
+        if delay > 0:
+            self._sleep(delay)
+
+        return self._tick()
+
+    async def wait_async(self) -> Tick:
+        """
+        Wait for the next tick without blocking the event loop.
+
+        Returns:
+            Tick: the tick.
+        """
+        import asyncio # only the asyncio engine needs it
+
+        if self._next_deadline is None:
+            self._next_deadline = self._clock()
+
+        delay = self._next_deadline - self._clock()
+        await asyncio.sleep(max(0.0, delay))
+
+        return self._tick()
+
+    def _tick(self) -> Tick:
+        """
+        Measure the tick that just happened and schedule the next one.
+
+        Returns:
+            Tick: the tick.
+        """
+        now = self._clock()
+        deadline = self._next_deadline
+        lateness = max(0.0, now - deadline)
+        missed = int(lateness // self.period) if self.policy is not CatchUpPolicy.BURST else 0
+
+        self.jitter.record(lateness)
+        dt = now - self._last_time if self._last_time is not None else self.period
+        tick = Tick(self.ticks, deadline, now, dt, lateness, missed)
+
+        self.ticks += 1
+        self.missed += missed
+        if self._first_time is None:
+            self._first_time = now
+        self._last_time = now
+
+        if self.policy is CatchUpPolicy.RESET and missed:
+            self._next_deadline = now + self.period
+        else:
+            self._next_deadline = deadline + (missed + 1) * self.period
+
+        return tick
+
+    def stats(self) -> dict:
+        """
+        Get the tick and lateness statistics.
+
+        Returns:
+            dict: ticks, missed ticks, achieved rate and p50/p99/max lateness (seconds).
+        """
+        elapsed = self._last_time - self._first_time if self.ticks > 1 else 0
+        return {
+            "ticks": self.ticks,
+            "missed": self.missed,
+            "rate": (self.ticks - 1) / elapsed if elapsed else 0.0,
+            "lateness_p50": self.jitter.percentile(50),
+            "lateness_p99": self.jitter.percentile(99),
+            "lateness_max": self.jitter.max
+        }
@@ -0,0 +1,628 @@
+"""
+Durable spool of the encoded picture batches: a write-ahead log on disk, replayed to the API by a drainer.
+
+Segment layout (<sequence>.log):
+    [body length: uint32, big endian][crc32 of the body: uint32, big endian][body]...
+
+Each segment has an acknowledgement file (<sequence>.ack) listing the offsets (uint64, big endian) of its records
+that were delivered. A segment is deleted once it is sealed (a newer segment receives the appends) and every record
+is acknowledged, so the spool holds exactly the batches still to be delivered, across process restarts.
+"""
+
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Condition, Thread
+from typing import Any, BinaryIO, Callable, Deque, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+
+from .config import error_logger, warning_logger, SPOOL_SEGMENT_BYTES, SPOOL_MAX_BYTES, SPOOL_FSYNC, \
+    SPOOL_DRAIN_CONCURRENCY, SPOOL_BACKOFF, SPOOL_MAX_BACKOFF
+
+RECORD_HEADER = struct.Struct('!II')
+ACK_ENTRY = struct.Struct('!Q')
+
+
+class SpoolRecord(NamedTuple):
+    """
+    Record of the spool, taken to be delivered.
+    """
+    segment: int
+    offset: int
+    body: bytes
+
+
+@dataclass(slots=True)
+class _Segment:
+    """
+    Segment file of the spool and the state of its records.
+    """
+
+    path: Path
+    size: int = 0
+    records: int = 0
+    acknowledged: int = 0
+    sealed: bool = False
+    pending: Deque[Tuple[int, int]] = field(default_factory=deque)
+    in_flight: Set[int] = field(default_factory=set)
+
+
+class PictureSpool:
+    """
+    PictureSpool appends the encoded picture batches to segment files on disk and hands them out until they are
+    acknowledged.
+
+    Notes
+    -----
+    Appends are sequential writes to the newest segment, which is sealed once it reaches segment_bytes. When the
+    segments exceed max_bytes, the oldest ones are evicted with the batches they still hold. After a crash, a record
+    cut short by the end of its segment is discarded; the checksum of each record is verified when it is taken.
+
+    Attributes
+    ----------
+    directory : Path
+        Directory of the segment files.
+    segment_bytes : int
+        Size from which a segment is sealed (bytes).
+    max_bytes : int
+        Maximum size of the segments (bytes), the oldest are evicted beyond it.
+    fsync : bool
+        Whether every append is synced to the disk (survives power losses, not only process crashes).
+    _segments : OrderedDict
+        Segments by sequence number, oldest first.
+    _active : BinaryIO
+        Append handle of the newest segment.
+    _condition : Condition
+        Condition notified on appends and acknowledgements.
+
+    Methods
+    -------
+    append(body: bytes)
+        Append an encoded batch to the spool.
+    take(limit: int, timeout: float)
+        Take pending batches to deliver.
+    ack(record: SpoolRecord)
+        Acknowledge the delivery of a batch.
+    drop(record: SpoolRecord)
+        Acknowledge a batch that will never be delivered.
+    nack(record: SpoolRecord)
+        Hand a batch that was not delivered back to the spool.
+    wait_empty(timeout: float)
+        Wait until every batch is delivered.
+    stats()
+        Get the spool statistics.
+    close()
+        Close the newest segment.
+    """
+
+    def __init__(self, directory: Union[str, Path], segment_bytes: int = SPOOL_SEGMENT_BYTES,
+                 max_bytes: int = SPOOL_MAX_BYTES, fsync: bool = SPOOL_FSYNC) -> None:
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._segments: Dict[int, _Segment] = OrderedDict()
+        self._active: Optional[BinaryIO] = None
+        self._condition = Condition()
+        self._appended = 0
+        self._delivered = 0
+        self._evicted = 0
+        self._corrupted = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._recover()
+
+    def append(self, body: bytes) -> None:
+        """
+        Append an encoded batch to the spool, then evict the oldest segments if the spool exceeds max_bytes.
+
+        Args:
+            body (bytes): encoded batch.
+
+        Returns
+        -------
+        None
+        """
+        with self._condition:
+            segment = self._active_segment()
+            offset = segment.size
+            self._active.write(RECORD_HEADER.pack(len(body), zlib.crc32(body)))
+            self._active.write(body)
+            if self.fsync:
+                os.fsync(self._active.fileno())
+
+            segment.size += RECORD_HEADER.size + len(body)
+            segment.records += 1
+            segment.pending.append((offset, len(body)))
+            self._appended += 1
+
+            if segment.size >= self.segment_bytes:
+                self._seal()
+            self._evict()
+            self._condition.notify_all()
+
+    def take(self, limit: int, timeout: Optional[float] = None) -> List[SpoolRecord]:
+        """
+        Take pending batches to deliver, oldest first. They stay in the spool until they are acknowledged.
+
+        Args:
+            limit (int): maximum number of batches.
+            timeout (float, optional): maximum time to wait for a pending batch (seconds), None to wait forever.
+
+        Returns:
+            List[SpoolRecord]: the batches, empty if none was appended before the timeout.
+        """
+        with self._condition:
+            if not self._condition.wait_for(self._has_pending, timeout):
+                return []
+
+            taken = []
+            for sequence, segment in self._segments.items():
+                while segment.pending and len(taken) < limit:
+                    offset, length = segment.pending.popleft()
+                    segment.in_flight.add(offset)
+                    taken.append((sequence, segment, offset, length))
+
+        records = []
+        for sequence, segment, offset, length in taken:
+            body = self._read(segment, offset, length)
+            if body is None: # dropped, not delivered
+                self.drop(SpoolRecord(sequence, offset, b''))
+            else:
+                records.append(SpoolRecord(sequence, offset, body))
+        return records
+
+    def ack(self, record: SpoolRecord) -> None:
+        """
+        Acknowledge the delivery of a batch, deleting its segment once every batch of it is acknowledged.
+
+        Args:
+            record (SpoolRecord): batch taken from the spool.
+
+        Returns
+        -------
+        None
+        """
+        self._acknowledge(record, delivered=True)
+
+    def drop(self, record: SpoolRecord) -> None:
+        """
+        Acknowledge a batch that will never be delivered (rejected by the API or corrupted), without counting it as
+        delivered.
+
+        Args:
+            record (SpoolRecord): batch taken from the spool.
+
+        Returns
+        -------
+        None
+        """
+        self._acknowledge(record, delivered=False)
+
+    def _acknowledge(self, record: SpoolRecord, delivered: bool) -> None:
+        """
+        Acknowledge a batch taken from the spool, deleting its segment once every batch of it is acknowledged.
+
+        Args:
+            record (SpoolRecord): batch taken from the spool.
+            delivered (bool): whether the batch was delivered, False for a corrupted batch dropped.
+
+        Returns
+        -------
+        None
+        """
+        with self._condition:
+            segment = self._segments.get(record.segment)
+            if segment is None or record.offset not in segment.in_flight: # evicted meanwhile
+                return
+
+            segment.in_flight.discard(record.offset)
+            segment.acknowledged += 1
+            if delivered:
+                self._delivered += 1
+            with open(segment.path.with_suffix('.ack'), 'ab') as ack_file:
+                ack_file.write(ACK_ENTRY.pack(record.offset))
+
+            if segment.sealed and segment.acknowledged == segment.records:
+                self._delete(record.segment)
+            self._condition.notify_all()
+
+    def nack(self, record: SpoolRecord) -> None:
+        """
+        Hand a batch that was not delivered back to the spool, ahead of the other pending batches of its segment.
+
+        Args:
+            record (SpoolRecord): batch taken from the spool.
+
+        Returns
+        -------
+        None
+        """
+        with self._condition:
+            segment = self._segments.get(record.segment)
+            if segment is None or record.offset not in segment.in_flight:
+                return
+
+            segment.in_flight.discard(record.offset)
+            segment.pending.appendleft((record.offset, len(record.body)))
+            self._condition.notify_all()
+
+    def wait_empty(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every batch is delivered (or evicted).
+
+        Args:
+            timeout (float, optional): maximum time to wait (seconds), None to wait forever.
+
+        Returns:
+            bool: whether the spool is empty.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not any(segment.pending or segment.in_flight for segment in self._segments.values()),
+                timeout)
+
+    def stats(self) -> dict:
+        """
+        Get the spool statistics.
+
+        Returns:
+            dict: segments, size (bytes), pending and in-flight batches, batches appended, delivered, evicted and
+                corrupted.
+        """
+        with self._condition:
+            return {
+                "segments": len(self._segments),
+                "bytes": sum(segment.size for segment in self._segments.values()),
+                "pending": sum(len(segment.pending) for segment in self._segments.values()),
+                "in_flight": sum(len(segment.in_flight) for segment in self._segments.values()),
+                "appended": self._appended,
+                "delivered": self._delivered,
+                "evicted": self._evicted,
+                "corrupted": self._corrupted
+            }
+
+    def close(self) -> None:
+        """
+        Close the newest segment. The batches not delivered are replayed by the next spool on this directory.
+
+        Returns
+        -------
+        None
+        """
+        with self._condition:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+
+    def _has_pending(self) -> bool:
+        return any(segment.pending for segment in self._segments.values())
+
+    def _active_segment(self) -> _Segment:
+        """
+        Get the newest segment, creating it if the previous one was sealed.
+
+        Returns:
+            _Segment: segment receiving the appends.
+        """
+        if self._active is None:
+            sequence = next(reversed(self._segments), 0) + 1
+            segment = _Segment(self.directory.joinpath(f'{sequence:016d}.log'))
+            self._segments[sequence] = segment
+            self._active = open(segment.path, 'ab', buffering=0)
+
+        return next(reversed(self._segments.values()))
+
+    def _seal(self) -> None:
+        """
+        Seal the newest segment: the next append creates a new one.
+
+        Returns
+        -------
+        None
+        """
+        sequence, segment = next(reversed(self._segments.items()))
+        self._active.close()
+        self._active = None
+        segment.sealed = True
+        if segment.acknowledged == segment.records:
+            self._delete(sequence)
+
+    def _evict(self) -> None:
+        """
+        Delete the oldest segments, with the batches they still hold, until the spool fits in max_bytes.
+        The newest segment is never evicted.
+
+        Returns
+        -------
+        None
+        """
+        while len(self._segments) > 1 and sum(segment.size for segment in self._segments.values()) > self.max_bytes:
+            sequence, segment = next(iter(self._segments.items()))
+            lost = segment.records - segment.acknowledged
+            self._evicted += lost
+            warning_logger.warning("Spool full: evicted segment %s with %s batches.", segment.path.name, lost)
+            self._delete(sequence)
+
+    def _delete(self, sequence: int) -> None:
+        """
+        Delete a segment and its acknowledgement file.
+
+        Returns
+        -------
+        None
+        """
+        segment = self._segments.pop(sequence)
+        segment.path.unlink(missing_ok=True)
+        segment.path.with_suffix('.ack').unlink(missing_ok=True)
+
+    def _read(self, segment: _Segment, offset: int, length: int) -> Optional[bytes]:
+        """
+        Read a record and verify its checksum.
+
+        Returns:
+            bytes: body of the record, None if it is corrupted or its segment was evicted.
+        """
+        try:
+            with open(segment.path, 'rb') as segment_file:
+                segment_file.seek(offset)
+                header = segment_file.read(RECORD_HEADER.size)
+                body = segment_file.read(length)
+        except FileNotFoundError:
+            return None
+
+        if len(header) == RECORD_HEADER.size and len(body) == length and RECORD_HEADER.unpack(header)[1] == \
+                zlib.crc32(body):
+            return body
+
+        with self._condition:
+            self._corrupted += 1
+        error_logger.error("Spool record at %s of %s is corrupted, dropped.", offset, segment.path.name)
+        return None
+
+    def _recover(self) -> None:
+        """
+        Load the segments left by a previous spool: every record not acknowledged is pending again. A record cut short
+        by the end of its segment (a crash during the append) is truncated.
+
+        Returns
+        -------
+        None
+        """
+        for path in sorted(self.directory.glob('*.log')):
+            acknowledged = set()
+            ack_path = path.with_suffix('.ack')
+            if ack_path.is_file():
+                data = ack_path.read_bytes()
+                acknowledged = {entry for (entry,) in ACK_ENTRY.iter_unpack(data[:len(data) - len(data) % 8])}
+
+            segment = _Segment(path, sealed=True)
+            file_size = path.stat().st_size
+            with open(path, 'rb') as segment_file:
+                while segment.size + RECORD_HEADER.size <= file_size:
+                    segment_file.seek(segment.size)
+                    length, _ = RECORD_HEADER.unpack(segment_file.read(RECORD_HEADER.size))
+                    if segment.size + RECORD_HEADER.size + length > file_size:
+                        break
+                    segment.records += 1
+                    if segment.size in acknowledged:
+                        segment.acknowledged += 1
+                    else:
+                        segment.pending.append((segment.size, length))
+                    segment.size += RECORD_HEADER.size + length
+
+            if segment.size < file_size:
+                warning_logger.warning("Spool segment %s ends with a partial record, truncated.", path.name)
+                os.truncate(path, segment.size)
+
+            self._segments[int(path.stem)] = segment
+            if segment.acknowledged == segment.records:
+                self._delete(int(path.stem))
+
+
+class SpoolDrainer:
+    """
+    SpoolDrainer delivers the batches of a PictureSpool to the API, on a bounded number of threads.
+
+    Notes
+    -----
+    A batch that fails to be delivered (connection error, 5xx response) goes back to the spool and the drainer backs
+    off exponentially. While it backs off, a single thread probes the API; as soon as a batch is delivered, every
+    thread sends again, so the backlog drains at full concurrency once the API is back. A batch rejected by the API
+    (4xx response) would never be accepted, it is dropped.
+
+    Attributes
+    ----------
+    spool : PictureSpool
+        Spool of the batches.
+    send : Callable[[bytes], Any]
+        Sends an encoded batch, returns a response with a status_code.
+    concurrency : int
+        Number of batches sent at the same time.
+    backoff : float
+        First backoff after a failure (seconds), doubled after each consecutive failure.
+    max_backoff : float
+        Maximum backoff (seconds).
+    _threads : List[Thread]
+        Threads sending the batches.
+    _failures : int
+        Number of consecutive failures.
+
+    Methods
+    -------
+    start()
+        Start delivering the batches.
+    stop(timeout: float)
+        Stop delivering the batches, once the spool is empty or the timeout expires.
+    stats()
+        Get the delivery statistics.
+    """
+
+    def __init__(self, spool: PictureSpool, send: Callable[[bytes], Any], concurrency: int = SPOOL_DRAIN_CONCURRENCY,
+                 backoff: float = SPOOL_BACKOFF, max_backoff: float = SPOOL_MAX_BACKOFF) -> None:
+        if concurrency <= 0:
+            raise ValueError("a drainer needs a concurrency greater than 0")
+
+        self.spool = spool
+        self.send = send
+        self.concurrency = concurrency
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._threads: List[Thread] = []
+        self._condition = Condition()
+        self._stopping = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self._probing = False
+        self._sent = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def start(self) -> None:
+        """
+        Start delivering the batches, including the ones left in the spool by a previous run.
+
+        Returns
+        -------
+        None
+        """
+        for index in range(self.concurrency):
+            thread = Thread(target=self._run, name=f'spool_drainer_{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stop delivering the batches, once the spool is empty or the timeout expires. The batches left stay in the
+        spool for the next run.
+
+        Args:
+            timeout (float, optional): maximum time to wait for the spool to be empty (seconds).
+
+        Returns:
+            bool: whether the spool was emptied.
+        """
+        emptied = self.spool.wait_empty(timeout)
+
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        return emptied
+
+    def stats(self) -> dict:
+        """
+        Get the delivery statistics.
+
+        Returns:
+            dict: batches sent, failed attempts, rejected batches and consecutive failures.
+        """
+        with self._condition:
+            return {
+                "sent": self._sent,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "consecutive_failures": self._failures
+            }
+
+    def _run(self) -> None:
+        """
+        Deliver the batches of the spool until the drainer is stopped.
+
+        Returns
+        -------
+        None
+        """
+        while (probe := self._wait_turn()) is not None:
+            records = self.spool.take(1, timeout=0.1)
+            if not records:
+                self._end_turn(probe, None)
+                continue
+
+            self._end_turn(probe, self._deliver(records[0]))
+
+    def _wait_turn(self) -> Optional[bool]:
+        """
+        Wait until this thread may send a batch: right away while the API answers, one thread at a time (the probe)
+        once the backoff expired while it does not.
+
+        Returns:
+            bool: whether this thread is the probe, None if the drainer is stopped.
+        """
+        with self._condition:
+            while not self._stopping:
+                if not self._failures:
+                    return False
+
+                wait = self._retry_at - time.monotonic()
+                if wait <= 0 and not self._probing:
+                    self._probing = True
+                    return True
+                self._condition.wait(wait if wait > 0 else None)
+
+            return None
+
+    def _end_turn(self, probe: bool, delivered: Optional[bool]) -> None:
+        """
+        Record the outcome of a turn: a delivery resets the backoff, a failure doubles it.
+
+        Args:
+            probe (bool): whether the thread was the probe.
+            delivered (bool, optional): whether the batch was delivered, None if there was no batch to send.
+
+        Returns
+        -------
+        None
+        """
+        with self._condition:
+            if probe:
+                self._probing = False
+            if delivered is True:
+                self._failures = 0
+            elif delivered is False:
+                self._failures += 1
+                self._retry_at = time.monotonic() + min(self.max_backoff, self.backoff * 2 ** (self._failures - 1))
+            self._condition.notify_all()
+
+    def _deliver(self, record: SpoolRecord) -> bool:
+        """
+        Send a batch and acknowledge it, or hand it back to the spool if it failed.
+
+        Args:
+            record (SpoolRecord): batch taken from the spool.
+
+        Returns:
+            bool: whether the API answered (the batch was delivered or rejected).
+        """
+        try:
+            status_code = self.send(record.body).status_code
+        except Exception as e:
+            status_code, error = None, e
+        else:
+            error = None
+
+        with self._condition:
+            if status_code is not None and status_code < 500:
+                self._sent += 1
+                if status_code >= 400:
+                    self._rejected += 1
+            else:
+                self._failed += 1
+
+        if status_code is None or status_code >= 500:
+            warning_logger.warning("Spooled pictures not delivered: %s, retrying.", error or status_code)
+            self.spool.nack(record)
+            return False
+
+        if status_code >= 400:
+            error_logger.error("API rejected the spooled pictures: %s, dropped.", status_code)
+            self.spool.drop(record)
+        else:
+            self.spool.ack(record)
+        return True
@@ -0,0 +1,870 @@
+"""
+Supervisor of the analysers of a floor: one WeavingAnalyser per loom, each in its own process pinned to a core, with
+its own cameras configuration.
+
+The workers publish their metrics to a board in shared memory, read by the supervisor to expose the metrics of the
+whole floor and to notice the workers that stopped responding. A worker that crashed or hung is restarted with an
+exponential backoff. The workers do not talk to the API themselves: their requests go through a queue to the uploader
+of the supervisor, which shares one pool of connections between every loom.
+
+usage: python -m weaving_analyser.supervisor [--looms 4 | --config looms.json] [--ttl xx] [--virtual-clock seed]
+                                             [--metrics-port port | --no-metrics]
+"""
+
+import argparse
+import json
+import multiprocessing
+import multiprocessing.synchronize
+import os
+import queue
+import signal
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .config import SUPERVISOR_DIRECTORY, SUPERVISOR_METRICS_PERIOD, SUPERVISOR_HEARTBEAT_TIMEOUT, \
+    SUPERVISOR_RESTART_BACKOFF, SUPERVISOR_MAX_RESTART_BACKOFF, SUPERVISOR_STOP_TIMEOUT, SUPERVISOR_STOP_GRACE, \
+    UPLOADER_WORKERS, UPLOADER_QUEUE_SIZE, PICTURE_CODEC, PICTURE_CODEC_QUALITY, METRICS_HOST, METRICS_PORT, \
+    console_logger, error_logger, warning_logger
+from .metrics import REGISTRY, MetricsRegistry, MetricsServer
+
+if TYPE_CHECKING:
+    from hardware_controllers.cameras_controller import CaptureBatch
+    from .picture_codecs import PictureEncoder
+
+# metrics published by every worker, in the order of the columns of the board
+LOOM_METRICS = ("heartbeat", "pid", "core", "samples", "missed_ticks", "sampling_rate", "lateness_p99", "frames",
+                "missed_frames", "trigger_latency", "pictures_dropped", "requests_queued", "requests_dropped")
+
+# kinds of the requests sent through the uploader
+PICTURES_BATCH = "pictures_batch"
+FABRIC_MOVEMENT = "fabric_movement"
+
+
+@dataclass
+class LoomConfig:
+    """
+    Configuration of the analyser of a loom.
+
+    Attributes
+    ----------
+    name : str
+        Name of the loom, also the name of its working directory (logs, spool).
+    camera_positions : List[str], optional
+        Positions of its cameras (see CameraPosition). Defaults to every position.
+    concurrent_acquisition : bool
+        Whether its cameras are read concurrently.
+    pictures_directory : str, optional
+        Directory of the simulated pictures. Defaults to the pictures of the package.
+    codec : str
+        Compression of its pictures.
+    quality : int
+        Quality of the lossy codecs.
+    core : int, optional
+        Core its worker is pinned to. Defaults to a core chosen by the supervisor.
+    virtual_clock_seed : int, optional
+        Simulate on a virtual clock seeded with it. Defaults to the system clock.
+    """
+
+    name: str
+    camera_positions: Optional[List[str]] = None
+    concurrent_acquisition: bool = True
+    pictures_directory: Optional[str] = None
+    codec: str = PICTURE_CODEC
+    quality: int = PICTURE_CODEC_QUALITY
+    core: Optional[int] = None
+    virtual_clock_seed: Optional[int] = None
+
+
+class MetricsBoard:
+    """
+    MetricsBoard is a table in shared memory with a row of LOOM_METRICS per loom, written by its worker and read by
+    the supervisor without any lock.
+
+    Each row starts with a sequence number, odd while the row is written: a reader retries when the number was odd
+    or changed during its copy, so it never sees half of an update (there is one writer per row).
+
+    Attributes
+    ----------
+    slots : int
+        Number of rows.
+    name : str
+        Name of the shared memory block, to attach to it from another process.
+    rows : np.ndarray
+        Sequence number and metrics of each row.
+
+    Methods
+    -------
+    attach(name: str, slots: int)
+        Attach to the board created by another process.
+    write(slot: int, metrics: Dict[str, float])
+        Update a row.
+    read(slot: int)
+        Read a row, None if it was never written.
+    clear(slot: int)
+        Empty a row, before a new worker takes it.
+    close()
+        Detach from the board.
+    unlink()
+        Destroy the board, once every process detached.
+    """
+
+    _READ_ATTEMPTS = 1000
+
+    def __init__(self, slots: int, name: Optional[str] = None) -> None:
+        """
+        Initialize the MetricsBoard.
+
+        Args:
+            slots (int): number of rows.
+            name (str, optional): name of an existing board to attach to. Defaults to creating a new board.
+        """
+        size = slots * (1 + len(LOOM_METRICS)) * np.dtype(np.float64).itemsize
+        self._memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.slots = slots
+        self.name = self._memory.name
+        self.rows = np.ndarray((slots, 1 + len(LOOM_METRICS)), dtype=np.float64, buffer=self._memory.buf)
+        if name is None:
+            self.rows[:] = 0
+
+    @classmethod
+    def attach(cls, name: str, slots: int) -> 'MetricsBoard':
+        """
+        Attach to the board created by another process.
+
+        Args:
+            name (str): name of the board.
+            slots (int): number of rows of the board.
+
+        Returns:
+            MetricsBoard: the board.
+        """
+        return cls(slots, name)
+
+    def write(self, slot: int, metrics: Dict[str, float]) -> None:
+        """
+        Update a row.
+
+        Args:
+            slot (int): row of the loom.
+            metrics (Dict[str, float]): value of each of LOOM_METRICS, the missing ones are left unchanged.
+
+        Returns
+        -------
+        None
+        """
+        row = self.rows[slot]
+        row[0] += 1 # odd: being written
+        for i, name in enumerate(LOOM_METRICS, start=1):
+            if name in metrics:
+                row[i] = metrics[name]
+        row[0] += 1
+
+    def read(self, slot: int) -> Optional[Dict[str, float]]:
+        """
+        Read a row.
+
+        Args:
+            slot (int): row of the loom.
+
+        Returns:
+            Dict[str, float]: value of each of LOOM_METRICS, None if the row was never written.
+        """
+        row = self.rows[slot]
+        for _ in range(MetricsBoard._READ_ATTEMPTS):
+            sequence = row[0]
+            values = row[1:].copy()
+            if sequence % 2 == 0 and row[0] == sequence:
+                break
+        else:
+            return None # the writer died while writing, the row is cleared on its restart
+
+        if sequence == 0:
+            return None
+        return dict(zip(LOOM_METRICS, values.tolist()))
+
+    def clear(self, slot: int) -> None:
+        """
+        Empty a row, before a new worker takes it.
+
+        Args:
+            slot (int): row of the loom.
+
+        Returns
+        -------
+        None
+        """
+        self.rows[slot] = 0
+
+    def close(self) -> None:
+        """
+        Detach from the board.
+
+        Returns
+        -------
+        None
+        """
+        self.rows = None # the buffer cannot be released while an array uses it
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """
+        Destroy the board, once every process detached.
+
+        Returns
+        -------
+        None
+        """
+        self._memory.unlink()
+
+
+class QueuedResponse:
+    """
+    Response of a request handed to the uploader: 201 when it was queued, 503 when the queue was full.
+
+    Attributes
+    ----------
+    status_code : int
+        Status of the request.
+    """
+
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+
+
+class QueuedAPIhandler:
+    """
+    QueuedAPIhandler stands for the APIhandler of a loom worker: its requests are queued for the uploader of the
+    supervisor instead of being sent. It never blocks: when the queue is full, the request is dropped and counted.
+
+    Attributes
+    ----------
+    upload_queue : multiprocessing.Queue
+        Requests waiting for the uploader, as (kind, loom, payload) tuples.
+    loom : str
+        Name of the loom.
+    queued : int
+        Number of requests queued.
+    dropped : int
+        Number of requests dropped because the queue was full.
+
+    Methods
+    -------
+    send_surface_movement_batch(samples: List[dict])
+        Queue a batch of surface movement samples.
+    send_encoded_pictures_batch(body: bytes)
+        Queue an encoded batch of pictures.
+    stream_pictures_batch(batch: CaptureBatch, light_indices: Sequence[int], encoder: PictureEncoder)
+        Encode and queue a batch of pictures: the uploader sends whole bodies.
+    connection_stats()
+        Get the number of requests queued and dropped.
+    close()
+        Nothing to close, the connections belong to the uploader.
+    """
+
+    def __init__(self, upload_queue: multiprocessing.Queue, loom: str) -> None:
+        self.upload_queue = upload_queue
+        self.loom = loom
+        self.queued, self.dropped = 0, 0
+        self._lock = Lock()
+
+    def send_surface_movement_batch(self, samples: List[dict]) -> QueuedResponse:
+        return self._put(FABRIC_MOVEMENT, samples)
+
+    def send_encoded_pictures_batch(self, body: bytes) -> QueuedResponse:
+        return self._put(PICTURES_BATCH, body)
+
+    def stream_pictures_batch(self, batch: "CaptureBatch", light_indices: Optional[Sequence[int]] = None,
+                              encoder: Optional["PictureEncoder"] = None) -> QueuedResponse:
+        from .batch_codec import encode_capture_batch
+        return self._put(PICTURES_BATCH, encode_capture_batch(batch, light_indices, encoder=encoder))
+
+    def connection_stats(self) -> dict:
+        return {"queued": self.queued, "dropped": self.dropped}
+
+    def close(self) -> None:
+        pass
+
+    def _put(self, kind: str, payload) -> QueuedResponse:
+        try:
+            self.upload_queue.put_nowait((kind, self.loom, payload))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return QueuedResponse(503)
+
+        with self._lock:
+            self.queued += 1
+        return QueuedResponse(201)
+
+
+class FloorUploader:
+    """
+    FloorUploader sends the requests queued by the loom workers to the API, from a few threads sharing one pool of
+    keep-alive connections.
+
+    Attributes
+    ----------
+    upload_queue : multiprocessing.Queue
+        Requests waiting to be sent, as (kind, loom, payload) tuples.
+    api_handler : APIhandler
+        Handler of the API, with a connection per thread.
+    workers : int
+        Number of sending threads.
+
+    Methods
+    -------
+    start()
+        Start the sending threads.
+    stop()
+        Send the requests still queued and stop the sending threads.
+    stats()
+        Get the number of requests sent, rejected and failed, by loom.
+    """
+
+    def __init__(self, upload_queue: multiprocessing.Queue, workers: int = UPLOADER_WORKERS) -> None:
+        """
+        Initialize the FloorUploader.
+
+        Args:
+            upload_queue (multiprocessing.Queue): requests queued by the loom workers.
+            workers (int): number of sending threads.
+        """
+        from .api import APIhandler
+
+        self.upload_queue = upload_queue
+        self.api_handler = APIhandler(pool_size=workers)
+        self.workers = workers
+        self._threads: List[Thread] = []
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = Lock()
+
+    def start(self) -> None:
+        """
+        Start the sending threads.
+
+        Returns
+        -------
+        None
+        """
+        self._threads = [Thread(target=self._send, name=f'uploader_{i}', daemon=True) for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Send the requests still queued and stop the sending threads.
+
+        Returns
+        -------
+        None
+        """
+        for _ in self._threads:
+            self.upload_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.api_handler.close()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get the number of requests sent, rejected and failed, by loom.
+
+        Returns:
+            Dict[str, Dict[str, int]]: requests accepted by the API (sent), answered with an error (rejected) and not
+                answered or not sent because of an error (failed), by loom.
+        """
+        with self._lock:
+            return {loom: dict(counts) for loom, counts in self._stats.items()}
+
+    def _send(self) -> None:
+        """
+        Send the queued requests until stopped.
+
+        Returns
+        -------
+        None
+        """
+        import requests # imported by the API handler
+
+        while True:
+            request = self.upload_queue.get()
+            if request is None:
+                return
+
+            kind, loom, payload = request
+            try:
+                if kind == PICTURES_BATCH:
+                    status_code = self.api_handler.send_encoded_pictures_batch(payload).status_code
+                else:
+                    status_code = self.api_handler.send_surface_movement_batch(payload).status_code
+                outcome = "sent" if status_code < 400 else "rejected"
+            except requests.exceptions.RequestException as e:
+                error_logger.error("Failed to send the %s of loom %s: %s", kind, loom, e)
+                outcome = "failed"
+            except Exception: # e.g. a malformed payload, the thread keeps sending the next requests
+                error_logger.exception("Failed to send the %s of loom %s.", kind, loom)
+                outcome = "failed"
+
+            with self._lock:
+                counts = self._stats.setdefault(loom, {"sent": 0, "rejected": 0, "failed": 0})
+                counts[outcome] += 1
+
+
+def choose_core(slot: int, core: Optional[int] = None) -> Optional[int]:
+    """
+    Choose the core of a loom worker: the looms are spread over the cores available to the process, except the first
+    one, left to the supervisor and its uploader when there are several.
+
+    Args:
+        slot (int): index of the loom.
+        core (int, optional): core requested by the loom configuration.
+
+    Returns:
+        int: the core, None where the affinity cannot be set.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    if core is not None:
+        return core
+
+    cores = sorted(os.sched_getaffinity(0))
+    cores = cores[1:] or cores
+    return cores[slot % len(cores)]
+
+
+def run_loom(config: LoomConfig, slot: int, board_name: str, slots: int, upload_queue: multiprocessing.Queue,
+             stop_event: multiprocessing.Event, ttl: Optional[float] = None) -> None:
+    """
+    Run the analyser of a loom, in a worker process: pin it to its core, build it with the cameras of the loom,
+    publish its metrics on the board until it is stopped, or until its ttl is over.
+
+    Args:
+        config (LoomConfig): configuration of the loom.
+        slot (int): row of the loom on the board.
+        board_name (str): name of the metrics board.
+        slots (int): number of rows of the board.
+        upload_queue (multiprocessing.Queue): queue of the uploader.
+        stop_event (multiprocessing.Event): set by the supervisor, or by SIGTERM, to stop the worker.
+        ttl (float, optional): time to live (seconds of the analyser clock). Defaults to running until stopped.
+
+    Returns
+    -------
+    None
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # ctrl+c is handled by the supervisor
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set()) # stops between two writes to the uploader queue
+    core = choose_core(slot, config.core)
+    if core is not None:
+        os.sched_setaffinity(0, {core})
+    directory = os.path.join(SUPERVISOR_DIRECTORY, config.name)
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory) # logs and spool of the loom
+
+    from hardware_controllers.clock import VirtualClock
+    from hardware_controllers.cameras_controller import CameraPosition, CamerasController, CachedPictureSource, \
+        FilePictureSource
+    from .analyser import WeavingAnalyser
+    from .picture_codecs import PictureEncoder
+
+    board = MetricsBoard.attach(board_name, slots)
+    board.write(slot, {"heartbeat": time.time(), "pid": os.getpid(), "core": -1 if core is None else core})
+
+    clock = VirtualClock(seed=config.virtual_clock_seed) if config.virtual_clock_seed is not None else None
+    analyser = WeavingAnalyser(clock=clock, picture_encoder=PictureEncoder(config.codec, config.quality))
+    positions = [CameraPosition(position) for position in config.camera_positions] \
+        if config.camera_positions else None
+    source = FilePictureSource(config.pictures_directory) if config.pictures_directory else None
+    analyser.camera_handler.cameras_controller = CamerasController(
+        analyser.clock, CachedPictureSource(source, byte_budget=CamerasController._PICTURE_CACHE_BYTE_BUDGET),
+        positions, config.concurrent_acquisition)
+    api_handler = QueuedAPIhandler(upload_queue, config.name)
+    analyser.velocity_handler.api_handler = analyser.camera_handler.api_handler = api_handler
+
+    def publish() -> None:
+        metrics = analyser.metrics()
+        board.write(slot, {
+            "heartbeat": time.time(),
+            "samples": metrics["sampling"]["ticks"],
+            "missed_ticks": metrics["sampling"]["missed"],
+            "sampling_rate": metrics["sampling"]["rate"],
+            "lateness_p99": metrics["sampling"]["lateness_p99"],
+            "frames": metrics["triggers"]["frames"],
+            "missed_frames": metrics["triggers"]["missed"],
+            "trigger_latency": metrics["triggers"]["latency"],
+            "pictures_dropped": metrics["pictures_pool"]["dropped"],
+            "requests_queued": api_handler.queued,
+            "requests_dropped": api_handler.dropped
+        })
+
+    if ttl is not None:
+        analyser.stop_time = analyser.clock.monotonic() + ttl
+    analyser.start()
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # set by start
+    try:
+        while not stop_event.wait(SUPERVISOR_METRICS_PERIOD) and analyser.updateThread.is_alive():
+            publish()
+    finally:
+        analyser.stop()
+        publish()
+        board.close()
+
+
+@dataclass
+class LoomWorker:
+    """
+    Worker process of a loom and its restarts.
+
+    Attributes
+    ----------
+    config : LoomConfig
+        Configuration of the loom.
+    slot : int
+        Row of the loom on the metrics board.
+    process : multiprocessing.Process
+        Current worker process, None before the first start.
+    stop_event : multiprocessing.Event
+        Set to stop the current worker process.
+    started : float
+        time.time() of the last start.
+    restarts : int
+        Number of restarts.
+    backoff : float
+        Delay before the next restart (seconds).
+    restart_at : float
+        time.time() of the next restart, None while the worker runs.
+    finished : bool
+        Whether the worker ended its ttl, it is not restarted.
+    """
+
+    config: LoomConfig
+    slot: int
+    process: Optional[multiprocessing.Process] = None
+    stop_event: Optional[multiprocessing.synchronize.Event] = None
+    started: float = 0.0
+    restarts: int = 0
+    backoff: float = SUPERVISOR_RESTART_BACKOFF
+    restart_at: Optional[float] = None
+    finished: bool = False
+
+
+class LoomSupervisor:
+    """
+    LoomSupervisor runs a worker process per loom and the uploader they share, and restarts the workers that crash
+    or stop publishing their metrics.
+
+    Attributes
+    ----------
+    workers : List[LoomWorker]
+        Worker of each loom.
+    board : MetricsBoard
+        Metrics published by the workers.
+    uploader : FloorUploader
+        Uploader of the requests of every loom.
+    ttl : float
+        Time to live of the workers (seconds of their clock), None to run until stopped.
+    heartbeat_timeout : float
+        Age of the last metrics of a worker after which it is restarted (seconds).
+    max_backoff : float
+        Maximum delay before a restart (seconds).
+
+    Methods
+    -------
+    start()
+        Start the uploader and the workers.
+    check()
+        Restart the workers that crashed or hung.
+    run()
+        Start, supervise the workers until they end their ttl or until stopped, then stop.
+    stop()
+        Stop the workers, then the uploader once it sent their last requests.
+    metrics()
+        Get the metrics of each loom, of the whole floor and of the uploader.
+    """
+
+    _POLL_PERIOD = 0.1 # seconds between two checks of the workers
+
+    def __init__(self, looms: List[LoomConfig], ttl: Optional[float] = None,
+                 uploader_workers: int = UPLOADER_WORKERS, upload_queue_size: int = UPLOADER_QUEUE_SIZE,
+                 restart_backoff: float = SUPERVISOR_RESTART_BACKOFF,
+                 max_backoff: float = SUPERVISOR_MAX_RESTART_BACKOFF,
+                 heartbeat_timeout: float = SUPERVISOR_HEARTBEAT_TIMEOUT) -> None:
+        """
+        Initialize the LoomSupervisor.
+
+        Args:
+            looms (List[LoomConfig]): configuration of each loom, their names must be unique.
+            ttl (float, optional): time to live of the workers (seconds of their clock). Defaults to running until
+                stopped.
+            uploader_workers (int): connections to the API shared by the floor.
+            upload_queue_size (int): requests waiting for the uploader, the next ones are dropped.
+            restart_backoff (float): delay before the first restart of a worker (seconds), doubled at each restart.
+            max_backoff (float): maximum delay before a restart (seconds).
+            heartbeat_timeout (float): age of the last metrics of a worker after which it is restarted (seconds).
+        """
+        names = [loom.name for loom in looms]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Loom names must be unique: {names}")
+
+        self._context = multiprocessing.get_context("spawn")
+        self.workers = [LoomWorker(loom, slot, backoff=restart_backoff) for slot, loom in enumerate(looms)]
+        self.board = MetricsBoard(len(looms))
+        self.uploader = FloorUploader(self._context.Queue(upload_queue_size), uploader_workers)
+        self.ttl = ttl
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_backoff = max_backoff
+        self._stopping = Event()
+
+    def start(self) -> None:
+        """
+        Start the uploader and the workers.
+
+        Returns
+        -------
+        None
+        """
+        self.uploader.start()
+        for worker in self.workers:
+            self._start_worker(worker)
+
+    def check(self) -> None:
+        """
+        Restart the workers that crashed, or whose metrics are older than heartbeat_timeout, after their backoff.
+        A worker that ended its ttl is not restarted.
+
+        Returns
+        -------
+        None
+        """
+        now = time.time()
+        for worker in self.workers:
+            if worker.finished or self._stopping.is_set():
+                continue
+
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    worker.restarts += 1
+                    self._start_worker(worker)
+                continue
+
+            if worker.process.is_alive():
+                metrics = self.board.read(worker.slot)
+                heartbeat = max(worker.started, metrics["heartbeat"] if metrics else 0)
+                if now - heartbeat <= self.heartbeat_timeout:
+                    continue
+                warning_logger.warning("Loom %s stopped responding, restarting it.", worker.config.name)
+                self._stop_worker(worker, SUPERVISOR_STOP_GRACE)
+            elif worker.process.exitcode == 0 and self.ttl is not None:
+                worker.finished = True
+                continue
+
+            error_logger.error("Loom %s worker ended with code %s, restarting it in %.1f seconds.",
+                               worker.config.name, worker.process.exitcode, worker.backoff)
+            worker.restart_at = now + worker.backoff
+            worker.backoff = min(worker.backoff * 2, self.max_backoff)
+
+    def run(self) -> None:
+        """
+        Start, supervise the workers until they end their ttl or until stopped (SIGINT), then stop.
+
+        Returns
+        -------
+        None
+        """
+        previous_handler = signal.signal(signal.SIGINT, lambda *_: self._stopping.set())
+        self.start()
+        try:
+            while not self._stopping.wait(LoomSupervisor._POLL_PERIOD):
+                self.check()
+                if all(worker.finished for worker in self.workers):
+                    break
+        finally:
+            self.stop()
+            signal.signal(signal.SIGINT, previous_handler)
+
+    def stop(self) -> None:
+        """
+        Stop the workers, then the uploader once it sent their last requests. The workers get SUPERVISOR_STOP_TIMEOUT
+        seconds to stop, then they are terminated.
+
+        Returns
+        -------
+        None
+        """
+        self._stopping.set()
+        for worker in self.workers:
+            if worker.stop_event is not None:
+                worker.stop_event.set()
+        deadline = time.monotonic() + SUPERVISOR_STOP_TIMEOUT
+        for worker in self.workers:
+            if worker.process is not None:
+                self._stop_worker(worker, max(0.0, deadline - time.monotonic()))
+
+        self.uploader.stop()
+
+    def close(self) -> None:
+        """
+        Destroy the metrics board, once stopped.
+
+        Returns
+        -------
+        None
+        """
+        self.board.close()
+        self.board.unlink()
+
+    def metrics(self) -> dict:
+        """
+        Get the metrics of each loom (as last published by its worker), their sum over the floor, and the requests
+        sent by the uploader.
+
+        Returns:
+            dict: metrics, restarts and state of each loom, totals of the floor, and uploader stats by loom.
+        """
+        looms = {}
+        for worker in self.workers:
+            metrics = self.board.read(worker.slot) or {}
+            looms[worker.config.name] = {
+                **metrics,
+                "alive": worker.process is not None and worker.process.is_alive(),
+                "restarts": worker.restarts,
+                "finished": worker.finished
+            }
+
+        floor = {name: sum(loom.get(name, 0) for loom in looms.values())
+                 for name in ("samples", "missed_ticks", "frames", "missed_frames", "pictures_dropped",
+                              "requests_queued", "requests_dropped", "restarts")}
+        return {"looms": looms, "floor": floor, "uploader": self.uploader.stats()}
+
+    def register_metrics(self, registry: MetricsRegistry = REGISTRY) -> None:
+        """
+        Expose the metrics of each loom in a metrics registry, labelled with the loom name.
+
+        Args:
+            registry (MetricsRegistry): registry of the metrics. Defaults to the global registry.
+
+        Returns
+        -------
+        None
+        """
+        for worker in self.workers:
+            labels = {"loom": worker.config.name}
+            for name in LOOM_METRICS[3:]:
+                registry.gauge(f"weaving_loom_{name}", f"{name.replace('_', ' ').capitalize()} of a loom worker.",
+                               labels=labels, function=lambda slot=worker.slot, name=name: self.board.read(slot)[name])
+            registry.gauge("weaving_loom_restarts", "Restarts of a loom worker.", labels=labels,
+                           function=lambda worker=worker: worker.restarts)
+            registry.gauge("weaving_loom_heartbeat_age_seconds", "Age of the last metrics of a loom worker (seconds).",
+                           labels=labels,
+                           function=lambda slot=worker.slot: time.time() - self.board.read(slot)["heartbeat"])
+
+    def _stop_worker(self, worker: LoomWorker, timeout: float) -> None:
+        """
+        Stop the process of a worker: ask it to stop, then terminate it (its SIGTERM handler stops it between two
+        writes to the uploader queue), and kill it only if it still runs SUPERVISOR_STOP_GRACE seconds later.
+
+        Args:
+            worker (LoomWorker): worker to stop.
+            timeout (float): time given to the worker to stop once asked (seconds).
+
+        Returns
+        -------
+        None
+        """
+        worker.stop_event.set()
+        worker.process.join(timeout)
+        if worker.process.is_alive():
+            warning_logger.warning("Loom %s did not stop, terminating it.", worker.config.name)
+            worker.process.terminate()
+            worker.process.join(SUPERVISOR_STOP_GRACE)
+        if worker.process.is_alive():
+            error_logger.error("Loom %s did not terminate, killing it.", worker.config.name)
+            worker.process.kill()
+            worker.process.join()
+
+    def _start_worker(self, worker: LoomWorker) -> None:
+        """
+        Start the process of a worker, on a cleared row of the board.
+
+        Args:
+            worker (LoomWorker): worker to start.
+
+        Returns
+        -------
+        None
+        """
+        self.board.clear(worker.slot)
+        worker.stop_event = self._context.Event()
+        worker.process = self._context.Process(
+            target=run_loom, name=f'loom_{worker.config.name}',
+            args=(worker.config, worker.slot, self.board.name, self.board.slots, self.uploader.upload_queue,
+                  worker.stop_event, self.ttl))
+        worker.started, worker.restart_at = time.time(), None
+        worker.process.start()
+        console_logger.info("Loom %s started (pid %s).", worker.config.name, worker.process.pid)
+
+
+def load_looms(path: Optional[str], looms: int) -> List[LoomConfig]:
+    """
+    Load the configuration of the looms from a JSON file (a list of LoomConfig fields), or name them loom_0 to
+    loom_<n-1> with the default configuration.
+
+    Args:
+        path (str, optional): path of the JSON file.
+        looms (int): number of looms without a file.
+
+    Returns:
+        List[LoomConfig]: configuration of each loom.
+    """
+    if path is None:
+        return [LoomConfig(f"loom_{i}") for i in range(looms)]
+    with open(path) as file:
+        return [LoomConfig(**loom) for loom in json.load(file)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Supervisor of the weaving analysers of a floor.")
+    looms = parser.add_mutually_exclusive_group()
+    looms.add_argument("-n", "--looms", type=int, default=1, help="number of looms with the default configuration")
+    looms.add_argument("-c", "--config", help="JSON file with the configuration of each loom (see LoomConfig)")
+    parser.add_argument("-t", "--ttl", type=float, default=None, help="time to live of the workers (seconds)")
+    parser.add_argument("--virtual-clock", type=int, default=None, metavar="SEED",
+                        help="simulate faster than real time, loom i on a virtual clock seeded with SEED + i")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help=f"port of the Prometheus metrics endpoint (http://{METRICS_HOST}:port/metrics)")
+    parser.add_argument("--no-metrics", action="store_true", help="do not expose the metrics")
+    args = parser.parse_args()
+
+    configs = load_looms(args.config, args.looms)
+    if args.virtual_clock is not None:
+        if args.ttl is None:
+            parser.error("--virtual-clock needs a ttl")
+        for i, config in enumerate(configs):
+            config.virtual_clock_seed = args.virtual_clock + i
+
+    supervisor = LoomSupervisor(configs, ttl=args.ttl)
+    supervisor.register_metrics()
+    metrics_server = None
+    if not args.no_metrics:
+        try:
+            metrics_server = MetricsServer(REGISTRY, METRICS_HOST, args.metrics_port)
+            metrics_server.start()
+        except OSError as e:
+            print(f"Metrics endpoint failed to start: {e}")
+            metrics_server = None
+
+    try:
+        supervisor.run()
+        print(json.dumps(supervisor.metrics(), indent=2))
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        supervisor.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+from collections import deque
+from threading import Lock
+from typing import Callable, List
+import time
+
+from .config import TELEMETRY_BATCH_SIZE, TELEMETRY_BATCH_LATENCY, TELEMETRY_BUFFER_CAPACITY
+
+
+class TelemetryBatcher:
+    """
+    TelemetryBatcher buffers timestamped surface movement samples so they can be sent to the API in batches.
+
+    A batch is due when it holds max_samples samples or when its oldest sample is older than max_latency seconds.
+    The buffer is bounded: when it is full (e.g. the API is down), the oldest samples are dropped.
+
+    Attributes
+    ----------
+    max_samples : int
+        Number of samples that makes a batch due.
+    max_latency : float
+        Maximum time a sample waits in the buffer before its batch is due (seconds).
+    dropped : int
+        Number of samples dropped because the buffer was full.
+    _samples : deque
+        Buffered samples.
+    _first_sample_time : float
+        Monotonic time of the oldest buffered sample.
+    _flush_pending : bool
+        Whether a due batch was already reported and not yet drained.
+    _lock : Lock
+        Lock shared by the sampling thread and the sending threads.
+    _clock : Callable[[], float]
+        Monotonic clock.
+
+    Methods
+    -------
+    add(timestamp: float, velocity: float, displacement: float)
+        Buffer a sample.
+    drain()
+        Take all the buffered samples.
+    cancel()
+        Forget that the due batch was reported, its flush was dropped.
+    """
+
+    def __init__(self, max_samples: int = TELEMETRY_BATCH_SIZE, max_latency: float = TELEMETRY_BATCH_LATENCY,
+                 capacity: int = TELEMETRY_BUFFER_CAPACITY, clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Initialize the TelemetryBatcher.
+
+        Args:
+            max_samples (int): number of samples that makes a batch due.
+            max_latency (float): maximum time a sample waits before its batch is due (seconds).
+            capacity (int): maximum number of buffered samples.
+            clock (Callable[[], float]): monotonic clock.
+        """
+        self.max_samples = max_samples
+        self.max_latency = max_latency
+        self.dropped = 0
+        self._samples = deque(maxlen=capacity)
+        self._first_sample_time = None
+        self._flush_pending = False
+        self._lock = Lock()
+        self._clock = clock
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def add(self, timestamp: float, velocity: float, displacement: float) -> bool:
+        """
+        Buffer a sample.
+
+        Args:
+            timestamp (float): time of the sample (seconds since the epoch).
+            velocity (float): velocity of the surface.
+            displacement (float): displacement of the surface.
+
+        Returns:
+            bool: True when a batch becomes due. It is only reported once until the buffer is drained.
+        """
+        now = self._clock()
+
+        with self._lock:
+            if len(self._samples) == self._samples.maxlen:
+                self.dropped += 1
+            if not self._samples:
+                self._first_sample_time = now
+
+            self._samples.append({"timestamp": timestamp, "velocity": velocity, "displacement": displacement})
+
+            if self._flush_pending:
+                return False
+
+            self._flush_pending = (len(self._samples) >= self.max_samples
+                                   or now - self._first_sample_time >= self.max_latency)
+            return self._flush_pending
+
+    def drain(self) -> List[dict]:
+        """
+        Take all the buffered samples.
+
+        Returns:
+            List[dict]: buffered samples, oldest first.
+        """
+        with self._lock:
+            samples = list(self._samples)
+            self._samples.clear()
+            self._flush_pending = False
+
+        return samples
+
+    def cancel(self) -> None:
+        """
+        Forget that the due batch was reported, its flush was dropped before being run: the next sample reports it
+        again.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._flush_pending = False
@@ -0,0 +1,288 @@
+from collections import deque
+from threading import Lock
+from typing import Callable, Deque, Optional, Tuple
+import time
+
+from .config import warning_logger, TRIGGER_LATENCY_SMOOTHING
+from .scheduler import JitterHistogram
+
+
+class TriggerScheduler:
+    """
+    TriggerScheduler decides when to start a camera iteration, from the predicted fabric displacement.
+
+    Notes
+    -----
+    Frame n covers the fabric from n * vertical_fov. The displacement is predicted trigger latency seconds ahead with
+    the filtered velocity, and the iteration of the next frame starts as soon as the predicted displacement reaches
+    it, so that the cameras trigger when the fabric gets there rather than one latency later.
+
+    The trigger latency is the time from the decision to the trigger of the cameras, not counting the time spent
+    waiting for the previous iteration to end, smoothed over the iterations. The iteration time (from the trigger to
+    the end of the last light type) bounds the velocity the cameras can cover: vertical_fov / iteration time.
+
+    The coverage error of a frame is the fabric between its trigger and the trigger of the previous frame, minus the
+    vertical field of view: positive for a gap (fabric never pictured), negative for an overlap.
+
+    Attributes
+    ----------
+    vertical_fov : float
+        Vertical field of view of the cameras (cm).
+    latency : float
+        Smoothed trigger latency (seconds).
+    iteration_time : float
+        Smoothed iteration time (seconds), None until an iteration ended.
+    frame : int
+        Number of camera iterations started.
+    _smoothing : float
+        Weight of a new measure in the smoothed latency and iteration time.
+    _clock : Callable[[], float]
+        Monotonic clock (seconds).
+    _decisions : Deque[Tuple[int, float]]
+        Frame and time of the iterations started and not triggered yet, oldest first.
+    _coverage_error : JitterHistogram
+        Absolute coverage error of the frames (cm).
+
+    Methods
+    -------
+    update(displacement: float, velocity: float)
+        Decide whether the iteration of the next frame starts now.
+    cancel(frame: int)
+        Forget an iteration dropped before being run, by default the one started last.
+    record_trigger(displacement: float)
+        Record the trigger of the cameras for an iteration.
+    record_miss()
+        Record an iteration that did not trigger the cameras.
+    record_iteration_end()
+        Record the end of the iteration triggered last.
+    max_velocity()
+        Get the highest velocity the cameras can cover.
+    stats()
+        Get the trigger latency, iteration time and coverage error statistics.
+    """
+
+    COVERAGE_ERROR_BOUNDS = [0.5, 1, 2, 5, 10, 25, 50, 100]
+
+    def __init__(self, vertical_fov: float, latency: float = 0.0, smoothing: float = TRIGGER_LATENCY_SMOOTHING,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Initialize the TriggerScheduler.
+
+        Args:
+            vertical_fov (float): vertical field of view of the cameras (cm).
+            latency (float): trigger latency until the first one is measured (seconds).
+            smoothing (float): weight of a new measure in the smoothed latency and iteration time (0 to 1).
+            clock (Callable[[], float]): monotonic clock (seconds).
+        """
+        self.vertical_fov = vertical_fov
+        self.latency = latency
+        self.iteration_time = None
+        self.frame = 0
+        self._smoothing = smoothing
+        self._clock = clock
+        self._lock = Lock()
+        self._decisions: Deque[Tuple[int, float]] = deque()
+        self._measured_latency = False
+        self._last_trigger_time = None
+        self._last_trigger_displacement = None
+        self._last_iteration_end = None
+        self._too_fast = False
+        self._triggered = 0
+        self._missed = 0
+        self._coverage_error = JitterHistogram(TriggerScheduler.COVERAGE_ERROR_BOUNDS)
+        self._gaps = 0
+        self._overlaps = 0
+        self._error_sum = 0.0
+        self._last_error = 0.0
+        self._max_gap = 0.0
+        self._max_overlap = 0.0
+
+    def predicted_displacement(self, displacement: float, velocity: float) -> float:
+        """
+        Predict the displacement at the trigger of an iteration started now.
+
+        Args:
+            displacement (float): current displacement (cm).
+            velocity (float): current filtered velocity (cm/sec).
+
+        Returns:
+            float: displacement one trigger latency ahead (cm).
+        """
+        return displacement + velocity * self.latency
+
+    def update(self, displacement: float, velocity: float) -> bool:
+        """
+        Decide whether the iteration of the next frame starts now. At most one iteration starts per call.
+
+        Args:
+            displacement (float): current displacement (cm).
+            velocity (float): current filtered velocity (cm/sec).
+
+        Returns:
+            bool: whether a camera iteration starts.
+        """
+        if self.predicted_displacement(displacement, velocity) // self.vertical_fov <= self.frame:
+            return False
+
+        with self._lock:
+            self.frame += 1
+            self._decisions.append((self.frame, self._clock()))
+
+        max_velocity = self.max_velocity()
+        too_fast = max_velocity is not None and velocity > max_velocity
+        if too_fast and not self._too_fast:
+            warning_logger.warning("Velocity %.2f cm/s above the %.2f cm/s the cameras can cover: the frames will have "
+                                   "gaps.", velocity, max_velocity)
+        self._too_fast = too_fast
+
+        return True
+
+    def cancel(self, frame: Optional[int] = None) -> None:
+        """
+        Forget an iteration dropped before being run, so that the next trigger is not matched with its decision.
+
+        Args:
+            frame (int, optional): frame of the iteration (see frame). Defaults to the iteration started last.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            if frame is None:
+                if self._decisions:
+                    self._decisions.pop()
+                return
+
+            for i, (decided, _) in enumerate(self._decisions):
+                if decided == frame:
+                    del self._decisions[i]
+                    return
+
+    def record_trigger(self, displacement: float) -> None:
+        """
+        Record the trigger of the cameras for an iteration: measures its latency and the coverage error of its frame.
+
+        Args:
+            displacement (float): displacement at the trigger (cm).
+
+        Returns
+        -------
+        None
+        """
+        now = self._clock()
+        with self._lock:
+            self._triggered += 1
+            if self._decisions:
+                _, ready = self._decisions.popleft()
+                if self._last_iteration_end is not None:
+                    ready = max(ready, self._last_iteration_end) # waiting for the previous iteration is not latency
+                self.latency = self._smooth(self.latency if self._measured_latency else None, now - ready)
+                self._measured_latency = True
+
+            if self._last_trigger_displacement is not None:
+                self._record_coverage(displacement - self._last_trigger_displacement - self.vertical_fov)
+            self._last_trigger_time = now
+            self._last_trigger_displacement = displacement
+
+    def record_miss(self) -> None:
+        """
+        Record an iteration that did not trigger the cameras.
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._missed += 1
+            if self._decisions:
+                self._decisions.popleft()
+
+    def record_iteration_end(self) -> None:
+        """
+        Record the end of the iteration triggered last.
+
+        Returns
+        -------
+        None
+        """
+        now = self._clock()
+        with self._lock:
+            self._last_iteration_end = now
+            if self._last_trigger_time is not None:
+                self.iteration_time = self._smooth(self.iteration_time, now - self._last_trigger_time)
+
+    def max_velocity(self) -> Optional[float]:
+        """
+        Get the highest velocity the cameras can cover without gaps.
+
+        Returns:
+            float: vertical field of view per iteration time (cm/sec), None until an iteration ended.
+        """
+        iteration_time = self.iteration_time
+        if not iteration_time:
+            return None
+        return self.vertical_fov / iteration_time
+
+    def stats(self) -> dict:
+        """
+        Get the trigger latency, iteration time and coverage error statistics.
+
+        Returns:
+            dict: iterations started, triggered and missed, trigger latency and iteration time (seconds), highest
+                velocity the cameras can cover (cm/sec), and the coverage error of the frames: gaps and overlaps
+                count, last, mean, p50 and p99 absolute error, largest gap and overlap (cm).
+        """
+        with self._lock:
+            covered = self._coverage_error.count
+            return {
+                "frames": self.frame,
+                "triggered": self._triggered,
+                "missed": self._missed,
+                "latency": self.latency,
+                "iteration_time": self.iteration_time,
+                "max_velocity": self.max_velocity(),
+                "coverage": {
+                    "frames": covered,
+                    "gaps": self._gaps,
+                    "overlaps": self._overlaps,
+                    "last_error": self._last_error,
+                    "mean_error": self._error_sum / covered if covered else 0.0,
+                    "abs_error_p50": self._coverage_error.percentile(50),
+                    "abs_error_p99": self._coverage_error.percentile(99),
+                    "max_gap": self._max_gap,
+                    "max_overlap": self._max_overlap
+                }
+            }
+
+    def _record_coverage(self, error: float) -> None:
+        """
+        Record the coverage error of a frame.
+
+        Args:
+            error (float): coverage error (cm), positive for a gap and negative for an overlap.
+        """
+        self._coverage_error.record(abs(error))
+        self._error_sum += error
+        self._last_error = error
+        if error > 0:
+            self._gaps += 1
+            self._max_gap = max(self._max_gap, error)
+        elif error < 0:
+            self._overlaps += 1
+            self._max_overlap = max(self._max_overlap, -error)
+
+    def _smooth(self, average: Optional[float], value: float) -> float:
+        """
+        Exponential moving average of a measure.
+
+        Args:
+            average (float, optional): current average, None before the first measure.
+            value (float): new measure.
+
+        Returns:
+            float: updated average.
+        """
+        if average is None:
+            return value
+        return average + self._smoothing * (value - average)
@@ -1,10 +1,32 @@
-from .config import debug_logger, warning_logger, info_logger
+from .config import debug_logger, warning_logger, info_logger, VELOCITY_WORKERS
 from hardware_controllers.velocity_sensor_controller import VelocitySensorController
+from hardware_controllers.clock import Clock, SystemClock
 from .api import APIhandler
-from typing import Any
+from .telemetry_batcher import TelemetryBatcher
+from .filters import Filter, FilterChain, MedianFilter, MovingAverageFilter
+from .metrics import REGISTRY
+from typing import Any, List, Optional
+import time
 
 ONE_HERTZ = 1
 
+# the count of the update histogram is the number of samples read
+UPDATE_SECONDS = REGISTRY.histogram("weaving_velocity_update_seconds",
+                                    "Time to read, filter and buffer a velocity sample (seconds).")
+NEGATIVE_VELOCITIES = REGISTRY.counter("weaving_negative_velocities_total", "Negative velocity readings.")
+
+def default_velocity_filter(window: int) -> Filter:
+    """
+    Default filter of the velocity readings: a median to reject outliers followed by a moving average.
+
+    Args:
+        window (int): window of both filters (samples).
+
+    Returns:
+        Filter: the filter.
+    """
+    return FilterChain(MedianFilter(window), MovingAverageFilter(window))
+
 class VelocityHandler:
     """
     VelocityHandler is a class that handles the velocity sensor and sends the velocity to the API.
@@ -25,10 +47,16 @@ class VelocityHandler:
         Instance of the velocity sensor controller.
     api_handler : APIhandler
         Instance of the API handler.
-    _velocity_buffer : List
-        Buffer for the moving average velocity.
-    _displacement_buffer : List
-        Buffer for the total displacement.
+    clock : Clock
+        Clock of the sensor and of the samples timestamps.
+    telemetry_batcher : TelemetryBatcher
+        Buffer of the samples waiting to be sent to the API.
+    velocity_filter : Filter
+        Filter of the velocity readings (median to reject outliers, then moving average, by default).
+    displacement_filter : MovingAverageFilter
+        Moving average of the total displacement.
+    average_displacement : float
+        Moving average of the total displacement (cm).
     _observers : List
         List of observers.
 
@@ -43,32 +71,50 @@ class VelocityHandler:
     stop()
         Stop the velocity sensor.
     handle_velocity(instant_velocity: float)
-        Handle the velocity readings. Smooths the velocity readings using a moving average.
-    get_displacement()
+        Handle the velocity readings. Smooths the velocity readings with the velocity filter.
+    get_displacement(dt: float)
         Get the displacement.
-    update()
-        Update the velocity handler.
+    update(dt: float)
+        Update the velocity handler and buffer the new sample.
+    take_samples()
+        Take the samples waiting to be sent to the API.
     __call__()
-        Call the VelocityHandler to use the velocity sensor and send the velocity data to the API.
+        Call the VelocityHandler to send the buffered velocity data to the API.
 
     """
     SAMPLING_RATE = 50 * ONE_HERTZ
     WINDOW = 5
     total_displacement = 0
 
-    def __init__(self) -> None:
+    def __init__(self, velocity_filter: Optional[Filter] = None, clock: Optional[Clock] = None) -> None:
         """
         Initialize the VelocityHandler.
+
+        Args:
+            velocity_filter (Filter, optional): filter of the velocity readings. Defaults to a median filter followed
+                by a moving average, both over WINDOW samples.
+            clock (Clock, optional): clock of the sensor and of the samples timestamps. Defaults to the system clock.
         """
         self._do_run = False
-        self.velocity_sensor_controller = VelocitySensorController()
+        self.clock = clock or SystemClock()
+        self.velocity_sensor_controller = VelocitySensorController(self.clock)
         self.total_displacement = 0
         self.displacement_threshold = 5
         self.velocity = 0
-        self.api_handler = APIhandler()
-        self.velocity_buffer = []
-        self.displacement_buffer = []
+        self.api_handler = APIhandler(pool_size=VELOCITY_WORKERS)
+        self.telemetry_batcher = TelemetryBatcher(clock=self.clock.monotonic)
+        self.reported_drops = 0
+        self.velocity_filter = velocity_filter or default_velocity_filter(VelocityHandler.WINDOW)
+        self.displacement_filter = MovingAverageFilter(VelocityHandler.WINDOW)
+        self.average_displacement = 0
         self.observers = []
+        # read when the metrics are collected, not on every sample
+        REGISTRY.gauge("weaving_velocity_cm_per_second", "Filtered fabric velocity (cm/sec).",
+                       function=lambda: self.velocity)
+        REGISTRY.gauge("weaving_displacement_cm", "Total fabric displacement (cm).",
+                       function=lambda: self.total_displacement)
+        REGISTRY.gauge("weaving_velocity_samples_dropped", "Velocity samples dropped: buffer full.",
+                       function=lambda: self.telemetry_batcher.dropped)
 
     def register_observer(self, observer: Any) -> None:
         """
@@ -112,67 +158,90 @@ class VelocityHandler:
     
     def handle_velocity(self, instant_velocity: float) -> float:
         """
-        Handle the velocity readings. Smooths the velocity readings using a moving average.
+        Handle the velocity readings. Smooths the velocity readings with the velocity filter.
 
         Args:
             instant_velocity (float): instant velocity from the velocity sensor.
 
         Returns:
-            float: moving average velocity.
+            float: filtered velocity.
         """
         if instant_velocity < 0:
-            warning_logger.warning(f"Negative velocity detected: {instant_velocity}")
-        
-        self.velocity_buffer.append(instant_velocity)
+            NEGATIVE_VELOCITIES.inc()
+            warning_logger.warning("Negative velocity detected: %s", instant_velocity)
         
-        if len(self.velocity_buffer) > VelocityHandler.WINDOW:
-            self.velocity_buffer.pop(0)
-        
-        moving_average_velocity = sum(self.velocity_buffer) / len(self.velocity_buffer)
-        return moving_average_velocity
+        return self.velocity_filter.update(instant_velocity)
 
     
-    def get_displacement(self) -> float:
+    def get_displacement(self, dt: Optional[float] = None) -> float:
         """
         Calculate the displacement based on the velocity.
 
+        Args:
+            dt (float, optional): measured time since the previous sample (seconds). Defaults to the sampling period.
+
         Returns:
             float: displacement.
         """
-        return self.velocity / VelocityHandler.SAMPLING_RATE
+        if dt is None:
+            return self.velocity / VelocityHandler.SAMPLING_RATE
+
+        return self.velocity * dt
     
     
-    def update(self) -> None:
+    def update(self, dt: Optional[float] = None) -> bool:
         """
-        Update the velocity handler.
+        Update the velocity handler and buffer the new sample to be sent to the API.
 
-        Returns
-        -------
-        None
+        Args:
+            dt (float, optional): measured time since the previous sample (seconds). Defaults to the sampling period.
+
+        Returns:
+            bool: True when a batch of samples is due to be sent (see TelemetryBatcher).
         """
+        start = time.perf_counter()
         instant_velocity = self.velocity_sensor_controller.get_velocity() / 60 # convert from cm/min to cm/sec
         self.velocity = self.handle_velocity(instant_velocity)
         
-        self.total_displacement += self.get_displacement()
-        self.displacement_buffer.append(self.total_displacement)
-
-        if len(self.displacement_buffer) > VelocityHandler.WINDOW:
-            self.displacement_buffer.pop(0)
+        self.total_displacement += self.get_displacement(dt)
+        self.average_displacement = self.displacement_filter.update(self.total_displacement)
         
         if self.total_displacement > self.displacement_threshold:
-            info_logger.info(f"Total displacement reached: {self.displacement_threshold}")
+            info_logger.info("Total displacement reached: %s", self.displacement_threshold)
             self.displacement_threshold += 5
 
         self.notify_observers()
-        debug_logger.debug(f"Total displacement: {self.total_displacement}; Moving average velocity: {self.velocity}; instant velocity: {instant_velocity}")
+        debug_logger.debug("Total displacement: %s; Moving average velocity: %s; instant velocity: %s",
+                           self.total_displacement, self.velocity, instant_velocity) # formatted by the log writer
+
+        samples_due = self.telemetry_batcher.add(self.clock.time(), self.velocity, self.total_displacement)
+        UPDATE_SECONDS.observe(time.perf_counter() - start)
+
+        return samples_due
 
 
     def __call__(self) -> None:
         """
-        Call the VelocityHandler to use the velocity sensor and send the velocity data to the API.
+        Call the VelocityHandler to send the buffered velocity data to the API, in a single request.
 
         Returns
         -------
         None
         """
-        self.api_handler.send_surface_movement(self.velocity, self.total_displacement)
\ No newline at end of file
+        samples = self.take_samples()
+        if samples:
+            self.api_handler.send_surface_movement_batch(samples)
+
+    def take_samples(self) -> List[dict]:
+        """
+        Take the samples waiting to be sent to the API.
+
+        Returns:
+            List[dict]: buffered samples, oldest first.
+        """
+        dropped = self.telemetry_batcher.dropped
+        if dropped > self.reported_drops:
+            warning_logger.warning("%s velocity samples dropped: buffer full.", dropped - self.reported_drops)
+            self.reported_drops = dropped
+
+        return self.telemetry_batcher.drain()
\ No newline at end of file